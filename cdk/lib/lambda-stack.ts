@@ -5,6 +5,8 @@ import * as dynamodb from 'aws-cdk-lib/aws-dynamodb';
 import * as stepfunctions from 'aws-cdk-lib/aws-stepfunctions';
 import * as stepfunctionsTasks from 'aws-cdk-lib/aws-stepfunctions-tasks';
 import * as secretsmanager from 'aws-cdk-lib/aws-secretsmanager';
+import * as sqs from 'aws-cdk-lib/aws-sqs';
+import * as lambdaEventSources from 'aws-cdk-lib/aws-lambda-event-sources';
 import * as path from 'path';
 import { Construct } from 'constructs';
 
@@ -40,6 +42,11 @@ export class LineEchoStack extends cdk.Stack {
     // Grant DynamoDB permissions
     this.grantDynamoDBPermissions(conversationTable, lambdaFunctions);
 
+    // Optional per-user/group/backend token and cost counters (-c usageAccounting=true)
+    if (this.node.tryGetContext('usageAccounting') === 'true') {
+      this.createUsageAccounting(lambdaFunctions);
+    }
+
     // Step Functions Workflow for AI processing
     const stateMachine = this.createStepFunctionsWorkflow(lambdaFunctions);
 
@@ -47,9 +54,14 @@ export class LineEchoStack extends cdk.Stack {
     lambdaFunctions.webhookLambda.addEnvironment('STEP_FUNCTION_ARN', stateMachine.stateMachineArn);
     stateMachine.grantStartExecution(lambdaFunctions.webhookLambda);
 
+    // Optional SQS-buffered ingestion (-c ingestionMode=queue)
+    if (this.node.tryGetContext('ingestionMode') === 'queue') {
+      this.createIngestionPipeline(conversationTable, secrets, dependenciesLayer, lambdaFunctions, stateMachine);
+    }
+
     // API Gateway for LINE webhook endpoint
     const api = new apigw.LambdaRestApi(this, 'Endpoint', { 
-      handler: lambdaFunctions.webhookLambda,
+      handler: this.invokeTarget(lambdaFunctions.webhookLambda),
       description: 'LINE Bot Webhook API',
       binaryMediaTypes: ['*/*'] // Support for various content types
     });
@@ -100,6 +112,19 @@ export class LineEchoStack extends cdk.Stack {
     };
   }
 
+  /**
+   * Grants read on the secrets of the extra LINE channels listed in LINE_CHANNELS
+   * ({"<botUserId>": {"channelSecretName": ..., "accessTokenName": ...}})
+   */
+  private grantChannelSecrets(fn: lambda.Function, keys: ('channelSecretName' | 'accessTokenName')[]): void {
+    const channels: Record<string, Record<string, string>> = JSON.parse(process.env.LINE_CHANNELS || '{}');
+    Object.entries(channels).forEach(([botUserId, channel]) => {
+      keys.forEach((key) => {
+        secretsmanager.Secret.fromSecretNameV2(fn, `Channel${botUserId}${key}`, channel[key]).grantRead(fn);
+      });
+    });
+  }
+
   /**
    * Creates Lambda layer for Python dependencies
    */
@@ -123,6 +148,8 @@ export class LineEchoStack extends cdk.Stack {
       runtime: lambda.Runtime.PYTHON_3_12,
       code: lambda.Code.fromAsset(path.join(__dirname, '../../lambda')),
       layers: [dependenciesLayer],
+      // Optional SnapStart (-c snapStart=true); handlers drop secrets before the snapshot
+      ...(this.snapStartEnabled() ? { snapStart: lambda.SnapStartConf.ON_PUBLISHED_VERSIONS } : {}),
     };
 
     const webhookLambda = new lambda.Function(this, 'WebhookHandler', {
@@ -137,10 +164,15 @@ export class LineEchoStack extends cdk.Stack {
         // Required for ai_processor import (used by /forget command)
         SAMBA_NOVA_API_KEY_NAME: secrets.sambaNovaApiKey.secretName,
         GROQ_API_KEY_NAME: secrets.groqApiKeySecret.secretName,
+        CONVERSATION_CACHE_ENABLED: process.env.CONVERSATION_CACHE_ENABLED || 'false',
+        WEBHOOK_PREFILTER_ENABLED: process.env.WEBHOOK_PREFILTER_ENABLED || 'false',
+        LONG_TERM_MEMORY_ENABLED: process.env.LONG_TERM_MEMORY_ENABLED || 'false',
+        LINE_CHANNELS: process.env.LINE_CHANNELS || '{}',
       },
     });
     secrets.lineChannelSecret.grantRead(webhookLambda);
     secrets.lineChannelAccessToken.grantRead(webhookLambda);
+    this.grantChannelSecrets(webhookLambda, ['channelSecretName', 'accessTokenName']);
 
     const aiProcessorLambda = new lambda.Function(this, 'AiProcessor', {
       ...baseConfig,
@@ -154,10 +186,25 @@ export class LineEchoStack extends cdk.Stack {
         AI_BACKEND: process.env.AI_BACKEND || 'groq',
         SAMBANOVA_MODEL: process.env.SAMBANOVA_MODEL || 'DeepSeek-V3-0324',
         GROQ_MODEL: process.env.GROQ_MODEL || 'openai/gpt-oss-20b',
+        // Speculative search calls Grok directly from this function
+        XAI_API_KEY_SECRET_NAME: secrets.xaiApiKeySecret.secretName,
+        SPECULATIVE_SEARCH_ENABLED: process.env.SPECULATIVE_SEARCH_ENABLED || 'false',
+        MODEL_CASCADE_ENABLED: process.env.MODEL_CASCADE_ENABLED || 'false',
+        CANCEL_SUPERSEDED_ENABLED: process.env.CANCEL_SUPERSEDED_ENABLED || 'false',
+        ADAPTIVE_INTERIM_ENABLED: process.env.ADAPTIVE_INTERIM_ENABLED || 'false',
+        INTERIM_THRESHOLD_S: process.env.INTERIM_THRESHOLD_S || '5',
+        // Archived in the conversation table by the webhook, recalled here
+        LONG_TERM_MEMORY_ENABLED: process.env.LONG_TERM_MEMORY_ENABLED || 'false',
+        MEMORY_TOP_K: process.env.MEMORY_TOP_K || '3',
+        // In-flight and latency counters live in the conversation table
+        OVERLOAD_CONTROL_ENABLED: process.env.OVERLOAD_CONTROL_ENABLED || 'false',
+        OVERLOAD_LATENCY_S: process.env.OVERLOAD_LATENCY_S || '8,12,18,30',
+        OVERLOAD_INFLIGHT: process.env.OVERLOAD_INFLIGHT || '30,50,80,120',
       },
     });
     secrets.sambaNovaApiKey.grantRead(aiProcessorLambda);
     secrets.groqApiKeySecret.grantRead(aiProcessorLambda);
+    secrets.xaiApiKeySecret.grantRead(aiProcessorLambda);
 
     const interimResponseSenderLambda = new lambda.Function(this, 'InterimResponseSender', {
       ...baseConfig,
@@ -166,9 +213,11 @@ export class LineEchoStack extends cdk.Stack {
       timeout: cdk.Duration.seconds(10),
       environment: {
         CHANNEL_ACCESS_TOKEN_NAME: secrets.lineChannelAccessToken.secretName,
+        LINE_CHANNELS: process.env.LINE_CHANNELS || '{}',
       },
     });
     secrets.lineChannelAccessToken.grantRead(interimResponseSenderLambda);
+    this.grantChannelSecrets(interimResponseSenderLambda, ['accessTokenName']);
 
     const grokProcessorLambda = new lambda.Function(this, 'GrokProcessor', {
       ...baseConfig,
@@ -177,9 +226,19 @@ export class LineEchoStack extends cdk.Stack {
       timeout: cdk.Duration.seconds(180), // Longer timeout for potential long searches
       environment: {
         XAI_API_KEY_SECRET_NAME: secrets.xaiApiKeySecret.secretName,
+        // Read to skip searches for superseded generations; search latency histograms live here too
+        CONVERSATION_TABLE_NAME: conversationTable.tableName,
+        CANCEL_SUPERSEDED_ENABLED: process.env.CANCEL_SUPERSEDED_ENABLED || 'false',
+        ADAPTIVE_INTERIM_ENABLED: process.env.ADAPTIVE_INTERIM_ENABLED || 'false',
+        INTERIM_THRESHOLD_S: process.env.INTERIM_THRESHOLD_S || '5',
+        // Late interim messages for searches that overrun the threshold
+        CHANNEL_ACCESS_TOKEN_NAME: secrets.lineChannelAccessToken.secretName,
+        LINE_CHANNELS: process.env.LINE_CHANNELS || '{}',
       },
     });
     secrets.xaiApiKeySecret.grantRead(grokProcessorLambda);
+    secrets.lineChannelAccessToken.grantRead(grokProcessorLambda);
+    this.grantChannelSecrets(grokProcessorLambda, ['accessTokenName']);
 
     const responseSenderLambda = new lambda.Function(this, 'ResponseSender', {
       ...baseConfig,
@@ -189,9 +248,15 @@ export class LineEchoStack extends cdk.Stack {
       environment: {
         CONVERSATION_TABLE_NAME: conversationTable.tableName,
         CHANNEL_ACCESS_TOKEN_NAME: secrets.lineChannelAccessToken.secretName,
+        CANCEL_SUPERSEDED_ENABLED: process.env.CANCEL_SUPERSEDED_ENABLED || 'false',
+        LINE_CHANNELS: process.env.LINE_CHANNELS || '{}',
       },
     });
     secrets.lineChannelAccessToken.grantRead(responseSenderLambda);
+    this.grantChannelSecrets(responseSenderLambda, ['accessTokenName']);
+
+    [webhookLambda, aiProcessorLambda, interimResponseSenderLambda, grokProcessorLambda, responseSenderLambda]
+      .forEach((fn) => this.applyMemoryProfiling(fn));
 
     return {
       webhookLambda,
@@ -202,6 +267,91 @@ export class LineEchoStack extends cdk.Stack {
     };
   }
 
+  /**
+   * Creates the SQS ingestion queue and its batch consumer, and switches the
+   * webhook to enqueue verified bodies instead of processing them inline
+   */
+  private createIngestionPipeline(
+    conversationTable: dynamodb.Table,
+    secrets: ReturnType<typeof this.createSecretReferences>,
+    dependenciesLayer: lambda.LayerVersion,
+    lambdaFunctions: ReturnType<typeof this.createLambdaFunctions>,
+    stateMachine: stepfunctions.StateMachine
+  ): void {
+    const deadLetterQueue = new sqs.Queue(this, 'IngestionDeadLetterQueue', {
+      retentionPeriod: cdk.Duration.days(4),
+    });
+
+    const ingestionQueue = new sqs.Queue(this, 'IngestionQueue', {
+      visibilityTimeout: cdk.Duration.seconds(60),
+      deadLetterQueue: { queue: deadLetterQueue, maxReceiveCount: 3 },
+    });
+
+    const ingestConsumerLambda = new lambda.Function(this, 'IngestConsumer', {
+      runtime: lambda.Runtime.PYTHON_3_12,
+      code: lambda.Code.fromAsset(path.join(__dirname, '../../lambda')),
+      layers: [dependenciesLayer],
+      handler: 'ingest_consumer.lambda_handler',
+      description: 'Drains queued LINE webhook bodies in batches and starts AI workflows',
+      timeout: cdk.Duration.seconds(30),
+      environment: {
+        CONVERSATION_TABLE_NAME: conversationTable.tableName,
+        CHANNEL_SECRET_NAME: secrets.lineChannelSecret.secretName,
+        CHANNEL_ACCESS_TOKEN_NAME: secrets.lineChannelAccessToken.secretName,
+        STEP_FUNCTION_ARN: stateMachine.stateMachineArn,
+        SAMBA_NOVA_API_KEY_NAME: secrets.sambaNovaApiKey.secretName,
+        GROQ_API_KEY_NAME: secrets.groqApiKeySecret.secretName,
+        WEBHOOK_PREFILTER_ENABLED: process.env.WEBHOOK_PREFILTER_ENABLED || 'false',
+        LONG_TERM_MEMORY_ENABLED: process.env.LONG_TERM_MEMORY_ENABLED || 'false',
+        LINE_CHANNELS: process.env.LINE_CHANNELS || '{}',
+      },
+    });
+    secrets.lineChannelSecret.grantRead(ingestConsumerLambda);
+    secrets.lineChannelAccessToken.grantRead(ingestConsumerLambda);
+    this.grantChannelSecrets(ingestConsumerLambda, ['channelSecretName', 'accessTokenName']);
+    this.applyMemoryProfiling(ingestConsumerLambda);
+    conversationTable.grantReadWriteData(ingestConsumerLambda);
+    stateMachine.grantStartExecution(ingestConsumerLambda);
+
+    ingestConsumerLambda.addEventSource(new lambdaEventSources.SqsEventSource(ingestionQueue, {
+      batchSize: 10,
+      maxBatchingWindow: cdk.Duration.seconds(1),
+      reportBatchItemFailures: true,
+    }));
+
+    lambdaFunctions.webhookLambda.addEnvironment('INGESTION_MODE', 'queue');
+    lambdaFunctions.webhookLambda.addEnvironment('INGESTION_QUEUE_URL', ingestionQueue.queueUrl);
+    ingestionQueue.grantSendMessages(lambdaFunctions.webhookLambda);
+  }
+
+  /**
+   * Creates the daily usage counter table and enables accounting in the functions
+   * that call the LLM and Grok APIs
+   */
+  private createUsageAccounting(
+    lambdaFunctions: ReturnType<typeof this.createLambdaFunctions>
+  ): void {
+    const usageTable = new dynamodb.Table(this, 'UsageCounters', {
+      tableName: 'line-bot-usage',
+      partitionKey: { name: 'period', type: dynamodb.AttributeType.STRING },
+      sortKey: { name: 'id', type: dynamodb.AttributeType.STRING },
+      timeToLiveAttribute: 'ttl',
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      removalPolicy: cdk.RemovalPolicy.RETAIN,
+    });
+
+    for (const fn of [lambdaFunctions.aiProcessorLambda, lambdaFunctions.grokProcessorLambda]) {
+      fn.addEnvironment('USAGE_ACCOUNTING_ENABLED', 'true');
+      fn.addEnvironment('USAGE_TABLE_NAME', usageTable.tableName);
+      usageTable.grantWriteData(fn);
+    }
+
+    new cdk.CfnOutput(this, 'UsageTableName', {
+      value: usageTable.tableName,
+      description: 'DynamoDB table name for daily token and cost counters'
+    });
+  }
+
   /**
    * Grants DynamoDB permissions to relevant Lambda functions
    */
@@ -212,6 +362,42 @@ export class LineEchoStack extends cdk.Stack {
     conversationTable.grantReadWriteData(lambdaFunctions.webhookLambda);
     conversationTable.grantReadWriteData(lambdaFunctions.aiProcessorLambda);
     conversationTable.grantReadWriteData(lambdaFunctions.responseSenderLambda);
+    conversationTable.grantReadWriteData(lambdaFunctions.grokProcessorLambda);
+  }
+
+  private readonly liveAliases = new Map<lambda.Function, lambda.Alias>();
+
+  /**
+   * Optional memory profiling (-c memoryProfile=true): handlers log MEMORY_PROFILE
+   * reports with tracemalloc peaks and top allocation sites; tracing starts with the
+   * interpreter so the init phase is covered too
+   */
+  private applyMemoryProfiling(fn: lambda.Function): void {
+    if (this.node.tryGetContext('memoryProfile') !== 'true') {
+      return;
+    }
+    fn.addEnvironment('MEMORY_PROFILE_ENABLED', 'true');
+    fn.addEnvironment('PYTHONTRACEMALLOC', '1');
+  }
+
+  private snapStartEnabled(): boolean {
+    return this.node.tryGetContext('snapStart') === 'true';
+  }
+
+  /**
+   * Returns what callers should invoke: a published-version alias when SnapStart
+   * is enabled (snapshots only exist for versions), otherwise the function itself
+   */
+  private invokeTarget(fn: lambda.Function): lambda.IFunction {
+    if (!this.snapStartEnabled()) {
+      return fn;
+    }
+    let alias = this.liveAliases.get(fn);
+    if (!alias) {
+      alias = fn.addAlias('live');
+      this.liveAliases.set(fn, alias);
+    }
+    return alias;
   }
 
   /**
@@ -221,38 +407,73 @@ export class LineEchoStack extends cdk.Stack {
     lambdaFunctions: ReturnType<typeof this.createLambdaFunctions>
   ): stepfunctions.StateMachine {
     const processAiTask = new stepfunctionsTasks.LambdaInvoke(this, 'ProcessWithSambaNova', {
-      lambdaFunction: lambdaFunctions.aiProcessorLambda,
+      lambdaFunction: this.invokeTarget(lambdaFunctions.aiProcessorLambda),
       resultPath: '$.aiProcessorResult',
       resultSelector: { 'Payload.$': '$.Payload' },
     });
 
+    // The interim push runs beside the search instead of before it. Each branch keeps
+    // only a small result; the Parallel state merges the Grok payload back into the
+    // state where SendFinalResponse reads it, after both branches finished.
     const sendInterimResponseTask = new stepfunctionsTasks.LambdaInvoke(this, 'SendInterimResponse', {
-      lambdaFunction: lambdaFunctions.interimResponseSenderLambda,
+      lambdaFunction: this.invokeTarget(lambdaFunctions.interimResponseSenderLambda),
       inputPath: '$.aiProcessorResult.Payload',
-      resultPath: stepfunctions.JsonPath.DISCARD,
+      resultSelector: { 'StatusCode.$': '$.StatusCode' },
     });
+    // A failed notice must not drop the answer the search is already producing
+    sendInterimResponseTask.addCatch(
+      new stepfunctions.Pass(this, 'InterimResponseFailed', {
+        result: stepfunctions.Result.fromObject({ interimFailed: true }),
+      })
+    );
+
+    const searchAlongsideInterimTask = new stepfunctionsTasks.LambdaInvoke(this, 'ProcessWithGrokAlongsideInterim', {
+      lambdaFunction: this.invokeTarget(lambdaFunctions.grokProcessorLambda),
+      inputPath: '$.aiProcessorResult.Payload',
+      resultSelector: { 'Payload.$': '$.Payload' },
+    });
+
+    const interimAndSearch = new stepfunctions.Parallel(this, 'SendInterimWhileSearching', {
+      resultSelector: { 'Payload.$': '$[1].Payload' },
+      resultPath: '$.grokProcessorResult',
+    })
+      .branch(sendInterimResponseTask)
+      .branch(searchAlongsideInterimTask);
 
     const processWithGrokTask = new stepfunctionsTasks.LambdaInvoke(this, 'ProcessWithGrok', {
-      lambdaFunction: lambdaFunctions.grokProcessorLambda,
+      lambdaFunction: this.invokeTarget(lambdaFunctions.grokProcessorLambda),
       inputPath: '$.aiProcessorResult.Payload',
       resultPath: '$.grokProcessorResult',
       resultSelector: { 'Payload.$': '$.Payload' },
     });
 
     const sendFinalResponseTask = new stepfunctionsTasks.LambdaInvoke(this, 'SendFinalResponse', {
-      lambdaFunction: lambdaFunctions.responseSenderLambda,
+      lambdaFunction: this.invokeTarget(lambdaFunctions.responseSenderLambda),
       inputPath: '$.grokProcessorResult.Payload',
     });
 
     const sendDirectResponseTask = new stepfunctionsTasks.LambdaInvoke(this, 'SendDirectResponse', {
-      lambdaFunction: lambdaFunctions.responseSenderLambda,
+      lambdaFunction: this.invokeTarget(lambdaFunctions.responseSenderLambda),
       inputPath: '$.aiProcessorResult.Payload',
     });
 
+    // Searches predicted fast skip the interim push; the Grok step races a timer instead
+    const interimChoice = new stepfunctions.Choice(this, 'CheckInterimTiming')
+      .when(
+        stepfunctions.Condition.and(
+          stepfunctions.Condition.isPresent('$.aiProcessorResult.Payload.interim'),
+          stepfunctions.Condition.stringEquals('$.aiProcessorResult.Payload.interim', 'deferred')
+        ),
+        processWithGrokTask
+      )
+      .otherwise(interimAndSearch);
+    processWithGrokTask.next(sendFinalResponseTask);
+    interimAndSearch.next(sendFinalResponseTask);
+
     const choice = new stepfunctions.Choice(this, 'CheckForToolCall')
       .when(
         stepfunctions.Condition.booleanEquals('$.aiProcessorResult.Payload.hasToolCall', true),
-        sendInterimResponseTask.next(processWithGrokTask).next(sendFinalResponseTask)
+        interimChoice
       )
       .otherwise(sendDirectResponseTask);
 
@@ -417,4 +417,36 @@ describe('LINE Echo Stack', () => {
       template.resourceCountIs('AWS::SecretsManager::Secret', 0);
     });
   });
+
+  describe('Queued Ingestion Configuration', () => {
+    test('should not create an ingestion queue by default', () => {
+      // Given: A LINE bot stack is created without ingestion context
+      // When: The stack is synthesized
+      // Then: The webhook should process events inline
+      template.resourceCountIs('AWS::SQS::Queue', 0);
+    });
+
+    test('should buffer webhook events through SQS when ingestionMode=queue', () => {
+      // Given: A LINE bot stack is created with queued ingestion
+      const queuedApp = new cdk.App({ context: { ingestionMode: 'queue' } });
+      const queuedTemplate = Template.fromStack(new LineEchoStack(queuedApp, 'QueuedStack'));
+
+      // When: The stack is synthesized
+      // Then: A queue, a dead-letter queue and a batch consumer should be created
+      queuedTemplate.resourceCountIs('AWS::SQS::Queue', 2);
+      queuedTemplate.hasResourceProperties('AWS::Lambda::Function', {
+        Handler: 'ingest_consumer.lambda_handler',
+      });
+      queuedTemplate.hasResourceProperties('AWS::Lambda::EventSourceMapping', {
+        BatchSize: 10,
+        FunctionResponseTypes: ['ReportBatchItemFailures'],
+      });
+      queuedTemplate.hasResourceProperties('AWS::Lambda::Function', {
+        Handler: 'webhook_handler.lambda_handler',
+        Environment: {
+          Variables: Match.objectLike({ INGESTION_MODE: 'queue' }),
+        },
+      });
+    });
+  });
 });
\ No newline at end of file
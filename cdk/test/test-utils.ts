@@ -127,7 +127,9 @@ export class TestDataFactory {
         expectedStates: [
           'ProcessWithSambaNova',
           'CheckForToolCall',
+          'SendInterimWhileSearching',
           'SendInterimResponse',
+          'ProcessWithGrokAlongsideInterim',
           'ProcessWithGrok',
           'SendFinalResponse',
           'SendDirectResponse'
@@ -2,11 +2,26 @@ import json
 import logging
 import os
 import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timezone
 
-import boto3
+import core
+import deadline
+import generation_guard
+import long_term_memory
+import memory_profile
+import model_cascade
 import openai
+import overload
+import payload_codec
 import pytz
+import retry_policy
+import search_latency
+import search_predictor
+import semantic_cache
+import snapstart
+import usage_accounting
 from boto3.dynamodb.conditions import Key
 
 logger = logging.getLogger()
@@ -21,30 +36,13 @@ AI_SELECT = os.environ.get("AI_BACKEND", "groq")  # Options: "groq" or "sambanov
 SAMBANOVA_MODEL = os.environ.get("SAMBANOVA_MODEL", "DeepSeek-V3-0324")
 GROQ_MODEL = os.environ.get("GROQ_MODEL", "openai/gpt-oss-20b")
 
-# AWS clients
-dynamodb = boto3.resource("dynamodb")
-conversation_table = dynamodb.Table(CONVERSATION_TABLE_NAME)
-secretsmanager = boto3.client("secretsmanager")
+# How long to wait for a speculative search once the model has asked for one
+SPECULATIVE_WAIT_S = float(os.environ.get("SPECULATIVE_WAIT_S", "10"))
 
-
-def get_secret(secret_name: str) -> str:
-    """Get secret value from AWS Secrets Manager.
-
-    Args:
-        secret_name: Name of the secret to retrieve
-
-    Returns:
-        The secret value as a string
-
-    Raises:
-        Exception: If secret retrieval fails
-    """
-    try:
-        response = secretsmanager.get_secret_value(SecretId=secret_name)
-        return response["SecretString"]
-    except Exception as e:
-        logger.error(f"Error retrieving secret {secret_name}: {e}")
-        raise
+# Shared AWS clients and secrets (see core.runtime)
+conversation_table = core.table(CONVERSATION_TABLE_NAME)
+get_secret = core.get_secret
+save_conversation_context = core.save_conversation_context
 
 
 # SambaNova client
@@ -63,6 +61,8 @@ def get_sambanova_client() -> openai.OpenAI:
         sambanova_client = openai.OpenAI(
             api_key=sambanova_api_key,
             base_url="https://api.sambanova.ai/v1",
+            # Retries are handled by retry_policy so they respect the deadline budget
+            max_retries=0,
         )
     return sambanova_client
 
@@ -83,10 +83,28 @@ def get_groq_client() -> openai.OpenAI:
         groq_client = openai.OpenAI(
             api_key=groq_api_key,
             base_url="https://api.groq.com/openai/v1",
+            max_retries=0,
         )
     return groq_client
 
 
+@snapstart.before_snapshot
+def drop_llm_clients() -> None:
+    """Keep API keys and open connections out of the SnapStart snapshot."""
+    global sambanova_client, groq_client
+    sambanova_client = groq_client = None
+    if search_predictor.SPECULATIVE_SEARCH_ENABLED:
+        # Speculative search imports grok_processor lazily; load it into the snapshot
+        snapstart.prewarm_imports("grok_processor")
+
+
+@snapstart.after_restore
+def refresh_aws_clients() -> None:
+    """Pick up the conversation table rebuilt by core after a SnapStart restore."""
+    global conversation_table
+    conversation_table = core.table(CONVERSATION_TABLE_NAME)
+
+
 def strip_mentions(text: str) -> str:
     if not text:
         return text
@@ -94,22 +112,78 @@ def strip_mentions(text: str) -> str:
     return re.sub(r"\s+", " ", cleaned).strip()
 
 
-def lambda_handler(event: dict, _context) -> dict:
-    logger.info("AI Processor received event: %s", json.dumps(event, default=str))
+DEADLINE_RESPONSE = "ごめんな〜😅 考えるのに時間かかりすぎてもうたわ！もう一回聞いてもらえる？"
+
+
+@memory_profile.profiled("ai_processor")
+def lambda_handler(event: dict, context) -> dict:
+    logger.info("AI Processor received event: %s", payload_codec.log_dumps(event))
 
     try:
         user_id = event["userId"]
         conversation_context = event["conversationContext"]
 
-        # Get AI response from SambaNova
-        response_payload = get_ai_response(conversation_context["messages"])
+        # Get AI response from SambaNova, bounded by the remaining deadline budget
+        try:
+            timeout = deadline.call_timeout(event, context)
+        except deadline.DeadlineExceeded:
+            event.update({"hasToolCall": False, "aiResponse": DEADLINE_RESPONSE})
+            return event
+        # A newer message has its own execution; do not pay for this one
+        if generation_guard.is_superseded(event, "AiProcessor"):
+            event["hasToolCall"] = False
+            return event
+        usage = usage_accounting.UsageRecorder.for_event(event)
+        try:
+            with overload.admission() as degradation:
+                # Under load the search tool is not offered, so nothing is worth speculating
+                speculation = (
+                    start_speculative_search(conversation_context["messages"], timeout, usage)
+                    if degradation["tools"]
+                    else None
+                )
+                memories = (
+                    long_term_memory.recall(conversation_context)
+                    if degradation["maxContextMessages"] is None
+                    else []
+                )
+                with memory_profile.stage("llm"):
+                    response_payload = get_ai_response(
+                        conversation_context["messages"],
+                        timeout=timeout,
+                        usage=usage,
+                        memories=memories,
+                        degradation=degradation,
+                    )
+        finally:
+            if usage is not None:
+                usage.flush()
+        if speculation is not None:
+            # The LLM call already used part of the budget; only wait for what is left
+            remaining = deadline.remaining_ms(event, context)
+            response_payload = resolve_speculative_search(
+                speculation, response_payload, None if remaining is None else remaining / 1000
+            )
 
         # Merge the original event with the new response payload
         # This ensures we pass through all necessary info like userId, sourceType, quote_token, etc.
         event.update(response_payload)
 
-        # If it's a normal response, add it to the conversation history now
-        if not event.get("hasToolCall"):
+        # Check again before the interim push and the Grok search
+        if event.get("hasToolCall") and generation_guard.is_superseded(event, "AiProcessor"):
+            event["hasToolCall"] = False
+            return event
+        if event.get("hasToolCall") and search_latency.ADAPTIVE_INTERIM_ENABLED:
+            # Fast searches skip SendInterimResponse; grok_processor races a timer instead
+            import grok_processor
+
+            event[search_latency.INTERIM_KEY] = search_latency.predict_interim(
+                grok_processor.get_tool_queries(event)
+            )
+
+        # If it's a normal response, add it to the conversation history now.
+        # Canned overload replies are not part of the conversation.
+        if not event.get("hasToolCall") and not event.get("overloaded"):
             ai_response = event.get("aiResponse")
             conversation_context["messages"].append(
                 {
@@ -119,7 +193,15 @@ def lambda_handler(event: dict, _context) -> dict:
                 }
             )
             # No need to clean up here, can be done after final response
-            save_conversation_context(user_id, conversation_context)
+            try:
+                save_conversation_context(
+                    user_id,
+                    conversation_context,
+                    generation=generation_guard.event_generation(event),
+                )
+            except core.GenerationSuperseded:
+                # The newer execution answers; this reply would be stale
+                event[generation_guard.SUPERSEDED_KEY] = True
 
         return event
 
@@ -131,26 +213,194 @@ def lambda_handler(event: dict, _context) -> dict:
         return event
 
 
-def get_ai_response(messages: list) -> dict:
+# Speculative Grok searches run here while the main LLM decides on tool use
+_speculation_executor = ThreadPoolExecutor(max_workers=2)
+
+
+def start_speculative_search(
+    messages: list, timeout: float | None, usage: usage_accounting.UsageRecorder | None = None
+) -> dict | None:
+    """Start a Grok search early if the latest message looks time-sensitive.
+
+    Args:
+        messages: List of conversation messages
+        timeout: Remaining call budget in seconds
+        usage: Recorder for the search's tokens and cost (None if accounting is off)
+
+    Returns:
+        Speculation state for resolve_speculative_search, or None if speculation is disabled
+    """
+    if not search_predictor.SPECULATIVE_SEARCH_ENABLED or not messages:
+        return None
+    text = strip_mentions(messages[-1].get("content", ""))
+    speculation: dict = {"predicted": False, "future": None, "startedAt": time.monotonic()}
+    if messages[-1].get("role") == "user" and search_predictor.predict_search(text):
+        # Imported lazily so webhook_handler (which imports this module) stays light
+        import grok_processor
+
+        speculation["predicted"] = True
+        speculation["future"] = _speculation_executor.submit(
+            grok_processor.search_with_grok, text, None, timeout, usage
+        )
+    return speculation
+
+
+def resolve_speculative_search(
+    speculation: dict, response_payload: dict, remaining_s: float | None
+) -> dict:
+    """Use or drop a speculative search depending on the model's decision.
+
+    If the model asked for search_with_grok and the speculative result arrives
+    in time, it is returned as a direct response so the interim and Grok
+    workflow steps are skipped. Otherwise the payload is returned unchanged.
+    There is no wait at all when less than the minimum call time is left.
+
+    Args:
+        speculation: State returned by start_speculative_search
+        response_payload: Result of get_ai_response
+        remaining_s: Budget left after the LLM call in seconds (None if unknown)
+
+    Returns:
+        The response payload to continue the workflow with
+    """
+    future: Future | None = speculation["future"]
+    tool_called = bool(response_payload.get("hasToolCall"))
+    result = None
+    if future is not None and tool_called:
+        wait_s = SPECULATIVE_WAIT_S if remaining_s is None else min(SPECULATIVE_WAIT_S, remaining_s)
+        if wait_s * 1000 >= deadline.MIN_CALL_TIMEOUT_MS or future.done():
+            try:
+                result = future.result(timeout=max(wait_s, 0))
+            except Exception as e:
+                logger.info(f"Speculative search not usable: {e!r}")
+        else:
+            logger.info(f"No budget left to wait for the speculative search ({remaining_s}s)")
+    if future is not None and not result and not future.cancel() and not future.done():
+        # A running search cannot be interrupted; its cost is spent without being used
+        logger.warning(
+            "Speculative search left running in the background after "
+            f"{time.monotonic() - speculation['startedAt']:.1f}s (wasted spend)"
+        )
+
+    search_predictor.record_outcome(
+        speculation["predicted"],
+        tool_called,
+        used=bool(result),
+        search_seconds=time.monotonic() - speculation["startedAt"],
+    )
+    if result:
+        return {"hasToolCall": False, "aiResponse": result, "speculativeSearch": True}
+    return response_payload
+
+
+def call_model_tier(
+    tier: str,
+    api_messages: list,
+    tools: list,
+    timeout: float | None,
+    reason: str,
+    usage: usage_accounting.UsageRecorder | None = None,
+    degradation: dict | None = None,
+) -> tuple:
+    """Call the configured backend with the model settings of one cascade tier.
+
+    Args:
+        tier: model_cascade.FAST_TIER or model_cascade.STRONG_TIER
+        api_messages: Messages prepared for the API
+        tools: Tool definitions (empty to offer none)
+        timeout: Request timeout in seconds (None uses the client default)
+        reason: Routing reason, for logging
+        usage: Recorder for the call's tokens and cost (None if accounting is off)
+        degradation: Overload settings capping max_tokens and reasoning effort
+
+    Returns:
+        Tuple of (response message, finish reason)
+    """
+    fast = tier == model_cascade.FAST_TIER
+    max_tokens = model_cascade.FAST_MAX_TOKENS if fast else 1000
+    reasoning_effort = "low" if fast else "medium"
+    if degradation and degradation["maxTokens"]:
+        max_tokens = min(max_tokens, degradation["maxTokens"])
+    if degradation and degradation["reasoningEffort"]:
+        reasoning_effort = degradation["reasoningEffort"]
+    tool_options = {"tools": tools, "tool_choice": "auto"} if tools else {}
+    started = time.monotonic()
+    if AI_SELECT == "sambanova":
+        model = model_cascade.SAMBANOVA_FAST_MODEL if fast else SAMBANOVA_MODEL
+        response = get_sambanova_client().chat.completions.create(  # type: ignore[call-overload]
+            model=model,
+            messages=api_messages,
+            temperature=0.7,
+            max_tokens=max_tokens,
+            timeout=timeout,
+            **tool_options,
+        )
+    else:
+        model = model_cascade.GROQ_FAST_MODEL if fast else GROQ_MODEL
+        response = get_groq_client().chat.completions.create(  # type: ignore[call-overload]
+            model=model,
+            reasoning_effort=reasoning_effort,
+            messages=api_messages,
+            temperature=0.7,
+            max_tokens=max_tokens,
+            timeout=timeout,
+            **tool_options,
+        )
+    model_cascade.record_call(
+        tier, model, time.monotonic() - started, getattr(response, "usage", None), reason
+    )
+    if usage is not None:
+        usage.add(usage_accounting.from_completion(AI_SELECT, model, response.usage))
+    choice = response.choices[0]
+    return choice.message, getattr(choice, "finish_reason", None)
+
+
+def get_ai_response(
+    messages: list,
+    timeout: float | None = None,
+    usage: usage_accounting.UsageRecorder | None = None,
+    memories: list[str] | None = None,
+    degradation: dict | None = None,
+) -> dict:
     """Determines if a tool call is needed or returns a direct response.
 
     Args:
         messages: List of conversation messages
+        timeout: Request timeout in seconds (None uses the client default)
+        usage: Recorder for token usage and cost (None if accounting is off)
+        memories: Snippets of earlier conversations to remind the model of
+        degradation: Overload settings (see overload.degradation; None is normal)
 
     Returns:
         Dict containing either tool call info or direct AI response
     """
     try:
         backend_name = "SambaNova" if AI_SELECT == "sambanova" else "Groq"
+
+        # Short first-turn questions may be answered from the warm-container semantic cache.
+        # Answers shaped by a user's memories are never shared.
+        cache = semantic_cache.response_cache
+        question = semantic_cache.cacheable_question(messages) if cache and not memories else None
+        cached = cache.lookup(question) if cache and question else None
+        if cache and cached and not cache.should_audit():
+            logger.info(f"Answered from semantic cache (hitRate={cache.hit_rate():.2f})")
+            return {"hasToolCall": False, "aiResponse": cached[1], "cacheHit": True}
+
+        degradation = degradation or overload.degradation(overload.NORMAL)
+        if degradation["canned"]:
+            return {"hasToolCall": False, "aiResponse": overload.CANNED_REPLY, "overloaded": True}
+        if degradation["maxContextMessages"]:
+            messages = messages[-degradation["maxContextMessages"] :]
+
         logger.info(f"Calling {backend_name} API with {len(messages)} messages")
-        api_messages = prepare_messages_for_api(messages)
+        api_messages = prepare_messages_for_api(messages, memories)
 
         tools = [
             {
                 "type": "function",
                 "function": {
                     "name": "search_with_grok",
-                    "description": "リアルタイムのWeb情報が必要な、専門的または複雑な質問に答えるために使用します。",
+                    "description": "リアルタイムのWeb情報が必要な、専門的または複雑な質問に答えるために使用します。複数の話題を調べる場合は話題ごとに呼び出してください。",
                     "parameters": {
                         "type": "object",
                         "properties": {
@@ -165,48 +415,84 @@ def get_ai_response(messages: list) -> dict:
                 },
             }
         ]
-
-        if AI_SELECT == "sambanova":
-            response = get_sambanova_client().chat.completions.create(  # type: ignore[call-overload]
-                model=SAMBANOVA_MODEL,
-                messages=api_messages,
-                temperature=0.7,
-                max_tokens=1000,
-                tools=tools,
-                tool_choice="auto",
-            )
-        else:
-            response = get_groq_client().chat.completions.create(  # type: ignore[call-overload]
-                model=GROQ_MODEL,
-                reasoning_effort="medium",
-                messages=api_messages,
-                temperature=0.7,
-                max_tokens=1000,
-                tools=tools,
-                tool_choice="auto",
-            )
-
-        message = response.choices[0].message
+        if not degradation["tools"]:
+            tools = []
+
+        # Short casual turns try the fast tier first and escalate if the self-check fails
+        tier, reason = model_cascade.choose_tier(messages)
+        started = time.monotonic()
+        message, finish_reason = retry_policy.default_policy.call(
+            lambda t: call_model_tier(tier, api_messages, tools, t, reason, usage, degradation),
+            timeout,
+            f"{backend_name} {tier} tier",
+        )
+        # Degraded turns keep the fast-tier answer instead of paying for a second call
+        if (
+            tier == model_cascade.FAST_TIER
+            and not message.tool_calls
+            and degradation["level"] < overload.SHORT_ANSWERS
+        ):
+            escalation = model_cascade.escalation_reason(message.content, finish_reason)
+            if escalation:
+                model_cascade.record_escalation(escalation)
+                remaining = None if timeout is None else timeout - (time.monotonic() - started)
+                if remaining is None or remaining * 1000 >= deadline.MIN_CALL_TIMEOUT_MS:
+                    message, _ = retry_policy.default_policy.call(
+                        lambda t: call_model_tier(
+                            model_cascade.STRONG_TIER,
+                            api_messages,
+                            tools,
+                            t,
+                            escalation,
+                            usage,
+                            degradation,
+                        ),
+                        remaining,
+                        f"{backend_name} escalation",
+                    )
+                elif escalation in ("empty", "truncated"):
+                    # An unsure answer is still worth sending; an empty or cut-off one is not
+                    logger.warning(f"No budget left to escalate a {escalation} fast-tier answer")
+                    return {"hasToolCall": False, "aiResponse": DEADLINE_RESPONSE}
+                else:
+                    logger.info(f"No budget left to escalate; keeping the {escalation} answer")
 
         if message.tool_calls:
-            tool_call = message.tool_calls[0]
-            if tool_call.function.name == "search_with_grok":
-                query = json.loads(tool_call.function.arguments).get("query")
-                prompt = json.loads(tool_call.function.arguments).get("prompt", "")
+            # The model may ask for several searches at once; grok_processor runs them in parallel
+            tool_queries = []
+            for tool_call in message.tool_calls:
+                if tool_call.function.name != "search_with_grok":
+                    continue
+                arguments = json.loads(tool_call.function.arguments)
+                query = arguments.get("query")
+                if not query:
+                    continue
+                tool_queries.append({"query": query, "prompt": arguments.get("prompt", "")})
                 logger.info(
                     f"{backend_name} suggested tool call: search_with_grok with query: {query}"
                 )
+            if tool_queries:
+                if cache and cached:
+                    cache.record_audit(cached[0], cached[1], None)
                 return {
                     "hasToolCall": True,
                     "toolName": "search_with_grok",
-                    "toolQuery": query,
-                    "toolPrompt": prompt,
+                    "toolQuery": tool_queries[0]["query"],
+                    "toolPrompt": tool_queries[0]["prompt"],
+                    "toolQueries": tool_queries,
                 }
 
         ai_response = message.content
+        if cache and cached:
+            cache.record_audit(cached[0], cached[1], ai_response)
+        elif cache and question and ai_response:
+            cache.store(question, ai_response)
         logger.info(f"{backend_name} API response received: {ai_response}")
         return {"hasToolCall": False, "aiResponse": ai_response}
 
+    except openai.APITimeoutError as e:
+        logger.error(f"{AI_SELECT} API call timed out after {timeout}s: {e}")
+        return {"hasToolCall": False, "aiResponse": DEADLINE_RESPONSE}
     except Exception as e:
         logger.error(f"Error calling SambaNova API: {e}")
         return {
@@ -272,11 +558,12 @@ def get_season(month: int) -> str:
     return "秋"
 
 
-def prepare_messages_for_api(messages: list) -> list:
+def prepare_messages_for_api(messages: list, memories: list[str] | None = None) -> list:
     """Prepare messages for SambaNova API with system prompt.
 
     Args:
         messages: List of conversation messages
+        memories: Snippets of earlier conversations (see long_term_memory.recall)
 
     Returns:
         List of messages formatted for API with system prompt
@@ -313,6 +600,14 @@ def prepare_messages_for_api(messages: list) -> list:
 
 日本語で話しかけられたら関西弁で返答し、英語など他の言語で話しかけられたらその言語で返答してください。
 ただし、関西弁の温かみと親しみやすさを常に保ってください。
+"""
+    if memories:
+        remembered = "\n".join(f"- {snippet}" for snippet in memories)
+        system_prompt += f"""
+以前の会話の記憶（今の話題に関係ありそうなものだけ）：
+{remembered}
+
+話の流れに合うときだけ自然に触れてください。記憶にないことは覚えているふりをしないでください。
 """
     api_messages = [{"role": "system", "content": system_prompt}]
     for msg in messages:
@@ -320,22 +615,6 @@ def prepare_messages_for_api(messages: list) -> list:
     return api_messages
 
 
-def save_conversation_context(user_id: str, conversation_context: dict) -> None:
-    """Save conversation context to DynamoDB.
-
-    Args:
-        user_id: User ID for the conversation
-        conversation_context: Conversation data to save
-    """
-    try:
-        conversation_context["lastActivity"] = datetime.now(timezone.utc).isoformat()
-        conversation_table.put_item(Item=conversation_context)
-        logger.info(f"Saved conversation context for user {user_id}")
-    except Exception as e:
-        logger.error(f"Error saving conversation context: {e}")
-        raise
-
-
 def delete_conversation_history(user_id: str) -> bool:
     """Delete all conversation history for a given user.
 
@@ -354,6 +633,7 @@ def delete_conversation_history(user_id: str) -> bool:
             for item in response["Items"]:
                 batch.delete_item(Key={"userId": str(item["userId"])})
 
+        long_term_memory.forget(user_id)
         logger.info(f"Deleted conversation history for user {user_id}")
         return True
     except Exception as e:
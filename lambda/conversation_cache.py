@@ -0,0 +1,75 @@
+import copy
+import logging
+import os
+from collections import OrderedDict
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables (the cache is opt-in)
+CONVERSATION_CACHE_ENABLED = os.environ.get("CONVERSATION_CACHE_ENABLED", "false").lower() == "true"
+CONVERSATION_CACHE_MAX_ENTRIES = int(os.environ.get("CONVERSATION_CACHE_MAX_ENTRIES", "512"))
+
+
+class ConversationCache:
+    """Warm-container LRU of the conversations this container last wrote.
+
+    Entries are never trusted blindly: the webhook compares an entry's version
+    with a projected read of the stored one before using it. A valid hit
+    fetches a few bytes instead of the whole transcript and skips
+    decompressing it; a stale one (any other stage wrote since, e.g. the
+    reply of the previous turn) costs that small read on top of the normal
+    full read. The cache only pays off when users send several messages
+    before the bot answers.
+    """
+
+    def __init__(self, max_entries: int = CONVERSATION_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+
+    def get(self, user_id: str) -> dict | None:
+        """Get a private copy of the cached conversation for a user.
+
+        Args:
+            user_id: LINE user ID
+
+        Returns:
+            Conversation context, or None if not cached
+        """
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.stats["hits"] += 1
+        return copy.deepcopy(entry)
+
+    def put(self, conversation_context: dict) -> None:
+        """Cache a copy of a conversation that was just written.
+
+        Args:
+            conversation_context: Saved conversation context (with its new version)
+        """
+        user_id = conversation_context["userId"]
+        self._entries[user_id] = copy.deepcopy(conversation_context)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def record_stale(self, user_id: str) -> None:
+        """Count a cached entry found outdated by its stored version and drop it."""
+        self.stats["stale"] += 1
+        self._entries.pop(user_id, None)
+        logger.info(f"Conversation cache entry for {user_id} was stale ({self.stats})")
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop a user's entry, e.g. after their history was deleted."""
+        self._entries.pop(user_id, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+conversations = ConversationCache() if CONVERSATION_CACHE_ENABLED else None
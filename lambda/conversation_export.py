@@ -0,0 +1,374 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from datetime import datetime
+from decimal import Decimal
+from typing import Any
+
+import transcript_codec
+from rate_limiter import TokenBucket
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional; exports fall back to chunked JSONL
+    pyarrow = None
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Key prefixes of non-conversation items (rate limits, search latency) in the conversation table
+AUXILIARY_KEY_PREFIXES = ("ratelimit#", "latency#", "memory#", "overload#")
+
+# Columns of the per-conversation analytics rows, in output order
+CONVERSATION_COLUMNS = [
+    "userId",
+    "messageCount",
+    "userMessages",
+    "assistantMessages",
+    "userChars",
+    "assistantChars",
+    "transcriptBytes",
+    "firstMessageAt",
+    "lastActivity",
+    "sessionSpanS",
+    "meanGapS",
+    "maxGapS",
+    "compressed",
+]
+
+_DONE = object()
+
+
+class SegmentThrottle:
+    """Keeps one scan segment under a read-capacity budget.
+
+    Consumed capacity is taken from a TokenBucket after every page; when the
+    bucket goes into debt the segment sleeps until it is paid back, so a
+    parallel export never exceeds ``segments * rcu_per_second``.
+    """
+
+    def __init__(
+        self,
+        rcu_per_second: float,
+        sleep: Callable[[float], None] = time.sleep,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.bucket = TokenBucket(rcu_per_second, rcu_per_second, updated_at=clock())
+        self.sleep = sleep
+        self.clock = clock
+        self.waited_s = 0.0
+
+    def consume(self, capacity_units: float) -> None:
+        """Charge the capacity of one page and wait if the budget is exceeded."""
+        self.bucket.refill(self.clock())
+        self.bucket.tokens -= capacity_units
+        if self.bucket.tokens < 0:
+            wait = -self.bucket.tokens / self.bucket.refill_per_second
+            self.waited_s += wait
+            self.sleep(wait)
+
+
+def scan_segment(
+    table: Any, segment: int, total_segments: int, throttle: SegmentThrottle, page_size: int
+) -> Iterator[list[dict]]:
+    """Page through one segment of a parallel Scan.
+
+    Args:
+        table: boto3 DynamoDB Table
+        segment: Segment number (0-based)
+        total_segments: Number of segments of the scan
+        throttle: Per-segment capacity budget
+        page_size: Items per Scan request
+
+    Yields:
+        Pages of items
+    """
+    request: dict = {
+        "Segment": segment,
+        "TotalSegments": total_segments,
+        "Limit": page_size,
+        "ReturnConsumedCapacity": "TOTAL",
+    }
+    while True:
+        response = table.scan(**request)
+        yield response.get("Items", [])
+        throttle.consume(float(response.get("ConsumedCapacity", {}).get("CapacityUnits", 0)))
+        if "LastEvaluatedKey" not in response:
+            return
+        request["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def parallel_scan(
+    table: Any,
+    segments: int = 4,
+    rcu_per_segment: float = 25.0,
+    page_size: int = 500,
+    max_pages_buffered: int | None = None,
+    throttle_factory: Callable[[float], SegmentThrottle] = SegmentThrottle,
+) -> Iterator[dict]:
+    """Scan a table with one worker thread per segment and stream the items.
+
+    Pages go through a bounded queue, so at most ``max_pages_buffered`` pages
+    (default: two per segment) are held in memory whatever the table size.
+    A failing segment stops the scan and its error is raised to the caller.
+
+    Args:
+        table: boto3 DynamoDB Table
+        segments: Number of scan segments and worker threads
+        rcu_per_segment: Read capacity units per second each segment may use
+        page_size: Items per Scan request
+        max_pages_buffered: Bound of the page queue
+        throttle_factory: Builds the per-segment throttle from rcu_per_segment
+
+    Yields:
+        Items in no particular order
+    """
+    pages: queue.Queue = queue.Queue(maxsize=max_pages_buffered or 2 * segments)
+    stop = threading.Event()
+
+    def put(value) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def work(segment: int) -> None:
+        throttle = throttle_factory(rcu_per_segment)
+        scanned = 0
+        try:
+            for page in scan_segment(table, segment, segments, throttle, page_size):
+                scanned += len(page)
+                if not put(page):
+                    return
+            logger.info(
+                f"Segment {segment}/{segments}: {scanned} items, throttled {throttle.waited_s:.1f}s"
+            )
+            put(_DONE)
+        except Exception as e:
+            put(e)
+
+    threads = [
+        threading.Thread(target=work, args=(segment,), name=f"scan-{segment}", daemon=True)
+        for segment in range(segments)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        remaining = segments
+        while remaining:
+            page = pages.get()
+            if page is _DONE:
+                remaining -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield from page
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def _epoch_s(timestamp: str | None) -> float | None:
+    if not timestamp:
+        return None
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except ValueError:
+        return None
+
+
+def conversation_row(item: dict) -> dict | None:
+    """Summarize one stored conversation for analytics.
+
+    Args:
+        item: Item from the conversation table (compressed or legacy transcript)
+
+    Returns:
+        Row with CONVERSATION_COLUMNS, or None for rate-limit and other non-conversation items
+    """
+    user_id = item.get("userId", "")
+    if user_id.startswith(AUXILIARY_KEY_PREFIXES):
+        return None
+    compressed = transcript_codec.BINARY_ATTRIBUTE in item
+    if compressed:
+        blob = item[transcript_codec.BINARY_ATTRIBUTE]
+        transcript_bytes = len(bytes(getattr(blob, "value", blob)))
+    elif "messages" in item:
+        transcript_bytes = len(json.dumps(item["messages"], ensure_ascii=False, default=str))
+    else:
+        return None
+    messages = transcript_codec.unpack_item(item).get("messages", [])
+
+    times = [t for t in (_epoch_s(m.get("timestamp")) for m in messages) if t is not None]
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    by_role = {"user": [0, 0], "assistant": [0, 0]}
+    for message in messages:
+        counts = by_role.get(message.get("role"))
+        if counts is not None:
+            counts[0] += 1
+            counts[1] += len(message.get("content") or "")
+    return {
+        "userId": user_id,
+        "messageCount": len(messages),
+        "userMessages": by_role["user"][0],
+        "assistantMessages": by_role["assistant"][0],
+        "userChars": by_role["user"][1],
+        "assistantChars": by_role["assistant"][1],
+        "transcriptBytes": transcript_bytes,
+        "firstMessageAt": times[0] if times else None,
+        "lastActivity": _epoch_s(item.get("lastActivity")),
+        "sessionSpanS": times[-1] - times[0] if times else None,
+        "meanGapS": sum(gaps) / len(gaps) if gaps else None,
+        "maxGapS": max(gaps) if gaps else None,
+        "compressed": compressed,
+    }
+
+
+def flat_row(item: dict) -> dict:
+    """Keep the scalar attributes of any item, with Decimals as numbers.
+
+    Used for tables other than the conversation table (e.g. the usage counters).
+    """
+    row = {}
+    for key, value in item.items():
+        if isinstance(value, Decimal):
+            row[key] = int(value) if value == value.to_integral_value() else float(value)
+        elif isinstance(value, (str, int, float, bool)) or value is None:
+            row[key] = value
+    return row
+
+
+def batched(rows: Iterable[dict], size: int) -> Iterator[list[dict]]:
+    """Group rows into lists of at most ``size``."""
+    batch: list[dict] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def to_columns(batch: list[dict], columns: list[str] | None = None) -> dict[str, list]:
+    """Turn a batch of rows into column lists (missing values become None)."""
+    if columns is None:
+        columns = list(dict.fromkeys(key for row in batch for key in row))
+    return {column: [row.get(column) for row in batch] for column in columns}
+
+
+class JsonlBatchWriter:
+    """Writes each batch to its own ``part-NNNNN.jsonl`` file of flat rows.
+
+    Flat scalar rows load directly with ``numpy.genfromtxt``-style tooling or
+    pandas.read_json(lines=True), and chunking keeps every file small.
+    """
+
+    suffix = "jsonl"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.files: list[str] = []
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, columns: dict[str, list]) -> None:
+        path = os.path.join(self.directory, f"part-{len(self.files):05d}.{self.suffix}")
+        names = list(columns)
+        with open(path, "w", encoding="utf-8") as f:
+            for values in zip(*columns.values(), strict=True):
+                f.write(json.dumps(dict(zip(names, values)), ensure_ascii=False) + "\n")
+        self.files.append(path)
+
+    def close(self) -> None:
+        pass
+
+
+class ParquetBatchWriter(JsonlBatchWriter):
+    """Writes each batch as one row group of ``part-00000.parquet``."""
+
+    suffix = "parquet"
+
+    def __init__(self, directory: str):
+        super().__init__(directory)
+        self.writer = None
+        self.schema = None
+
+    def write(self, columns: dict[str, list]) -> None:
+        if self.schema is not None:
+            # Parquet has one schema per file; columns first seen later are dropped
+            rows = len(next(iter(columns.values()), []))
+            columns = {name: columns.get(name, [None] * rows) for name in self.schema.names}
+        table = pyarrow.table(columns, schema=self.schema)
+        if self.writer is None:
+            self.schema = table.schema
+            path = os.path.join(self.directory, f"part-00000.{self.suffix}")
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+            self.files.append(path)
+        self.writer.write_table(table)
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+
+def make_writer(directory: str, output_format: str = "auto") -> JsonlBatchWriter:
+    """Pick the batch writer: Parquet when pyarrow is installed, else chunked JSONL.
+
+    Args:
+        directory: Output directory
+        output_format: "auto", "parquet" or "jsonl"
+
+    Raises:
+        RuntimeError: If Parquet is requested without pyarrow
+    """
+    if output_format == "parquet" and pyarrow is None:
+        raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)")
+    if output_format == "parquet" or (output_format == "auto" and pyarrow is not None):
+        return ParquetBatchWriter(directory)
+    return JsonlBatchWriter(directory)
+
+
+def export(
+    items: Iterable[dict],
+    writer: JsonlBatchWriter,
+    to_row: Callable[[dict], dict | None] = conversation_row,
+    batch_size: int = 5000,
+    columns: list[str] | None = CONVERSATION_COLUMNS,
+) -> dict:
+    """Run the generator pipeline: items -> rows -> batches -> columnar files.
+
+    Args:
+        items: Item stream, usually from parallel_scan
+        writer: Batch writer from make_writer
+        to_row: Row builder; rows it returns None for are skipped
+        batch_size: Rows per written batch
+        columns: Fixed column order (None: columns seen in each batch)
+
+    Returns:
+        Dict with the number of items read, rows written and output files
+    """
+    stats = {"items": 0, "rows": 0}
+
+    def rows() -> Iterator[dict]:
+        for item in items:
+            stats["items"] += 1
+            row = to_row(item)
+            if row is not None:
+                yield row
+
+    try:
+        for batch in batched(rows(), batch_size):
+            writer.write(to_columns(batch, columns))
+            stats["rows"] += len(batch)
+    finally:
+        writer.close()
+    return {**stats, "files": writer.files}
@@ -0,0 +1,53 @@
+"""Shared runtime for every Lambda handler: one registry of clients, secrets and LINE config."""
+
+from core.channels import (
+    DEFAULT_CHANNEL,
+    ChannelCache,
+    channel_configuration,
+    channel_secret_name,
+    resolve_channel,
+)
+from core.conversations import (
+    GenerationSuperseded,
+    conversation_table,
+    new_version,
+    save_conversation_context,
+    save_if_version,
+    stored_generation,
+    stored_version,
+)
+from core.line import send_line_message
+from core.runtime import (
+    Registry,
+    client,
+    get_json_secret,
+    get_secret,
+    line_configuration,
+    registry,
+    resource,
+    table,
+)
+
+__all__ = [
+    "DEFAULT_CHANNEL",
+    "ChannelCache",
+    "GenerationSuperseded",
+    "Registry",
+    "channel_configuration",
+    "channel_secret_name",
+    "client",
+    "conversation_table",
+    "get_json_secret",
+    "get_secret",
+    "line_configuration",
+    "new_version",
+    "registry",
+    "resolve_channel",
+    "resource",
+    "save_conversation_context",
+    "save_if_version",
+    "send_line_message",
+    "stored_generation",
+    "stored_version",
+    "table",
+]
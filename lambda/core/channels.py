@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Any
+
+import snapstart
+
+from core.runtime import get_secret, line_configuration
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Channels served besides the stack's own, keyed by bot user ID (the webhook "destination"):
+# {"U0123...": {"channelSecretName": "...", "accessTokenName": "..."}}
+LINE_CHANNELS: dict[str, dict[str, str]] = json.loads(os.environ.get("LINE_CHANNELS", "{}"))
+# Per-channel LINE objects kept warm in one container
+CHANNEL_CACHE_SIZE = int(os.environ.get("CHANNEL_CACHE_SIZE", "32"))
+
+# The channel named by CHANNEL_SECRET_NAME / CHANNEL_ACCESS_TOKEN_NAME
+DEFAULT_CHANNEL = "default"
+
+
+def resolve_channel(destination: str | None) -> str:
+    """Map a webhook destination (bot user ID) to a channel ID.
+
+    Args:
+        destination: "destination" of the webhook body
+
+    Returns:
+        The destination if it is a configured channel, otherwise DEFAULT_CHANNEL
+    """
+    if destination and destination in LINE_CHANNELS:
+        return destination
+    return DEFAULT_CHANNEL
+
+
+def is_default(channel_id: str | None) -> bool:
+    """Whether a channel ID (None in payloads from older webhooks) is the stack's own."""
+    return channel_id in (None, DEFAULT_CHANNEL)
+
+
+def channel_secret_name(channel_id: str | None) -> str:
+    """Secrets Manager name of a channel's secret."""
+    if is_default(channel_id):
+        return os.environ["CHANNEL_SECRET_NAME"]
+    return LINE_CHANNELS[channel_id]["channelSecretName"]  # type: ignore[index]
+
+
+def access_token_name(channel_id: str | None) -> str:
+    """Secrets Manager name of a channel's access token."""
+    if is_default(channel_id):
+        return os.environ["CHANNEL_ACCESS_TOKEN_NAME"]
+    return LINE_CHANNELS[channel_id]["accessTokenName"]  # type: ignore[index]
+
+
+class ChannelCache:
+    """Thread-safe LRU of per-channel objects built on first use.
+
+    Each container keeps at most ``max_entries`` channels warm; a channel
+    evicted here is rebuilt (secret lookup included) the next time one of its
+    webhooks or pushes arrives.
+    """
+
+    def __init__(self, build: Callable[[str], Any], max_entries: int = CHANNEL_CACHE_SIZE):
+        self.build = build
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, Any] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, channel_id: str) -> Any:
+        """Get the object for a channel, building it if needed.
+
+        Args:
+            channel_id: Channel ID from resolve_channel
+
+        Returns:
+            The cached object
+        """
+        with self._lock:
+            entry = self._entries.get(channel_id)
+            if entry is not None:
+                self._entries.move_to_end(channel_id)
+                self.stats["hits"] += 1
+                return entry
+        # Built outside the lock: a secret lookup must not block other channels
+        entry = self.build(channel_id)
+        with self._lock:
+            self.stats["misses"] += 1
+            entry = self._entries.setdefault(channel_id, entry)
+            self._entries.move_to_end(channel_id)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+                logger.info(f"Evicted LINE channel {evicted} ({self.stats})")
+        return entry
+
+    def clear(self) -> None:
+        """Forget every channel."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _build_configuration(channel_id: str) -> Any:
+    from linebot.v3.messaging import Configuration
+
+    return Configuration(access_token=get_secret(access_token_name(channel_id)))
+
+
+configurations = ChannelCache(_build_configuration)
+
+
+def channel_configuration(channel_id: str | None = None) -> Any:
+    """Get the LINE Messaging API configuration of a channel.
+
+    Args:
+        channel_id: Channel ID from the workflow payload (None for the default channel)
+
+    Returns:
+        Configuration with the channel's access token
+    """
+    if is_default(channel_id):
+        return line_configuration()
+    return configurations.get(channel_id)  # type: ignore[arg-type]
+
+
+@snapstart.before_snapshot
+def drop_channels() -> None:
+    """Keep other channels' tokens out of the SnapStart snapshot; they are rebuilt lazily."""
+    configurations.clear()
@@ -0,0 +1,147 @@
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Any
+
+import transcript_codec
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+from core.runtime import table
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class GenerationSuperseded(Exception):
+    """A newer user message replaced the generation a write belonged to."""
+
+
+def conversation_table() -> Any:
+    """Get the shared conversation history table (CONVERSATION_TABLE_NAME)."""
+    return table(os.environ.get("CONVERSATION_TABLE_NAME", ""))
+
+
+def new_version() -> str:
+    """Generate a fresh version tag; every write of a conversation sets a new one."""
+    return uuid.uuid4().hex
+
+
+def stored_generation(user_id: str) -> str | None:
+    """Read the generation token of the stored conversation.
+
+    Args:
+        user_id: User ID for the conversation
+
+    Returns:
+        The generation set by the latest user message, or None if there is none
+    """
+    response = conversation_table().get_item(
+        Key={"userId": user_id}, ProjectionExpression="generation", ConsistentRead=True
+    )
+    return response.get("Item", {}).get("generation")
+
+
+def stored_version(user_id: str) -> str | None:
+    """Read only the version of the stored conversation.
+
+    The projection keeps the response to a few bytes instead of the whole
+    compressed transcript (the read is still billed by item size).
+
+    Args:
+        user_id: User ID for the conversation
+
+    Returns:
+        The version stamped by the latest writer, or None if there is no item
+    """
+    response = conversation_table().get_item(
+        Key={"userId": user_id}, ProjectionExpression="version"
+    )
+    return response.get("Item", {}).get("version")
+
+
+def save_conversation_context(
+    user_id: str,
+    conversation_context: dict,
+    max_messages: int | None = None,
+    generation: str | None = None,
+) -> None:
+    """Save conversation context to DynamoDB.
+
+    Args:
+        user_id: User ID for the conversation
+        conversation_context: Conversation data to save
+        max_messages: Keep only this many of the latest messages (None keeps all)
+        generation: Only save while the stored item still has this generation token
+
+    Raises:
+        GenerationSuperseded: If a newer user message has been stored meanwhile
+        Exception: If the write fails
+    """
+    try:
+        messages = conversation_context["messages"]
+        if max_messages is not None and len(messages) > max_messages:
+            conversation_context["messages"] = messages[-max_messages:]
+            logger.info(f"Cleaned up conversation, kept last {max_messages} messages")
+
+        conversation_context["lastActivity"] = datetime.now(timezone.utc).isoformat()
+        conversation_context["version"] = new_version()
+        item = transcript_codec.pack_item(conversation_context)
+        condition = {}
+        if generation is not None:
+            condition = {
+                "ConditionExpression": "attribute_not_exists(generation) OR generation = :generation",
+                "ExpressionAttributeValues": {":generation": generation},
+            }
+        conversation_table().put_item(Item=item, **condition)
+        transcript_codec.log_item_savings(conversation_context, item)
+        logger.info(f"Saved conversation context for user {user_id}")
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            logger.error(f"Error saving conversation context: {e}")
+            raise
+        logger.info(f"Not saving superseded generation {generation} for user {user_id}")
+        raise GenerationSuperseded(generation) from e
+    except Exception as e:
+        logger.error(f"Error saving conversation context: {e}")
+        raise
+
+
+def save_if_version(conversation_context: dict, expected_version: str | None) -> dict | None:
+    """Save a conversation only if the stored item still has the expected version.
+
+    Args:
+        conversation_context: Conversation data to save (gets a new version on success)
+        expected_version: Version the context was based on (None: no versioned item stored)
+
+    Returns:
+        None if saved, otherwise the stored item that won (an empty dict if it was deleted)
+
+    Raises:
+        Exception: If the write fails for any other reason
+    """
+    if expected_version is None:
+        condition = {"ConditionExpression": "attribute_not_exists(version)"}
+    else:
+        condition = {
+            "ConditionExpression": "version = :expected",
+            "ExpressionAttributeValues": {":expected": expected_version},
+        }
+    previous = (conversation_context.get("lastActivity"), conversation_context.get("version"))
+    conversation_context["lastActivity"] = datetime.now(timezone.utc).isoformat()
+    conversation_context["version"] = new_version()
+    try:
+        conversation_table().put_item(
+            Item=transcript_codec.pack_item(conversation_context),
+            ReturnValuesOnConditionCheckFailure="ALL_OLD",
+            **condition,
+        )
+        return None
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        conversation_context["lastActivity"], conversation_context["version"] = previous
+        item = e.response.get("Item") or {}
+        deserializer = TypeDeserializer()
+        return {k: deserializer.deserialize(v) for k, v in item.items()}
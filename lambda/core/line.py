@@ -0,0 +1,66 @@
+import logging
+import uuid
+
+import retry_policy
+
+from core.channels import channel_configuration
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def send_line_message(
+    to_id: str,
+    message: str,
+    quote_token: str | None = None,
+    source_type: str | None = None,
+    timeout: float | None = None,
+    channel_id: str | None = None,
+) -> None:
+    """Send message to a LINE destination using the Push API.
+
+    Throttled (429) and transient (5xx) failures are retried with the shared
+    retry policy. Every attempt carries the same X-Line-Retry-Key, so LINE
+    delivers the message at most once even if an earlier attempt got through.
+
+    Args:
+        to_id: LINE user or group ID to send message to
+        message: Message text to send
+        quote_token: Quote token for replying to a specific message
+        source_type: Source type (group, room, user)
+        timeout: Time budget in seconds for all attempts (None if unlimited)
+        channel_id: Channel to send from (None for the stack's default channel)
+
+    Raises:
+        Exception: If message sending fails
+    """
+    from linebot.v3.messaging import ApiClient, MessagingApi, PushMessageRequest, TextMessage
+    from linebot.v3.messaging.exceptions import ApiException
+
+    # Create text message with quote token if available (for group/room chats)
+    text_message = TextMessage(
+        text=message,
+        quoteToken=quote_token if quote_token and source_type in ("group", "room") else None,
+    )
+    request = PushMessageRequest(to=to_id, messages=[text_message])
+    retry_key = str(uuid.uuid4())
+
+    def push(attempt_timeout: float | None) -> None:
+        with ApiClient(channel_configuration(channel_id)) as api_client:
+            try:
+                MessagingApi(api_client).push_message_with_http_info(
+                    push_message_request=request,
+                    x_line_retry_key=retry_key,
+                    _request_timeout=attempt_timeout,
+                )
+            except ApiException as e:
+                # 409 means a previous attempt with this retry key was already accepted
+                if e.status != 409:
+                    raise
+
+    try:
+        retry_policy.default_policy.call(push, timeout, "LINE push")
+        logger.info(f"Sent message to {to_id}: {message}")
+    except Exception as e:
+        logger.error(f"Error sending LINE message: {e}")
+        raise e
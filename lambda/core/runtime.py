@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+import boto3
+import snapstart
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Registry key kinds
+CLIENT = "client"
+RESOURCE = "resource"
+TABLE = "table"
+SECRET = "secret"
+LINE_CONFIGURATION = "lineConfiguration"
+
+
+class Registry:
+    """Process-wide instances created lazily and exactly once.
+
+    Every handler module shares one registry, so a container that imports
+    several handlers (the webhook imports ai_processor and rate_limiter)
+    still builds a single client per AWS service.
+    """
+
+    def __init__(self):
+        self._instances: dict[tuple[str, str], Any] = {}
+        self._lock = threading.RLock()
+        self.stats: dict[str, float] = {"created": 0, "initSeconds": 0.0}
+
+    def get(self, kind: str, name: str, factory: Callable[[], Any]) -> Any:
+        """Get an instance, creating it with factory on first use.
+
+        Args:
+            kind: Key kind (CLIENT, RESOURCE, TABLE, SECRET or LINE_CONFIGURATION)
+            name: Key name within the kind
+            factory: Creates the instance; called at most once per key
+
+        Returns:
+            The shared instance
+        """
+        key = (kind, name)
+        instance = self._instances.get(key)
+        if instance is not None:
+            return instance
+        with self._lock:
+            # Another thread may have created it while we waited
+            instance = self._instances.get(key)
+            if instance is None:
+                started = time.perf_counter()
+                instance = factory()
+                elapsed = time.perf_counter() - started
+                self._instances[key] = instance
+                self.stats["created"] += 1
+                self.stats["initSeconds"] += elapsed
+                logger.info(f"Initialized {kind} {name} in {elapsed * 1000:.1f}ms")
+            return instance
+
+    def peek(self, kind: str, name: str) -> Any:
+        """Get an instance only if it was already created.
+
+        Args:
+            kind: Key kind
+            name: Key name
+
+        Returns:
+            The instance or None
+        """
+        return self._instances.get((kind, name))
+
+    def drop(self, *kinds: str) -> None:
+        """Forget instances of the given kinds so they are rebuilt on next use.
+
+        Args:
+            kinds: Key kinds to drop
+        """
+        with self._lock:
+            for key in [key for key in self._instances if key[0] in kinds]:
+                del self._instances[key]
+
+    def keys(self) -> list[tuple[str, str]]:
+        """Get the keys of the instances created so far."""
+        return list(self._instances)
+
+
+# Shared by every module in the process
+registry = Registry()
+
+
+def client(service: str) -> Any:
+    """Get the shared boto3 client for a service.
+
+    Args:
+        service: AWS service name (e.g. "secretsmanager")
+
+    Returns:
+        boto3 client
+    """
+    return registry.get(CLIENT, service, lambda: boto3.client(service))  # type: ignore[call-overload]
+
+
+def resource(service: str) -> Any:
+    """Get the shared boto3 resource for a service.
+
+    Args:
+        service: AWS service name (e.g. "dynamodb")
+
+    Returns:
+        boto3 service resource
+    """
+    return registry.get(RESOURCE, service, lambda: boto3.resource(service))  # type: ignore[call-overload]
+
+
+def table(table_name: str) -> Any:
+    """Get the shared DynamoDB Table object.
+
+    Args:
+        table_name: DynamoDB table name
+
+    Returns:
+        boto3 Table resource
+    """
+    return registry.get(TABLE, table_name, lambda: resource("dynamodb").Table(table_name))
+
+
+def get_secret(secret_name: str) -> str:
+    """Get secret value from AWS Secrets Manager (fetched once per container).
+
+    Args:
+        secret_name: Name of the secret to retrieve
+
+    Returns:
+        The secret value as a string
+
+    Raises:
+        Exception: If secret retrieval fails
+    """
+
+    def fetch() -> str:
+        try:
+            response = client("secretsmanager").get_secret_value(SecretId=secret_name)
+            return response["SecretString"]
+        except Exception as e:
+            logger.error(f"Error retrieving secret {secret_name}: {e}")
+            raise
+
+    return registry.get(SECRET, secret_name, fetch)
+
+
+def get_json_secret(secret_name: str) -> dict[str, Any]:
+    """Get a JSON secret value from AWS Secrets Manager.
+
+    Args:
+        secret_name: Name of the secret to retrieve
+
+    Returns:
+        The secret value as a dictionary
+
+    Raises:
+        Exception: If secret retrieval or parsing fails
+    """
+    result: dict[str, Any] = json.loads(get_secret(secret_name))
+    return result
+
+
+def line_configuration() -> Any:
+    """Get the shared LINE Messaging API configuration.
+
+    Returns:
+        Configuration using the channel access token named by CHANNEL_ACCESS_TOKEN_NAME
+    """
+    # Imported here so handlers that never talk to LINE (grok_processor) skip the SDK
+    from linebot.v3.messaging import Configuration
+
+    return registry.get(
+        LINE_CONFIGURATION,
+        "default",
+        lambda: Configuration(access_token=get_secret(os.environ["CHANNEL_ACCESS_TOKEN_NAME"])),
+    )
+
+
+@snapstart.before_snapshot
+def drop_secrets() -> None:
+    """Keep secrets out of the SnapStart snapshot (clients stay pre-warmed)."""
+    registry.drop(SECRET)
+    configuration = registry.peek(LINE_CONFIGURATION, "default")
+    if configuration is not None:
+        configuration.access_token = ""
+
+
+@snapstart.after_restore
+def refresh_after_restore() -> None:
+    """Rebuild AWS clients (fresh credentials and connections) and reload the LINE token."""
+    registry.drop(CLIENT, RESOURCE, TABLE)
+    configuration = registry.peek(LINE_CONFIGURATION, "default")
+    if configuration is not None:
+        # Modules hold this object, so refresh it in place
+        configuration.access_token = get_secret(os.environ["CHANNEL_ACCESS_TOKEN_NAME"])
@@ -0,0 +1,97 @@
+import logging
+import os
+import time
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Total time budget for one user message, measured from webhook receipt.
+# Kept below the 5 minute state machine timeout so a fallback can still be pushed.
+PIPELINE_BUDGET_MS = int(os.environ.get("PIPELINE_BUDGET_MS", "270000"))
+
+# Time reserved at the end of the pipeline for ResponseSender to push a reply
+RESPONSE_RESERVE_MS = int(os.environ.get("DEADLINE_RESPONSE_RESERVE_MS", "8000"))
+
+# Time reserved inside each Lambda to build the payload and save context after a call
+HANDLER_RESERVE_MS = int(os.environ.get("DEADLINE_HANDLER_RESERVE_MS", "2000"))
+
+# Calls with less time than this are not worth starting
+MIN_CALL_TIMEOUT_MS = int(os.environ.get("DEADLINE_MIN_CALL_MS", "1500"))
+
+DEADLINE_KEY = "deadlineMs"
+
+
+class DeadlineExceeded(Exception):
+    """Raised when too little of the budget is left to start an outbound call."""
+
+
+def now_ms() -> int:
+    """Get the current wall-clock time in epoch milliseconds.
+
+    Returns:
+        Current time in milliseconds since the epoch
+    """
+    return int(time.time() * 1000)
+
+
+def start_budget(received_at_ms: int | None = None) -> int:
+    """Compute the absolute deadline for a message received now.
+
+    Args:
+        received_at_ms: Receipt time in epoch milliseconds (defaults to now)
+
+    Returns:
+        Deadline in epoch milliseconds
+    """
+    if received_at_ms is None:
+        received_at_ms = now_ms()
+    return received_at_ms + PIPELINE_BUDGET_MS
+
+
+def remaining_ms(event: dict, context, reserve_ms: int = RESPONSE_RESERVE_MS) -> int | None:
+    """Get the time left for work in the current stage.
+
+    The result is the tighter of the pipeline deadline carried in the event
+    (minus the time reserved for the final push) and the Lambda's own
+    remaining time (minus the in-handler reserve).
+
+    Args:
+        event: Workflow payload, optionally carrying ``deadlineMs``
+        context: Lambda context object, or None when running locally
+        reserve_ms: Time to keep free at the end of the pipeline
+
+    Returns:
+        Remaining milliseconds, or None if neither limit is known
+    """
+    candidates = []
+    deadline = event.get(DEADLINE_KEY)
+    if deadline is not None:
+        candidates.append(int(deadline) - now_ms() - reserve_ms)
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        candidates.append(context.get_remaining_time_in_millis() - HANDLER_RESERVE_MS)
+    if not candidates:
+        return None
+    return min(candidates)
+
+
+def call_timeout(event: dict, context, reserve_ms: int = RESPONSE_RESERVE_MS) -> float | None:
+    """Turn the remaining budget into a per-call timeout.
+
+    Args:
+        event: Workflow payload, optionally carrying ``deadlineMs``
+        context: Lambda context object, or None when running locally
+        reserve_ms: Time to keep free at the end of the pipeline
+
+    Returns:
+        Timeout in seconds, or None if no limit is known
+
+    Raises:
+        DeadlineExceeded: If the remaining budget is below the minimum call time
+    """
+    remaining = remaining_ms(event, context, reserve_ms)
+    if remaining is None:
+        return None
+    if remaining < MIN_CALL_TIMEOUT_MS:
+        logger.warning(f"Deadline budget exhausted: {remaining}ms left")
+        raise DeadlineExceeded(f"Only {remaining}ms left in the deadline budget")
+    return remaining / 1000
@@ -0,0 +1,60 @@
+import logging
+import os
+
+import core
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables (opt-in; every check costs one consistent GetItem)
+CANCEL_SUPERSEDED_ENABLED = os.environ.get("CANCEL_SUPERSEDED_ENABLED", "false").lower() == "true"
+
+# Set on the workflow payload once a stage has found a newer generation
+SUPERSEDED_KEY = "superseded"
+
+
+def event_generation(event: dict) -> str | None:
+    """Get the generation token a workflow execution was started for.
+
+    The webhook sets a fresh token on the conversation with every user message
+    (webhook_handler.append_user_message), so it travels in conversationContext.
+
+    Args:
+        event: Workflow payload
+
+    Returns:
+        The token, or None when the check is disabled or the payload has none
+    """
+    if not CANCEL_SUPERSEDED_ENABLED:
+        return None
+    return (event.get("conversationContext") or {}).get("generation")
+
+
+def is_superseded(event: dict, stage: str) -> bool:
+    """Check whether a newer user message has started another execution.
+
+    Marks the payload so later stages skip without reading DynamoDB again.
+    A failed read is treated as current so the user still gets a reply.
+
+    Args:
+        event: Workflow payload
+        stage: Stage name, for logging
+
+    Returns:
+        True if the stored conversation has a different generation
+    """
+    if event.get(SUPERSEDED_KEY):
+        return True
+    generation = event_generation(event)
+    if generation is None:
+        return False
+    try:
+        stored = core.stored_generation(event["userId"])
+    except Exception as e:
+        logger.warning(f"{stage}: could not read the conversation generation: {e}")
+        return False
+    if stored is None or stored == generation:
+        return False
+    logger.info(f"{stage}: generation {generation} superseded by {stored}; skipping")
+    event[SUPERSEDED_KEY] = True
+    return True
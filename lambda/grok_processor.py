@@ -1,9 +1,16 @@
-import json
 import logging
 import os
-from typing import Any
-
-import boto3
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import core
+import deadline
+import generation_guard
+import memory_profile
+import payload_codec
+import search_latency
+import snapstart
+import usage_accounting
 from xai_sdk import Client
 from xai_sdk.chat import user
 from xai_sdk.tools import web_search
@@ -11,33 +18,23 @@ from xai_sdk.tools import web_search
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Environment variables
-XAI_API_KEY_SECRET_NAME = os.environ["XAI_API_KEY_SECRET_NAME"]
-
-# AWS clients
-secretsmanager = boto3.client("secretsmanager")
+# Environment variables (use get() to allow import from ai_processor for speculative search)
+XAI_API_KEY_SECRET_NAME = os.environ.get("XAI_API_KEY_SECRET_NAME", "")
+GROK_MAX_PARALLEL = int(os.environ.get("GROK_MAX_PARALLEL", "4"))
+GROK_QUERY_TIMEOUT_S = float(os.environ.get("GROK_QUERY_TIMEOUT_S", "90"))
 
+GROK_MODEL = "grok-4-1-fast"
 
-def get_secret(secret_name: str) -> dict[str, Any]:
-    """Get secret value from AWS Secrets Manager.
+LINE_MAX_TEXT_LENGTH = 5000
 
-    Args:
-        secret_name: Name of the secret to retrieve
-
-    Returns:
-        The secret value as a dictionary
+SEARCH_FAILED_RESPONSE = "ごめんやで～、こびとさんが情報見つけられへんかった...。もうちょっと簡単な言葉で聞いてみてくれる？"
+DEADLINE_RESPONSE = (
+    "ごめんやで〜、こびとさんが調べるのに時間かかりすぎてもうた...。もう一回聞いてみてくれる？"
+)
+PARTIAL_RESULTS_NOTE = "（一部の調べものは間に合わへんかったわ、ごめんな〜）"
 
-    Raises:
-        Exception: If secret retrieval fails
-    """
-    try:
-        response = secretsmanager.get_secret_value(SecretId=secret_name)
-        secret_string = response["SecretString"]
-        result: dict[str, Any] = json.loads(secret_string)
-        return result
-    except Exception as e:
-        logger.error(f"Error retrieving secret {secret_name}: {e}")
-        raise
+# Shared secrets (see core.runtime); the xAI secret is a JSON document
+get_secret = core.get_json_secret
 
 
 # xAI client (lazy initialization)
@@ -64,84 +61,235 @@ def get_xai_api_key() -> str:
     return XAI_API_KEY
 
 
-def call_grok_api(query: str, prompt: str | None) -> str:
-    """Call xAI Grok API for search using official SDK.
+@snapstart.before_snapshot
+def drop_xai_api_key() -> None:
+    """Keep the xAI API key out of the SnapStart snapshot."""
+    global XAI_API_KEY
+    XAI_API_KEY = None
+
+
+def search_with_grok(
+    query: str,
+    prompt: str | None,
+    timeout: float | None = None,
+    usage: usage_accounting.UsageRecorder | None = None,
+) -> str:
+    """Run one Grok web search, raising on failure.
 
     Args:
         query: Search query string
+        prompt: Optional instructions on how to use the search results
+        timeout: Request timeout in seconds (None uses the client default)
+        usage: Recorder for the search's tokens, search count and cost
 
     Returns:
         Response content from Grok API
+
+    Raises:
+        Exception: If the Grok API call fails
     """
-    try:
-        logger.info(f"Calling Grok-4 with query: {query}")
-        logger.info(f"Using prompt: {prompt if prompt else 'No prompt provided'}")
+    logger.info(f"Calling Grok-4 with query: {query}")
+    logger.info(f"Using prompt: {prompt if prompt else 'No prompt provided'}")
 
-        # Initialize xAI client
-        client = Client(api_key=get_xai_api_key())
+    # Initialize xAI client
+    client = Client(api_key=get_xai_api_key(), timeout=timeout)
 
-        # Create chat with web search tool (Agent Tools API)
-        chat = client.chat.create(
-            model="grok-4-1-fast",
-            tools=[web_search()],
-        )
+    # Create chat with web search tool (Agent Tools API)
+    chat = client.chat.create(
+        model=GROK_MODEL,
+        tools=[web_search()],
+    )
 
-        # Create search prompt in Japanese
-        search_prompt = f"""
+    # Create search prompt in Japanese
+    search_prompt = f"""
 以下について詳しく調べて、関西弁で分かりやすく教えて: {query}
 {prompt if prompt else ""}
 """
-        chat.append(user(search_prompt))
+    chat.append(user(search_prompt))
+
+    # Get response
+    response = chat.sample()
+    if usage is not None:
+        usage.add(usage_accounting.from_grok(GROK_MODEL, response))
+    return str(response.content)
 
-        # Get response
-        response = chat.sample()
-        return str(response.content)
 
+def call_grok_api(query: str, prompt: str | None, timeout: float | None = None) -> str:
+    """Call xAI Grok API for search using official SDK.
+
+    Args:
+        query: Search query string
+        prompt: Optional instructions on how to use the search results
+        timeout: Request timeout in seconds (None uses the client default)
+
+    Returns:
+        Response content from Grok API, or an apology if the search failed
+    """
+    try:
+        return search_with_grok(query, prompt, timeout)
     except Exception as e:
         logger.error(f"Error calling Grok-4 API: {e}")
-        return "ごめんやで～、こびとさんが情報見つけられへんかった...。もうちょっと簡単な言葉で聞いてみてくれる？"
+        return SEARCH_FAILED_RESPONSE
+
+
+def call_grok_api_batch(
+    queries: list[dict],
+    timeout: float | None = None,
+    usage: usage_accounting.UsageRecorder | None = None,
+) -> list[str | None]:
+    """Run several Grok searches concurrently on a bounded thread pool.
+
+    Args:
+        queries: List of {"query": ..., "prompt": ...} dicts
+        timeout: Overall time limit in seconds (None uses GROK_QUERY_TIMEOUT_S)
+        usage: Recorder for token usage and search counts (None if accounting is off)
+
+    Returns:
+        One result per query, in order; None where the search failed or timed out
+    """
+    per_query_timeout = (
+        GROK_QUERY_TIMEOUT_S if timeout is None else min(timeout, GROK_QUERY_TIMEOUT_S)
+    )
+    results: list[str | None] = [None] * len(queries)
+
+    executor = ThreadPoolExecutor(max_workers=min(GROK_MAX_PARALLEL, len(queries)))
+    try:
+        futures = {
+            executor.submit(
+                search_with_grok, q["query"], q.get("prompt"), per_query_timeout, usage
+            ): i
+            for i, q in enumerate(queries)
+        }
+        done, not_done = wait(futures, timeout=per_query_timeout)
+        for future in done:
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                logger.error(f"Grok search failed for query {queries[index]['query']}: {e}")
+        for future in not_done:
+            logger.warning(f"Grok search timed out for query {queries[futures[future]]['query']}")
+    finally:
+        # Do not block on searches that overran the timeout
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results
+
 
+def merge_search_results(queries: list[dict], results: list[str | None]) -> str:
+    """Merge per-query search results into a single reply.
 
-def lambda_handler(event: dict, _context) -> dict:
-    logger.info("Grok Processor received event: %s", json.dumps(event, default=str))
+    Args:
+        queries: The queries that were searched
+        results: Results from call_grok_api_batch (None for failed searches)
+
+    Returns:
+        Combined reply text, trimmed to the LINE text message limit
+    """
+    succeeded = [(q["query"], r) for q, r in zip(queries, results, strict=True) if r]
+    if not succeeded:
+        return SEARCH_FAILED_RESPONSE
+
+    if len(queries) == 1:
+        merged = succeeded[0][1]
+    else:
+        merged = "\n\n".join(f"【{query}】\n{result}" for query, result in succeeded)
+        if len(succeeded) < len(queries):
+            merged += f"\n\n{PARTIAL_RESULTS_NOTE}"
+
+    if len(merged) > LINE_MAX_TEXT_LENGTH:
+        merged = merged[: LINE_MAX_TEXT_LENGTH - 1] + "…"
+    return merged
+
+
+def get_tool_queries(event: dict) -> list[dict]:
+    """Get the list of search queries from the workflow payload.
+
+    Args:
+        event: Workflow payload with toolQueries, or the single toolQuery/toolPrompt pair
 
-    query = event.get("toolQuery")
-    if not query:
+    Returns:
+        List of {"query": ..., "prompt": ...} dicts with non-empty queries
+    """
+    queries = event.get("toolQueries") or [
+        {"query": event.get("toolQuery"), "prompt": event.get("toolPrompt", "")}
+    ]
+    return [q for q in queries if q.get("query")]
+
+
+def start_interim_race(event: dict, context) -> search_latency.InterimTimer | None:
+    """Send the deferred interim message if the search overruns the threshold.
+
+    Args:
+        event: Workflow payload; ai_processor marks it deferred for searches predicted fast
+        context: Lambda context
+
+    Returns:
+        The running timer, or None if SendInterimResponse already ran
+    """
+    if search_latency.interim_sent_upfront(event):
+        return None
+
+    def send() -> None:
+        # Imported on first use: most deferred searches finish before the timer fires
+        import interim_response_sender
+
+        interim_response_sender.send_interim_message(event, context)
+
+    return search_latency.InterimTimer(send).start()
+
+
+# Keys of the tool call that the final response step no longer needs
+TOOL_CALL_KEYS = ("hasToolCall", "toolName", "toolQuery", "toolPrompt", "toolQueries")
+
+
+def pass_through(event: dict) -> dict:
+    """Workflow payload for SendFinalResponse without the answered tool call.
+
+    Everything else (userId, source, quote_token, channelId, deadline,
+    generation, ...) travels on unchanged.
+    """
+    return {key: value for key, value in event.items() if key not in TOOL_CALL_KEYS}
+
+
+@memory_profile.profiled("grok_processor")
+def lambda_handler(event: dict, context) -> dict:
+    logger.info("Grok Processor received event: %s", payload_codec.log_dumps(event))
+
+    queries = get_tool_queries(event)
+    if not queries:
         raise ValueError("No query found in the event payload")
-    prompt = event.get("toolPrompt", "")
+    if generation_guard.is_superseded(event, "GrokProcessor"):
+        return event
 
     try:
-        grok_response = call_grok_api(query, prompt)
+        usage = usage_accounting.UsageRecorder.for_event(event)
+        interim = start_interim_race(event, context)
+        try:
+            timeout = deadline.call_timeout(event, context)
+            started = time.monotonic()
+            with memory_profile.stage("search"):
+                results = call_grok_api_batch(queries, timeout=timeout, usage=usage)
+            search_latency.record_latency(
+                search_latency.query_features(queries), time.monotonic() - started
+            )
+            grok_response = merge_search_results(queries, results)
+        except deadline.DeadlineExceeded:
+            grok_response = DEADLINE_RESPONSE
+        finally:
+            if interim is not None:
+                interim.finish()
+            if usage is not None:
+                usage.flush()
         logger.info(f"Grok-4 response received: {grok_response}")
 
         # Return the response with all necessary context for the next lambda
-        response_data = {
-            "grokResponse": grok_response,
-            "userId": event.get("userId"),
-            "conversationContext": event.get("conversationContext"),
-            "sourceType": event.get("sourceType"),
-            "sourceId": event.get("sourceId"),
-        }
-
-        # Include quote_token if present
-        if "quote_token" in event:
-            response_data["quote_token"] = event["quote_token"]
-
-        return response_data
+        return {**pass_through(event), "grokResponse": grok_response}
 
     except Exception as e:
         logger.error(f"Error in Grok processor: {e}")
         # Return a user-friendly error message with context
-        error_response = {
+        return {
+            **pass_through(event),
             "grokResponse": "ごめんやで〜、こびとさんが情報見つけられへんかったわ...。もうちょっと簡単な言葉で聞いてみてくれる？",
-            "userId": event.get("userId"),
-            "conversationContext": event.get("conversationContext"),
-            "sourceType": event.get("sourceType"),
-            "sourceId": event.get("sourceId"),
         }
-
-        # Include quote_token if present
-        if "quote_token" in event:
-            error_response["quote_token"] = event["quote_token"]
-
-        return error_response
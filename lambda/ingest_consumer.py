@@ -0,0 +1,168 @@
+import logging
+from collections import defaultdict
+
+import core
+import deadline
+import ingest_queue
+import memory_profile
+import webhook_handler
+import webhook_prefilter
+from linebot.v3.webhooks import Event, MessageEvent, TextMessageContent
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Re-read and re-append attempts when another consumer wrote the same conversation
+MAX_SAVE_ATTEMPTS = 3
+
+
+@memory_profile.profiled("ingest_consumer")
+def lambda_handler(event: dict, _context) -> dict:
+    """Drain a batch of queued webhook bodies (SQS event source, up to 10 records).
+
+    Returns:
+        SQS partial batch response listing records that should be retried
+    """
+    records = event.get("Records", [])
+    logger.info(f"Ingest consumer received {len(records)} record(s)")
+
+    messages: list[dict] = []
+    batch_item_failures = []
+    for record in records:
+        try:
+            messages.extend(parse_record(record))
+        except Exception as e:
+            logger.error(f"Failed to parse record {record.get('messageId')}: {e}")
+            batch_item_failures.append({"itemIdentifier": record["messageId"]})
+
+    # Messages are already saved once processing starts, so only parse failures are retried
+    process_messages(messages)
+    return {"batchItemFailures": batch_item_failures}
+
+
+def parse_record(record: dict) -> list[dict]:
+    """Turn one queued webhook body into accepted text messages.
+
+    Args:
+        record: SQS record whose body was produced by ingest_queue.encode_envelope
+
+    Returns:
+        Accepted messages (see webhook_handler.accept_message) with ordering metadata
+    """
+    payload, received_at_ms = ingest_queue.decode_envelope(record["body"])
+    logger.info(f"Queue lag for {record['messageId']}: {deadline.now_ms() - received_at_ms}ms")
+
+    channel_id = core.resolve_channel(payload.get("destination"))
+    raw_events = payload.get("events", [])
+    if webhook_prefilter.WEBHOOK_PREFILTER_ENABLED:
+        raw_events = webhook_handler.relevant_events(payload, channel_id)
+    messages = []
+    for raw_event in raw_events:
+        message = parse_event(raw_event, received_at_ms, channel_id)
+        if message is not None:
+            messages.append(message)
+    return messages
+
+
+def parse_event(
+    raw_event: dict, received_at_ms: int, channel_id: str = core.DEFAULT_CHANNEL
+) -> dict | None:
+    """Turn one raw webhook event into an accepted text message.
+
+    Args:
+        raw_event: Event object from the webhook body
+        received_at_ms: Webhook receipt time in epoch milliseconds
+        channel_id: Channel the webhook was sent to (see core.resolve_channel)
+
+    Returns:
+        Accepted message (see webhook_handler.accept_message) with ordering
+        metadata, or None if the event is not a text message or was ignored
+    """
+    try:
+        line_event = Event.from_dict(raw_event)
+    except ValueError:
+        logger.info(f"Skipping unknown event type {raw_event.get('type')}")
+        return None
+    if not isinstance(line_event, MessageEvent) or not isinstance(
+        line_event.message, TextMessageContent
+    ):
+        return None
+
+    message = webhook_handler.accept_message(line_event, channel_id)
+    if message is None:
+        return None
+    message["timestamp"] = line_event.timestamp
+    message["receivedAtMs"] = received_at_ms
+    return message
+
+
+def process_messages(messages: list[dict]) -> None:
+    """Apply a batch of accepted messages with per-user ordering and bulk I/O.
+
+    Each user's messages are appended in event-timestamp order and all
+    contexts are read with one BatchGetItem. Each context is written on
+    condition that its lastActivity is still the one that was read, so a
+    consumer handling another batch for the same user cannot overwrite its
+    turns; on a conflict the context is re-read and the messages appended
+    again. One workflow is started per user, replying in the chat of their
+    latest message.
+
+    Args:
+        messages: Accepted messages from parse_record
+    """
+    if not messages:
+        return
+
+    by_user: dict[str, list[dict]] = defaultdict(list)
+    for message in messages:
+        by_user[message["userId"]].append(message)
+
+    for user_messages in by_user.values():
+        user_messages.sort(key=lambda m: m["timestamp"])
+
+    contexts = webhook_handler.get_conversation_contexts(list(by_user))
+    pending = list(by_user)
+    for attempt in range(MAX_SAVE_ATTEMPTS):
+        if attempt:
+            # Another consumer saved these users' turns first; re-read and append on top
+            logger.info(f"Re-reading {len(pending)} conversation(s) after a concurrent write")
+            contexts.update(
+                webhook_handler.get_conversation_contexts(pending, consistent_read=True)
+            )
+        conflicts = []
+        for user_id in pending:
+            context = contexts[user_id]
+            # New contexts start with no messages; loaded ones are conditioned on what was read
+            read_activity = context["lastActivity"] if context["messages"] else None
+            for message in by_user[user_id]:
+                webhook_handler.append_user_message(context, message["text"])
+            try:
+                saved = webhook_handler.save_conversation_context_if_unchanged(
+                    context, read_activity
+                )
+            except Exception as e:
+                logger.error(f"Error saving conversation context for {user_id}: {e}")
+                saved = True
+            if not saved:
+                conflicts.append(user_id)
+        pending = conflicts
+        if not pending:
+            break
+    else:
+        # Keep the turns even if the ordering guarantee is lost
+        logger.warning(f"Gave up ordering writes for {pending} after {MAX_SAVE_ATTEMPTS} attempts")
+        webhook_handler.save_conversation_contexts([contexts[u] for u in pending])
+
+    for user_id, user_messages in by_user.items():
+        latest = user_messages[-1]
+        webhook_handler.start_ai_processing(
+            user_id,
+            contexts[user_id],
+            latest["sourceType"],
+            latest["sourceId"],
+            latest["quoteToken"],
+            received_at_ms=min(m["receivedAtMs"] for m in user_messages),
+            channel_id=latest["channelId"],
+        )
+
+    logger.info(f"Processed {len(messages)} message(s) for {len(by_user)} user(s)")
@@ -0,0 +1,139 @@
+import logging
+import os
+import uuid
+from collections import deque
+
+import core
+import payload_codec
+import snapstart
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables
+INGESTION_QUEUE_URL = os.environ.get("INGESTION_QUEUE_URL", "")
+
+# SQS delivers at most 10 messages per batch to a Lambda consumer
+MAX_BATCH_SIZE = 10
+
+
+class SqsQueue:
+    """Ingestion queue backed by Amazon SQS."""
+
+    def __init__(self, queue_url: str, client=None):
+        self.queue_url = queue_url
+        self.client = client or core.client("sqs")
+
+    def send(self, body: str) -> None:
+        """Enqueue one message body.
+
+        Args:
+            body: Message body (JSON text)
+        """
+        self.client.send_message(QueueUrl=self.queue_url, MessageBody=body)
+
+
+class LocalQueue:
+    """In-memory stand-in for the ingestion queue, for tests and local runs.
+
+    Messages are drained as SQS-shaped Lambda events so the batch consumer
+    can be exercised exactly as it runs behind an SQS event source.
+    """
+
+    def __init__(self):
+        self.messages: deque[dict] = deque()
+
+    def send(self, body: str) -> None:
+        """Enqueue one message body.
+
+        Args:
+            body: Message body (JSON text)
+        """
+        self.messages.append({"messageId": str(uuid.uuid4()), "body": body})
+
+    def drain_batch(self, max_messages: int = MAX_BATCH_SIZE) -> dict:
+        """Remove up to ``max_messages`` messages as an SQS Lambda event.
+
+        Args:
+            max_messages: Maximum batch size
+
+        Returns:
+            Dict shaped like an SQS event ({"Records": [...]})
+        """
+        records = []
+        while self.messages and len(records) < max_messages:
+            message = self.messages.popleft()
+            records.append(
+                {
+                    "messageId": message["messageId"],
+                    "body": message["body"],
+                    "eventSource": "aws:sqs",
+                }
+            )
+        return {"Records": records}
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+
+_queue: SqsQueue | LocalQueue | None = None
+
+
+def get_queue() -> SqsQueue | LocalQueue:
+    """Get the process-wide ingestion queue.
+
+    Returns:
+        An SqsQueue when INGESTION_QUEUE_URL is set, otherwise a LocalQueue
+    """
+    global _queue
+    if _queue is None:
+        if INGESTION_QUEUE_URL:
+            _queue = SqsQueue(INGESTION_QUEUE_URL)
+        else:
+            logger.warning("INGESTION_QUEUE_URL is not set; using an in-memory queue")
+            _queue = LocalQueue()
+    return _queue
+
+
+@snapstart.after_restore
+def reset_queue() -> None:
+    """Drop the cached SQS client so a restored snapshot opens fresh connections."""
+    global _queue
+    if isinstance(_queue, SqsQueue):
+        _queue = None
+
+
+def set_queue(queue: SqsQueue | LocalQueue | None) -> None:
+    """Replace the process-wide ingestion queue (used by tests and local runs).
+
+    Args:
+        queue: Queue to use, or None to fall back to the environment default
+    """
+    global _queue
+    _queue = queue
+
+
+def encode_envelope(body: str, received_at_ms: int) -> str:
+    """Wrap a raw webhook body with its receipt time for the queue.
+
+    Args:
+        body: Raw webhook request body (signature already verified)
+        received_at_ms: Webhook receipt time in epoch milliseconds
+
+    Returns:
+        JSON text to enqueue
+    """
+    return payload_codec.dumps({"body": body, "receivedAtMs": received_at_ms})
+
+
+def decode_envelope(message_body: str) -> tuple[dict, int]:
+    """Unwrap a queued webhook body.
+
+    Args:
+        message_body: JSON text produced by encode_envelope
+
+    Returns:
+        Tuple of (parsed webhook payload, receipt time in epoch milliseconds)
+    """
+    envelope = payload_codec.loads(message_body)
+    return payload_codec.loads(envelope["body"]), int(envelope["receivedAtMs"])
@@ -1,15 +1,10 @@
-import json
 import logging
 import os
 
-import boto3
-from linebot.v3.messaging import (
-    ApiClient,
-    Configuration,
-    MessagingApi,
-    PushMessageRequest,
-    TextMessage,
-)
+import core
+import deadline
+import memory_profile
+import payload_codec
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -17,54 +12,48 @@ logger.setLevel(logging.INFO)
 # Environment variables
 CHANNEL_ACCESS_TOKEN_NAME = os.environ["CHANNEL_ACCESS_TOKEN_NAME"]
 
-# AWS clients
-secretsmanager = boto3.client("secretsmanager")
+# Shared LINE setup (see core.runtime); built during init so it lands in a SnapStart snapshot
+send_line_message = core.send_line_message
+configuration = core.line_configuration()
 
 
-def get_secret(secret_name: str) -> str:
-    """Get secret value from AWS Secrets Manager.
+INTERIM_MESSAGE = "なんやややこしい質問やな～ 今こびとさんに調べてきてもろとるから待っとき！"
 
-    Args:
-        secret_name: Name of the secret to retrieve
 
-    Returns:
-        The secret value as a string
+def send_interim_message(event: dict, context) -> None:
+    """Push the fixed interim message to the conversation of a workflow payload.
 
-    Raises:
-        Exception: If secret retrieval fails
+    Args:
+        event: Workflow payload from ai_processor
+        context: Lambda context (None when called outside Lambda)
     """
-    try:
-        response = secretsmanager.get_secret_value(SecretId=secret_name)
-        return response["SecretString"]
-    except Exception as e:
-        logger.error(f"Error retrieving secret {secret_name}: {e}")
-        raise
-
-
-# LINE Bot setup
-CHANNEL_ACCESS_TOKEN = get_secret(CHANNEL_ACCESS_TOKEN_NAME)
-configuration = Configuration(access_token=CHANNEL_ACCESS_TOKEN)
-
-
-def lambda_handler(event: dict, _context) -> dict:
-    logger.info("Interim Response Sender received event: %s", json.dumps(event, default=str))
+    user_id: str = event["userId"]
+    source_type: str | None = event.get("sourceType")
+    source_id: str | None = event.get("sourceId")
+
+    # Determine the target ID for the push message
+    target_id = source_id if source_type in ("group", "room") and source_id else user_id
+
+    # Get quote token if available for group/room messages
+    quote_token: str | None = event.get("quote_token")
+    # Retries keep the time reserved for the final response
+    remaining = deadline.remaining_ms(event, context)
+    send_line_message(
+        target_id,
+        INTERIM_MESSAGE,
+        quote_token,
+        source_type,
+        timeout=None if remaining is None else max(remaining, 0) / 1000,
+        channel_id=event.get("channelId"),
+    )
+
+
+@memory_profile.profiled("interim_response_sender")
+def lambda_handler(event: dict, context) -> dict:
+    logger.info("Interim Response Sender received event: %s", payload_codec.log_dumps(event))
 
     try:
-        user_id: str = event["userId"]
-        source_type: str | None = event.get("sourceType")
-        source_id: str | None = event.get("sourceId")
-
-        # Determine the target ID for the push message
-        target_id = source_id if source_type in ("group", "room") and source_id else user_id
-
-        # Send a fixed interim message
-        interim_message = (
-            "なんやややこしい質問やな～ 今こびとさんに調べてきてもろとるから待っとき！"
-        )
-
-        # Get quote token if available for group/room messages
-        quote_token: str | None = event.get("quote_token")
-        send_line_message(target_id, interim_message, quote_token, source_type)
+        send_interim_message(event, context)
 
         # Pass the original event payload through to the next step
         return event
@@ -73,38 +62,3 @@ def lambda_handler(event: dict, _context) -> dict:
         logger.error(f"Error in interim response sender: {e}")
         # Propagate the error to stop the workflow
         raise
-
-
-def send_line_message(
-    to_id: str, message: str, quote_token: str | None = None, source_type: str | None = None
-) -> None:
-    """Send message to a LINE destination using the Push API.
-
-    Args:
-        to_id: LINE user or group ID to send message to
-        message: Message text to send
-        quote_token: Quote token for replying to a specific message
-        source_type: Source type (group, room, user)
-
-    Raises:
-        Exception: If message sending fails
-    """
-    try:
-        with ApiClient(configuration) as api_client:
-            line_bot_api = MessagingApi(api_client)
-
-            # Create text message with quote token if available (for group/room chats)
-            text_message = TextMessage(
-                text=message,
-                quoteToken=quote_token
-                if quote_token and source_type in ("group", "room")
-                else None,
-            )
-
-            line_bot_api.push_message_with_http_info(
-                push_message_request=PushMessageRequest(to=to_id, messages=[text_message])
-            )
-        logger.info(f"Sent interim message to {to_id}: {message}")
-    except Exception as e:
-        logger.error(f"Error sending LINE message: {e}")
-        raise e
@@ -0,0 +1,352 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+from datetime import datetime, timedelta, timezone
+
+import core
+import numpy as np
+import semantic_cache
+import snapstart
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables (long-term memory is opt-in)
+LONG_TERM_MEMORY_ENABLED = os.environ.get("LONG_TERM_MEMORY_ENABLED", "false").lower() == "true"
+# Snippets injected into the system prompt per turn
+MEMORY_TOP_K = int(os.environ.get("MEMORY_TOP_K", "3"))
+# Snippets less similar than this to the latest message are not injected
+MEMORY_MIN_SIMILARITY = float(os.environ.get("MEMORY_MIN_SIMILARITY", "0.12"))
+# Oldest snippets are dropped beyond this many per user
+MEMORY_MAX_SNIPPETS = int(os.environ.get("MEMORY_MAX_SNIPPETS", "200"))
+# Memories (and expired conversations waiting to be archived) are kept this long
+MEMORY_RETENTION_DAYS = int(os.environ.get("MEMORY_RETENTION_DAYS", "30"))
+# Warm containers keep each user's index here and memory-map it on later turns
+MEMORY_CACHE_DIR = os.environ.get("MEMORY_CACHE_DIR", "/tmp/long-term-memory")
+
+# Indexes live in the conversation table under a "memory#" key prefix, one item per user.
+# 200 snippets of at most 200 characters with 256 float16 dimensions stay well under
+# DynamoDB's 400KB item limit.
+MEMORY_TABLE_NAME = os.environ.get(
+    "MEMORY_TABLE_NAME", os.environ.get("CONVERSATION_TABLE_NAME", "")
+)
+MEMORY_KEY_PREFIX = "memory#"
+
+# Conversation field linking a conversation to the index version it may recall from
+VERSION_KEY = "memoryVersion"
+
+MEMORY_DIM = 256
+SNIPPET_CHARS = 200
+# Speaker labels of a snippet; left out of its vector so every snippet does not share them
+USER_LABEL = "ユーザー: "
+REPLY_LABEL = " / あいちゃん: "
+
+# Shared AWS clients (see core.runtime)
+memory_table = core.table(MEMORY_TABLE_NAME) if MEMORY_TABLE_NAME else None
+
+
+@snapstart.after_restore
+def refresh_clients() -> None:
+    """Pick up the table rebuilt by core after a SnapStart restore."""
+    global memory_table
+    memory_table = core.table(MEMORY_TABLE_NAME) if MEMORY_TABLE_NAME else None
+
+
+def snippets_from_messages(messages: list) -> list[str]:
+    """Turn a transcript into memory snippets, one per user turn and its reply.
+
+    Args:
+        messages: List of {"role", "content"} dicts
+
+    Returns:
+        Snippets such as "ユーザー: ... / あいちゃん: ...", at most SNIPPET_CHARS long
+    """
+    snippets = []
+    for i, message in enumerate(messages):
+        if message.get("role") != "user" or not message.get("content"):
+            continue
+        snippet = f"{USER_LABEL}{strip_mentions(message['content'])}"
+        reply = messages[i + 1] if i + 1 < len(messages) else None
+        if reply is not None and reply.get("role") == "assistant" and reply.get("content"):
+            snippet += f"{REPLY_LABEL}{reply['content']}"
+        snippets.append(snippet[:SNIPPET_CHARS])
+    return snippets
+
+
+def strip_mentions(text: str) -> str:
+    """Drop @mentions so group turns are remembered by what was said."""
+    return " ".join(word for word in text.split() if not word.startswith("@"))
+
+
+def embed_snippet(snippet: str, dim: int = MEMORY_DIM) -> np.ndarray:
+    """Embed what was said in a snippet, without its speaker labels."""
+    text = snippet.removeprefix(USER_LABEL).replace(REPLY_LABEL, " ")
+    return semantic_cache.embed_text(text, dim)
+
+
+class MemoryIndex:
+    """One user's snippets and their float16 hashing-embedder vectors.
+
+    ``vectors`` may be a read-only memory map of the warm-container copy;
+    add() always returns a new index instead of writing to it.
+    """
+
+    def __init__(self, vectors: np.ndarray, snippets: list[str], version: str | None = None):
+        self.vectors = vectors
+        self.snippets = snippets
+        self.version = version
+
+    @classmethod
+    def empty(cls, dim: int = MEMORY_DIM) -> "MemoryIndex":
+        return cls(np.zeros((0, dim), dtype=np.float16), [])
+
+    def __len__(self) -> int:
+        return len(self.snippets)
+
+    def add(self, snippets: list[str]) -> "MemoryIndex":
+        """Append snippets, keeping the newest MEMORY_MAX_SNIPPETS.
+
+        Args:
+            snippets: Snippets from snippets_from_messages
+
+        Returns:
+            New index (with no version until it is saved)
+        """
+        dim = self.vectors.shape[1]
+        added = np.array([embed_snippet(s, dim) for s in snippets], dtype=np.float16).reshape(
+            -1, dim
+        )
+        vectors = np.concatenate([self.vectors, added])[-MEMORY_MAX_SNIPPETS:]
+        return MemoryIndex(vectors, (self.snippets + snippets)[-MEMORY_MAX_SNIPPETS:])
+
+    def search(self, text: str, k: int | None = None) -> list[tuple[float, str]]:
+        """Find the snippets most similar to a text.
+
+        Args:
+            text: Query text (the latest user message)
+            k: Number of snippets (None uses MEMORY_TOP_K)
+
+        Returns:
+            Up to k (similarity, snippet) pairs at or above MEMORY_MIN_SIMILARITY, best first
+        """
+        k = MEMORY_TOP_K if k is None else k
+        if not len(self) or k <= 0:
+            return []
+        query = semantic_cache.embed_text(text, self.vectors.shape[1])
+        scores = np.asarray(self.vectors, dtype=np.float32) @ query
+        candidates = np.argpartition(scores, -k)[-k:] if len(self) > k else np.arange(len(self))
+        top = candidates[np.argsort(scores[candidates])[::-1]]
+        return [
+            (float(scores[i]), self.snippets[i]) for i in top if scores[i] >= MEMORY_MIN_SIMILARITY
+        ]
+
+    def to_item(self, user_id: str) -> dict:
+        """Build the DynamoDB item of this index (zlib-compressed vectors and snippets)."""
+        expires = datetime.now(timezone.utc) + timedelta(days=MEMORY_RETENTION_DAYS)
+        snippets = json.dumps(self.snippets, ensure_ascii=False, separators=(",", ":"))
+        return {
+            "userId": f"{MEMORY_KEY_PREFIX}{user_id}",
+            "version": self.version,
+            "dim": self.vectors.shape[1],
+            "vectors": zlib.compress(np.ascontiguousarray(self.vectors).tobytes(), 6),
+            "snippets": zlib.compress(snippets.encode("utf-8"), 6),
+            "ttl": int(expires.timestamp()),
+        }
+
+    @classmethod
+    def from_item(cls, item: dict) -> "MemoryIndex":
+        """Rebuild an index from its DynamoDB item."""
+        # boto3 returns Binary wrappers for B attributes
+        vectors = bytes(getattr(item["vectors"], "value", item["vectors"]))
+        snippets = bytes(getattr(item["snippets"], "value", item["snippets"]))
+        dim = int(item["dim"])
+        return cls(
+            np.frombuffer(zlib.decompress(vectors), dtype=np.float16).reshape(-1, dim),
+            json.loads(zlib.decompress(snippets)),
+            item.get("version"),
+        )
+
+
+def cache_paths(user_id: str) -> tuple[str, str]:
+    """Paths of a user's warm-container copy: the vector array and its snippets."""
+    name = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32]
+    base = os.path.join(MEMORY_CACHE_DIR, name)
+    return f"{base}.npy", f"{base}.json"
+
+
+def save_local(user_id: str, index: MemoryIndex) -> None:
+    """Write an index to /tmp so later turns in this container can memory-map it."""
+    vectors_path, snippets_path = cache_paths(user_id)
+    suffix = f".{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(MEMORY_CACHE_DIR, exist_ok=True)
+        # Vectors first: a reader that sees the new snippets file also sees the new vectors
+        with open(vectors_path + suffix, "wb") as f:
+            np.save(f, np.asarray(index.vectors, dtype=np.float16))
+        os.replace(vectors_path + suffix, vectors_path)
+        with open(snippets_path + suffix, "w", encoding="utf-8") as f:
+            json.dump({"version": index.version, "snippets": index.snippets}, f, ensure_ascii=False)
+        os.replace(snippets_path + suffix, snippets_path)
+    except OSError as e:
+        logger.warning(f"Could not cache long-term memory locally: {e}")
+
+
+def load_local(user_id: str, version: str) -> MemoryIndex | None:
+    """Memory-map the warm-container copy of an index if it is the wanted version.
+
+    Returns:
+        The index, or None if there is no copy or it is stale
+    """
+    vectors_path, snippets_path = cache_paths(user_id)
+    try:
+        with open(snippets_path, encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("version") != version:
+            return None
+        vectors = np.load(vectors_path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    if vectors.shape[0] != len(cached["snippets"]):
+        # Replaced by another thread between the two reads
+        return None
+    return MemoryIndex(vectors, cached["snippets"], version)
+
+
+def load_index(user_id: str, version: str | None) -> MemoryIndex | None:
+    """Get a user's index, from /tmp when warm, otherwise from DynamoDB.
+
+    Args:
+        user_id: User ID
+        version: Index version the conversation links to (None: nothing stored)
+
+    Returns:
+        The index, or None if there is none or it cannot be read
+    """
+    if version is None:
+        return None
+    index = load_local(user_id, version)
+    if index is not None:
+        return index
+    if memory_table is None:
+        return None
+    try:
+        item = memory_table.get_item(Key={"userId": f"{MEMORY_KEY_PREFIX}{user_id}"}).get("Item")
+    except Exception as e:
+        logger.warning(f"Could not read long-term memory of {user_id}: {e}")
+        return None
+    if item is None:
+        return None
+    index = MemoryIndex.from_item(item)
+    save_local(user_id, index)
+    return index
+
+
+def archive_conversation(conversation: dict) -> str | None:
+    """Add the turns of an expired conversation to the user's long-term memory.
+
+    The write is conditioned on the index version the conversation linked
+    to, so two webhooks expiring the same conversation archive it once.
+    Failures are logged; the new conversation then keeps the old version.
+
+    Args:
+        conversation: Expired conversation context with its ``messages``
+
+    Returns:
+        Index version the next conversation should link to (None if there is none)
+    """
+    previous = conversation.get(VERSION_KEY)
+    if not LONG_TERM_MEMORY_ENABLED or memory_table is None:
+        return previous
+    snippets = snippets_from_messages(conversation.get("messages", []))
+    if not snippets:
+        return previous
+
+    user_id = conversation["userId"]
+    index = (load_index(user_id, previous) or MemoryIndex.empty()).add(snippets)
+    index.version = core.new_version()
+    condition = (
+        {"ConditionExpression": "attribute_not_exists(version)"}
+        if previous is None
+        else {
+            "ConditionExpression": "version = :previous",
+            "ExpressionAttributeValues": {":previous": previous},
+        }
+    )
+    try:
+        memory_table.put_item(Item=index.to_item(user_id), **condition)
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            logger.error(f"Could not archive conversation of {user_id}: {e}")
+            return previous
+        # Another webhook archived the same conversation; link to its version
+        stored = memory_table.get_item(
+            Key={"userId": f"{MEMORY_KEY_PREFIX}{user_id}"}, ProjectionExpression="version"
+        ).get("Item", {})
+        return stored.get("version", previous)
+    except Exception as e:
+        logger.error(f"Could not archive conversation of {user_id}: {e}")
+        return previous
+    save_local(user_id, index)
+    logger.info(f"Archived {len(snippets)} turn(s) of {user_id} ({len(index)} in memory)")
+    return index.version
+
+
+def recall(conversation_context: dict) -> list[str]:
+    """Find the remembered snippets relevant to the latest user message.
+
+    Args:
+        conversation_context: Current conversation (links to its index by VERSION_KEY)
+
+    Returns:
+        Up to MEMORY_TOP_K snippets, best first (empty when disabled or nothing matches)
+    """
+    if not LONG_TERM_MEMORY_ENABLED:
+        return []
+    messages = conversation_context.get("messages", [])
+    if not messages or messages[-1].get("role") != "user":
+        return []
+    user_id = conversation_context.get("userId", "")
+    index = load_index(user_id, conversation_context.get(VERSION_KEY))
+    if index is None:
+        return []
+    matches = index.search(strip_mentions(messages[-1].get("content", "")))
+    if matches:
+        logger.info(
+            f"Recalled {len(matches)} of {len(index)} snippet(s) for {user_id} "
+            f"(best={matches[0][0]:.2f})"
+        )
+    return [snippet for _, snippet in matches]
+
+
+def forget(user_id: str) -> None:
+    """Delete a user's long-term memory, stored and cached (the /forget command).
+
+    Raises:
+        Exception: If the stored index cannot be deleted
+    """
+    if not LONG_TERM_MEMORY_ENABLED:
+        return
+    if memory_table is not None:
+        memory_table.delete_item(Key={"userId": f"{MEMORY_KEY_PREFIX}{user_id}"})
+    for path in cache_paths(user_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def conversation_ttl(now: datetime) -> int:
+    """TTL of a new conversation item.
+
+    With long-term memory on, an expired conversation must outlive the gap
+    until the user's next message, which is when its turns are archived.
+    """
+    if LONG_TERM_MEMORY_ENABLED:
+        lifetime = timedelta(days=MEMORY_RETENTION_DAYS)
+    else:
+        lifetime = timedelta(hours=24)
+    return int((now + lifetime).timestamp())
@@ -0,0 +1,211 @@
+import functools
+import json
+import logging
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables (profiling slows every allocation, so it is opt-in).
+# Set PYTHONTRACEMALLOC=1 as well to trace the imports of the init phase.
+MEMORY_PROFILE_ENABLED = os.environ.get("MEMORY_PROFILE_ENABLED", "false").lower() == "true"
+MEMORY_PROFILE_TOP = int(os.environ.get("MEMORY_PROFILE_TOP", "10"))
+MEMORY_PROFILE_FRAMES = int(os.environ.get("MEMORY_PROFILE_FRAMES", "1"))
+# Ranking allocation sites walks every trace (seconds on a 50MB heap), so invocations
+# after the first only rank them every this many calls; the totals are always reported
+MEMORY_PROFILE_SITES_EVERY = int(os.environ.get("MEMORY_PROFILE_SITES_EVERY", "20"))
+
+# Prefix of the structured log lines (one JSON report per init and invocation)
+LOG_PREFIX = "MEMORY_PROFILE"
+
+MIB = 1024 * 1024
+
+# Reports of this process, newest last (read by scripts/memory_rightsizing.py)
+reports: list[dict] = []
+
+_local = threading.local()
+_init_reported: set[str] = set()
+_invocations: dict[str, int] = {}
+
+
+def start() -> None:
+    """Start tracing allocations if the profiling mode is on and nobody started it yet."""
+    if MEMORY_PROFILE_ENABLED and not tracemalloc.is_tracing():
+        tracemalloc.start(MEMORY_PROFILE_FRAMES)
+
+
+def rss_mib() -> float:
+    """Current resident set size of the process in MiB."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / MIB
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mib()
+
+
+def peak_rss_mib() -> float:
+    """Peak resident set size of the process in MiB (what Lambda bills memory against)."""
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def top_sites(snapshot: tracemalloc.Snapshot, base: tracemalloc.Snapshot | None = None) -> list:
+    """Largest allocation sites of a snapshot, or of its growth since ``base``.
+
+    Args:
+        snapshot: Snapshot to rank
+        base: Earlier snapshot to diff against (None ranks what is allocated)
+
+    Returns:
+        Up to MEMORY_PROFILE_TOP {"site", "sizeKiB", "count"} dicts, largest first
+    """
+    snapshot = snapshot.filter_traces(
+        [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ]
+    )
+    if base is None:
+        stats = snapshot.statistics("lineno")
+        sized = [(s.traceback, s.size, s.count) for s in stats]
+    else:
+        stats = snapshot.compare_to(base, "lineno")
+        sized = [(s.traceback, s.size_diff, s.count_diff) for s in stats if s.size_diff > 0]
+        sized.sort(key=lambda entry: entry[1], reverse=True)
+    return [
+        {
+            "site": f"{traceback[0].filename}:{traceback[0].lineno}",
+            "sizeKiB": round(size / 1024, 1),
+            "count": count,
+        }
+        for traceback, size, count in sized[:MEMORY_PROFILE_TOP]
+    ]
+
+
+def emit(report: dict) -> None:
+    """Log one report as a structured line and keep it in ``reports``."""
+    reports.append(report)
+    logger.info(f"{LOG_PREFIX} {json.dumps(report, ensure_ascii=False)}")
+
+
+def report_init(function: str) -> None:
+    """Report what the init phase (module imports and global setup) left allocated.
+
+    Args:
+        function: Handler name used in the report
+    """
+    if not tracemalloc.is_tracing() or function in _init_reported:
+        return
+    _init_reported.add(function)
+    current, peak = tracemalloc.get_traced_memory()
+    emit(
+        {
+            "function": function,
+            "phase": "init",
+            "rssMiB": round(rss_mib(), 1),
+            "peakRssMiB": round(peak_rss_mib(), 1),
+            "tracedMiB": round(current / MIB, 2),
+            "tracedPeakMiB": round(peak / MIB, 2),
+            "top": top_sites(tracemalloc.take_snapshot()),
+        }
+    )
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Measure one stage of an invocation (e.g. the LLM call or the Grok search).
+
+    A no-op unless an invocation is being profiled.
+
+    Args:
+        name: Stage name in the invocation report
+    """
+    stages = getattr(_local, "stages", None)
+    if stages is None:
+        yield
+        return
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        after, peak = tracemalloc.get_traced_memory()
+        # reset_peak above hid earlier peaks of the invocation from its report
+        _local.peak = max(_local.peak, peak)
+        stages[name] = {
+            "ms": round((time.perf_counter() - started) * 1000, 1),
+            "retainedKiB": round((after - before) / 1024, 1),
+            "peakKiB": round((peak - before) / 1024, 1),
+            "peakRssMiB": round(peak_rss_mib(), 1),
+        }
+
+
+def profiled(function: str) -> Callable:
+    """Decorate a Lambda handler to report memory at init and per invocation.
+
+    The first invocation also reports the init phase. Each invocation report
+    has the traced peak, the growth of RSS and the stages measured with
+    ``stage``; the first and every MEMORY_PROFILE_SITES_EVERY-th one also
+    ranks the allocation sites that grew. With the profiling mode off the
+    handler is returned unchanged.
+
+    Args:
+        function: Handler name used in the reports
+
+    Returns:
+        Decorator for ``lambda_handler(event, context)``
+    """
+
+    def decorate(handler: Callable) -> Callable:
+        if not MEMORY_PROFILE_ENABLED:
+            return handler
+        start()
+
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            report_init(function)
+            count = _invocations[function] = _invocations.get(function, 0) + 1
+            rank_sites = (count - 1) % max(MEMORY_PROFILE_SITES_EVERY, 1) == 0
+            # Stages of nested handlers (the pipeline server) land in their own report
+            outer = getattr(_local, "stages", None), getattr(_local, "peak", 0)
+            _local.stages, _local.peak = {}, 0
+            base = tracemalloc.take_snapshot() if rank_sites else None
+            base_current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            rss_before = rss_mib()
+            started = time.perf_counter()
+            try:
+                return handler(event, context)
+            finally:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, _local.peak)
+                stages = _local.stages
+                _local.stages, _local.peak = outer
+                report = {
+                    "function": function,
+                    "phase": "invoke",
+                    "invocation": count,
+                    "ms": round(elapsed_ms, 1),
+                    "rssMiB": round(rss_mib(), 1),
+                    "rssGrowthMiB": round(rss_mib() - rss_before, 2),
+                    "peakRssMiB": round(peak_rss_mib(), 1),
+                    "tracedPeakKiB": round((peak - base_current) / 1024, 1),
+                    "retainedKiB": round((current - base_current) / 1024, 1),
+                    "stages": stages,
+                }
+                if base is not None:
+                    report["top"] = top_sites(tracemalloc.take_snapshot(), base)
+                emit(report)
+
+        return wrapper
+
+    return decorate
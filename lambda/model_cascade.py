@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables (the cascade is opt-in; when off every turn uses the strong tier)
+MODEL_CASCADE_ENABLED = os.environ.get("MODEL_CASCADE_ENABLED", "false").lower() == "true"
+GROQ_FAST_MODEL = os.environ.get("GROQ_FAST_MODEL", "openai/gpt-oss-20b")
+SAMBANOVA_FAST_MODEL = os.environ.get("SAMBANOVA_FAST_MODEL", "Meta-Llama-3.1-8B-Instruct")
+# Turns longer or deeper than this go straight to the strong tier
+CASCADE_MAX_FAST_CHARS = int(os.environ.get("CASCADE_MAX_FAST_CHARS", "80"))
+CASCADE_MAX_FAST_DEPTH = int(os.environ.get("CASCADE_MAX_FAST_DEPTH", "8"))
+FAST_MAX_TOKENS = int(os.environ.get("CASCADE_FAST_MAX_TOKENS", "400"))
+
+# USD per 1M (input, output) tokens, used only for logging estimated cost
+DEFAULT_MODEL_PRICES = {
+    "openai/gpt-oss-20b": (0.10, 0.50),
+    "openai/gpt-oss-120b": (0.15, 0.75),
+    "DeepSeek-V3-0324": (3.00, 4.50),
+    "Meta-Llama-3.1-8B-Instruct": (0.10, 0.20),
+}
+MODEL_PRICES = {
+    **DEFAULT_MODEL_PRICES,
+    **{k: tuple(v) for k, v in json.loads(os.environ.get("MODEL_PRICES", "{}")).items()},
+}
+
+# Wording that usually needs careful reasoning even in a short message
+COMPLEX_PATTERN = re.compile(
+    r"なぜ|なんで|どうして|理由|比較|違い|説明|詳しく|計算|証明|コード|プログラム|翻訳|要約|```"
+)
+# A fast-tier answer containing these is treated as a failed self-check
+UNSURE_PATTERN = re.compile(
+    r"わからへん|わからん|分からない|わかりません|自信ない|自信がない|不明|I'?m not sure|I don'?t know",
+    re.IGNORECASE,
+)
+
+FAST_TIER = "fast"
+STRONG_TIER = "strong"
+
+# Warm-container per-tier counters for tuning the thresholds
+stats = {
+    tier: {"calls": 0, "latencySeconds": 0.0, "costUsd": 0.0} for tier in (FAST_TIER, STRONG_TIER)
+}
+escalations: dict[str, int] = {}
+
+
+def choose_tier(messages: list) -> tuple[str, str]:
+    """Pick the tier for this turn from the latest message and conversation depth.
+
+    Args:
+        messages: Conversation messages (latest last)
+
+    Returns:
+        Tuple of (tier name, reason)
+    """
+    if not MODEL_CASCADE_ENABLED:
+        return STRONG_TIER, "cascade_disabled"
+    text = (messages[-1].get("content") or "") if messages else ""
+    if len(text) > CASCADE_MAX_FAST_CHARS:
+        return STRONG_TIER, "long_message"
+    if len(messages) > CASCADE_MAX_FAST_DEPTH:
+        return STRONG_TIER, "deep_conversation"
+    if COMPLEX_PATTERN.search(text):
+        return STRONG_TIER, "complex_wording"
+    return FAST_TIER, "short_casual"
+
+
+def escalation_reason(content: str | None, finish_reason: str | None) -> str | None:
+    """Self-check a fast-tier answer.
+
+    Args:
+        content: Answer text (None if the model returned a tool call)
+        finish_reason: Completion finish reason
+
+    Returns:
+        Why the turn should be retried on the strong tier, or None to accept the answer
+    """
+    if finish_reason == "length":
+        return "truncated"
+    if not content or not content.strip():
+        return "empty"
+    if UNSURE_PATTERN.search(content):
+        return "unsure"
+    return None
+
+
+def estimate_cost(model: str, usage) -> float:
+    """Estimate the cost of one completion in USD.
+
+    Args:
+        model: Model name
+        usage: Completion usage with prompt_tokens and completion_tokens (may be None)
+
+    Returns:
+        Estimated cost (0.0 when the model price or usage is unknown)
+    """
+    if usage is None or model not in MODEL_PRICES:
+        return 0.0
+    input_price, output_price = MODEL_PRICES[model]
+    prompt_tokens = int(getattr(usage, "prompt_tokens", 0) or 0)
+    completion_tokens = int(getattr(usage, "completion_tokens", 0) or 0)
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+def record_call(tier: str, model: str, latency_s: float, usage, reason: str) -> None:
+    """Log one tier call with its latency and estimated cost.
+
+    Args:
+        tier: Tier name
+        model: Model name
+        latency_s: Call latency in seconds
+        usage: Completion usage (may be None)
+        reason: Routing or escalation reason
+    """
+    cost = estimate_cost(model, usage)
+    tier_stats = stats[tier]
+    tier_stats["calls"] += 1
+    tier_stats["latencySeconds"] += latency_s
+    tier_stats["costUsd"] += cost
+    logger.info(
+        f"Model cascade: tier={tier} model={model} reason={reason} "
+        f"latency={latency_s:.2f}s cost=${cost:.6f} "
+        f"avgLatency={tier_stats['latencySeconds'] / tier_stats['calls']:.2f}s"
+    )
+
+
+def record_escalation(reason: str) -> None:
+    """Count an escalation from the fast to the strong tier.
+
+    Args:
+        reason: Value returned by escalation_reason
+    """
+    escalations[reason] = escalations.get(reason, 0) + 1
+    logger.info(f"Model cascade escalating to {STRONG_TIER}: {reason} ({escalations})")
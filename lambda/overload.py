@@ -0,0 +1,235 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+import core
+import snapstart
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables (overload control is opt-in)
+OVERLOAD_CONTROL_ENABLED = os.environ.get("OVERLOAD_CONTROL_ENABLED", "false").lower() == "true"
+# Mean AI step latency in seconds at which levels 1-4 start
+OVERLOAD_LATENCY_S = tuple(
+    float(v) for v in os.environ.get("OVERLOAD_LATENCY_S", "8,12,18,30").split(",")
+)
+# AI steps in flight across all containers at which levels 1-4 start
+OVERLOAD_INFLIGHT = tuple(
+    int(v) for v in os.environ.get("OVERLOAD_INFLIGHT", "30,50,80,120").split(",")
+)
+# Latency means over fewer turns than this are not trusted
+OVERLOAD_MIN_SAMPLES = int(os.environ.get("OVERLOAD_MIN_SAMPLES", "3"))
+# Degraded settings: answer length cap (level 2+) and context kept (level 3+)
+DEGRADED_MAX_TOKENS = int(os.environ.get("DEGRADED_MAX_TOKENS", "300"))
+DEGRADED_CONTEXT_MESSAGES = int(os.environ.get("DEGRADED_CONTEXT_MESSAGES", "4"))
+
+# Counters live in the conversation table under an "overload#" key prefix, one item
+# per window. Each AI step adds itself to the in-flight count of the window it started
+# in and removes itself with its latency when it ends; a step killed by its timeout
+# only inflates the count until the window after next.
+OVERLOAD_TABLE_NAME = os.environ.get(
+    "OVERLOAD_TABLE_NAME", os.environ.get("CONVERSATION_TABLE_NAME", "")
+)
+OVERLOAD_KEY_PREFIX = "overload#"
+# Longer than the AI step timeout, so a step ends at most one window after it started
+WINDOW_S = 90
+# The previous window is reread after this many seconds
+PREVIOUS_REFRESH_S = 10.0
+
+LEVEL_NAMES = ("normal", "no_search", "short_answers", "short_context", "canned")
+NORMAL, NO_SEARCH, SHORT_ANSWERS, SHORT_CONTEXT, CANNED = range(len(LEVEL_NAMES))
+
+CANNED_REPLY = (
+    "ごめんな〜🙏 今めっちゃ混み合ってて、ちゃんと考えて返事できへんねん💦 "
+    "ちょっと時間置いてからもう一回話しかけてな！"
+)
+
+# Shared AWS clients (see core.runtime)
+overload_table = core.table(OVERLOAD_TABLE_NAME) if OVERLOAD_TABLE_NAME else None
+
+# Warm-container latencies of recent AI steps: (finished at, seconds)
+_latencies: deque[tuple[float, float]] = deque(maxlen=50)
+# Warm-container copy of the previous window: (window, fetched at, item)
+_previous: tuple[int, float, dict] | None = None
+_lock = threading.Lock()
+
+# Warm-container count of turns per level, for tuning the thresholds
+stats = {name: 0 for name in LEVEL_NAMES}
+
+
+@snapstart.after_restore
+def refresh_clients() -> None:
+    """Pick up the table rebuilt by core after a SnapStart restore."""
+    global overload_table, _previous
+    overload_table = core.table(OVERLOAD_TABLE_NAME) if OVERLOAD_TABLE_NAME else None
+    _previous = None
+    _latencies.clear()
+
+
+def level_for(value: float, thresholds: tuple) -> int:
+    """Highest level whose threshold a signal has reached (0 below the first)."""
+    return sum(1 for threshold in thresholds if value >= threshold)
+
+
+def degradation(level: int) -> dict:
+    """Settings of a degradation level.
+
+    Args:
+        level: NORMAL to CANNED
+
+    Returns:
+        Dict with level, name, tools (offer the search tool), maxTokens and
+        reasoningEffort (None: unchanged), maxContextMessages (None: all)
+        and canned (answer with CANNED_REPLY without calling the model)
+    """
+    level = max(NORMAL, min(level, CANNED))
+    return {
+        "level": level,
+        "name": LEVEL_NAMES[level],
+        "tools": level < NO_SEARCH,
+        "maxTokens": DEGRADED_MAX_TOKENS if level >= SHORT_ANSWERS else None,
+        "reasoningEffort": "low" if level >= SHORT_ANSWERS else None,
+        "maxContextMessages": DEGRADED_CONTEXT_MESSAGES if level >= SHORT_CONTEXT else None,
+        "canned": level >= CANNED,
+    }
+
+
+def record_latency(seconds: float, now: float | None = None) -> None:
+    """Add the latency of one AI step to the warm-container stats."""
+    with _lock:
+        _latencies.append((time.monotonic() if now is None else now, seconds))
+
+
+def local_latency(now: float | None = None) -> tuple[float, int]:
+    """Mean latency of this container's AI steps in the last two windows.
+
+    Returns:
+        Tuple of (mean seconds, sample count)
+    """
+    now = time.monotonic() if now is None else now
+    with _lock:
+        recent = [s for at, s in _latencies if now - at < 2 * WINDOW_S]
+    return (sum(recent) / len(recent) if recent else 0.0), len(recent)
+
+
+def _window_key(window: int) -> dict:
+    return {"userId": f"{OVERLOAD_KEY_PREFIX}{window}"}
+
+
+def _previous_window(window: int) -> dict:
+    """Counters of the window before ``window``, cached for PREVIOUS_REFRESH_S."""
+    global _previous
+    now = time.monotonic()
+    cached = _previous
+    if cached is not None and cached[0] == window - 1 and now - cached[1] < PREVIOUS_REFRESH_S:
+        return cached[2]
+    item = overload_table.get_item(Key=_window_key(window - 1)).get("Item", {})
+    _previous = (window - 1, now, item)
+    return item
+
+
+def enter(window: int) -> tuple[int, float, int]:
+    """Count one AI step in flight and read the shared load of the last two windows.
+
+    Args:
+        window: Current window number (epoch seconds // WINDOW_S)
+
+    Returns:
+        Tuple of (steps in flight, mean step latency in seconds, latency samples);
+        zeros if the counters cannot be used
+    """
+    if overload_table is None:
+        return 0, 0.0, 0
+    try:
+        current = overload_table.update_item(
+            Key=_window_key(window),
+            UpdateExpression="ADD inflight :one SET #ttl = if_not_exists(#ttl, :ttl)",
+            ExpressionAttributeNames={"#ttl": "ttl"},
+            ExpressionAttributeValues={":one": 1, ":ttl": int((window + 3) * WINDOW_S)},
+            ReturnValues="ALL_NEW",
+        )["Attributes"]
+        previous = _previous_window(window)
+    except Exception as e:
+        logger.warning(f"Could not read the overload counters: {e}")
+        return 0, 0.0, 0
+    inflight = sum(int(item.get("inflight", 0)) for item in (current, previous))
+    calls = sum(int(item.get("calls", 0)) for item in (current, previous))
+    latency_ms = sum(int(item.get("latencyMs", 0)) for item in (current, previous))
+    return inflight, (latency_ms / calls / 1000 if calls else 0.0), calls
+
+
+def leave(window: int, seconds: float | None) -> None:
+    """Remove one AI step from the in-flight count, adding its latency if it called the model.
+
+    Args:
+        window: Window the step entered in
+        seconds: Step latency (None for canned replies, which say nothing about the backend)
+    """
+    if overload_table is None:
+        return
+    expression, values = "ADD inflight :minus", {":minus": -1}
+    if seconds is not None:
+        expression += ", latencyMs :ms, calls :one"
+        values.update({":ms": int(seconds * 1000), ":one": 1})
+    try:
+        overload_table.update_item(
+            Key=_window_key(window),
+            UpdateExpression=expression,
+            ExpressionAttributeValues=values,
+        )
+    except Exception as e:
+        logger.warning(f"Could not update the overload counters: {e}")
+
+
+def current_level(inflight: int, latency_s: float, samples: int) -> int:
+    """Degradation level for the observed load.
+
+    The level is the highest one reached by the in-flight count, the shared
+    latency mean or this container's own latency mean (each mean only with
+    at least OVERLOAD_MIN_SAMPLES turns behind it).
+    """
+    local_s, local_samples = local_latency()
+    levels = [level_for(inflight, OVERLOAD_INFLIGHT)]
+    if samples >= OVERLOAD_MIN_SAMPLES:
+        levels.append(level_for(latency_s, OVERLOAD_LATENCY_S))
+    if local_samples >= OVERLOAD_MIN_SAMPLES:
+        levels.append(level_for(local_s, OVERLOAD_LATENCY_S))
+    return max(levels)
+
+
+@contextmanager
+def admission(now: float | None = None) -> Iterator[dict]:
+    """Run one AI step under overload control.
+
+    Yields the degradation settings for the current load (normal settings
+    when the controller is off) and logs the active level. The step's
+    latency is recorded when it ends, unless it was answered canned.
+
+    Args:
+        now: Current epoch seconds (defaults to time.time())
+    """
+    if not OVERLOAD_CONTROL_ENABLED:
+        yield degradation(NORMAL)
+        return
+    window = int((time.time() if now is None else now) // WINDOW_S)
+    inflight, latency_s, samples = enter(window)
+    settings = degradation(current_level(inflight, latency_s, samples))
+    stats[settings["name"]] += 1
+    log = logger.warning if settings["level"] else logger.info
+    log(
+        f"Overload level {settings['level']} ({settings['name']}): inflight={inflight}, "
+        f"latency={latency_s:.1f}s over {samples} turn(s), local={local_latency()[0]:.1f}s"
+    )
+    started = time.monotonic()
+    try:
+        yield settings
+    finally:
+        elapsed = time.monotonic() - started
+        if not settings["canned"]:
+            record_latency(elapsed)
+        leave(window, None if settings["canned"] else elapsed)
@@ -0,0 +1,163 @@
+import base64
+import json
+import logging
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:  # Local runs without the layer use the stdlib encoder
+    orjson = None
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables ("stdlib" forces the fallback, e.g. to compare encoders)
+PAYLOAD_CODEC = os.environ.get("PAYLOAD_CODEC", "orjson")
+
+# Fields of a stored conversation and their types. Only the transcript is required;
+# the others are checked when present (DynamoDB itself rejects a missing key).
+REQUIRED_FIELDS = {"messages": list}
+OPTIONAL_FIELDS = {
+    "userId": str,
+    "conversationId": str,
+    "lastActivity": str,
+    "ttl": int,
+    "version": str,
+    "generation": str,
+    "memoryVersion": str,
+}
+
+
+class SchemaError(ValueError):
+    """A conversation record does not match the stored schema."""
+
+
+def encode_default(value):
+    """Encode the types DynamoDB and the handlers put into payloads.
+
+    Integral Decimals (``ttl``, counters) stay integers instead of turning
+    into strings; other Decimals become floats.
+
+    Raises:
+        TypeError: For any other type, so nothing is silently stringified
+    """
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    # boto3 returns Binary wrappers for B attributes
+    raw = getattr(value, "value", value)
+    if isinstance(raw, (bytes, bytearray)):
+        return base64.b64encode(raw).decode("ascii")
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def _log_default(value):
+    try:
+        return encode_default(value)
+    except TypeError:
+        return str(value)
+
+
+def use_orjson() -> bool:
+    """Whether the fast encoder is available and selected."""
+    return orjson is not None and PAYLOAD_CODEC == "orjson"
+
+
+def dumps_bytes(value) -> bytes:
+    """Encode a payload as compact UTF-8 JSON.
+
+    Raises:
+        TypeError: If the payload holds a type encode_default does not know
+    """
+    if use_orjson():
+        return orjson.dumps(value, default=encode_default)
+    return dumps(value).encode("utf-8")
+
+
+def dumps(value) -> str:
+    """Encode a payload as compact JSON text (Step Functions input, queue messages).
+
+    Raises:
+        TypeError: If the payload holds a type encode_default does not know
+    """
+    if use_orjson():
+        return orjson.dumps(value, default=encode_default).decode("utf-8")
+    return json.dumps(value, default=encode_default, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads(data: str | bytes):
+    """Decode JSON text or bytes produced by dumps or received from AWS."""
+    if use_orjson():
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def log_dumps(value) -> str:
+    """Encode a payload for a log line; unknown types (SDK models) are stringified."""
+    if use_orjson():
+        return orjson.dumps(value, default=_log_default).decode("utf-8")
+    return json.dumps(value, default=_log_default, ensure_ascii=False)
+
+
+def _check_type(name: str, value, expected: type) -> None:
+    if not isinstance(value, expected):
+        raise SchemaError(f"{name} must be {expected.__name__}, got {type(value).__name__}")
+
+
+def _coerce_int(name: str, value) -> int:
+    """Turn a Decimal, integral float or digit string (old workflow payloads) into an int."""
+    if isinstance(value, bool):
+        raise SchemaError(f"{name} must be int, got bool")
+    if isinstance(value, int):
+        return value
+    try:
+        number = Decimal(str(value))
+        if number == number.to_integral_value():
+            return int(number)
+    except ArithmeticError as e:
+        raise SchemaError(f"{name} must be int, got {value!r}") from e
+    raise SchemaError(f"{name} must be int, got {value!r}")
+
+
+def check_conversation(record: dict) -> dict:
+    """Validate a conversation record before it is stored, fixing number types in place.
+
+    ``ttl`` written as a string or Decimal by older payloads becomes an int
+    again, so DynamoDB's TTL keeps expiring the item.
+
+    Args:
+        record: Conversation context (with an expanded ``messages`` list)
+
+    Returns:
+        The same record
+
+    Raises:
+        SchemaError: If a field is missing or has the wrong type
+    """
+    if not isinstance(record, dict):
+        raise SchemaError(f"conversation must be a dict, got {type(record).__name__}")
+    for name, expected in REQUIRED_FIELDS.items():
+        if name not in record:
+            raise SchemaError(f"conversation is missing {name}")
+        _check_type(name, record[name], expected)
+    for name, expected in OPTIONAL_FIELDS.items():
+        if record.get(name) is None:
+            continue
+        if expected is int:
+            record[name] = _coerce_int(name, record[name])
+        else:
+            _check_type(name, record[name], expected)
+    for i, message in enumerate(record["messages"]):
+        if not isinstance(message, dict):
+            raise SchemaError(f"messages[{i}] must be a dict, got {type(message).__name__}")
+        _check_type(f"messages[{i}].role", message.get("role"), str)
+        if message.get("content") is not None:
+            _check_type(f"messages[{i}].content", message["content"], str)
+        if message.get("timestamp") is not None:
+            _check_type(f"messages[{i}].timestamp", message["timestamp"], str)
+    return record
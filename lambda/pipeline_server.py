@@ -0,0 +1,379 @@
+"""Long-running asyncio HTTP server that runs the whole bot pipeline in-process.
+
+Instead of API Gateway, a webhook Lambda and a Step Functions execution per
+message, this server verifies the LINE signature with webhook_handler's
+handler, acknowledges the request, and queues each event for a bounded pool
+of workers. The workers run the same steps as the state machine by calling
+ai_processor, interim_response_sender, grok_processor and response_sender
+directly.
+
+Events are sharded by sender so one user's messages are processed in order.
+SIGTERM/SIGINT stop accepting requests and drain the queues before exiting.
+
+Example:
+    python lambda/pipeline_server.py --port 8080 --workers 32
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+import zlib
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+import deadline
+import payload_codec
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables
+SERVER_HOST = os.environ.get("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.environ.get("SERVER_PORT", "8080"))
+SERVER_WEBHOOK_PATH = os.environ.get("SERVER_WEBHOOK_PATH", "/webhook")
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", "16"))
+# Events waiting per worker shard before requests are rejected with 503
+SERVER_QUEUE_SIZE = int(os.environ.get("SERVER_QUEUE_SIZE", "256"))
+SERVER_DRAIN_TIMEOUT_S = float(os.environ.get("SERVER_DRAIN_TIMEOUT_S", "60"))
+
+# Interim pushes run beside the Grok search, like the state machine's Parallel state
+_interim_executor = ThreadPoolExecutor(max_workers=SERVER_WORKERS, thread_name_prefix="interim")
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    413: "Payload Too Large",
+    503: "Service Unavailable",
+}
+
+
+def run_workflow(workflow_input: dict) -> dict:
+    """Run the AI workflow in-process, as the Step Functions state machine does.
+
+    Args:
+        workflow_input: Payload built by webhook_handler.build_workflow_input
+
+    Returns:
+        Output of the last step
+    """
+    import ai_processor
+    import grok_processor
+    import interim_response_sender
+    import response_sender
+    import search_latency
+
+    # Round-trip through JSON like the Step Functions input, so no step shares state
+    event = payload_codec.loads(payload_codec.dumps(workflow_input))
+    ai_result = ai_processor.lambda_handler(event, None)
+    if ai_result.get("hasToolCall"):
+        interim = None
+        if search_latency.interim_sent_upfront(ai_result):
+            interim = _interim_executor.submit(
+                interim_response_sender.lambda_handler,
+                payload_codec.loads(payload_codec.dumps(ai_result)),
+                None,
+            )
+        grok_result = grok_processor.lambda_handler(ai_result, None)
+        if interim is not None:
+            # The notice goes out before the answer; a failed notice does not hold the answer back
+            try:
+                interim.result()
+            except Exception as e:
+                logger.warning(f"Interim message failed; sending the answer anyway: {e}")
+        return response_sender.lambda_handler(grok_result, None)
+    return response_sender.lambda_handler(ai_result, None)
+
+
+def process_event(raw_event: dict, received_at_ms: int, channel_id: str | None = None) -> None:
+    """Accept one webhook event, update the conversation and run the workflow.
+
+    Args:
+        raw_event: Event object from a verified webhook body
+        received_at_ms: Webhook receipt time in epoch milliseconds
+        channel_id: Channel the webhook was sent to (None for the default channel)
+    """
+    import core
+    import ingest_consumer
+    import webhook_handler
+
+    message = ingest_consumer.parse_event(
+        raw_event, received_at_ms, channel_id or core.DEFAULT_CHANNEL
+    )
+    if message is None:
+        return
+    user_id = message["userId"]
+    conversation_context = webhook_handler.get_conversation_context(user_id)
+    webhook_handler.append_user_message(conversation_context, message["text"])
+    webhook_handler.save_conversation_context(user_id, conversation_context)
+    run_workflow(
+        webhook_handler.build_workflow_input(
+            user_id,
+            conversation_context,
+            message["sourceType"],
+            message["sourceId"],
+            message["quoteToken"],
+            received_at_ms,
+            message["channelId"],
+        )
+    )
+
+
+def verify_signature(body: str, signature: str | None) -> bool:
+    """Check the x-line-signature with the secret of the channel the body was sent to."""
+    import webhook_handler
+
+    return webhook_handler.verify_signature(body, signature, webhook_handler.route_channel(body))
+
+
+def shard_key(raw_event: dict) -> str:
+    """Key that keeps one sender's events on one worker."""
+    source = raw_event.get("source") or {}
+    return source.get("userId") or source.get("groupId") or source.get("roomId") or ""
+
+
+class PipelineServer:
+    """Asyncio HTTP front end with sharded in-process queues and a bounded worker pool."""
+
+    def __init__(
+        self,
+        host: str = SERVER_HOST,
+        port: int = SERVER_PORT,
+        workers: int = SERVER_WORKERS,
+        queue_size: int = SERVER_QUEUE_SIZE,
+        path: str = SERVER_WEBHOOK_PATH,
+        process: Callable[[dict, int, str], None] = process_event,
+        verify: Callable[[str, str | None], bool] = verify_signature,
+    ):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.workers = workers
+        self.queue_size = queue_size
+        self.process = process
+        self.verify = verify
+        self.queues: list[asyncio.Queue] = []
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline")
+        self.stats = {"accepted": 0, "rejected": 0, "processed": 0, "failed": 0, "inFlight": 0}
+        self._server: asyncio.Server | None = None
+        self._worker_tasks: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """Start the workers and begin accepting connections."""
+        self.queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        self._worker_tasks = [asyncio.create_task(self._work(q)) for q in self.queues]
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(
+            f"Pipeline server listening on http://{self.host}:{self.port}{self.path} "
+            f"with {self.workers} workers"
+        )
+
+    async def shutdown(self, drain_timeout: float = SERVER_DRAIN_TIMEOUT_S) -> None:
+        """Stop accepting requests, finish queued events, then stop the workers.
+
+        Args:
+            drain_timeout: Seconds to wait for queued and in-flight events
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        pending = sum(q.qsize() for q in self.queues) + self.stats["inFlight"]
+        logger.info(f"Draining {pending} event(s) before shutdown")
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(q.join() for q in self.queues)), timeout=drain_timeout
+            )
+        except TimeoutError:
+            logger.warning(f"Drain timed out after {drain_timeout}s; dropping queued events")
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self.executor.shutdown(wait=True)
+        logger.info(f"Pipeline server stopped: {self.stats}")
+
+    def enqueue(self, body: str, received_at_ms: int) -> bool:
+        """Queue every event of a verified body on its sender's shard.
+
+        Returns:
+            False if a shard queue is full (nothing is queued in that case)
+        """
+        from core.channels import resolve_channel
+
+        payload = json.loads(body)
+        channel_id = resolve_channel(payload.get("destination"))
+        events = payload.get("events", [])
+        shards = [zlib.crc32(shard_key(e).encode("utf-8")) % self.workers for e in events]
+        if any(self.queues[i].qsize() + shards.count(i) > self.queue_size for i in set(shards)):
+            return False
+        for event, i in zip(events, shards, strict=True):
+            self.queues[i].put_nowait((event, received_at_ms, channel_id))
+        return True
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            raw_event, received_at_ms, channel_id = await queue.get()
+            self.stats["inFlight"] += 1
+            started = time.perf_counter()
+            try:
+                await loop.run_in_executor(
+                    self.executor, self.process, raw_event, received_at_ms, channel_id
+                )
+                self.stats["processed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"Pipeline failed for event {raw_event.get('webhookEventId')}: {e}")
+            finally:
+                self.stats["inFlight"] -= 1
+                queue.task_done()
+            logger.info(f"Processed event in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except ValueError as e:
+                    # Malformed request line, Content-Length or body encoding
+                    logger.warning(f"Rejected malformed request: {e}")
+                    await self._write_response(writer, 400, {"message": "Bad Request"}, False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, payload = self._respond(method, path, headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def _write_response(
+        self, writer: asyncio.StreamWriter, status: int, payload: dict, keep_alive: bool
+    ) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        head = [
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(data)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == 503:
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("ascii") + data)
+        await writer.drain()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        if len(head) > MAX_HEADER_BYTES:
+            return None
+        lines = head.decode("latin-1").split("\r\n")
+        method, path, _ = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length < 0:
+            raise ValueError(f"negative Content-Length {length}")
+        if length > MAX_BODY_BYTES:
+            return method, path, headers, None
+        body = (await reader.readexactly(length)).decode("utf-8") if length else ""
+        return method, path, headers, body
+
+    def _respond(self, method: str, path: str, headers: dict, body: str | None) -> tuple[int, dict]:
+        if method == "GET" and path == "/healthz":
+            return 200, {
+                "status": "ok",
+                **self.stats,
+                "queued": sum(q.qsize() for q in self.queues),
+            }
+        if method != "POST" or path != self.path:
+            return 404, {"message": "Not Found"}
+        if body is None:
+            return 413, {"message": "Payload Too Large"}
+        received_at_ms = deadline.now_ms()
+        if not self.verify(body, headers.get("x-line-signature")):
+            logger.error("Invalid signature")
+            return 400, {"message": "Invalid Signature"}
+        try:
+            accepted = self.enqueue(body, received_at_ms)
+        except (ValueError, AttributeError):
+            return 400, {"message": "Bad Request"}
+        if not accepted:
+            self.stats["rejected"] += 1
+            return 503, {"message": "Overloaded"}
+        self.stats["accepted"] += 1
+        return 200, {"message": "OK"}
+
+
+def seed_secrets(channel_secret: str, access_token: str) -> None:
+    """Cache local LINE credentials so no Secrets Manager call is made.
+
+    Args:
+        channel_secret: Channel secret signatures are verified with
+        access_token: Channel access token used for LINE API calls
+    """
+    from core import runtime
+
+    os.environ.setdefault("CHANNEL_SECRET_NAME", "local-channel-secret")
+    os.environ.setdefault("CHANNEL_ACCESS_TOKEN_NAME", "local-channel-access-token")
+    for name, value in (
+        (os.environ["CHANNEL_SECRET_NAME"], channel_secret),
+        (os.environ["CHANNEL_ACCESS_TOKEN_NAME"], access_token),
+    ):
+        runtime.registry.get(runtime.SECRET, name, lambda value=value: value)
+
+
+async def serve(server: PipelineServer, drain_timeout: float) -> None:
+    """Run until SIGTERM or SIGINT, then shut down gracefully."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await server.start()
+    await stop.wait()
+    await server.shutdown(drain_timeout)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=SERVER_HOST, help="Bind address")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="Bind port")
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="Worker pool size")
+    parser.add_argument("--queue-size", type=int, default=SERVER_QUEUE_SIZE, help="Queue per shard")
+    parser.add_argument(
+        "--drain-timeout", type=float, default=SERVER_DRAIN_TIMEOUT_S, help="Shutdown drain (s)"
+    )
+    parser.add_argument("--secret", help="Local channel secret (skips Secrets Manager)")
+    parser.add_argument("--access-token", default="local-access-token", help="Local access token")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s")
+    # The workflow runs in-process, so no state machine is needed
+    os.environ.setdefault("STEP_FUNCTION_ARN", "")
+    if args.secret:
+        seed_secrets(args.secret, args.access_token)
+    import webhook_handler  # noqa: F401  (load the handlers before accepting traffic)
+
+    server = PipelineServer(args.host, args.port, args.workers, args.queue_size)
+    asyncio.run(serve(server, args.drain_timeout))
+
+
+if __name__ == "__main__":
+    main()
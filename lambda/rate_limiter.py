@@ -0,0 +1,265 @@
+import json
+import logging
+import os
+import time
+from decimal import Decimal
+
+import core
+import snapstart
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Buckets live in the conversation table under a "ratelimit#" key prefix by default,
+# so no extra table is needed; TTL removes idle buckets.
+RATE_LIMIT_TABLE_NAME = os.environ.get(
+    "RATE_LIMIT_TABLE_NAME", os.environ.get("CONVERSATION_TABLE_NAME", "")
+)
+RATE_LIMIT_KEY_PREFIX = "ratelimit#"
+
+# capacity: burst size, refillPerMinute: sustained messages per minute
+DEFAULT_RATE_LIMITS = {
+    "user": {"capacity": 10, "refillPerMinute": 4},
+    "group": {"capacity": 20, "refillPerMinute": 10},
+    "room": {"capacity": 20, "refillPerMinute": 10},
+}
+RATE_LIMITS = {**DEFAULT_RATE_LIMITS, **json.loads(os.environ.get("RATE_LIMITS", "{}"))}
+
+# Shared AWS clients (see core.runtime)
+rate_limit_table = core.table(RATE_LIMIT_TABLE_NAME) if RATE_LIMIT_TABLE_NAME else None
+
+
+@snapstart.after_restore
+def refresh_clients() -> None:
+    """Pick up the table rebuilt by core after a SnapStart restore."""
+    global rate_limit_table
+    rate_limit_table = core.table(RATE_LIMIT_TABLE_NAME) if RATE_LIMIT_TABLE_NAME else None
+
+
+class TokenBucket:
+    """Token bucket with continuous refill."""
+
+    def __init__(
+        self,
+        capacity: float,
+        refill_per_second: float,
+        tokens: float | None = None,
+        updated_at: float | None = None,
+    ):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity if tokens is None else tokens
+        self.updated_at = time.time() if updated_at is None else updated_at
+
+    def refill(self, now: float) -> None:
+        """Add the tokens accrued since the last update, up to capacity."""
+        elapsed = max(0.0, now - self.updated_at)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self.updated_at = max(self.updated_at, now)
+
+    def try_consume(self, now: float, cost: float = 1.0) -> bool:
+        """Refill, then take ``cost`` tokens if available.
+
+        Returns:
+            True if the tokens were taken, False if the bucket is too empty
+        """
+        self.refill(now)
+        if self.tokens < cost:
+            return False
+        self.tokens -= cost
+        return True
+
+
+# In-container mirror of the shared buckets. Other containers can only have taken
+# more tokens, so a mirror that is empty lets us reject without a DynamoDB round trip.
+_local_buckets: dict[str, TokenBucket] = {}
+
+
+def get_limits(source_type: str) -> dict:
+    """Get the token bucket limits for a LINE source type.
+
+    Args:
+        source_type: Source type (user, group, room)
+
+    Returns:
+        Dict with capacity and refillPerMinute
+    """
+    return RATE_LIMITS.get(source_type, RATE_LIMITS["user"])
+
+
+def _new_bucket(source_type: str) -> TokenBucket:
+    limits = get_limits(source_type)
+    return TokenBucket(float(limits["capacity"]), float(limits["refillPerMinute"]) / 60)
+
+
+def _mirror(bucket_key: str, source_type: str, tat: float, now: float) -> TokenBucket:
+    """Record the shared bucket state seen in DynamoDB in the local mirror."""
+    bucket = _new_bucket(source_type)
+    bucket.tokens = min(bucket.capacity, bucket.capacity - (tat - now) * bucket.refill_per_second)
+    bucket.updated_at = now
+    _local_buckets[bucket_key] = bucket
+    return bucket
+
+
+def _consume_shared(bucket_key: str, source_type: str, now: float) -> bool:
+    """Take a token from the DynamoDB bucket with a single conditional update.
+
+    The bucket is stored in GCRA form as ``tat``, the time at which it would be
+    full again: it holds ``capacity - (tat - now) * rate`` tokens, so a token can
+    be taken while ``tat <= now + (capacity - 1) / rate`` and taking one moves
+    ``tat`` to ``max(tat, now) + 1 / rate``. The max() is not expressible in an
+    UpdateExpression, so the write is guessed from the local mirror: an idle or
+    unseen bucket resets ``tat`` to ``now + interval``, a busy one adds the
+    interval. A failed condition returns the stored item, and the other form is
+    tried once.
+    """
+    key = f"{RATE_LIMIT_KEY_PREFIX}{bucket_key}"
+    bucket = _new_bucket(source_type)
+    interval = 1 / bucket.refill_per_second
+    limit = now + (bucket.capacity - 1) * interval
+    ttl = int(now + bucket.capacity * interval + 3600)
+
+    local = _local_buckets.get(bucket_key)
+    busy = local is not None and local.tokens < local.capacity - 1
+    for _ in range(2):
+        if busy:
+            # Bucket already in debt: add one interval unless that would overdraw it
+            update = {
+                "UpdateExpression": "SET tat = tat + :interval, #ttl = :ttl",
+                "ConditionExpression": "tat <= :limit",
+                "ExpressionAttributeValues": {
+                    ":interval": Decimal(str(round(interval, 6))),
+                    ":limit": Decimal(str(round(limit, 6))),
+                    ":ttl": ttl,
+                },
+            }
+        else:
+            # Idle, unseen or pre-GCRA bucket: start a fresh debt of one interval
+            update = {
+                "UpdateExpression": "SET tat = :next, #ttl = :ttl REMOVE tokens, updatedAt",
+                "ConditionExpression": "attribute_not_exists(tat) OR tat <= :now",
+                "ExpressionAttributeValues": {
+                    ":next": Decimal(str(round(now + interval, 6))),
+                    ":now": Decimal(str(round(now, 6))),
+                    ":ttl": ttl,
+                },
+            }
+        try:
+            result = rate_limit_table.update_item(
+                Key={"userId": key},
+                ExpressionAttributeNames={"#ttl": "ttl"},
+                ReturnValues="UPDATED_NEW",
+                ReturnValuesOnConditionCheckFailure="ALL_OLD",
+                **update,
+            )
+            _mirror(bucket_key, source_type, float(result["Attributes"]["tat"]), now)
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            old = e.response.get("Item") or {}
+            if "tat" not in old:
+                if busy:
+                    # The item expired between the mirror and this write
+                    busy = False
+                    continue
+                break
+            tat = float(old["tat"]["N"] if isinstance(old["tat"], dict) else old["tat"])
+            if _mirror(bucket_key, source_type, tat, now).tokens < 1:
+                return False
+            busy = tat > now
+
+    # Both forms lost a race with another writer; admission control fails open
+    logger.info(f"Concurrent update on rate limit bucket {bucket_key}; admitting message")
+    return True
+
+
+def release(bucket_key: str, source_type: str, now: float | None = None) -> None:
+    """Give back a token taken by try_acquire (best effort).
+
+    Args:
+        bucket_key: Bucket identifier passed to try_acquire
+        source_type: Source type used to pick the limits (user, group, room)
+        now: Current epoch seconds (defaults to time.time())
+    """
+    if now is None:
+        now = time.time()
+    local = _local_buckets.get(bucket_key)
+    if local is not None:
+        local.tokens = min(local.capacity, local.tokens + 1)
+    if rate_limit_table is None:
+        return
+    interval = 1 / _new_bucket(source_type).refill_per_second
+    try:
+        rate_limit_table.update_item(
+            Key={"userId": f"{RATE_LIMIT_KEY_PREFIX}{bucket_key}"},
+            UpdateExpression="SET tat = tat - :interval",
+            ConditionExpression="tat > :now",
+            ExpressionAttributeValues={
+                ":interval": Decimal(str(round(interval, 6))),
+                ":now": Decimal(str(round(now, 6))),
+            },
+        )
+    except Exception as e:
+        logger.info(f"Could not release rate limit token for {bucket_key}: {e}")
+
+
+def try_acquire(bucket_key: str, source_type: str, now: float | None = None) -> bool:
+    """Take one token from the bucket for ``bucket_key``.
+
+    Fails open: if DynamoDB is unavailable the message is admitted.
+
+    Args:
+        bucket_key: Bucket identifier, e.g. "user#U123" or "group#C456"
+        source_type: Source type used to pick the limits (user, group, room)
+        now: Current epoch seconds (defaults to time.time())
+
+    Returns:
+        True if the message is admitted, False if it should be throttled
+    """
+    if now is None:
+        now = time.time()
+
+    local = _local_buckets.get(bucket_key)
+    if local is not None:
+        local.refill(now)
+        if local.tokens < 1:
+            logger.info(f"Rate limit fast path rejected {bucket_key}")
+            return False
+
+    if rate_limit_table is None:
+        if local is None:
+            local = _local_buckets[bucket_key] = _new_bucket(source_type)
+        return local.try_consume(now)
+
+    try:
+        return _consume_shared(bucket_key, source_type, now)
+    except Exception as e:
+        logger.error(f"Rate limiter unavailable for {bucket_key}, admitting message: {e}")
+        return True
+
+
+def admit_message(user_id: str, source_type: str, source_id: str | None) -> bool:
+    """Check the per-user bucket and, for group/room chats, the per-chat bucket.
+
+    Args:
+        user_id: LINE user ID of the sender
+        source_type: Source type (user, group, room)
+        source_id: Group or room ID for group/room chats
+
+    A group or room rejection gives the user's token back, so a busy chat does
+    not use up its members' personal allowance.
+
+    Returns:
+        True if the message may start a workflow
+    """
+    if not try_acquire(f"user#{user_id}", "user"):
+        logger.info(f"Throttled user {user_id}")
+        return False
+    if source_type in ("group", "room") and source_id:
+        if not try_acquire(f"{source_type}#{source_id}", source_type):
+            logger.info(f"Throttled {source_type} {source_id}")
+            release(f"user#{user_id}", "user")
+            return False
+    return True
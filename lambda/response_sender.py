@@ -1,16 +1,12 @@
-import json
 import logging
 import os
 from datetime import datetime, timezone
 
-import boto3
-from linebot.v3.messaging import (
-    ApiClient,
-    Configuration,
-    MessagingApi,
-    PushMessageRequest,
-    TextMessage,
-)
+import core
+import deadline
+import generation_guard
+import memory_profile
+import payload_codec
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -19,39 +15,14 @@ logger.setLevel(logging.INFO)
 CHANNEL_ACCESS_TOKEN_NAME = os.environ["CHANNEL_ACCESS_TOKEN_NAME"]
 CONVERSATION_TABLE_NAME = os.environ["CONVERSATION_TABLE_NAME"]
 
-# AWS clients
-secretsmanager = boto3.client("secretsmanager")
-dynamodb = boto3.resource("dynamodb")
-conversation_table = dynamodb.Table(CONVERSATION_TABLE_NAME)
+# Shared LINE setup (see core.runtime); built during init so it lands in a SnapStart snapshot
+send_line_message = core.send_line_message
+configuration = core.line_configuration()
 
 
-def get_secret(secret_name: str) -> str:
-    """Get secret value from AWS Secrets Manager.
-
-    Args:
-        secret_name: Name of the secret to retrieve
-
-    Returns:
-        The secret value as a string
-
-    Raises:
-        Exception: If secret retrieval fails
-    """
-    try:
-        response = secretsmanager.get_secret_value(SecretId=secret_name)
-        return response["SecretString"]
-    except Exception as e:
-        logger.error(f"Error retrieving secret {secret_name}: {e}")
-        raise
-
-
-# LINE Bot setup
-CHANNEL_ACCESS_TOKEN = get_secret(CHANNEL_ACCESS_TOKEN_NAME)
-configuration = Configuration(access_token=CHANNEL_ACCESS_TOKEN)
-
-
-def lambda_handler(event: dict, _context) -> dict:
-    logger.info("Response Sender received event: %s", json.dumps(event, default=str))
+@memory_profile.profiled("response_sender")
+def lambda_handler(event: dict, context) -> dict:
+    logger.info("Response Sender received event: %s", payload_codec.log_dumps(event))
 
     try:
         user_id: str = event["userId"]
@@ -65,13 +36,26 @@ def lambda_handler(event: dict, _context) -> dict:
         if not message_to_send:
             logger.warning("No message found to send. Skipping.")
             return event
+        # A reply to an older message would arrive after (or instead of) the current one
+        if generation_guard.is_superseded(event, "ResponseSender"):
+            return event
 
         # Determine the target ID for the push message
         target_id = source_id if source_type in ("group", "room") and source_id else user_id
 
         # Get quote token if available for group/room messages
         quote_token: str | None = event.get("quote_token")
-        send_line_message(target_id, message_to_send, quote_token, source_type)
+        # This is the last stage, so retries may use the whole remaining budget
+        remaining = deadline.remaining_ms(event, context, reserve_ms=0)
+        with memory_profile.stage("push"):
+            send_line_message(
+                target_id,
+                message_to_send,
+                quote_token,
+                source_type,
+                timeout=None if remaining is None else max(remaining, 0) / 1000,
+                channel_id=event.get("channelId"),
+            )
 
         # If it was a final response (from Grok), save it to the conversation history
         if "grokResponse" in event:
@@ -83,7 +67,10 @@ def lambda_handler(event: dict, _context) -> dict:
                     "timestamp": datetime.now(timezone.utc).isoformat(),
                 }
             )
-            save_conversation_context(user_id, conversation_context)
+            with memory_profile.stage("save"):
+                save_conversation_context(
+                    user_id, conversation_context, generation_guard.event_generation(event)
+                )
 
         return event
 
@@ -94,64 +81,29 @@ def lambda_handler(event: dict, _context) -> dict:
             error_user_id: str | None = event.get("userId")
             if error_user_id:
                 send_line_message(
-                    error_user_id, "申し訳ございません。応答の送信中にエラーが発生しました。"
+                    error_user_id,
+                    "申し訳ございません。応答の送信中にエラーが発生しました。",
+                    channel_id=event.get("channelId"),
                 )
         except Exception as inner_e:
             logger.error(f"Failed to send error message to user: {inner_e}")
         raise
 
 
-def send_line_message(
-    to_id: str, message: str, quote_token: str | None = None, source_type: str | None = None
+def save_conversation_context(
+    user_id: str, conversation_context: dict, generation: str | None = None
 ) -> None:
-    """Send message to a LINE destination using the Push API.
-
-    Args:
-        to_id: LINE user or group ID to send message to
-        message: Message text to send
-        quote_token: Quote token for replying to a specific message
-        source_type: Source type (group, room, user)
-
-    Raises:
-        Exception: If message sending fails
-    """
-    try:
-        with ApiClient(configuration) as api_client:
-            line_bot_api = MessagingApi(api_client)
-
-            # Create text message with quote token if available (for group/room chats)
-            text_message = TextMessage(
-                text=message,
-                quoteToken=quote_token
-                if quote_token and source_type in ("group", "room")
-                else None,
-            )
-
-            line_bot_api.push_message_with_http_info(
-                push_message_request=PushMessageRequest(to=to_id, messages=[text_message])
-            )
-        logger.info(f"Sent message to {to_id}: {message}")
-    except Exception as e:
-        logger.error(f"Error sending LINE message: {e}")
-        raise e
-
-
-def save_conversation_context(user_id: str, conversation_context: dict) -> None:
-    """Save conversation context to DynamoDB.
+    """Save conversation context to DynamoDB, keeping the last 20 messages.
 
     Args:
         user_id: User ID for the conversation
         conversation_context: Conversation data to save
+        generation: Skip the write if a newer user message has been stored
     """
     try:
-        # Clean up old messages before saving
-        messages = conversation_context["messages"]
-        if len(messages) > 20:
-            conversation_context["messages"] = messages[-20:]
-            logger.info("Cleaned up conversation, kept last 20 messages")
-
-        conversation_context["lastActivity"] = datetime.now(timezone.utc).isoformat()
-        conversation_table.put_item(Item=conversation_context)
-        logger.info(f"Saved conversation context for user {user_id}")
-    except Exception as e:
-        logger.error(f"Error saving conversation context: {e}")
+        core.save_conversation_context(
+            user_id, conversation_context, max_messages=20, generation=generation
+        )
+    except Exception:
+        # Already logged; the reply has been sent, so do not fail the workflow
+        pass
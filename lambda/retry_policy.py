@@ -0,0 +1,171 @@
+import email.utils
+import logging
+import os
+import random
+import time
+from collections.abc import Callable
+from typing import Any, TypeVar
+
+import deadline
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY_S = float(os.environ.get("RETRY_BASE_DELAY_S", "0.5"))
+RETRY_MAX_DELAY_S = float(os.environ.get("RETRY_MAX_DELAY_S", "8"))
+
+# HTTP statuses worth retrying: throttling, timeouts and transient server errors
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+# Exception class names of transport failures in openai/httpx and urllib3 (used by linebot)
+RETRYABLE_ERROR_NAMES = {
+    "APIConnectionError",
+    "APITimeoutError",
+    "ConnectError",
+    "ReadTimeout",
+    "RemoteProtocolError",
+    "MaxRetryError",
+    "NewConnectionError",
+    "ProtocolError",
+}
+
+T = TypeVar("T")
+
+
+def parse_retry_after(value: str | None, now: float | None = None) -> float | None:
+    """Parse a Retry-After header given in seconds or as an HTTP date.
+
+    Args:
+        value: Header value
+        now: Current epoch seconds (defaults to time.time())
+
+    Returns:
+        Seconds to wait, or None if the header is missing or malformed
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at - (time.time() if now is None else now))
+
+
+def _status_and_headers(error: Exception) -> tuple[int | None, Any]:
+    # openai.APIStatusError has status_code/response; linebot ApiException has status/headers
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    headers = getattr(error, "headers", None)
+    response = getattr(error, "response", None)
+    if headers is None and response is not None:
+        headers = getattr(response, "headers", None)
+    return (status if isinstance(status, int) else None), headers
+
+
+def classify(error: Exception) -> tuple[bool, float | None]:
+    """Decide whether a failed call may be retried.
+
+    Args:
+        error: Exception raised by the call
+
+    Returns:
+        Tuple of (retryable, server-requested delay in seconds or None)
+    """
+    status, headers = _status_and_headers(error)
+    if status is not None:
+        retry_after = None
+        if headers is not None:
+            retry_after = parse_retry_after(
+                headers.get("retry-after") or headers.get("Retry-After")
+            )
+        return status in RETRYABLE_STATUSES, retry_after
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True, None
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__), None
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, Retry-After and a deadline-aware stop.
+
+    Attempt ``n`` (0-based) waits a random time in ``[0, min(max_delay,
+    base_delay * 2**n)]`` unless the server asked for a specific delay. No
+    retry is started if the wait would leave less than the minimum call time
+    of the budget.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        base_delay: float = RETRY_BASE_DELAY_S,
+        max_delay: float = RETRY_MAX_DELAY_S,
+        sleep: Callable[[float], None] = time.sleep,
+        rng: random.Random | None = None,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        # The module-level generator by default: snapstart.reseed_random reseeds it after
+        # a restore, so restored environments do not replay the same jitter
+        self.rng = rng
+
+    def backoff(self, attempt: int, retry_after: float | None = None) -> float:
+        """Delay before the next attempt.
+
+        Args:
+            attempt: Number of the attempt that just failed (0-based)
+            retry_after: Delay requested by the server, if any
+
+        Returns:
+            Seconds to wait
+        """
+        if retry_after is not None:
+            return retry_after
+        rng = self.rng or random
+        return rng.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def call(self, func: Callable[[float | None], T], timeout: float | None, name: str) -> T:
+        """Call ``func`` until it succeeds, fails permanently or the budget runs out.
+
+        Args:
+            func: Callable taking the per-attempt timeout in seconds (None if unlimited)
+            timeout: Total budget in seconds for all attempts (None if unlimited)
+            name: Call name, for logging
+
+        Returns:
+            The value returned by func
+
+        Raises:
+            Exception: The last error when it is not retryable, attempts are
+                exhausted or the remaining budget is too short for another try
+        """
+        give_up_at = None if timeout is None else time.monotonic() + timeout
+        min_call_s = deadline.MIN_CALL_TIMEOUT_MS / 1000
+        attempt = 0
+        while True:
+            remaining = None if give_up_at is None else give_up_at - time.monotonic()
+            try:
+                return func(remaining)
+            except Exception as e:
+                retryable, retry_after = classify(e)
+                if not retryable or attempt + 1 >= self.max_attempts:
+                    raise
+                delay = self.backoff(attempt, retry_after)
+                if give_up_at is not None and time.monotonic() + delay + min_call_s > give_up_at:
+                    logger.warning(f"{name} failed with {e!r}; no budget left to retry")
+                    raise
+                logger.warning(
+                    f"{name} failed with {e!r}; retry {attempt + 1}/{self.max_attempts - 1} "
+                    f"in {delay:.2f}s" + (" (Retry-After)" if retry_after is not None else "")
+                )
+                self.sleep(delay)
+                attempt += 1
+
+
+# Shared policy for outbound LINE and LLM calls
+default_policy = RetryPolicy()
@@ -0,0 +1,225 @@
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable
+
+import core
+import search_predictor
+import snapstart
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables (adaptive interim messaging is opt-in)
+ADAPTIVE_INTERIM_ENABLED = os.environ.get("ADAPTIVE_INTERIM_ENABLED", "false").lower() == "true"
+# Searches expected to take longer than this get the interim message
+INTERIM_THRESHOLD_S = float(os.environ.get("INTERIM_THRESHOLD_S", "5"))
+# Probability of a slow search above which the interim message is sent up front
+INTERIM_SLOW_PROBABILITY = float(os.environ.get("INTERIM_SLOW_PROBABILITY", "0.5"))
+# Histograms with fewer samples are not trusted; the timer race decides instead
+LATENCY_MIN_SAMPLES = int(os.environ.get("LATENCY_MIN_SAMPLES", "20"))
+# Warm containers reread a histogram after this many seconds
+LATENCY_REFRESH_S = float(os.environ.get("LATENCY_REFRESH_S", "300"))
+
+# Histograms live in the conversation table under a "latency#" key prefix,
+# one item per feature key with one counter per bucket.
+LATENCY_TABLE_NAME = os.environ.get(
+    "LATENCY_TABLE_NAME", os.environ.get("CONVERSATION_TABLE_NAME", "")
+)
+LATENCY_KEY_PREFIX = "latency#"
+
+# Upper bounds of the histogram buckets in seconds; a last bucket catches anything slower
+BUCKETS_S = (1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 21.0, 34.0, 55.0, 90.0)
+
+# Workflow payload field set by ai_processor on tool calls
+INTERIM_KEY = "interim"
+IMMEDIATE = "immediate"  # SendInterimResponse runs before the search
+DEFERRED = "deferred"  # grok_processor sends it only if the search overruns the threshold
+
+# Topic features of search_predictor that shape search time
+TOPIC_FEATURES = ("weather", "market", "results", "latest", "schedule")
+
+# Shared AWS clients (see core.runtime)
+latency_table = core.table(LATENCY_TABLE_NAME) if LATENCY_TABLE_NAME else None
+
+# Warm-container copies of stored histograms: key -> (fetched at, counts)
+_histograms: dict[str, tuple[float, list[int]]] = {}
+_lock = threading.Lock()
+
+
+@snapstart.after_restore
+def refresh_clients() -> None:
+    """Pick up the table rebuilt by core after a SnapStart restore."""
+    global latency_table
+    latency_table = core.table(LATENCY_TABLE_NAME) if LATENCY_TABLE_NAME else None
+    _histograms.clear()
+
+
+def query_features(queries: list[dict]) -> str:
+    """Reduce a set of search queries to the key of their latency histogram.
+
+    Args:
+        queries: List of {"query": ..., "prompt": ...} dicts
+
+    Returns:
+        Key such as "1q:weather:short" (query count, topic, query length)
+    """
+    text = " ".join(q.get("query") or "" for q in queries)
+    _, matched = search_predictor.score_message(text)
+    topic = next((name for name in TOPIC_FEATURES if name in matched), "general")
+    longest = max((len(q.get("query") or "") for q in queries), default=0)
+    size = "short" if longest <= 20 else "long"
+    return f"{min(len(queries), 3)}q:{topic}:{size}"
+
+
+def bucket_index(seconds: float) -> int:
+    """Index of the histogram bucket a latency falls into."""
+    for i, upper in enumerate(BUCKETS_S):
+        if seconds <= upper:
+            return i
+    return len(BUCKETS_S)
+
+
+def record_latency(key: str, seconds: float) -> None:
+    """Add one search latency to the stored histogram of its feature key.
+
+    Failures are logged and ignored; a missing sample never fails a search.
+
+    Args:
+        key: Feature key from query_features
+        seconds: Wall time of the whole search step
+    """
+    logger.info(f"Search latency for {key}: {seconds:.1f}s")
+    if not ADAPTIVE_INTERIM_ENABLED or latency_table is None:
+        return
+    try:
+        latency_table.update_item(
+            Key={"userId": f"{LATENCY_KEY_PREFIX}{key}"},
+            UpdateExpression="ADD #bucket :one, samples :one",
+            ExpressionAttributeNames={"#bucket": f"b{bucket_index(seconds)}"},
+            ExpressionAttributeValues={":one": 1},
+        )
+    except Exception as e:
+        logger.warning(f"Could not record search latency for {key}: {e}")
+
+
+def load_histogram(key: str, now: float | None = None) -> list[int]:
+    """Get the bucket counts of a feature key, cached per warm container.
+
+    Args:
+        key: Feature key from query_features
+        now: Current monotonic time (defaults to time.monotonic())
+
+    Returns:
+        One count per bucket (all zero when nothing is stored or the read fails)
+    """
+    now = time.monotonic() if now is None else now
+    with _lock:
+        cached = _histograms.get(key)
+    if cached is not None and now - cached[0] < LATENCY_REFRESH_S:
+        return cached[1]
+    counts = [0] * (len(BUCKETS_S) + 1)
+    if latency_table is not None:
+        try:
+            item = latency_table.get_item(Key={"userId": f"{LATENCY_KEY_PREFIX}{key}"}).get(
+                "Item", {}
+            )
+            counts = [int(item.get(f"b{i}", 0)) for i in range(len(counts))]
+        except Exception as e:
+            logger.warning(f"Could not read search latency histogram for {key}: {e}")
+    with _lock:
+        _histograms[key] = (now, counts)
+    return counts
+
+
+def slow_probability(counts: list[int], threshold_s: float | None = None) -> float:
+    """Share of samples in buckets that lie entirely above a threshold.
+
+    Args:
+        counts: Bucket counts from load_histogram
+        threshold_s: Latency in seconds (None uses INTERIM_THRESHOLD_S)
+
+    Returns:
+        Probability estimate between 0 and 1 (0 for an empty histogram)
+    """
+    threshold_s = INTERIM_THRESHOLD_S if threshold_s is None else threshold_s
+    total = sum(counts)
+    if not total:
+        return 0.0
+    lower_bounds = (0.0, *BUCKETS_S)
+    slow = sum(c for c, lower in zip(counts, lower_bounds, strict=True) if lower >= threshold_s)
+    return slow / total
+
+
+def predict_interim(queries: list[dict]) -> str:
+    """Decide whether the interim message goes out before the search.
+
+    Args:
+        queries: The queries grok_processor will search
+
+    Returns:
+        IMMEDIATE when the search is likely slow (or the feature is off),
+        otherwise DEFERRED
+    """
+    if not ADAPTIVE_INTERIM_ENABLED:
+        return IMMEDIATE
+    key = query_features(queries)
+    counts = load_histogram(key)
+    samples = sum(counts)
+    probability = slow_probability(counts)
+    decision = (
+        IMMEDIATE
+        if samples >= LATENCY_MIN_SAMPLES and probability >= INTERIM_SLOW_PROBABILITY
+        else DEFERRED
+    )
+    logger.info(
+        f"Interim prediction for {key}: {decision} "
+        f"(P(>{INTERIM_THRESHOLD_S}s)={probability:.2f}, samples={samples})"
+    )
+    return decision
+
+
+def interim_sent_upfront(event: dict) -> bool:
+    """Whether the workflow runs SendInterimResponse before the search."""
+    return event.get(INTERIM_KEY) != DEFERRED
+
+
+class InterimTimer:
+    """Races the search against the interim threshold.
+
+    If the search is still running ``threshold_s`` after start(), ``send`` is
+    called once on a background thread. finish() cancels a pending timer and
+    waits for a push already in flight, so the interim message always lands
+    before the final response is handed on.
+    """
+
+    def __init__(self, send: Callable[[], None], threshold_s: float | None = None):
+        self.send = send
+        self.threshold_s = INTERIM_THRESHOLD_S if threshold_s is None else threshold_s
+        self.fired = False
+        self._timer = threading.Timer(self.threshold_s, self._fire)
+        self._timer.daemon = True
+
+    def _fire(self) -> None:
+        self.fired = True
+        logger.info(f"Search still running after {self.threshold_s}s; sending the interim message")
+        try:
+            self.send()
+        except Exception as e:
+            logger.error(f"Late interim message failed: {e}")
+
+    def start(self) -> "InterimTimer":
+        self._timer.start()
+        return self
+
+    def finish(self) -> bool:
+        """Stop the race.
+
+        Returns:
+            True if the interim message was sent
+        """
+        self._timer.cancel()
+        if self._timer.is_alive():
+            self._timer.join()
+        return self.fired
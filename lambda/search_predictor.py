@@ -0,0 +1,115 @@
+import logging
+import os
+import re
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables (speculation costs searches, so it is opt-in)
+SPECULATIVE_SEARCH_ENABLED = os.environ.get("SPECULATIVE_SEARCH_ENABLED", "false").lower() == "true"
+SPECULATIVE_SEARCH_THRESHOLD = float(os.environ.get("SPECULATIVE_SEARCH_THRESHOLD", "2.0"))
+
+# (feature name, pattern, weight): time-sensitive wording that usually needs a web search
+FEATURES = [
+    ("relative_time", re.compile(r"今日|明日|昨日|今週|来週|今月|今年|最近|現在|今の|いま"), 1.0),
+    ("latest", re.compile(r"最新|速報|ニュース|発表|リリース|アップデート"), 1.5),
+    ("weather", re.compile(r"天気|気温|降水|雨|雪|台風|地震"), 1.5),
+    ("market", re.compile(r"株価|為替|円安|円高|相場|ビットコイン|値段|価格"), 1.5),
+    ("results", re.compile(r"結果|スコア|試合|順位|優勝|選挙"), 1.5),
+    ("schedule", re.compile(r"開催|営業時間|発売日|公開日|上映|いつから|何時から"), 1.0),
+    ("year", re.compile(r"20[2-9]\d年?"), 1.0),
+    ("lookup", re.compile(r"調べて|検索|教えて"), 0.5),
+    (
+        "english",
+        re.compile(r"\b(today|latest|news|weather|price|score|current|now)\b", re.IGNORECASE),
+        1.5,
+    ),
+]
+
+# Casual chat rarely needs a search even if it mentions time
+NEGATIVE_FEATURES = [
+    (
+        "greeting",
+        re.compile(r"^(おはよう|こんにちは|こんばんは|おやすみ|ありがとう|よろしく)"),
+        -2.0,
+    ),
+]
+
+
+def score_message(text: str) -> tuple[float, list[str]]:
+    """Score how likely a message is to need a web search.
+
+    Args:
+        text: User message
+
+    Returns:
+        Tuple of (score, names of matched features)
+    """
+    score = 0.0
+    matched = []
+    for name, pattern, weight in FEATURES + NEGATIVE_FEATURES:
+        hits = len(pattern.findall(text))
+        if hits:
+            # A second hit of the same feature adds confidence; more add nothing
+            score += weight * min(hits, 2)
+            matched.append(name)
+    return score, matched
+
+
+def predict_search(text: str) -> bool:
+    """Predict whether the model will ask for search_with_grok.
+
+    Args:
+        text: User message
+
+    Returns:
+        True if a speculative search should be started
+    """
+    score, matched = score_message(text)
+    predicted = score >= SPECULATIVE_SEARCH_THRESHOLD
+    logger.info(f"Search prediction: {predicted} (score={score}, features={matched})")
+    return predicted
+
+
+# Warm-container counters for speculation accuracy and wasted search cost
+stats = {"predicted": 0, "hits": 0, "late": 0, "wasted": 0, "misses": 0, "wastedSeconds": 0.0}
+
+
+def record_outcome(predicted: bool, tool_called: bool, used: bool, search_seconds: float) -> str:
+    """Record how a speculative search turned out.
+
+    Outcomes: ``hit`` (result used), ``late`` (search needed but not ready in
+    time), ``wasted`` (no search needed), ``miss`` (search needed but not
+    predicted) and ``skip`` (neither predicted nor needed).
+
+    Args:
+        predicted: Whether a speculative search was started
+        tool_called: Whether the model asked for search_with_grok
+        used: Whether the speculative result was used for the reply
+        search_seconds: Time the speculative search ran before being used or dropped
+
+    Returns:
+        The outcome name
+    """
+    if predicted:
+        stats["predicted"] += 1
+        if used:
+            outcome = "hit"
+            stats["hits"] += 1
+        elif tool_called:
+            outcome = "late"
+            stats["late"] += 1
+        else:
+            outcome = "wasted"
+            stats["wasted"] += 1
+        if not used:
+            stats["wastedSeconds"] += search_seconds
+    elif tool_called:
+        outcome = "miss"
+        stats["misses"] += 1
+    else:
+        outcome = "skip"
+
+    precision = stats["hits"] / stats["predicted"] if stats["predicted"] else 0.0
+    logger.info(f"Speculative search outcome: {outcome} (precision={precision:.2f}, stats={stats})")
+    return outcome
@@ -0,0 +1,215 @@
+import logging
+import os
+import random
+import re
+import time
+import unicodedata
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables (the cache is opt-in)
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.88"))
+SEMANTIC_CACHE_TTL_S = float(os.environ.get("SEMANTIC_CACHE_TTL_S", "600"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "256"))
+# Fraction of hits that are re-answered by the backend to measure false hits
+SEMANTIC_CACHE_AUDIT_RATE = float(os.environ.get("SEMANTIC_CACHE_AUDIT_RATE", "0.05"))
+
+# Only short, standalone questions are worth sharing between users
+MAX_CACHEABLE_LENGTH = 60
+
+VECTOR_DIM = 512
+NGRAM_SIZES = (1, 2, 3)
+
+# A cached answer that shares less than this with a fresh answer counts as a false hit
+FALSE_HIT_SIMILARITY = 0.35
+
+_PUNCTUATION = re.compile(r"[\s\W_]+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text for vectorizing (NFKC, lower case, no punctuation or spaces).
+
+    Args:
+        text: Raw text
+
+    Returns:
+        Normalized text
+    """
+    return _PUNCTUATION.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+def embed_text(text: str, dim: int = VECTOR_DIM) -> np.ndarray:
+    """Embed text with a signed character n-gram hashing vectorizer.
+
+    Args:
+        text: Text to embed
+        dim: Vector dimension
+
+    Returns:
+        L2-normalized float32 vector (all zeros for empty text)
+    """
+    normalized = normalize_text(text)
+    vector = np.zeros(dim, dtype=np.float32)
+    for n in NGRAM_SIZES:
+        for i in range(len(normalized) - n + 1):
+            digest = zlib.crc32(normalized[i : i + n].encode("utf-8"))
+            # Low bits pick the slot, one high bit picks the sign to reduce collision bias
+            vector[digest % dim] += 1.0 if digest & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+class SemanticCache:
+    """Fixed-size, array-backed cache of responses keyed by question vectors.
+
+    Lookups are a single matrix-vector product over the live rows. Entries
+    expire after ``ttl_s`` and the least recently used row is overwritten
+    when the cache is full.
+    """
+
+    def __init__(
+        self,
+        capacity: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl_s: float = SEMANTIC_CACHE_TTL_S,
+        dim: int = VECTOR_DIM,
+    ):
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        # expires_at == 0 marks an empty row
+        self._expires_at = np.zeros(capacity, dtype=np.float64)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._questions: list[str | None] = [None] * capacity
+        self._responses: list[str | None] = [None] * capacity
+        self.stats = {"lookups": 0, "hits": 0, "audits": 0, "falseHits": 0, "evictions": 0}
+
+    def _best_match(self, vector: np.ndarray, now: float) -> tuple[int, float]:
+        live = self._expires_at > now
+        if not live.any():
+            return -1, 0.0
+        scores = self._vectors @ vector
+        scores[~live] = -1.0
+        index = int(np.argmax(scores))
+        return index, float(scores[index])
+
+    def lookup(self, question: str, now: float | None = None) -> tuple[int, str, float] | None:
+        """Find a cached response for a similar question.
+
+        Args:
+            question: User question
+            now: Current epoch seconds (defaults to time.time())
+
+        Returns:
+            Tuple of (entry index, cached response, similarity) on a hit, otherwise None
+        """
+        now = time.time() if now is None else now
+        self.stats["lookups"] += 1
+        index, score = self._best_match(embed_text(question, self._vectors.shape[1]), now)
+        if index < 0 or score < self.threshold:
+            return None
+
+        self.stats["hits"] += 1
+        self._last_used[index] = now
+        logger.info(
+            f"Semantic cache hit (score={score:.3f}) for '{question}' "
+            f"matching '{self._questions[index]}'"
+        )
+        return index, self._responses[index], score  # type: ignore[return-value]
+
+    def store(self, question: str, response: str, now: float | None = None) -> None:
+        """Cache a response, replacing a near-duplicate, an empty or the LRU row.
+
+        Args:
+            question: User question
+            response: Backend response to reuse
+            now: Current epoch seconds (defaults to time.time())
+        """
+        now = time.time() if now is None else now
+        vector = embed_text(question, self._vectors.shape[1])
+        index, score = self._best_match(vector, now)
+        if index < 0 or score < self.threshold:
+            free = np.flatnonzero(self._expires_at <= now)
+            if free.size:
+                index = int(free[0])
+            else:
+                index = int(np.argmin(self._last_used))
+                self.stats["evictions"] += 1
+
+        self._vectors[index] = vector
+        self._expires_at[index] = now + self.ttl_s
+        self._last_used[index] = now
+        self._questions[index] = question
+        self._responses[index] = response
+
+    def invalidate(self, index: int) -> None:
+        """Drop one entry.
+
+        Args:
+            index: Entry index returned by lookup
+        """
+        self._expires_at[index] = 0.0
+        self._questions[index] = None
+        self._responses[index] = None
+
+    def should_audit(self) -> bool:
+        """Decide whether this hit should be re-answered by the backend for auditing."""
+        return random.random() < SEMANTIC_CACHE_AUDIT_RATE
+
+    def record_audit(self, index: int, cached_response: str, fresh_response: str | None) -> bool:
+        """Compare a cached response with a fresh one and count false hits.
+
+        A fresh answer that needed a tool call, or that shares little with
+        the cached answer, marks the hit as false and evicts the entry.
+
+        Args:
+            index: Entry index returned by lookup
+            cached_response: Response the cache would have returned
+            fresh_response: Backend response (None if the backend asked for a tool)
+
+        Returns:
+            True if the hit was a false hit
+        """
+        self.stats["audits"] += 1
+        false_hit = fresh_response is None or (
+            float(embed_text(cached_response) @ embed_text(fresh_response)) < FALSE_HIT_SIMILARITY
+        )
+        if false_hit:
+            self.stats["falseHits"] += 1
+            self.invalidate(index)
+        logger.info(f"Semantic cache audit: falseHit={false_hit}, stats={self.stats}")
+        return false_hit
+
+    def hit_rate(self) -> float:
+        """Get the fraction of lookups that were hits."""
+        return self.stats["hits"] / self.stats["lookups"] if self.stats["lookups"] else 0.0
+
+
+def cacheable_question(messages: list) -> str | None:
+    """Get the question text if this turn may be served from the cache.
+
+    Only first turns (no earlier context) with a short question qualify.
+
+    Args:
+        messages: Conversation messages
+
+    Returns:
+        The question text, or None if the turn should not use the cache
+    """
+    if len(messages) != 1 or messages[0].get("role") != "user":
+        return None
+    question = messages[0].get("content") or ""
+    if not normalize_text(question) or len(question) > MAX_CACHEABLE_LENGTH:
+        return None
+    return question
+
+
+# Warm-container cache shared by invocations (None when disabled)
+response_cache = SemanticCache() if SEMANTIC_CACHE_ENABLED else None
@@ -0,0 +1,108 @@
+import logging
+import random
+import time
+from collections.abc import Callable
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class Lifecycle:
+    """Ordered before-snapshot and after-restore hooks for one process.
+
+    Before-snapshot hooks run in reverse registration order so that modules
+    imported later (which may depend on earlier ones) release their state
+    first; after-restore hooks run in registration order so dependencies are
+    rebuilt before the modules that use them.
+    """
+
+    def __init__(self):
+        self._before_snapshot: list[Callable[[], None]] = []
+        self._after_restore: list[Callable[[], None]] = []
+        self.phase = "init"
+
+    def before_snapshot(self, func: Callable[[], None]) -> Callable[[], None]:
+        """Register a hook that drops secrets and connections before the snapshot.
+
+        Args:
+            func: Hook taking no arguments
+
+        Returns:
+            func, so this can be used as a decorator
+        """
+        self._before_snapshot.append(func)
+        return func
+
+    def after_restore(self, func: Callable[[], None]) -> Callable[[], None]:
+        """Register a hook that reloads secrets and connections after a restore.
+
+        Args:
+            func: Hook taking no arguments
+
+        Returns:
+            func, so this can be used as a decorator
+        """
+        self._after_restore.append(func)
+        return func
+
+    def _run(self, hooks: list[Callable[[], None]], phase: str) -> None:
+        started = time.perf_counter()
+        for hook in hooks:
+            hook_started = time.perf_counter()
+            hook()
+            logger.info(
+                f"SnapStart {phase} hook {hook.__module__}.{hook.__qualname__} "
+                f"took {(time.perf_counter() - hook_started) * 1000:.1f}ms"
+            )
+        self.phase = phase
+        logger.info(
+            f"SnapStart {phase}: {len(hooks)} hooks in {(time.perf_counter() - started) * 1000:.1f}ms"
+        )
+
+    def run_before_snapshot(self) -> None:
+        """Run the before-snapshot hooks (called by the runtime)."""
+        self._run(list(reversed(self._before_snapshot)), "snapshot")
+
+    def run_after_restore(self) -> None:
+        """Run the after-restore hooks (called by the runtime)."""
+        self._run(self._after_restore, "restored")
+
+    def simulate(self) -> None:
+        """Run a snapshot and restore cycle locally, as SnapStart would."""
+        self.run_before_snapshot()
+        self.run_after_restore()
+
+
+# Process-wide lifecycle shared by every handler module
+lifecycle = Lifecycle()
+before_snapshot = lifecycle.before_snapshot
+after_restore = lifecycle.after_restore
+
+
+@after_restore
+def reseed_random() -> None:
+    """Reseed the random module so restored environments do not share one sequence."""
+    random.seed()
+
+
+def prewarm_imports(*module_names: str) -> None:
+    """Import modules that are otherwise imported lazily so they land in the snapshot.
+
+    Args:
+        module_names: Module names to import
+    """
+    for name in module_names:
+        try:
+            __import__(name)
+        except Exception as e:
+            logger.warning(f"SnapStart prewarm import of {name} failed: {e}")
+
+
+try:
+    # Provided by the Lambda Python runtime when SnapStart is enabled
+    from snapshot_restore_py import register_after_restore, register_before_snapshot
+
+    register_before_snapshot(lifecycle.run_before_snapshot)
+    register_after_restore(lifecycle.run_after_restore)
+except ImportError:
+    pass
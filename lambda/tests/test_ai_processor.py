@@ -16,7 +16,12 @@ with patch.dict(
         "AI_BACKEND": "groq",
     },
 ):
-    from ai_processor import delete_conversation_history
+    from ai_processor import (
+        DEADLINE_RESPONSE,
+        delete_conversation_history,
+        get_ai_response,
+        lambda_handler,
+    )
 
 
 class TestAiProcessor(unittest.TestCase):
@@ -50,6 +55,44 @@ class TestAiProcessor(unittest.TestCase):
         self.assertFalse(result)
         mock_table.query.assert_called_once()
 
+    @patch("ai_processor.get_ai_response")
+    @patch("ai_processor.save_conversation_context")
+    def test_lambda_handler_skips_call_when_deadline_exhausted(self, mock_save, mock_get_ai):
+        """An exhausted deadline budget should return the fallback without calling the LLM."""
+        event = {
+            "userId": "test_user",
+            "conversationContext": {"messages": [{"role": "user", "content": "hi"}]},
+            "deadlineMs": 0,
+        }
+
+        result = lambda_handler(event, None)
+
+        self.assertFalse(result["hasToolCall"])
+        self.assertEqual(result["aiResponse"], DEADLINE_RESPONSE)
+        mock_get_ai.assert_not_called()
+        mock_save.assert_not_called()
+
+    @patch("ai_processor.get_groq_client")
+    def test_get_ai_response_collects_all_tool_calls(self, mock_get_client):
+        """Every search_with_grok call in a turn should be forwarded, not just the first."""
+        tool_calls = []
+        for query in ("大阪の天気", "阪神の試合結果"):
+            tool_call = MagicMock()
+            tool_call.function.name = "search_with_grok"
+            tool_call.function.arguments = f'{{"query": "{query}"}}'
+            tool_calls.append(tool_call)
+        response = MagicMock()
+        response.choices[0].message.tool_calls = tool_calls
+        mock_get_client.return_value.chat.completions.create.return_value = response
+
+        result = get_ai_response([{"role": "user", "content": "天気と野球教えて"}])
+
+        self.assertTrue(result["hasToolCall"])
+        self.assertEqual(
+            [q["query"] for q in result["toolQueries"]], ["大阪の天気", "阪神の試合結果"]
+        )
+        self.assertEqual(result["toolQuery"], "大阪の天気")
+
 
 if __name__ == "__main__":
     unittest.main()
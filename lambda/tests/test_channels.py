@@ -0,0 +1,219 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+with (
+    patch("boto3.client"),
+    patch("boto3.resource"),
+    patch("core.runtime.get_secret", return_value="token"),
+    patch("webhook_handler.get_secret", return_value="default-secret"),
+):
+    import core
+    import grok_processor
+    import ingest_consumer
+    import ingest_queue
+    import response_sender
+    import webhook_handler
+    from core import channels
+
+OTHER_BOT = "Uother"
+CHANNELS = {OTHER_BOT: {"channelSecretName": "other-secret", "accessTokenName": "other-token"}}
+SECRETS = {"other-secret": "other-channel-secret", "other-token": "other-access-token"}
+
+
+def webhook_body(destination=OTHER_BOT, text="こんにちは"):
+    return json.dumps(
+        {
+            "destination": destination,
+            "events": [
+                {
+                    "type": "message",
+                    "mode": "active",
+                    "timestamp": 1700000000000,
+                    "source": {"type": "user", "userId": "U1"},
+                    "webhookEventId": "evt-1",
+                    "deliveryContext": {"isRedelivery": False},
+                    "replyToken": "reply",
+                    "message": {"id": "1", "type": "text", "text": text, "quoteToken": "q"},
+                }
+            ],
+        }
+    )
+
+
+def sign(body, secret):
+    digest = hmac.new(secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+
+class TestChannelCache(unittest.TestCase):
+    def test_least_recently_used_channel_is_evicted(self):
+        """Only max_entries channels stay warm; a touched channel survives the eviction."""
+        built = []
+        cache = core.ChannelCache(lambda channel_id: built.append(channel_id) or channel_id, 2)
+
+        cache.get("a")
+        cache.get("b")
+        cache.get("a")
+        cache.get("c")
+        cache.get("a")
+        cache.get("b")
+
+        self.assertEqual(built, ["a", "b", "c", "b"])
+        self.assertEqual(cache.stats, {"hits": 2, "misses": 4, "evictions": 2})
+        self.assertEqual(len(cache), 2)
+
+
+class TestChannelRouting(unittest.TestCase):
+    def setUp(self):
+        for target in (
+            patch.object(channels, "LINE_CHANNELS", CHANNELS),
+            patch("webhook_handler.get_secret", side_effect=SECRETS.get),
+            patch("core.channels.get_secret", side_effect=SECRETS.get),
+            patch("core.runtime.get_secret", return_value="token"),
+        ):
+            target.start()
+            self.addCleanup(target.stop)
+        webhook_handler.channel_handlers.clear()
+        channels.configurations.clear()
+
+    def test_resolve_channel(self):
+        """Configured destinations map to their channel, anything else to the default."""
+        self.assertEqual(core.resolve_channel(OTHER_BOT), OTHER_BOT)
+        self.assertEqual(core.resolve_channel("Uunknown"), core.DEFAULT_CHANNEL)
+        self.assertEqual(core.resolve_channel(None), core.DEFAULT_CHANNEL)
+        self.assertEqual(webhook_handler.route_channel("not json"), core.DEFAULT_CHANNEL)
+
+    def test_single_channel_deployment_skips_parsing(self):
+        """Without LINE_CHANNELS the body is not parsed just to route it."""
+        with (
+            patch.object(channels, "LINE_CHANNELS", {}),
+            patch("webhook_handler.json.loads") as mock_loads,
+        ):
+            self.assertEqual(webhook_handler.route_channel(webhook_body()), core.DEFAULT_CHANNEL)
+        mock_loads.assert_not_called()
+
+    def test_signature_is_verified_with_the_channel_secret(self):
+        """Each channel's webhooks are checked against that channel's own secret."""
+        body = webhook_body()
+
+        self.assertTrue(
+            webhook_handler.verify_signature(body, sign(body, "other-channel-secret"), OTHER_BOT)
+        )
+        self.assertFalse(
+            webhook_handler.verify_signature(body, sign(body, "default-secret"), OTHER_BOT)
+        )
+
+    @patch("webhook_handler.traffic_capture.capture_webhook")
+    @patch("webhook_handler.handle_message")
+    def test_webhook_is_dispatched_with_its_channel(self, mock_handle, _mock_capture):
+        """The destination picks the handler and the channel reaches handle_message."""
+        body = webhook_body()
+        event = {"body": body, "headers": {"x-line-signature": sign(body, "other-channel-secret")}}
+
+        response = webhook_handler.lambda_handler(event, None)
+
+        self.assertEqual(response["statusCode"], 200)
+        self.assertEqual(mock_handle.call_args.args[1], OTHER_BOT)
+
+    def test_other_channel_uses_its_destination_as_bot_id(self):
+        """Mention checks of other channels need no get_bot_info call."""
+        with patch("webhook_handler.MessagingApi") as mock_api:
+            self.assertEqual(webhook_handler.get_bot_user_id(OTHER_BOT), OTHER_BOT)
+        mock_api.assert_not_called()
+
+    def test_channel_travels_in_workflow_payload(self):
+        """Only payloads of other channels carry channelId, so old executions stay valid."""
+        context = {"messages": []}
+
+        other = webhook_handler.build_workflow_input(
+            "U1", context, "user", "U1", None, 0, OTHER_BOT
+        )
+        default = webhook_handler.build_workflow_input(
+            "U1", context, "user", "U1", None, 0, core.DEFAULT_CHANNEL
+        )
+
+        self.assertEqual(other["channelId"], OTHER_BOT)
+        self.assertNotIn("channelId", default)
+
+    @patch("grok_processor.call_grok_api_batch")
+    def test_channel_survives_the_search_step(self, mock_search):
+        """The Grok step hands channelId on, so the search answer uses the channel token."""
+        event = webhook_handler.build_workflow_input(
+            "U1", {"messages": []}, "user", "U1", None, 0, OTHER_BOT
+        )
+        event.update({"hasToolCall": True, "toolQuery": "大阪の天気"})
+
+        for outcome in ({"return_value": ["晴れやで"]}, {"side_effect": RuntimeError("grok down")}):
+            with self.subTest(outcome=outcome):
+                mock_search.configure_mock(**outcome)
+                with patch("response_sender.send_line_message") as send:
+                    result = grok_processor.lambda_handler(dict(event), None)
+                    response_sender.lambda_handler(result, None)
+
+                self.assertEqual(result["channelId"], OTHER_BOT)
+                self.assertNotIn("toolQuery", result)
+                self.assertEqual(send.call_args.kwargs["channel_id"], OTHER_BOT)
+
+    @patch("webhook_handler.traffic_capture.capture_webhook")
+    def test_queue_mode_prefilter_judges_mentions_per_channel(self, _mock_capture):
+        """Another channel's group mentions are matched to that bot, not the default one."""
+        payload = json.loads(webhook_body())
+        payload["events"][0]["source"] = {"type": "group", "groupId": "G1", "userId": "U1"}
+        payload["events"][0]["message"]["mention"] = {
+            "mentionees": [{"index": 0, "length": 4, "type": "user", "userId": OTHER_BOT}]
+        }
+        body = json.dumps(payload)
+        queue = MagicMock()
+        with (
+            patch.object(webhook_handler, "INGESTION_MODE", "queue"),
+            patch.object(webhook_handler.webhook_prefilter, "WEBHOOK_PREFILTER_ENABLED", True),
+            patch.object(webhook_handler, "BOT_USER_ID", None),
+            patch("webhook_handler.ingest_queue.get_queue", return_value=queue),
+        ):
+            response = webhook_handler.lambda_handler(
+                {"body": body, "headers": {"x-line-signature": sign(body, "other-channel-secret")}},
+                None,
+            )
+            default_bot_id = webhook_handler.BOT_USER_ID
+
+        self.assertEqual(response["statusCode"], 200)
+        queue.send.assert_called_once()
+        self.assertIsNone(default_bot_id)
+
+    def test_queued_webhook_keeps_its_channel(self):
+        """The ingest consumer resolves the channel from the queued body's destination."""
+        with patch("ingest_consumer.webhook_handler.accept_message", return_value={}) as accept:
+            record = {
+                "messageId": "m1",
+                "body": ingest_queue.encode_envelope(webhook_body(), 1700000000000),
+            }
+            ingest_consumer.parse_record(record)
+
+        self.assertEqual(accept.call_args.args[1], OTHER_BOT)
+
+    @patch("linebot.v3.messaging.MessagingApi")
+    def test_push_uses_the_channel_token(self, mock_api):
+        """send_line_message pushes with the token of the payload's channel."""
+        used = []
+        mock_api.side_effect = lambda client: (
+            used.append(client.configuration.access_token) or MagicMock()
+        )
+
+        core.send_line_message("U1", "まいど", channel_id=OTHER_BOT)
+        core.send_line_message("U1", "まいど")
+
+        self.assertEqual(used, ["other-access-token", "token"])
+        self.assertIs(core.channel_configuration(OTHER_BOT), core.channel_configuration(OTHER_BOT))
+
+
+if __name__ == "__main__":
+    unittest.main()
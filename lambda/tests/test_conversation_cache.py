@@ -0,0 +1,180 @@
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+with (
+    patch("boto3.client"),
+    patch("boto3.resource"),
+    patch("webhook_handler.get_secret", return_value="test_secret"),
+):
+    import core
+    import webhook_handler
+    from conversation_cache import ConversationCache
+
+
+class FakeConversationTable:
+    """Stores items by userId and evaluates the version conditions used by core."""
+
+    def __init__(self):
+        self.items = {}
+        self.queries = 0
+        self.version_reads = 0
+        self.puts = 0
+        self.rejected_puts = 0
+
+    def get_item(self, Key, ProjectionExpression, **_):
+        self.version_reads += 1
+        item = self.items.get(Key["userId"])
+        if item is None:
+            return {}
+        return {"Item": {k: item[k] for k in ProjectionExpression.split(", ") if k in item}}
+
+    def query(self, ExpressionAttributeValues, **_):
+        self.queries += 1
+        item = self.items.get(ExpressionAttributeValues[":user_id"])
+        return {"Items": [dict(item)] if item else []}
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeValues=None, **_):
+        self.puts += 1
+        stored = self.items.get(Item["userId"])
+        if ConditionExpression == "attribute_not_exists(version)":
+            ok = stored is None or "version" not in stored
+        elif ConditionExpression == "version = :expected":
+            ok = (
+                stored is not None
+                and stored.get("version") == ExpressionAttributeValues[":expected"]
+            )
+        else:
+            ok = True
+        if not ok:
+            self.rejected_puts += 1
+            response = {"Error": {"Code": "ConditionalCheckFailedException", "Message": "x"}}
+            if stored is not None:
+                serializer = TypeSerializer()
+                response["Item"] = {k: serializer.serialize(v) for k, v in stored.items()}
+            raise ClientError(response, "PutItem")
+        self.items[Item["userId"]] = dict(Item)
+
+
+class TestConversationCache(unittest.TestCase):
+    def setUp(self):
+        self.table = FakeConversationTable()
+        self.cache = ConversationCache(max_entries=2)
+        for target, value in [
+            ("conversation_cache.conversations", self.cache),
+            ("webhook_handler.conversation_table", self.table),
+            ("core.conversations.conversation_table", lambda: self.table),
+            ("transcript_codec.TRANSCRIPT_ENCODING", "json"),
+        ]:
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def send(self, user_id, text):
+        context = webhook_handler.get_conversation_context(user_id)
+        webhook_handler.append_user_message(context, text)
+        webhook_handler.save_conversation_context(user_id, context)
+        return context
+
+    def answer(self, user_id, text):
+        """ResponseSender saves the answer from another container."""
+        stored = dict(self.table.items[user_id])
+        stored["messages"] = stored["messages"] + [{"role": "assistant", "content": text}]
+        core.save_conversation_context(user_id, stored)
+
+    def test_hit_reads_only_the_version(self):
+        """Messages sent before the bot answers reuse the cached transcript."""
+        self.send("U1", "one")
+        self.send("U1", "two")
+        context = self.send("U1", "three")
+
+        self.assertEqual(self.table.queries, 1)
+        self.assertEqual(self.table.version_reads, 2)
+        self.assertEqual([m["content"] for m in context["messages"]], ["one", "two", "three"])
+        self.assertEqual(self.table.items["U1"]["version"], context["version"])
+        self.assertEqual((self.cache.stats["hits"], self.cache.stats["stale"]), (2, 0))
+
+    def test_stale_entry_is_read_again(self):
+        """A write by another stage is caught by the version read, before any write."""
+        self.send("U1", "question")
+        self.answer("U1", "answer")
+
+        context = self.send("U1", "follow-up")
+
+        self.assertEqual(
+            [m["content"] for m in context["messages"]], ["question", "answer", "follow-up"]
+        )
+        self.assertEqual(self.table.items["U1"]["messages"], context["messages"])
+        self.assertEqual(self.table.queries, 2)
+        self.assertEqual(self.table.rejected_puts, 0)
+        self.assertEqual(self.cache.stats["stale"], 1)
+
+    def test_concurrent_write_is_merged(self):
+        """A write between the read and the save fails and is merged with the stored item."""
+        first = self.send("U1", "question")
+        context = webhook_handler.get_conversation_context("U1")
+        webhook_handler.append_user_message(context, "follow-up")
+        self.answer("U1", "answer")
+
+        webhook_handler.save_conversation_context("U1", context)
+
+        self.assertEqual(
+            [m["content"] for m in context["messages"]], ["question", "answer", "follow-up"]
+        )
+        self.assertEqual(self.table.rejected_puts, 1)
+        # The stored item carried the first turn's generation; this turn's one is kept
+        self.assertNotEqual(context["generation"], first["generation"])
+        self.assertEqual(self.table.items["U1"]["generation"], context["generation"])
+
+    def test_session_window_checked_on_cached_copy(self):
+        """A cached conversation older than 30 minutes starts a new one without a read."""
+        self.send("U1", "old")
+        old = datetime.now(timezone.utc) - timedelta(minutes=31)
+        self.table.items["U1"]["lastActivity"] = old.isoformat()
+        entry = self.cache._entries["U1"]
+        entry["lastActivity"] = old.isoformat()
+
+        context = self.send("U1", "new")
+
+        self.assertEqual([m["content"] for m in context["messages"]], ["new"])
+        self.assertEqual(self.table.queries, 1)
+        self.assertEqual(self.cache.stats["stale"], 0)
+
+    def test_deleted_history_starts_over(self):
+        """If the stored conversation was deleted the cached copy is not resurrected."""
+        self.send("U1", "secret")
+        del self.table.items["U1"]
+
+        context = self.send("U1", "hello")
+
+        self.assertEqual([m["content"] for m in context["messages"]], ["hello"])
+
+    def test_lru_eviction(self):
+        """The least recently used conversation is evicted beyond max_entries."""
+        self.send("U1", "a")
+        self.send("U2", "b")
+        self.send("U1", "c")
+        self.send("U3", "d")
+
+        self.assertEqual(list(self.cache._entries), ["U1", "U3"])
+        self.assertEqual(self.cache.stats["evictions"], 1)
+
+    def test_cache_returns_copies(self):
+        """Mutating a context taken from the cache does not change the cached entry."""
+        self.send("U1", "a")
+        context = self.cache.get("U1")
+        context["messages"].append({"role": "user", "content": "unsaved"})
+
+        self.assertEqual(len(self.cache.get("U1")["messages"]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,250 @@
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import unittest
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import conversation_export
+import transcript_codec
+from conversation_export import (
+    CONVERSATION_COLUMNS,
+    JsonlBatchWriter,
+    SegmentThrottle,
+    conversation_row,
+    export,
+    flat_row,
+    parallel_scan,
+)
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def conversation_item(user_id, gaps_s=(0, 60, 30), compressed=True):
+    messages = []
+    at = START
+    for i, gap in enumerate(gaps_s):
+        at += timedelta(seconds=gap)
+        messages.append(
+            {
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": "あ" * (i + 1),
+                "timestamp": at.isoformat(),
+            }
+        )
+    context = {"userId": user_id, "messages": messages, "lastActivity": at.isoformat()}
+    if compressed:
+        item = {k: v for k, v in context.items() if k != "messages"}
+        item[transcript_codec.BINARY_ATTRIBUTE] = transcript_codec.encode_messages(messages)
+        return item
+    return context
+
+
+class FakeScanTable:
+    """Serves Segment/TotalSegments scans over hash-partitioned items with 1 RCU per item."""
+
+    def __init__(self, items, delay_s=0.0, fail_segment=None):
+        self.items = items
+        self.delay_s = delay_s
+        self.fail_segment = fail_segment
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def scan(self, Segment, TotalSegments, Limit, ExclusiveStartKey=None, **kwargs):
+        with self.lock:
+            self.requests.append((Segment, ExclusiveStartKey, kwargs))
+        if Segment == self.fail_segment:
+            raise RuntimeError("ProvisionedThroughputExceededException")
+        time.sleep(self.delay_s)
+        mine = [item for i, item in enumerate(self.items) if i % TotalSegments == Segment]
+        start = ExclusiveStartKey or 0
+        page = mine[start : start + Limit]
+        response = {"Items": page, "ConsumedCapacity": {"CapacityUnits": float(len(page))}}
+        if start + Limit < len(mine):
+            response["LastEvaluatedKey"] = start + Limit
+        return response
+
+
+class TestParallelScan(unittest.TestCase):
+    def test_reads_every_item_once_across_segments(self):
+        """All segments are paged to the end and no item is lost or duplicated."""
+        items = [{"userId": f"U{i}"} for i in range(95)]
+        table = FakeScanTable(items)
+
+        scanned = list(parallel_scan(table, segments=4, rcu_per_segment=1e9, page_size=10))
+
+        self.assertEqual(sorted(i["userId"] for i in scanned), sorted(i["userId"] for i in items))
+        self.assertEqual({segment for segment, _, _ in table.requests}, {0, 1, 2, 3})
+
+    def test_segments_run_concurrently(self):
+        """Four segments with slow pages finish in about the time of one."""
+        table = FakeScanTable([{"userId": f"U{i}"} for i in range(8)], delay_s=0.1)
+
+        started = time.monotonic()
+        list(parallel_scan(table, segments=4, rcu_per_segment=1e9, page_size=2))
+
+        self.assertLess(time.monotonic() - started, 0.3)
+
+    def test_segment_error_is_raised(self):
+        """A failing segment stops the export instead of silently dropping data."""
+        table = FakeScanTable([{"userId": f"U{i}"} for i in range(20)], fail_segment=1)
+
+        with self.assertRaises(RuntimeError):
+            list(parallel_scan(table, segments=2, rcu_per_segment=1e9, page_size=5))
+
+    def test_memory_stays_bounded(self):
+        """Only a few pages are held however many items the table has."""
+
+        class GeneratingTable:
+            # Builds every page on request, like a real table, so nothing is retained upstream
+            def scan(self, Segment, Limit, ExclusiveStartKey=None, **_):
+                start = ExclusiveStartKey or 0
+                page = [
+                    {"userId": f"U{Segment}-{start + i}", "payload": "x" * 1000}
+                    for i in range(Limit)
+                ]
+                response = {"Items": page}
+                if start + Limit < 2000:
+                    response["LastEvaluatedKey"] = start + Limit
+                return response
+
+        tracemalloc.start()
+        count = 0
+        for _ in parallel_scan(GeneratingTable(), segments=2, rcu_per_segment=1e9, page_size=50):
+            count += 1
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.assertEqual(count, 4000)
+        # 4000 items of ~1KB; the bounded queue holds at most a handful of 50-item pages
+        self.assertLess(peak, 1_000_000)
+
+
+class TestSegmentThrottle(unittest.TestCase):
+    def test_waits_when_budget_is_exceeded(self):
+        """A segment consuming more than its RCU budget sleeps the difference."""
+        now = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        throttle = SegmentThrottle(10, sleep=sleep, clock=lambda: now[0])
+        for _ in range(5):
+            throttle.consume(10)  # 50 RCU with a 10 RCU/s budget
+
+        self.assertAlmostEqual(sum(sleeps), 4.0)
+        self.assertAlmostEqual(throttle.waited_s, 4.0)
+
+    def test_scan_uses_one_throttle_per_segment(self):
+        """Consumed capacity is charged to the segment that read it."""
+        charged = {}
+
+        class Recorder(SegmentThrottle):
+            def consume(self, capacity_units):
+                charged.setdefault(id(self), []).append(capacity_units)
+
+        table = FakeScanTable([{"userId": f"U{i}"} for i in range(30)])
+        list(
+            parallel_scan(
+                table, segments=3, rcu_per_segment=5, page_size=4, throttle_factory=Recorder
+            )
+        )
+
+        self.assertEqual(len(charged), 3)
+        self.assertEqual(sum(sum(units) for units in charged.values()), 30)
+        self.assertTrue(
+            all(kwargs["ReturnConsumedCapacity"] == "TOTAL" for *_, kwargs in table.requests)
+        )
+
+
+class TestRows(unittest.TestCase):
+    def test_conversation_row(self):
+        """Rows summarize roles, characters and gaps of compressed and legacy items."""
+        for compressed in (True, False):
+            row = conversation_row(conversation_item("U1", compressed=compressed))
+
+            self.assertEqual(row["messageCount"], 3)
+            self.assertEqual((row["userMessages"], row["assistantMessages"]), (2, 1))
+            self.assertEqual((row["userChars"], row["assistantChars"]), (4, 2))
+            self.assertEqual((row["sessionSpanS"], row["maxGapS"], row["meanGapS"]), (90, 60, 45))
+            self.assertEqual(row["compressed"], compressed)
+
+    def test_auxiliary_items_are_skipped(self):
+        """Rate-limit buckets stored in the same table are not conversations."""
+        self.assertIsNone(conversation_row({"userId": "ratelimit#user#U1", "tat": Decimal(1)}))
+
+    def test_flat_row_converts_decimals(self):
+        """Numbers from DynamoDB become ints or floats."""
+        row = flat_row({"id": "U1", "calls": Decimal(3), "costUsd": Decimal("0.25"), "m": {}})
+
+        self.assertEqual(row, {"id": "U1", "calls": 3, "costUsd": 0.25})
+
+
+class TestExport(unittest.TestCase):
+    def test_jsonl_batches(self):
+        """The pipeline writes one chunk file per batch with fixed columns."""
+        items = [conversation_item(f"U{i}") for i in range(5)] + [{"userId": "ratelimit#x"}]
+        with tempfile.TemporaryDirectory() as directory:
+            result = export(iter(items), JsonlBatchWriter(directory), batch_size=2)
+
+            self.assertEqual((result["items"], result["rows"]), (6, 5))
+            self.assertEqual(len(result["files"]), 3)
+            with open(result["files"][0], encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f]
+        self.assertEqual(list(rows[0]), CONVERSATION_COLUMNS)
+
+    @unittest.skipIf(conversation_export.pyarrow is None, "pyarrow is not installed")
+    def test_parquet_row_groups(self):
+        """With pyarrow each batch becomes a row group of one Parquet file."""
+        import pyarrow.parquet
+
+        items = [conversation_item(f"U{i}") for i in range(5)]
+        with tempfile.TemporaryDirectory() as directory:
+            writer = conversation_export.make_writer(directory, "parquet")
+            result = export(iter(items), writer, batch_size=2)
+            parquet = pyarrow.parquet.ParquetFile(result["files"][0])
+
+            self.assertEqual(parquet.metadata.num_rows, 5)
+            self.assertEqual(parquet.metadata.num_row_groups, 3)
+
+
+@unittest.skipUnless(importlib.util.find_spec("moto"), "moto is not installed")
+class TestExportAgainstMoto(unittest.TestCase):
+    def test_parallel_scan_of_moto_table(self):
+        """The exporter reads a real (mocked) DynamoDB table end to end."""
+        import boto3
+        from moto import mock_aws
+
+        with mock_aws():
+            dynamodb = boto3.resource("dynamodb", region_name="ap-northeast-1")
+            table = dynamodb.create_table(
+                TableName="line-bot-conversations",
+                KeySchema=[{"AttributeName": "userId", "KeyType": "HASH"}],
+                AttributeDefinitions=[{"AttributeName": "userId", "AttributeType": "S"}],
+                BillingMode="PAY_PER_REQUEST",
+            )
+            for i in range(50):
+                table.put_item(Item=conversation_item(f"U{i}"))
+
+            with tempfile.TemporaryDirectory() as directory:
+                result = export(
+                    parallel_scan(table, segments=4, page_size=7),
+                    JsonlBatchWriter(directory),
+                    batch_size=20,
+                )
+
+        self.assertEqual(result["rows"], 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.runtime import Registry
+
+
+class TestRegistry(unittest.TestCase):
+    def test_nested_factories_do_not_deadlock(self):
+        """A factory may ask the registry for another instance (table -> resource)."""
+        registry = Registry()
+
+        def make_table():
+            return ("table", registry.get("resource", "dynamodb", lambda: "resource"))
+
+        result = []
+        worker = threading.Thread(
+            target=lambda: result.append(registry.get("table", "t", make_table))
+        )
+        worker.start()
+        worker.join(timeout=5)
+
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(result, [("table", "resource")])
+        self.assertEqual(registry.stats["created"], 2)
+
+    def test_initialized_exactly_once_across_threads(self):
+        """Concurrent first use builds one instance."""
+        registry = Registry()
+        calls = []
+
+        def slow_factory():
+            calls.append(1)
+            time.sleep(0.05)
+            return object()
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(registry.get("client", "sqs", slow_factory))
+            )
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len({id(r) for r in results}), 1)
+
+    def test_drop_by_kind(self):
+        """Dropped kinds are rebuilt on next use; other kinds are kept."""
+        registry = Registry()
+        registry.get("client", "sqs", lambda: "sqs-1")
+        registry.get("secret", "s", lambda: "secret")
+
+        registry.drop("client")
+
+        self.assertEqual(registry.get("client", "sqs", lambda: "sqs-2"), "sqs-2")
+        self.assertEqual(registry.peek("secret", "s"), "secret")
+
+    def test_shared_clients_are_reused(self):
+        """Handlers asking for the same table share one resource and Table object."""
+        import core
+
+        with patch("boto3.resource") as mock_resource:
+            core.registry.drop("resource", "table")
+            first = core.table("shared-table")
+            second = core.table("shared-table")
+
+        self.assertIs(first, second)
+        mock_resource.assert_called_once_with("dynamodb")
+
+
+if __name__ == "__main__":
+    unittest.main()
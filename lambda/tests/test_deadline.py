@@ -0,0 +1,49 @@
+import os
+import sys
+import unittest
+from unittest.mock import Mock, patch
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import deadline
+
+
+class TestDeadline(unittest.TestCase):
+    def _context(self, remaining_ms):
+        context = Mock()
+        context.get_remaining_time_in_millis.return_value = remaining_ms
+        return context
+
+    @patch("deadline.now_ms", return_value=1_000_000)
+    def test_start_budget_adds_pipeline_budget(self, _mock_now):
+        """Deadline should be receipt time plus the pipeline budget."""
+        self.assertEqual(deadline.start_budget(), 1_000_000 + deadline.PIPELINE_BUDGET_MS)
+        self.assertEqual(deadline.start_budget(5), 5 + deadline.PIPELINE_BUDGET_MS)
+
+    @patch("deadline.now_ms", return_value=1_000_000)
+    def test_call_timeout_uses_tighter_limit(self, _mock_now):
+        """The pipeline deadline wins when it is closer than the Lambda timeout."""
+        event = {"deadlineMs": 1_000_000 + 20_000}
+        timeout = deadline.call_timeout(event, self._context(60_000), reserve_ms=5_000)
+        self.assertEqual(timeout, 15.0)
+
+        # Lambda remaining time wins when it is closer
+        event = {"deadlineMs": 1_000_000 + 200_000}
+        timeout = deadline.call_timeout(event, self._context(30_000), reserve_ms=5_000)
+        self.assertEqual(timeout, (30_000 - deadline.HANDLER_RESERVE_MS) / 1000)
+
+    def test_call_timeout_without_limits(self):
+        """No deadline and no context means no timeout."""
+        self.assertIsNone(deadline.call_timeout({}, None))
+
+    @patch("deadline.now_ms", return_value=1_000_000)
+    def test_call_timeout_raises_when_exhausted(self, _mock_now):
+        """Too little remaining budget should stop the call from starting."""
+        event = {"deadlineMs": 1_000_000 + 1_000}
+        with self.assertRaises(deadline.DeadlineExceeded):
+            deadline.call_timeout(event, self._context(60_000), reserve_ms=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+from botocore.exceptions import ClientError
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+with (
+    patch("boto3.client"),
+    patch("boto3.resource"),
+    patch("core.runtime.get_secret", return_value="token"),
+):
+    import ai_processor
+    import core
+    import generation_guard
+    import grok_processor
+    import response_sender
+    import webhook_handler
+
+
+def workflow_event(generation="gen-old", **extra):
+    context = {
+        "userId": "U1",
+        "generation": generation,
+        "messages": [{"role": "user", "content": "明日の天気"}],
+    }
+    return {"userId": "U1", "sourceType": "user", "conversationContext": context, **extra}
+
+
+class TestGenerationGuard(unittest.TestCase):
+    def setUp(self):
+        self.stored = {"generation": "gen-new"}
+        patcher = patch.object(generation_guard, "CANCEL_SUPERSEDED_ENABLED", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch("core.stored_generation", side_effect=lambda _: self.stored["generation"])
+        self.read = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_each_user_message_starts_a_generation(self):
+        """Appending a user message sets a fresh token on the conversation."""
+        context = {"messages": []}
+        webhook_handler.append_user_message(context, "a")
+        first = context["generation"]
+        webhook_handler.append_user_message(context, "b")
+
+        self.assertNotEqual(first, context["generation"])
+
+    def test_is_superseded(self):
+        """Only a different stored token supersedes; the result is kept on the payload."""
+        self.assertFalse(generation_guard.is_superseded(workflow_event("gen-new"), "test"))
+
+        event = workflow_event()
+        self.assertTrue(generation_guard.is_superseded(event, "test"))
+        self.read.reset_mock()
+        self.assertTrue(generation_guard.is_superseded(event, "test"))
+        self.read.assert_not_called()
+
+    def test_disabled_check_never_reads(self):
+        """With the feature off no stage pays for the extra read."""
+        with patch.object(generation_guard, "CANCEL_SUPERSEDED_ENABLED", False):
+            self.assertFalse(generation_guard.is_superseded(workflow_event(), "test"))
+        self.read.assert_not_called()
+
+    @patch("ai_processor.get_ai_response")
+    def test_ai_processor_skips_the_llm_call(self, mock_get_ai):
+        """A superseded execution does not call the model."""
+        result = ai_processor.lambda_handler(workflow_event(), None)
+
+        mock_get_ai.assert_not_called()
+        self.assertFalse(result["hasToolCall"])
+        self.assertTrue(result["superseded"])
+
+    @patch("ai_processor.get_ai_response")
+    def test_ai_processor_drops_search_after_newer_message(self, mock_get_ai):
+        """A newer message arriving during the LLM call cancels the interim push and search."""
+        self.stored["generation"] = "gen-old"
+
+        def answer(*_, **__):
+            self.stored["generation"] = "gen-new"
+            return {"hasToolCall": True, "toolQuery": "天気"}
+
+        mock_get_ai.side_effect = answer
+
+        result = ai_processor.lambda_handler(workflow_event(), None)
+
+        self.assertFalse(result["hasToolCall"])
+        self.assertTrue(result["superseded"])
+
+    @patch(
+        "ai_processor.get_ai_response", return_value={"hasToolCall": False, "aiResponse": "晴れ"}
+    )
+    @patch("ai_processor.save_conversation_context", side_effect=core.GenerationSuperseded)
+    def test_ai_processor_marks_answer_stale_when_save_loses(self, mock_save, _mock_get_ai):
+        """The save is conditioned on the generation; losing it marks the reply stale."""
+        self.stored["generation"] = "gen-old"
+
+        result = ai_processor.lambda_handler(workflow_event(), None)
+
+        self.assertEqual(mock_save.call_args.kwargs["generation"], "gen-old")
+        self.assertTrue(result["superseded"])
+
+    @patch("grok_processor.call_grok_api_batch")
+    def test_grok_processor_skips_search(self, mock_batch):
+        """A superseded execution does not pay for Grok searches."""
+        result = grok_processor.lambda_handler(workflow_event(toolQuery="天気"), None)
+
+        mock_batch.assert_not_called()
+        self.assertNotIn("grokResponse", result)
+
+    @patch("response_sender.send_line_message")
+    def test_response_sender_skips_stale_push(self, mock_send):
+        """The older execution never pushes its reply."""
+        response_sender.lambda_handler(workflow_event(grokResponse="晴れやで"), None)
+
+        mock_send.assert_not_called()
+
+    @patch("core.conversations.conversation_table")
+    def test_conditional_save_raises_when_superseded(self, mock_table):
+        """save_conversation_context refuses to overwrite a newer generation."""
+        error = {"Error": {"Code": "ConditionalCheckFailedException", "Message": "x"}}
+        mock_table.return_value = MagicMock(
+            put_item=MagicMock(side_effect=ClientError(error, "PutItem"))
+        )
+
+        with self.assertRaises(core.GenerationSuperseded):
+            core.save_conversation_context("U1", {"messages": []}, generation="gen-old")
+
+        kwargs = mock_table.return_value.put_item.call_args.kwargs
+        self.assertEqual(kwargs["ExpressionAttributeValues"], {":generation": "gen-old"})
+
+
+if __name__ == "__main__":
+    unittest.main()
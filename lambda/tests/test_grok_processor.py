@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+import unittest
+from unittest.mock import patch
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+with (
+    patch("boto3.client"),
+    patch.dict(os.environ, {"XAI_API_KEY_SECRET_NAME": "test-xai-key"}),
+):
+    from grok_processor import (
+        PARTIAL_RESULTS_NOTE,
+        SEARCH_FAILED_RESPONSE,
+        call_grok_api_batch,
+        lambda_handler,
+        merge_search_results,
+    )
+
+
+def fake_search(query, _prompt, _timeout, _usage=None):
+    """Stand-in for search_with_grok with query-controlled latency and failures."""
+    if query.startswith("fail"):
+        raise RuntimeError("search failed")
+    if query.startswith("slow"):
+        time.sleep(1.0)
+    else:
+        time.sleep(0.2)
+    return f"result for {query}"
+
+
+class TestGrokProcessor(unittest.TestCase):
+    @patch("grok_processor.search_with_grok", side_effect=fake_search)
+    def test_batch_runs_queries_concurrently(self, _mock_search):
+        """Three 0.2s searches should finish in about the time of one."""
+        queries = [{"query": f"q{i}", "prompt": ""} for i in range(3)]
+
+        started = time.monotonic()
+        results = call_grok_api_batch(queries, timeout=5)
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(results, ["result for q0", "result for q1", "result for q2"])
+        self.assertLess(elapsed, 0.5)
+
+    @patch("grok_processor.search_with_grok", side_effect=fake_search)
+    def test_batch_keeps_partial_results(self, _mock_search):
+        """Failed and timed-out searches should not drop the successful ones."""
+        queries = [{"query": "ok"}, {"query": "fail"}, {"query": "slow"}]
+
+        results = call_grok_api_batch(queries, timeout=0.5)
+
+        self.assertEqual(results, ["result for ok", None, None])
+
+    def test_merge_search_results(self):
+        """Merged output should label each facet and note missing ones."""
+        queries = [{"query": "天気"}, {"query": "ニュース"}]
+
+        self.assertEqual(merge_search_results(queries[:1], ["晴れ"]), "晴れ")
+        self.assertEqual(
+            merge_search_results(queries, ["晴れ", "特になし"]),
+            "【天気】\n晴れ\n\n【ニュース】\n特になし",
+        )
+        self.assertEqual(
+            merge_search_results(queries, ["晴れ", None]),
+            f"【天気】\n晴れ\n\n{PARTIAL_RESULTS_NOTE}",
+        )
+        self.assertEqual(merge_search_results(queries, [None, None]), SEARCH_FAILED_RESPONSE)
+
+    @patch("grok_processor.search_with_grok", side_effect=fake_search)
+    def test_lambda_handler_falls_back_to_single_query(self, _mock_search):
+        """Payloads without toolQueries should still be searched."""
+        event = {"userId": "user123", "toolQuery": "q", "toolPrompt": ""}
+
+        result = lambda_handler(event, None)
+
+        self.assertEqual(result["grokResponse"], "result for q")
+
+
+if __name__ == "__main__":
+    unittest.main()
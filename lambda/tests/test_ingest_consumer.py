@@ -0,0 +1,170 @@
+import json
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+from botocore.exceptions import ClientError
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+with (
+    patch("boto3.client"),
+    patch("boto3.resource"),
+    patch("webhook_handler.get_secret", return_value="test_secret"),
+):
+    import ingest_consumer
+    import ingest_queue
+    import webhook_handler
+
+
+def text_event(user_id, text, timestamp, source=None):
+    return {
+        "type": "message",
+        "mode": "active",
+        "timestamp": timestamp,
+        "webhookEventId": f"evt-{user_id}-{timestamp}",
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": f"reply-{timestamp}",
+        "source": source or {"type": "user", "userId": user_id},
+        "message": {"type": "text", "id": str(timestamp), "quoteToken": "q", "text": text},
+    }
+
+
+class TestQueuedIngestion(unittest.TestCase):
+    def setUp(self):
+        self.queue = ingest_queue.LocalQueue()
+        ingest_queue.set_queue(self.queue)
+
+    def tearDown(self):
+        ingest_queue.set_queue(None)
+
+    @patch("webhook_handler.INGESTION_MODE", "queue")
+    @patch("webhook_handler.handler.handle")
+    def test_webhook_only_verifies_and_enqueues(self, mock_handle):
+        """Queue mode acknowledges after the signature check without processing events."""
+        body = json.dumps({"destination": "bot", "events": [text_event("U1", "hi", 1)]})
+        event = {"headers": {"x-line-signature": "sig"}, "body": body}
+
+        with patch.object(
+            webhook_handler.handler.parser.signature_validator, "validate", return_value=True
+        ):
+            response = webhook_handler.lambda_handler(event, None)
+
+        self.assertEqual(response["statusCode"], 200)
+        mock_handle.assert_not_called()
+        self.assertEqual(len(self.queue), 1)
+        payload, _ = ingest_queue.decode_envelope(self.queue.messages[0]["body"])
+        self.assertEqual(payload["events"][0]["message"]["text"], "hi")
+
+    @patch("webhook_handler.INGESTION_MODE", "queue")
+    def test_webhook_rejects_bad_signature(self):
+        """Bodies with an invalid signature are never enqueued."""
+        event = {"headers": {"x-line-signature": "bad"}, "body": '{"events": []}'}
+
+        with patch.object(
+            webhook_handler.handler.parser.signature_validator, "validate", return_value=False
+        ):
+            response = webhook_handler.lambda_handler(event, None)
+
+        self.assertEqual(response["statusCode"], 400)
+        self.assertEqual(len(self.queue), 0)
+
+    @patch("webhook_handler.start_ai_processing")
+    @patch("webhook_handler.save_conversation_context_if_unchanged", return_value=True)
+    @patch("webhook_handler.get_conversation_contexts")
+    @patch("webhook_handler.rate_limiter")
+    def test_consumer_orders_per_user_and_batches_io(
+        self, mock_rate_limiter, mock_get_contexts, mock_save_contexts, mock_start
+    ):
+        """A batch is read and written in bulk with one workflow per user, in event order."""
+        mock_rate_limiter.admit_message.return_value = True
+        mock_get_contexts.side_effect = lambda user_ids, **_: {
+            u: webhook_handler.new_conversation_context(u) for u in user_ids
+        }
+
+        # U1's messages arrive out of order across two webhook deliveries
+        self.queue.send(
+            ingest_queue.encode_envelope(
+                json.dumps({"events": [text_event("U1", "second", 20), text_event("U2", "x", 5)]}),
+                1000,
+            )
+        )
+        self.queue.send(
+            ingest_queue.encode_envelope(
+                json.dumps({"events": [text_event("U1", "first", 10)]}), 1001
+            )
+        )
+
+        result = ingest_consumer.lambda_handler(self.queue.drain_batch(), None)
+
+        self.assertEqual(result, {"batchItemFailures": []})
+        mock_get_contexts.assert_called_once_with(["U1", "U2"])
+        self.assertEqual(mock_save_contexts.call_count, 2)
+        # Both contexts were new, so each write may only create the conversation
+        self.assertEqual([c.args[1] for c in mock_save_contexts.call_args_list], [None, None])
+        self.assertEqual(mock_start.call_count, 2)
+        u1_context = mock_start.call_args_list[0][0][1]
+        self.assertEqual([m["content"] for m in u1_context["messages"]], ["first", "second"])
+        self.assertEqual(mock_start.call_args_list[0].kwargs["received_at_ms"], 1000)
+
+    @patch("webhook_handler.start_ai_processing")
+    @patch("webhook_handler.rate_limiter")
+    def test_concurrent_consumer_turns_are_not_lost(self, mock_rate_limiter, mock_start):
+        """A write conflict re-reads the context and appends on top of the other batch."""
+        mock_rate_limiter.admit_message.return_value = True
+        stored = webhook_handler.new_conversation_context("U1")
+        stored["messages"] = [{"role": "user", "content": "from-other-consumer"}]
+        reads = iter([{}, {"U1": json.loads(json.dumps(stored))}])
+
+        def get_contexts(user_ids, consistent_read=False):
+            loaded = next(reads)
+            return {
+                u: loaded.get(u) or webhook_handler.new_conversation_context(u) for u in user_ids
+            }
+
+        self.queue.send(
+            ingest_queue.encode_envelope(json.dumps({"events": [text_event("U1", "mine", 10)]}), 1)
+        )
+        with (
+            patch("webhook_handler.get_conversation_contexts", side_effect=get_contexts),
+            patch(
+                "webhook_handler.save_conversation_context_if_unchanged",
+                side_effect=[False, True],
+            ) as mock_save,
+        ):
+            ingest_consumer.lambda_handler(self.queue.drain_batch(), None)
+
+        self.assertEqual(mock_save.call_args_list[1].args[1], stored["lastActivity"])
+        saved = mock_start.call_args[0][1]
+        self.assertEqual([m["content"] for m in saved["messages"]], ["from-other-consumer", "mine"])
+
+    def test_conditional_save_checks_last_activity(self):
+        """The write is conditioned on the lastActivity that was read."""
+        context = webhook_handler.new_conversation_context("U1")
+        with patch("webhook_handler.conversation_table") as mock_table:
+            mock_table.put_item.side_effect = ClientError(
+                {"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem"
+            )
+            saved = webhook_handler.save_conversation_context_if_unchanged(context, "2026-01-01")
+
+        self.assertFalse(saved)
+        kwargs = mock_table.put_item.call_args.kwargs
+        self.assertEqual(kwargs["ConditionExpression"], "lastActivity = :read")
+        self.assertEqual(kwargs["ExpressionAttributeValues"], {":read": "2026-01-01"})
+
+    def test_consumer_reports_unparseable_records(self):
+        """Malformed records are returned as batch item failures for retry."""
+        self.queue.send("not json")
+        batch = self.queue.drain_batch()
+
+        result = ingest_consumer.lambda_handler(batch, None)
+
+        self.assertEqual(
+            result["batchItemFailures"], [{"itemIdentifier": batch["Records"][0]["messageId"]}]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
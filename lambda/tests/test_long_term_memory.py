@@ -0,0 +1,178 @@
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+with (
+    patch("boto3.client"),
+    patch("boto3.resource"),
+    patch("core.runtime.get_secret", return_value="token"),
+    patch("webhook_handler.get_secret", return_value="test_secret"),
+):
+    import ai_processor
+    import long_term_memory
+    import webhook_handler
+    from long_term_memory import MemoryIndex
+
+TRANSCRIPT = [
+    {"role": "user", "content": "@あいちゃん 来週京都に旅行行くねん"},
+    {"role": "assistant", "content": "ええな〜！清水寺と伏見稲荷はおすすめやで"},
+    {"role": "user", "content": "猫飼い始めてん、名前はこたろう"},
+    {"role": "assistant", "content": "こたろうくん！めっちゃかわいい名前やん"},
+]
+
+
+class TestMemoryIndex(unittest.TestCase):
+    def test_snippets_pair_turns_with_replies(self):
+        """Each user turn becomes one snippet with its reply, mentions stripped."""
+        snippets = long_term_memory.snippets_from_messages(TRANSCRIPT)
+
+        self.assertEqual(len(snippets), 2)
+        self.assertTrue(snippets[0].startswith("ユーザー: 来週京都に旅行行くねん / あいちゃん:"))
+
+    def test_search_returns_relevant_snippets(self):
+        """The most similar snippet comes first and unrelated ones are left out."""
+        index = MemoryIndex.empty().add(long_term_memory.snippets_from_messages(TRANSCRIPT))
+
+        matches = index.search("こたろうにおもちゃ買ってあげたいねん", k=2)
+
+        self.assertEqual(index.vectors.dtype, np.float16)
+        self.assertEqual(len(matches), 1)
+        self.assertIn("こたろう", matches[0][1])
+
+    def test_oldest_snippets_are_dropped(self):
+        """Only the newest MEMORY_MAX_SNIPPETS snippets are kept."""
+        with patch.object(long_term_memory, "MEMORY_MAX_SNIPPETS", 3):
+            index = MemoryIndex.empty().add([f"ユーザー: 話題{i}" for i in range(5)])
+
+        self.assertEqual(index.snippets, ["ユーザー: 話題2", "ユーザー: 話題3", "ユーザー: 話題4"])
+        self.assertEqual(index.vectors.shape[0], 3)
+
+    def test_item_round_trip(self):
+        """The stored item rebuilds the same vectors and snippets."""
+        index = MemoryIndex.empty().add(long_term_memory.snippets_from_messages(TRANSCRIPT))
+        index.version = "v1"
+
+        restored = MemoryIndex.from_item(index.to_item("U1"))
+
+        np.testing.assert_array_equal(restored.vectors, index.vectors)
+        self.assertEqual((restored.snippets, restored.version), (index.snippets, "v1"))
+
+
+class TestMemoryStore(unittest.TestCase):
+    def setUp(self):
+        self.table = MagicMock()
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        for target in (
+            patch.object(long_term_memory, "LONG_TERM_MEMORY_ENABLED", True),
+            patch.object(long_term_memory, "MEMORY_CACHE_DIR", cache_dir.name),
+            patch.object(long_term_memory, "memory_table", self.table),
+        ):
+            target.start()
+            self.addCleanup(target.stop)
+
+    def test_archive_then_recall_from_warm_copy(self):
+        """Archiving writes DynamoDB and /tmp; recall memory-maps /tmp without a read."""
+        version = long_term_memory.archive_conversation({"userId": "U1", "messages": TRANSCRIPT})
+
+        item = self.table.put_item.call_args.kwargs["Item"]
+        self.assertEqual(item["userId"], "memory#U1")
+        self.assertEqual(item["version"], version)
+
+        context = {
+            "userId": "U1",
+            "memoryVersion": version,
+            "messages": [{"role": "user", "content": "京都の旅行の話の続きやけど"}],
+        }
+        with patch("long_term_memory.np.load", wraps=np.load) as mock_load:
+            recalled = long_term_memory.recall(context)
+
+        self.assertIn("京都", recalled[0])
+        self.assertEqual(mock_load.call_args.kwargs["mmap_mode"], "r")
+        self.table.get_item.assert_not_called()
+
+    def test_stale_warm_copy_is_reloaded(self):
+        """A container holding an older version reads the stored index."""
+        index = MemoryIndex.empty().add(["ユーザー: たこ焼き好きやねん"])
+        index.version = "old"
+        long_term_memory.save_local("U1", index)
+        index.version = "new"
+        self.table.get_item.return_value = {"Item": index.to_item("U1")}
+
+        loaded = long_term_memory.load_index("U1", "new")
+
+        self.assertEqual(loaded.version, "new")
+        self.table.get_item.assert_called_once()
+
+    def test_conversation_without_memory_reads_nothing(self):
+        """Users with nothing archived cost no read."""
+        context = {"userId": "U1", "messages": [{"role": "user", "content": "こんにちは"}]}
+
+        self.assertEqual(long_term_memory.recall(context), [])
+        self.table.get_item.assert_not_called()
+
+    def test_expired_conversation_is_archived_and_linked(self):
+        """A session reset archives the old turns and links the new conversation."""
+        expired = {
+            "userId": "U1",
+            "version": "conv-v1",
+            "messages": TRANSCRIPT,
+            "lastActivity": (datetime.now(timezone.utc) - timedelta(hours=2)).isoformat(),
+        }
+        with (
+            patch.object(webhook_handler, "conversation_table") as conversation_table,
+            patch.object(webhook_handler.conversation_cache, "conversations", None),
+        ):
+            conversation_table.query.return_value = {"Items": [expired]}
+            context = webhook_handler.get_conversation_context("U1")
+
+        self.assertEqual(context["messages"], [])
+        self.assertEqual(context["version"], "conv-v1")
+        self.assertEqual(
+            context["memoryVersion"], self.table.put_item.call_args.kwargs["Item"]["version"]
+        )
+
+
+class TestMemoryPrompt(unittest.TestCase):
+    def test_memories_are_injected_into_system_prompt(self):
+        """Recalled snippets reach the system prompt, not the message history."""
+        messages = [{"role": "user", "content": "こたろう元気やで"}]
+
+        api_messages = ai_processor.prepare_messages_for_api(messages, ["ユーザー: 猫飼い始めてん"])
+
+        self.assertIn("- ユーザー: 猫飼い始めてん", api_messages[0]["content"])
+        self.assertEqual(len(api_messages), 2)
+        self.assertNotIn(
+            "以前の会話", ai_processor.prepare_messages_for_api(messages)[0]["content"]
+        )
+
+    def test_answers_with_memories_skip_the_shared_cache(self):
+        """A personalized answer is never served from or stored in the semantic cache."""
+        cache = MagicMock()
+        client = MagicMock()
+        client.chat.completions.create.return_value.choices = [
+            MagicMock(message=MagicMock(tool_calls=None, content="元気でよかったわ〜"))
+        ]
+        with (
+            patch("ai_processor.semantic_cache.response_cache", cache),
+            patch("ai_processor.get_groq_client", return_value=client),
+            patch("ai_processor.usage_accounting.from_completion"),
+        ):
+            ai_processor.get_ai_response(
+                [{"role": "user", "content": "こたろう元気やで"}], memories=["ユーザー: 猫"]
+            )
+
+        cache.lookup.assert_not_called()
+        cache.store.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
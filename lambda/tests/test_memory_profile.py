@@ -0,0 +1,71 @@
+import os
+import sys
+import tracemalloc
+import unittest
+from unittest.mock import patch
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import memory_profile
+
+
+class TestMemoryProfile(unittest.TestCase):
+    def setUp(self):
+        for target in (
+            patch.object(memory_profile, "MEMORY_PROFILE_ENABLED", True),
+            patch.object(memory_profile, "MEMORY_PROFILE_SITES_EVERY", 2),
+            patch.object(memory_profile, "reports", []),
+            patch.object(memory_profile, "_init_reported", set()),
+            patch.object(memory_profile, "_invocations", {}),
+        ):
+            target.start()
+            self.addCleanup(target.stop)
+        if not tracemalloc.is_tracing():
+            self.addCleanup(tracemalloc.stop)
+
+    def test_disabled_mode_leaves_handler_alone(self):
+        """Without the env flag the handler is not wrapped and nothing is traced."""
+
+        def handler(event, context):
+            return event
+
+        with patch.object(memory_profile, "MEMORY_PROFILE_ENABLED", False):
+            self.assertIs(memory_profile.profiled("h")(handler), handler)
+            with memory_profile.stage("noop"):
+                pass
+        self.assertEqual(memory_profile.reports, [])
+
+    def test_init_and_invocation_reports(self):
+        """The first call reports init, then every call reports peaks and stages."""
+        kept = []
+
+        @memory_profile.profiled("handler")
+        def handler(event, context):
+            with memory_profile.stage("work"):
+                scratch = bytearray(2 * 1024 * 1024)  # freed before the report
+                del scratch
+                kept.append(bytearray(256 * 1024))
+            return "ok"
+
+        self.assertEqual(handler({}, None), "ok")
+        handler({}, None)
+
+        init, first, second = memory_profile.reports
+        self.assertEqual((init["phase"], first["phase"]), ("init", "invoke"))
+        # The peak of a stage survives the stage's reset_peak
+        self.assertGreaterEqual(first["tracedPeakKiB"], 2048)
+        self.assertGreaterEqual(first["stages"]["work"]["peakKiB"], 2048)
+        self.assertGreaterEqual(first["retainedKiB"], 256)
+        self.assertIn(__file__, first["top"][0]["site"])
+        # Sites are only ranked every MEMORY_PROFILE_SITES_EVERY invocations
+        self.assertNotIn("top", second)
+
+    def test_rss(self):
+        """RSS readings are positive and the peak is at least the current size."""
+        self.assertGreater(memory_profile.rss_mib(), 0)
+        self.assertGreaterEqual(memory_profile.peak_rss_mib() + 1, memory_profile.rss_mib())
+
+
+if __name__ == "__main__":
+    unittest.main()
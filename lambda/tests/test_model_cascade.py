@@ -0,0 +1,136 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import model_cascade
+from model_cascade import FAST_TIER, STRONG_TIER, choose_tier, escalation_reason, estimate_cost
+
+with patch.dict(
+    os.environ,
+    {
+        "CONVERSATION_TABLE_NAME": "test-table",
+        "SAMBA_NOVA_API_KEY_NAME": "test-samba-key",
+        "GROQ_API_KEY_NAME": "test-groq-key",
+        "AI_BACKEND": "groq",
+    },
+):
+    from ai_processor import DEADLINE_RESPONSE, get_ai_response
+
+
+def make_response(content, finish_reason="stop"):
+    choice = SimpleNamespace(
+        message=SimpleNamespace(content=content, tool_calls=None), finish_reason=finish_reason
+    )
+    usage = SimpleNamespace(prompt_tokens=100, completion_tokens=50)
+    return SimpleNamespace(choices=[choice], usage=usage)
+
+
+@patch.object(model_cascade, "MODEL_CASCADE_ENABLED", True)
+class TestModelCascade(unittest.TestCase):
+    def test_short_casual_turn_uses_fast_tier(self):
+        """A greeting at the start of a conversation goes to the fast tier."""
+        self.assertEqual(
+            choose_tier([{"role": "user", "content": "おはよう"}]), (FAST_TIER, "short_casual")
+        )
+
+    def test_long_deep_or_complex_turns_use_strong_tier(self):
+        """Length, depth and reasoning-heavy wording each route to the strong tier."""
+        self.assertEqual(choose_tier([{"role": "user", "content": "あ" * 200}])[1], "long_message")
+        deep = [{"role": "user", "content": "うん"}] * 20
+        self.assertEqual(choose_tier(deep)[1], "deep_conversation")
+        self.assertEqual(
+            choose_tier([{"role": "user", "content": "なんで空は青いん？"}])[1], "complex_wording"
+        )
+
+    def test_disabled_cascade_always_uses_strong_tier(self):
+        """Without the flag every turn keeps the configured model."""
+        with patch.object(model_cascade, "MODEL_CASCADE_ENABLED", False):
+            self.assertEqual(choose_tier([{"role": "user", "content": "おはよう"}])[0], STRONG_TIER)
+
+    def test_self_check(self):
+        """Truncated, empty or unsure answers fail the self-check."""
+        self.assertEqual(escalation_reason("まいど！", "length"), "truncated")
+        self.assertEqual(escalation_reason("  ", "stop"), "empty")
+        self.assertEqual(escalation_reason("うーん、ようわからんわ", "stop"), "unsure")
+        self.assertIsNone(escalation_reason("おはようさん！", "stop"))
+
+    def test_estimate_cost(self):
+        """Cost uses per-1M-token prices and ignores unknown models."""
+        usage = SimpleNamespace(prompt_tokens=1_000_000, completion_tokens=1_000_000)
+        self.assertAlmostEqual(estimate_cost("openai/gpt-oss-20b", usage), 0.60)
+        self.assertEqual(estimate_cost("unknown-model", usage), 0.0)
+
+    @patch("ai_processor.get_groq_client")
+    def test_fast_answer_accepted(self, mock_get_client):
+        """A confident fast-tier answer is returned without a second call."""
+        create = mock_get_client.return_value.chat.completions.create
+        create.return_value = make_response("おはようさん！")
+
+        result = get_ai_response([{"role": "user", "content": "おはよう"}])
+
+        self.assertEqual(result["aiResponse"], "おはようさん！")
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual(create.call_args.kwargs["reasoning_effort"], "low")
+
+    @patch("ai_processor.get_groq_client")
+    def test_failed_self_check_escalates(self, mock_get_client):
+        """An unsure fast-tier answer is retried on the strong tier."""
+        create = mock_get_client.return_value.chat.completions.create
+        create.side_effect = [
+            make_response("ようわからんわ"),
+            make_response("それはな、こういうことやで！"),
+        ]
+
+        result = get_ai_response([{"role": "user", "content": "おはよう"}], timeout=30)
+
+        self.assertEqual(result["aiResponse"], "それはな、こういうことやで！")
+        self.assertEqual(create.call_count, 2)
+        self.assertEqual(create.call_args.kwargs["reasoning_effort"], "medium")
+        self.assertLessEqual(create.call_args.kwargs["timeout"], 30)
+
+    @patch("ai_processor.time.monotonic")
+    @patch("ai_processor.get_groq_client")
+    def test_truncated_answer_without_budget(self, mock_get_client, mock_monotonic):
+        """A cut-off fast-tier answer is not sent when there is no time to escalate."""
+        create = mock_get_client.return_value.chat.completions.create
+        clock = [0.0]
+        mock_monotonic.side_effect = lambda: clock[0]
+
+        def slow_call(**_):
+            clock[0] = 9.5
+            return make_response("それはな、", finish_reason="length")
+
+        create.side_effect = slow_call
+
+        result = get_ai_response([{"role": "user", "content": "おはよう"}], timeout=10)
+
+        self.assertEqual(result["aiResponse"], DEADLINE_RESPONSE)
+        self.assertEqual(create.call_count, 1)
+
+    @patch("ai_processor.time.monotonic")
+    @patch("ai_processor.get_groq_client")
+    def test_unsure_answer_kept_without_budget(self, mock_get_client, mock_monotonic):
+        """An unsure answer is still returned when the escalation would be too short."""
+        create = mock_get_client.return_value.chat.completions.create
+        clock = [0.0]
+        mock_monotonic.side_effect = lambda: clock[0]
+
+        def slow_call(**_):
+            clock[0] = 9.5
+            return make_response("ようわからんわ")
+
+        create.side_effect = slow_call
+
+        result = get_ai_response([{"role": "user", "content": "おはよう"}], timeout=10)
+
+        self.assertEqual(result["aiResponse"], "ようわからんわ")
+        self.assertEqual(create.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
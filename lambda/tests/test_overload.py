@@ -0,0 +1,174 @@
+import os
+import sys
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+with (
+    patch("boto3.client"),
+    patch("boto3.resource"),
+    patch("core.runtime.get_secret", return_value="token"),
+):
+    import ai_processor
+    import overload
+
+
+def slow_client(delay_s: float, content: str = "ええで〜") -> MagicMock:
+    """A Groq client whose completions take ``delay_s`` seconds (injected backend latency)."""
+
+    def create(**kwargs):
+        time.sleep(delay_s)
+        response = MagicMock()
+        response.choices = [MagicMock(message=MagicMock(tool_calls=None, content=content))]
+        return response
+
+    client = MagicMock()
+    client.chat.completions.create.side_effect = create
+    return client
+
+
+def turn(text: str = "今日なにしよかな") -> dict:
+    return {
+        "userId": "U1",
+        "conversationContext": {
+            "userId": "U1",
+            "messages": [
+                {"role": "user" if i % 2 == 0 else "assistant", "content": f"話{i}"}
+                for i in range(10)
+            ]
+            + [{"role": "user", "content": text}],
+        },
+    }
+
+
+class TestDegradationLevels(unittest.TestCase):
+    def test_levels_step_through_the_degradations(self):
+        """Each level keeps the previous degradations and adds one."""
+        settings = [overload.degradation(level) for level in range(5)]
+
+        self.assertEqual([s["tools"] for s in settings], [True, False, False, False, False])
+        self.assertEqual(
+            [s["maxTokens"] for s in settings], [None, None] + [overload.DEGRADED_MAX_TOKENS] * 3
+        )
+        self.assertEqual(settings[2]["reasoningEffort"], "low")
+        self.assertIsNone(settings[2]["maxContextMessages"])
+        self.assertEqual(settings[3]["maxContextMessages"], overload.DEGRADED_CONTEXT_MESSAGES)
+        self.assertEqual([s["canned"] for s in settings], [False] * 4 + [True])
+
+    def test_shared_counters_raise_the_level(self):
+        """In-flight steps across containers and their mean latency come from one item per window."""
+        table = MagicMock()
+        table.update_item.return_value = {
+            "Attributes": {"inflight": 45, "calls": 10, "latencyMs": 100_000}
+        }
+        table.get_item.return_value = {"Item": {"inflight": 10}}
+        with (
+            patch.object(overload, "OVERLOAD_CONTROL_ENABLED", True),
+            patch.object(overload, "overload_table", table),
+            patch.object(overload, "_previous", None),
+            self.assertLogs(level="WARNING") as logs,
+            overload.admission(now=900) as settings,
+        ):
+            pass
+
+        # 55 in flight reaches level 2; 10s mean latency only level 1
+        self.assertEqual(settings["name"], "short_answers")
+        self.assertIn("Overload level 2 (short_answers): inflight=55", logs.output[0])
+        self.assertEqual(
+            table.update_item.call_args_list[0].kwargs["Key"], {"userId": "overload#10"}
+        )
+        self.assertEqual(table.get_item.call_args.kwargs["Key"], {"userId": "overload#9"})
+        leave = table.update_item.call_args_list[1].kwargs
+        self.assertEqual(leave["ExpressionAttributeValues"][":minus"], -1)
+        self.assertIn("latencyMs", leave["UpdateExpression"])
+
+    def test_counter_failures_do_not_block_answers(self):
+        """An unreachable table leaves the turn at the locally observed level."""
+        table = MagicMock()
+        table.update_item.side_effect = Exception("throttled")
+        with (
+            patch.object(overload, "OVERLOAD_CONTROL_ENABLED", True),
+            patch.object(overload, "overload_table", table),
+            patch.object(overload, "_latencies", overload.deque(maxlen=50)),
+            overload.admission() as settings,
+        ):
+            pass
+
+        self.assertEqual(settings["level"], overload.NORMAL)
+
+
+class TestOverloadedTurns(unittest.TestCase):
+    def setUp(self):
+        self.save = MagicMock()
+        for target in (
+            patch.object(overload, "OVERLOAD_CONTROL_ENABLED", True),
+            patch.object(overload, "overload_table", None),
+            patch.object(overload, "_latencies", overload.deque(maxlen=50)),
+            # Millisecond thresholds so a few slow test turns walk through the levels
+            patch.object(overload, "OVERLOAD_LATENCY_S", (0.05, 0.1, 0.15, 0.2)),
+            patch.object(ai_processor, "save_conversation_context", self.save),
+            patch("ai_processor.usage_accounting.from_completion"),
+        ):
+            target.start()
+            self.addCleanup(target.stop)
+
+    def run_turns(self, delay_s: float, turns: int) -> MagicMock:
+        client = slow_client(delay_s)
+        with patch("ai_processor.get_groq_client", return_value=client):
+            for _ in range(turns):
+                ai_processor.lambda_handler(turn(), None)
+        return client
+
+    def test_fast_backend_keeps_normal_settings(self):
+        """Quick answers keep the search tool and full context."""
+        client = self.run_turns(0, 4)
+
+        kwargs = client.chat.completions.create.call_args.kwargs
+        self.assertEqual(kwargs["tools"][0]["function"]["name"], "search_with_grok")
+        self.assertEqual(kwargs["max_tokens"], 1000)
+        self.assertEqual(len(kwargs["messages"]), 12)
+
+    def test_slow_backend_drops_the_search_tool(self):
+        """Once the mean latency passes the first threshold the tool is not offered."""
+        client = self.run_turns(0.07, 4)
+
+        calls = client.chat.completions.create.call_args_list
+        first, last = calls[0], calls[-1]
+        self.assertIn("tools", first.kwargs)
+        self.assertNotIn("tools", last.kwargs)
+        self.assertNotIn("tool_choice", last.kwargs)
+        self.assertEqual(last.kwargs["max_tokens"], 1000)
+
+    def test_slower_backend_shortens_answers_and_context(self):
+        """Higher latency caps max_tokens and reasoning, then trims the history."""
+        with self.assertLogs(level="WARNING") as logs:
+            client = self.run_turns(0.17, 4)
+
+        kwargs = client.chat.completions.create.call_args.kwargs
+        self.assertEqual(kwargs["max_tokens"], overload.DEGRADED_MAX_TOKENS)
+        self.assertEqual(kwargs["reasoning_effort"], "low")
+        # System prompt plus the newest DEGRADED_CONTEXT_MESSAGES messages
+        self.assertEqual(len(kwargs["messages"]), overload.DEGRADED_CONTEXT_MESSAGES + 1)
+        self.assertEqual(kwargs["messages"][-1]["content"], "今日なにしよかな")
+        self.assertTrue(any("Overload level 3 (short_context)" in line for line in logs.output))
+
+    def test_stalled_backend_answers_canned(self):
+        """Past the last threshold the model is not called and nothing is saved."""
+        client = self.run_turns(0.22, 3)
+        self.save.reset_mock()
+        calls = client.chat.completions.create.call_count
+
+        with patch("ai_processor.get_groq_client", return_value=client):
+            result = ai_processor.lambda_handler(turn(), None)
+
+        self.assertEqual(result["aiResponse"], overload.CANNED_REPLY)
+        self.assertFalse(result["hasToolCall"])
+        self.assertEqual(client.chat.completions.create.call_count, calls)
+        self.save.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import json
+import os
+import sys
+import unittest
+from datetime import datetime, timezone
+from decimal import Decimal
+from unittest.mock import patch
+
+from boto3.dynamodb.types import Binary
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+with (
+    patch("boto3.client"),
+    patch("boto3.resource"),
+    patch("core.runtime.get_secret", return_value="token"),
+    patch("webhook_handler.get_secret", return_value="test_secret"),
+):
+    import payload_codec
+    import transcript_codec
+    import webhook_handler
+    from payload_codec import SchemaError
+
+
+def stored_conversation():
+    """A conversation as DynamoDB returns it (numbers as Decimal)."""
+    return {
+        "userId": "U1",
+        "conversationId": "conv_20260101_000000",
+        "messages": [
+            {"role": "user", "content": "たこ焼きの美味しい店教えて", "timestamp": "2026-01-01"},
+            {"role": "assistant", "content": "道頓堀やな〜", "timestamp": "2026-01-01"},
+        ],
+        "lastActivity": "2026-01-01T00:00:00+00:00",
+        "ttl": Decimal("1767312000"),
+        "version": "v1",
+    }
+
+
+class CodecCases:
+    """Cases run with each encoder (see the subclasses)."""
+
+    def test_decimal_ttl_stays_a_number(self):
+        """The round trip through a workflow payload keeps ttl an integer."""
+        decoded = payload_codec.loads(payload_codec.dumps(stored_conversation()))
+
+        self.assertEqual(decoded["ttl"], 1767312000)
+        self.assertIsInstance(decoded["ttl"], int)
+
+    def test_explicit_types(self):
+        """Fractional Decimals, datetimes, sets and Binary have fixed encodings."""
+        value = {
+            "cost": Decimal("0.25"),
+            "at": datetime(2026, 1, 1, tzinfo=timezone.utc),
+            "tags": {"a"},
+            "blob": Binary(b"\x01\x02"),
+        }
+
+        self.assertEqual(
+            payload_codec.loads(payload_codec.dumps(value)),
+            {"cost": 0.25, "at": "2026-01-01T00:00:00+00:00", "tags": ["a"], "blob": "AQI="},
+        )
+
+    def test_unknown_types_fail_loudly(self):
+        """Payloads are never silently stringified; only log lines fall back to str()."""
+        with self.assertRaises(TypeError):
+            payload_codec.dumps({"event": object()})
+        self.assertIn("object", payload_codec.log_dumps({"event": object()}))
+
+    def test_output_matches_stdlib(self):
+        """Both encoders write the same compact UTF-8 JSON."""
+        value = {"text": "関西弁やで", "n": [1, 2.5, None, True]}
+
+        self.assertEqual(
+            payload_codec.dumps(value), json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        )
+
+
+@unittest.skipIf(payload_codec.orjson is None, "orjson is not installed")
+class TestOrjsonCodec(CodecCases, unittest.TestCase):
+    pass
+
+
+class TestStdlibCodec(CodecCases, unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(payload_codec, "PAYLOAD_CODEC", "stdlib")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TestConversationSchema(unittest.TestCase):
+    def test_stringified_ttl_is_repaired(self):
+        """ttl written as a string by older payloads is stored as a number again."""
+        for ttl in ("1767312000", Decimal("1767312000"), 1767312000.0):
+            with self.subTest(ttl=ttl):
+                context = dict(stored_conversation(), ttl=ttl)
+                item = transcript_codec.pack_item(context)
+
+                self.assertEqual(item["ttl"], 1767312000)
+                self.assertIsInstance(item["ttl"], int)
+
+    def test_invalid_records_are_rejected(self):
+        """Wrong types fail before anything is written."""
+        cases = [
+            {"userId": "U1"},
+            dict(stored_conversation(), ttl="tomorrow"),
+            dict(stored_conversation(), ttl=True),
+            dict(stored_conversation(), messages=[{"role": None, "content": "x"}]),
+            dict(stored_conversation(), messages=[{"role": "user", "content": 3}]),
+            dict(stored_conversation(), version=1),
+        ]
+        for record in cases:
+            with self.subTest(record=record), self.assertRaises(SchemaError):
+                payload_codec.check_conversation(record)
+
+    @patch("webhook_handler.stepfunctions")
+    def test_workflow_input_keeps_number_types(self, mock_sfn):
+        """The Step Functions input carries ttl as a JSON number."""
+        webhook_handler.start_ai_processing("U1", stored_conversation(), "user", "U1")
+
+        payload = json.loads(mock_sfn.start_execution.call_args.kwargs["input"])
+        self.assertEqual(payload["conversationContext"]["ttl"], 1767312000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,215 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from pipeline_server import PipelineServer, run_workflow
+
+
+def webhook_body(*user_ids):
+    events = [
+        {
+            "type": "message",
+            "webhookEventId": f"evt-{i}",
+            "source": {"type": "user", "userId": user_id},
+            "message": {"type": "text", "id": str(i), "text": f"{user_id}-{i}"},
+        }
+        for i, user_id in enumerate(user_ids)
+    ]
+    return json.dumps({"destination": "Ubot", "events": events})
+
+
+async def post(port, body, signature="valid", path="/webhook"):
+    data = body.encode("utf-8")
+    return await send_raw(
+        port,
+        (
+            f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+            f"x-line-signature: {signature}\r\nContent-Length: {len(data)}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode("ascii")
+        + data,
+    )
+
+
+async def send_raw(port, data):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(data)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return int(response.split(b" ", 2)[1])
+
+
+class TestPipelineServer(unittest.IsolatedAsyncioTestCase):
+    async def start_server(self, process, **kwargs):
+        server = PipelineServer(
+            host="127.0.0.1",
+            port=0,
+            process=process,
+            verify=lambda body, signature: signature == "valid",
+            **kwargs,
+        )
+        await server.start()
+        return server
+
+    async def test_events_processed_in_order_per_user(self):
+        """Events are acknowledged at once and each user's events run in arrival order."""
+        seen = []
+        lock = threading.Lock()
+
+        def process(raw_event, received_at_ms, channel_id):
+            time.sleep(0.01)
+            with lock:
+                seen.append(raw_event["message"]["text"])
+
+        server = await self.start_server(process, workers=4)
+        statuses = []
+        for _ in range(3):
+            statuses.append(await post(server.port, webhook_body("U1", "U2", "U1")))
+        await server.shutdown(drain_timeout=5)
+
+        self.assertEqual(statuses, [200, 200, 200])
+        self.assertEqual(server.stats["processed"], 9)
+        u1 = [t for t in seen if t.startswith("U1")]
+        self.assertEqual(u1, ["U1-0", "U1-2"] * 3)
+
+    async def test_invalid_signature_rejected(self):
+        """Unsigned bodies get 400 and are never queued."""
+        calls = []
+        server = await self.start_server(lambda e, t, c: calls.append(e), workers=2)
+
+        status = await post(server.port, webhook_body("U1"), signature="forged")
+        await server.shutdown(drain_timeout=1)
+
+        self.assertEqual(status, 400)
+        self.assertEqual(calls, [])
+
+    async def test_malformed_requests_return_400(self):
+        """Broken request lines and Content-Length values are answered, not dropped."""
+        server = await self.start_server(lambda e, t, c: None)
+
+        statuses = [
+            await send_raw(server.port, request)
+            for request in (
+                b"GARBAGE\r\nHost: localhost\r\n\r\n",
+                b"POST /webhook HTTP/1.1\r\nContent-Length: lots\r\n\r\n",
+                b"POST /webhook HTTP/1.1\r\nContent-Length: -5\r\n\r\n",
+            )
+        ]
+        healthy = await send_raw(server.port, b"GET /healthz HTTP/1.1\r\nConnection: close\r\n\r\n")
+        await server.shutdown(drain_timeout=5)
+
+        self.assertEqual(statuses, [400, 400, 400])
+        self.assertEqual(healthy, 200)
+
+    async def test_full_queue_returns_503(self):
+        """When a shard's queue is full the request is rejected for redelivery."""
+        release = threading.Event()
+        server = await self.start_server(lambda e, t, c: release.wait(5), workers=1, queue_size=1)
+
+        first = await post(server.port, webhook_body("U1"))
+        await asyncio.sleep(0.05)  # the worker takes the first event
+        second = await post(server.port, webhook_body("U1"))
+        third = await post(server.port, webhook_body("U1"))
+        release.set()
+        await server.shutdown(drain_timeout=5)
+
+        self.assertEqual((first, second, third), (200, 200, 503))
+        self.assertEqual(server.stats["rejected"], 1)
+
+    async def test_shutdown_drains_queued_events(self):
+        """Shutdown stops accepting but finishes everything already acknowledged."""
+        done = []
+        server = await self.start_server(
+            lambda e, t, c: (time.sleep(0.02), done.append(e)), workers=2
+        )
+
+        for i in range(5):
+            await post(server.port, webhook_body(f"U{i}", f"U{i}"))
+        await server.shutdown(drain_timeout=5)
+
+        self.assertEqual(len(done), 10)
+        with self.assertRaises(OSError):
+            await post(server.port, webhook_body("U1"))
+
+
+class TestRunWorkflow(unittest.TestCase):
+    def setUp(self):
+        with (
+            patch("boto3.client"),
+            patch("boto3.resource"),
+            patch("core.runtime.get_secret", return_value="x"),
+        ):
+            import ai_processor
+            import grok_processor
+            import interim_response_sender
+            import response_sender
+        self.modules = (ai_processor, interim_response_sender, grok_processor, response_sender)
+        self.calls = []
+
+    def step(self, name, result, delay_s=0.0, error=None):
+        """A stubbed workflow step taking ``delay_s`` seconds."""
+
+        def handler(event, context):
+            time.sleep(delay_s)
+            if error:
+                raise error
+            self.calls.append(name)
+            return {**event, **result}
+
+        return handler
+
+    def run_stubbed(self, interim_s=0.0, grok_s=0.0, interim_error=None):
+        ai, interim, grok, send = self.modules
+        with (
+            patch.object(ai, "lambda_handler", self.step("ai", {"hasToolCall": True})),
+            patch.object(
+                interim, "lambda_handler", self.step("interim", {}, interim_s, interim_error)
+            ),
+            patch.object(grok, "lambda_handler", self.step("grok", {"grokResponse": "r"}, grok_s)),
+            patch.object(send, "lambda_handler", self.step("send", {})),
+        ):
+            started = time.monotonic()
+            result = run_workflow({"userId": "U1", "conversationContext": {"messages": []}})
+        return result, time.monotonic() - started
+
+    def test_tool_call_path_matches_state_machine(self):
+        """A tool call runs interim and Grok side by side, then the final response."""
+        result, _ = self.run_stubbed()
+
+        self.assertEqual(self.calls[0], "ai")
+        self.assertEqual(sorted(self.calls[1:3]), ["grok", "interim"])
+        self.assertEqual(self.calls[3], "send")
+        self.assertEqual(result["grokResponse"], "r")
+
+    def test_interim_push_overlaps_the_search(self):
+        """With a 0.2s push and a 0.3s search the turn takes about 0.3s, not 0.5s."""
+        _, elapsed = self.run_stubbed(interim_s=0.2, grok_s=0.3)
+
+        self.assertLess(elapsed, 0.45)
+        self.assertEqual(self.calls[1:], ["interim", "grok", "send"])
+
+    def test_slow_interim_push_still_precedes_the_answer(self):
+        """The answer waits for a notice that outlasts the search."""
+        self.run_stubbed(interim_s=0.2, grok_s=0.05)
+
+        self.assertEqual(self.calls[1:], ["grok", "interim", "send"])
+
+    def test_failed_interim_push_does_not_drop_the_answer(self):
+        """The search result is still sent when the notice fails."""
+        result, _ = self.run_stubbed(interim_error=RuntimeError("LINE 500"))
+
+        self.assertEqual(self.calls[1:], ["grok", "send"])
+        self.assertEqual(result["grokResponse"], "r")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+import os
+import sys
+import unittest
+from decimal import Decimal
+from unittest.mock import patch
+
+from botocore.exceptions import ClientError
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+with patch("boto3.resource"):
+    import rate_limiter
+    from rate_limiter import TokenBucket, admit_message, try_acquire
+
+
+def conditional_check_failed(item=None):
+    response = {"Error": {"Code": "ConditionalCheckFailedException", "Message": "conflict"}}
+    if item is not None:
+        response["Item"] = item
+    return ClientError(response, "UpdateItem")
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_consume_and_refill(self):
+        """Bucket should allow a burst up to capacity, then refill over time."""
+        bucket = TokenBucket(capacity=2, refill_per_second=1, updated_at=0)
+
+        self.assertTrue(bucket.try_consume(0))
+        self.assertTrue(bucket.try_consume(0))
+        self.assertFalse(bucket.try_consume(0))
+        self.assertTrue(bucket.try_consume(1))
+        # Refill never exceeds capacity
+        bucket.refill(100)
+        self.assertEqual(bucket.tokens, 2)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        rate_limiter._local_buckets.clear()
+
+    @patch("rate_limiter.rate_limit_table", None)
+    def test_in_memory_limits_per_source_type(self):
+        """Without a table, buckets are kept in the container."""
+        capacity = rate_limiter.get_limits("user")["capacity"]
+        results = [try_acquire("user#U1", "user", now=0) for _ in range(capacity + 1)]
+
+        self.assertEqual(results.count(True), capacity)
+        self.assertFalse(results[-1])
+
+    @patch("rate_limiter.rate_limit_table", None)
+    def test_admit_message_checks_group_bucket(self):
+        """A noisy group is throttled even when each user is under their limit."""
+        capacity = rate_limiter.get_limits("group")["capacity"]
+        admitted = [admit_message(f"U{i}", "group", "C1") for i in range(capacity + 1)]
+
+        self.assertEqual(admitted.count(True), capacity)
+        self.assertTrue(admit_message("U_other", "user", None))
+
+    @patch("rate_limiter.rate_limit_table")
+    def test_shared_bucket_single_update(self, mock_table):
+        """An idle bucket is charged with one conditional update_item and no read."""
+        mock_table.update_item.return_value = {"Attributes": {"tat": Decimal("115")}}
+
+        self.assertTrue(try_acquire("user#U1", "user", now=100))
+
+        mock_table.get_item.assert_not_called()
+        mock_table.put_item.assert_not_called()
+        kwargs = mock_table.update_item.call_args.kwargs
+        self.assertEqual(kwargs["ConditionExpression"], "attribute_not_exists(tat) OR tat <= :now")
+        self.assertEqual(kwargs["ExpressionAttributeValues"][":next"], Decimal("115.0"))
+
+    def test_shared_bucket_enforces_capacity(self):
+        """Against a shared table the burst is capped at capacity, then refills."""
+        table = FakeBucketTable()
+        capacity = rate_limiter.get_limits("user")["capacity"]
+        with patch("rate_limiter.rate_limit_table", table):
+            results = [try_acquire("user#U1", "user", now=100) for _ in range(capacity + 1)]
+            # Another container's mirror is empty, so it goes straight to DynamoDB
+            rate_limiter._local_buckets.clear()
+            self.assertFalse(try_acquire("user#U1", "user", now=100))
+            self.assertTrue(try_acquire("user#U1", "user", now=116))
+
+        self.assertEqual(results.count(True), capacity)
+        self.assertFalse(results[-1])
+
+    @patch("rate_limiter.rate_limit_table")
+    def test_empty_local_mirror_skips_dynamodb(self, mock_table):
+        """Once the shared bucket is seen empty, the container rejects without a round trip."""
+        # Stored bucket is a full burst in debt
+        mock_table.update_item.side_effect = conditional_check_failed({"tat": {"N": "250"}})
+
+        self.assertFalse(try_acquire("user#U1", "user", now=100))
+        self.assertFalse(try_acquire("user#U1", "user", now=101))
+
+        mock_table.update_item.assert_called_once()
+
+    @patch("rate_limiter.rate_limit_table")
+    def test_contention_fails_open(self, mock_table):
+        """Losing both conditional writes to other containers admits the message."""
+        mock_table.update_item.side_effect = [
+            conditional_check_failed({"tat": {"N": "110"}}),
+            conditional_check_failed({"tat": {"N": "110"}}),
+        ]
+
+        self.assertTrue(try_acquire("user#U1", "user", now=100))
+        self.assertEqual(mock_table.update_item.call_count, 2)
+
+    @patch("rate_limiter.rate_limit_table")
+    def test_fails_open_when_dynamodb_errors(self, mock_table):
+        """Admission control should not drop messages when DynamoDB is down."""
+        mock_table.update_item.side_effect = Exception("DynamoDB unavailable")
+
+        self.assertTrue(try_acquire("user#U1", "user", now=100))
+
+    def test_group_rejection_refunds_user_token(self):
+        """A throttled group does not use up the sender's own allowance."""
+        table = FakeBucketTable()
+        group_capacity = rate_limiter.get_limits("group")["capacity"]
+        user_capacity = rate_limiter.get_limits("user")["capacity"]
+        with patch("rate_limiter.rate_limit_table", table), patch("time.time", return_value=100):
+            for i in range(group_capacity):
+                self.assertTrue(admit_message(f"U{i}", "group", "C1"))
+            for _ in range(user_capacity + 2):
+                self.assertFalse(admit_message("U_spam", "group", "C1"))
+            self.assertTrue(admit_message("U_spam", "user", None))
+
+
+class FakeBucketTable:
+    """Evaluates the two update_item forms used by rate_limiter against a dict."""
+
+    def __init__(self):
+        self.items = {}
+
+    def update_item(
+        self, Key, UpdateExpression, ConditionExpression, ExpressionAttributeValues, **_
+    ):
+        values = ExpressionAttributeValues
+        item = self.items.get(Key["userId"], {})
+        tat = item.get("tat")
+        if ConditionExpression == "tat <= :limit":
+            ok = tat is not None and tat <= values[":limit"]
+        elif ConditionExpression == "tat > :now":
+            ok = tat is not None and tat > values[":now"]
+        else:
+            ok = tat is None or tat <= values[":now"]
+        if not ok:
+            raise conditional_check_failed({"tat": {"N": str(tat)}} if tat is not None else None)
+        if ":next" in values:
+            tat = values[":next"]
+        elif "tat - :interval" in UpdateExpression:
+            tat = tat - values[":interval"]
+        else:
+            tat = tat + values[":interval"]
+        self.items[Key["userId"]] = {"tat": tat}
+        return {"Attributes": {"tat": tat}}
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,7 +9,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 with (
     patch("boto3.client"),
     patch("boto3.resource"),
-    patch("response_sender.get_secret", return_value="token"),
+    patch("core.runtime.get_secret", return_value="token"),
 ):
     from response_sender import lambda_handler
 
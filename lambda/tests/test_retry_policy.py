@@ -0,0 +1,200 @@
+import json
+import os
+import random
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import openai
+import retry_policy
+import snapstart
+from retry_policy import RetryPolicy, classify, parse_retry_after
+
+with patch("boto3.client"), patch("boto3.resource"):
+    import core
+    from ai_processor import get_ai_response
+
+CHAT_COMPLETION = {
+    "id": "chatcmpl-1",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "openai/gpt-oss-20b",
+    "choices": [
+        {
+            "index": 0,
+            "message": {"role": "assistant", "content": "まいど！"},
+            "finish_reason": "stop",
+        }
+    ],
+}
+
+
+class FakeServer:
+    """Local HTTP server answering each POST with the next scripted (status, headers, body)."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                fake.requests.append(
+                    {
+                        "path": self.path,
+                        "headers": dict(self.headers),
+                        "body": self.rfile.read(length),
+                    }
+                )
+                status, headers, body = fake.responses.pop(0)
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestClassification(unittest.TestCase):
+    def test_parse_retry_after(self):
+        """Retry-After is accepted in seconds or as an HTTP date."""
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        self.assertAlmostEqual(
+            parse_retry_after("Thu, 01 Jan 2026 00:00:10 GMT", now=1767225600), 10.0
+        )
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertIsNone(parse_retry_after(None))
+
+    def test_classify(self):
+        """Throttling, 5xx and transport errors are retryable; client errors are not."""
+        throttled = type("E", (Exception,), {"status": 429, "headers": {"Retry-After": "2"}})()
+        self.assertEqual(classify(throttled), (True, 2.0))
+        bad_request = type("E", (Exception,), {"status_code": 400})()
+        self.assertEqual(classify(bad_request), (False, None))
+        self.assertEqual(classify(ConnectionResetError()), (True, None))
+        self.assertEqual(classify(ValueError("bad json")), (False, None))
+
+    def test_full_jitter_bounds(self):
+        """Backoff is uniform in [0, min(max_delay, base * 2**attempt)]."""
+        policy = RetryPolicy(base_delay=0.5, max_delay=4, rng=random.Random(1))
+        for attempt, cap in [(0, 0.5), (1, 1.0), (3, 4.0), (10, 4.0)]:
+            delays = [policy.backoff(attempt) for _ in range(200)]
+            self.assertTrue(all(0 <= d <= cap for d in delays))
+            self.assertGreater(max(delays), cap * 0.8)
+        self.assertEqual(policy.backoff(5, retry_after=1.5), 1.5)
+
+    def test_default_jitter_is_reseeded_after_restore(self):
+        """The shared policy draws from the global generator that SnapStart restores reseed."""
+        random.seed(7)
+        snapshot = [retry_policy.default_policy.backoff(3) for _ in range(5)]
+        random.seed(7)
+        self.assertEqual([retry_policy.default_policy.backoff(3) for _ in range(5)], snapshot)
+
+        random.seed(7)
+        snapstart.reseed_random()
+        self.assertNotEqual([retry_policy.default_policy.backoff(3) for _ in range(5)], snapshot)
+
+
+class TestRetryAgainstFakeServer(unittest.TestCase):
+    def make_server(self, responses):
+        server = FakeServer(responses)
+        self.addCleanup(server.close)
+        return server
+
+    def make_policy(self):
+        self.sleeps = []
+        return RetryPolicy(max_attempts=4, sleep=self.sleeps.append)
+
+    def test_llm_call_retries_429_and_5xx(self):
+        """A 429 with Retry-After then a 503 are retried until the call succeeds."""
+        server = self.make_server(
+            [
+                (429, {"Retry-After": "0.25"}, {"error": {"message": "rate limited"}}),
+                (503, {}, {"error": {"message": "unavailable"}}),
+                (200, {}, CHAT_COMPLETION),
+            ]
+        )
+        client = openai.OpenAI(api_key="k", base_url=f"{server.url}/v1", max_retries=0)
+
+        with (
+            patch.object(retry_policy, "default_policy", self.make_policy()),
+            patch("ai_processor.get_groq_client", return_value=client),
+        ):
+            result = get_ai_response([{"role": "user", "content": "おはよう"}], timeout=30)
+
+        self.assertEqual(result["aiResponse"], "まいど！")
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(self.sleeps[0], 0.25)
+
+    def test_client_error_is_not_retried(self):
+        """A 400 fails immediately."""
+        server = self.make_server([(400, {}, {"error": {"message": "bad request"}})])
+        client = openai.OpenAI(api_key="k", base_url=f"{server.url}/v1", max_retries=0)
+
+        with self.assertRaises(openai.BadRequestError):
+            self.make_policy().call(
+                lambda t: client.chat.completions.create(model="m", messages=[], timeout=t),
+                30,
+                "test",
+            )
+        self.assertEqual(len(server.requests), 1)
+
+    def test_stops_when_retry_after_exceeds_deadline(self):
+        """No retry is started if the requested wait does not fit the remaining budget."""
+        server = self.make_server([(429, {"Retry-After": "30"}, {"error": {"message": "slow"}})])
+        client = openai.OpenAI(api_key="k", base_url=f"{server.url}/v1", max_retries=0)
+
+        with self.assertRaises(openai.RateLimitError):
+            self.make_policy().call(
+                lambda t: client.chat.completions.create(model="m", messages=[], timeout=t),
+                5,
+                "test",
+            )
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(self.sleeps, [])
+
+    def test_line_push_retries_with_one_retry_key(self):
+        """LINE pushes are retried with the same X-Line-Retry-Key on every attempt."""
+        from linebot.v3.messaging import Configuration
+
+        server = self.make_server(
+            [
+                (429, {"Retry-After": "0"}, {"message": "rate limited"}),
+                (500, {}, {"message": "error"}),
+                (200, {}, {"sentMessages": [{"id": "1", "quoteToken": "q"}]}),
+            ]
+        )
+        configuration = Configuration(host=server.url, access_token="token")
+
+        with (
+            patch.object(retry_policy, "default_policy", self.make_policy()),
+            patch("core.line.channel_configuration", return_value=configuration),
+        ):
+            core.send_line_message("U1", "まいど！", timeout=30)
+
+        self.assertEqual(len(server.requests), 3)
+        retry_keys = {r["headers"]["X-Line-Retry-Key"] for r in server.requests}
+        self.assertEqual(len(retry_keys), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,193 @@
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+with (
+    patch("boto3.client"),
+    patch("boto3.resource"),
+    patch("core.runtime.get_secret", return_value="token"),
+    patch.dict(os.environ, {"XAI_API_KEY_SECRET_NAME": "test-xai-key"}),
+):
+    import ai_processor
+    import grok_processor
+    import interim_response_sender
+    import search_latency
+    from pipeline_server import run_workflow
+    from search_latency import DEFERRED, IMMEDIATE, InterimTimer
+
+
+def histogram(fast, slow):
+    """Counts with ``fast`` samples in the 1-2s bucket and ``slow`` in the 8-13s bucket."""
+    counts = [0] * (len(search_latency.BUCKETS_S) + 1)
+    counts[search_latency.bucket_index(1.5)] = fast
+    counts[search_latency.bucket_index(10)] = slow
+    return counts
+
+
+def tool_event(**extra):
+    return {
+        "userId": "U1",
+        "sourceType": "user",
+        "toolQuery": "明日の大阪の天気",
+        "conversationContext": {"messages": [{"role": "user", "content": "明日の天気"}]},
+        **extra,
+    }
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(search_latency, "ADAPTIVE_INTERIM_ENABLED", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        search_latency._histograms.clear()
+
+    def test_query_features(self):
+        """Queries are keyed by count, topic and length."""
+        self.assertEqual(
+            search_latency.query_features([{"query": "明日の大阪の天気"}]), "1q:weather:short"
+        )
+        self.assertEqual(
+            search_latency.query_features([{"query": "たこ焼き " * 10}, {"query": "a"}]),
+            "2q:general:long",
+        )
+
+    def test_slow_probability(self):
+        """Only buckets entirely above the threshold count as slow."""
+        self.assertEqual(search_latency.slow_probability(histogram(3, 1), 5.0), 0.25)
+        self.assertEqual(search_latency.slow_probability(histogram(0, 0), 5.0), 0.0)
+
+    def test_record_latency_adds_to_bucket(self):
+        """Each search adds one to its bucket and the sample count."""
+        table = MagicMock()
+        with patch.object(search_latency, "latency_table", table):
+            search_latency.record_latency("1q:weather:short", 9.0)
+
+        kwargs = table.update_item.call_args.kwargs
+        self.assertEqual(kwargs["Key"], {"userId": "latency#1q:weather:short"})
+        self.assertEqual(kwargs["ExpressionAttributeNames"], {"#bucket": "b5"})
+
+    def test_histogram_is_cached_per_container(self):
+        """A warm container rereads a histogram only after LATENCY_REFRESH_S."""
+        table = MagicMock()
+        table.get_item.return_value = {"Item": {"b1": 4, "samples": 4}}
+        with patch.object(search_latency, "latency_table", table):
+            first = search_latency.load_histogram("k", now=0)
+            search_latency.load_histogram("k", now=1)
+            search_latency.load_histogram("k", now=search_latency.LATENCY_REFRESH_S + 1)
+
+        self.assertEqual(first[1], 4)
+        self.assertEqual(table.get_item.call_count, 2)
+
+    def test_predict_interim(self):
+        """Slow histories send the interim up front; fast or thin ones defer it."""
+        cases = [(histogram(30, 0), DEFERRED), (histogram(5, 25), IMMEDIATE), ([0] * 11, DEFERRED)]
+        for counts, expected in cases:
+            with (
+                self.subTest(counts=counts),
+                patch("search_latency.load_histogram", return_value=counts),
+            ):
+                self.assertEqual(search_latency.predict_interim([{"query": "天気"}]), expected)
+
+        with patch.object(search_latency, "ADAPTIVE_INTERIM_ENABLED", False):
+            self.assertEqual(search_latency.predict_interim([{"query": "天気"}]), IMMEDIATE)
+
+
+class TestInterimTimer(unittest.TestCase):
+    def test_fast_search_sends_nothing(self):
+        """A search finishing before the threshold cancels the interim message."""
+        send = MagicMock()
+        timer = InterimTimer(send, threshold_s=0.2).start()
+
+        self.assertFalse(timer.finish())
+        send.assert_not_called()
+
+    def test_slow_search_sends_once_and_waits_for_the_push(self):
+        """A slow search gets the interim message, finished before finish() returns."""
+        pushed = threading.Event()
+
+        def send():
+            time.sleep(0.1)
+            pushed.set()
+
+        timer = InterimTimer(send, threshold_s=0.05).start()
+        time.sleep(0.1)
+
+        self.assertTrue(timer.finish())
+        self.assertTrue(pushed.is_set())
+
+
+class TestAdaptiveWorkflow(unittest.TestCase):
+    def setUp(self):
+        for target in (
+            patch.object(search_latency, "ADAPTIVE_INTERIM_ENABLED", True),
+            patch.object(search_latency, "INTERIM_THRESHOLD_S", 0.1),
+            patch("search_latency.record_latency"),
+            patch.object(interim_response_sender, "send_interim_message"),
+        ):
+            mock = target.start()
+            self.addCleanup(target.stop)
+        self.send_interim = mock
+
+    @patch("ai_processor.get_ai_response", return_value={"hasToolCall": True, "toolQuery": "天気"})
+    @patch("search_latency.load_histogram", return_value=histogram(30, 0))
+    @patch.object(search_latency, "INTERIM_THRESHOLD_S", 5.0)
+    def test_ai_processor_defers_interim_for_fast_searches(self, _mock_load, _mock_ai):
+        """Tool calls predicted fast are marked deferred for the Choice state."""
+        result = ai_processor.lambda_handler(tool_event(), None)
+
+        self.assertEqual(result[search_latency.INTERIM_KEY], DEFERRED)
+
+    def run_search(self, seconds, **extra):
+        def search(*_, **__):
+            time.sleep(seconds)
+            return ["晴れやで"]
+
+        with patch("grok_processor.call_grok_api_batch", side_effect=search):
+            return grok_processor.lambda_handler(tool_event(**extra), None)
+
+    def test_deferred_fast_search_skips_interim(self):
+        """A deferred search that finishes in time pushes nothing extra."""
+        result = self.run_search(0.01, interim=DEFERRED)
+
+        self.assertEqual(result["grokResponse"], "晴れやで")
+        self.send_interim.assert_not_called()
+
+    def test_deferred_slow_search_sends_late_interim(self):
+        """A deferred search overrunning the threshold sends the interim itself."""
+        self.run_search(0.3, interim=DEFERRED)
+
+        self.send_interim.assert_called_once()
+
+    def test_upfront_interim_is_not_repeated(self):
+        """When SendInterimResponse already ran, grok_processor never pushes."""
+        self.run_search(0.3, interim=IMMEDIATE)
+
+        self.send_interim.assert_not_called()
+
+    def test_local_workflow_skips_interim_step_when_deferred(self):
+        """The in-process workflow mirrors the Choice state."""
+        calls = []
+
+        def step(name, result):
+            return lambda event, _: calls.append(name) or {**event, **result}
+
+        ai_result = {"hasToolCall": True, search_latency.INTERIM_KEY: DEFERRED}
+        with (
+            patch.object(ai_processor, "lambda_handler", step("ai", ai_result)),
+            patch.object(interim_response_sender, "lambda_handler", step("interim", {})),
+            patch.object(grok_processor, "lambda_handler", step("grok", {})),
+            patch("response_sender.lambda_handler", step("send", {})),
+        ):
+            run_workflow({"userId": "U1"})
+
+        self.assertEqual(calls, ["ai", "grok", "send"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import unittest
+from concurrent.futures import Future
+from unittest.mock import patch
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import search_predictor
+from search_predictor import predict_search, record_outcome, score_message
+
+with patch.dict(
+    os.environ,
+    {
+        "CONVERSATION_TABLE_NAME": "test-table",
+        "SAMBA_NOVA_API_KEY_NAME": "test-samba-key",
+        "GROQ_API_KEY_NAME": "test-groq-key",
+        "AI_BACKEND": "groq",
+    },
+):
+    from ai_processor import resolve_speculative_search
+
+
+class TestSearchPredictor(unittest.TestCase):
+    def setUp(self):
+        for key in search_predictor.stats:
+            search_predictor.stats[key] = 0
+
+    def test_time_sensitive_questions_are_predicted(self):
+        """Weather, news and market questions should trigger a speculative search."""
+        self.assertTrue(predict_search("今日の大阪の天気教えて"))
+        self.assertTrue(predict_search("最新のニュースは？"))
+        self.assertTrue(predict_search("What's the latest news today?"))
+
+    def test_casual_chat_is_not_predicted(self):
+        """Greetings and small talk should not start a search."""
+        self.assertFalse(predict_search("おはよう！今日もよろしく"))
+        self.assertFalse(predict_search("たこ焼きの作り方教えて"))
+        self.assertEqual(score_message("ありがとう")[0], -2.0)
+
+    def test_record_outcome_tracks_accuracy_and_waste(self):
+        """Each combination of prediction and tool call maps to one outcome."""
+        self.assertEqual(record_outcome(True, True, True, 1.0), "hit")
+        self.assertEqual(record_outcome(True, True, False, 2.0), "late")
+        self.assertEqual(record_outcome(True, False, False, 3.0), "wasted")
+        self.assertEqual(record_outcome(False, True, False, 0.0), "miss")
+        self.assertEqual(record_outcome(False, False, False, 0.0), "skip")
+
+        self.assertEqual(search_predictor.stats["predicted"], 3)
+        self.assertEqual(search_predictor.stats["hits"], 1)
+        self.assertEqual(search_predictor.stats["misses"], 1)
+        self.assertEqual(search_predictor.stats["wastedSeconds"], 5.0)
+
+
+class TestResolveSpeculativeSearch(unittest.TestCase):
+    def make_speculation(self, result=None):
+        future = Future()
+        if result is not None:
+            future.set_result(result)
+        return {"predicted": True, "future": future, "startedAt": 0.0}
+
+    def test_result_used_when_model_asks_for_search(self):
+        """A finished speculative search replaces the tool call with a direct reply."""
+        speculation = self.make_speculation("晴れやで☀️")
+        payload = {"hasToolCall": True, "toolQuery": "大阪 天気"}
+
+        result = resolve_speculative_search(speculation, payload, remaining_s=5)
+
+        self.assertEqual(
+            result, {"hasToolCall": False, "aiResponse": "晴れやで☀️", "speculativeSearch": True}
+        )
+
+    def test_result_dropped_when_model_answers_directly(self):
+        """Without a tool call the payload is kept and the search is cancelled."""
+        speculation = self.make_speculation()
+        payload = {"hasToolCall": False, "aiResponse": "まいど！"}
+
+        result = resolve_speculative_search(speculation, payload, remaining_s=5)
+
+        self.assertIs(result, payload)
+        self.assertTrue(speculation["future"].cancelled())
+
+    def test_slow_search_falls_back_to_workflow(self):
+        """If the search is not ready in time the normal Grok path is used."""
+        speculation = self.make_speculation()
+        payload = {"hasToolCall": True, "toolQuery": "大阪 天気"}
+
+        result = resolve_speculative_search(speculation, payload, remaining_s=5)
+
+        self.assertIs(result, payload)
+
+    def test_no_wait_without_budget(self):
+        """Once the LLM call used up the budget the search is not waited for."""
+        speculation = self.make_speculation()
+        payload = {"hasToolCall": True, "toolQuery": "大阪 天気"}
+
+        with patch("ai_processor.SPECULATIVE_WAIT_S", 30):
+            started = time.monotonic()
+            result = resolve_speculative_search(speculation, payload, remaining_s=0.5)
+
+        self.assertIs(result, payload)
+        self.assertLess(time.monotonic() - started, 0.2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from semantic_cache import SemanticCache, cacheable_question, embed_text
+
+
+class TestEmbedText(unittest.TestCase):
+    def test_similar_questions_score_higher(self):
+        """Near-duplicate questions should be closer than unrelated ones."""
+        base = embed_text("今日の天気は？")
+        similar = embed_text("今日の天気は")
+        unrelated = embed_text("おすすめのラーメン")
+
+        self.assertAlmostEqual(float(np.linalg.norm(base)), 1.0, places=5)
+        self.assertGreater(float(base @ similar), 0.95)
+        self.assertLess(float(base @ unrelated), 0.3)
+
+    def test_empty_text_is_zero_vector(self):
+        """Punctuation-only input has no n-grams to hash."""
+        self.assertFalse(embed_text("？！ ").any())
+
+
+class TestSemanticCache(unittest.TestCase):
+    def test_hit_for_similar_question(self):
+        """A paraphrase above the threshold should be served from the cache."""
+        cache = SemanticCache(capacity=4, threshold=0.85, ttl_s=60)
+        cache.store("おすすめのラーメン教えて", "天下一品やで！", now=0)
+
+        hit = cache.lookup("おすすめのラーメン教えて！", now=1)
+        miss = cache.lookup("明日の予定", now=1)
+
+        self.assertIsNotNone(hit)
+        self.assertEqual(hit[1], "天下一品やで！")
+        self.assertIsNone(miss)
+        self.assertEqual(cache.hit_rate(), 0.5)
+
+    def test_ttl_expiry(self):
+        """Entries past their TTL should not be returned."""
+        cache = SemanticCache(capacity=4, threshold=0.85, ttl_s=60)
+        cache.store("今日の天気は？", "晴れやで", now=0)
+
+        self.assertIsNone(cache.lookup("今日の天気は？", now=61))
+
+    def test_lru_eviction(self):
+        """When full, the least recently used entry is overwritten."""
+        cache = SemanticCache(capacity=2, threshold=0.85, ttl_s=600)
+        cache.store("たこ焼きの作り方", "a", now=0)
+        cache.store("お好み焼きの店", "b", now=1)
+        cache.lookup("たこ焼きの作り方", now=2)
+
+        cache.store("明日の天気", "c", now=3)
+
+        self.assertIsNotNone(cache.lookup("たこ焼きの作り方", now=4))
+        self.assertIsNone(cache.lookup("お好み焼きの店", now=4))
+        self.assertEqual(cache.stats["evictions"], 1)
+
+    def test_audit_counts_false_hits_and_evicts(self):
+        """A fresh answer that needed a tool call marks the cached answer as a false hit."""
+        cache = SemanticCache(capacity=4, threshold=0.85, ttl_s=600)
+        cache.store("今日の天気は？", "晴れやで", now=0)
+        index, cached_response, _ = cache.lookup("今日の天気は？", now=1)
+
+        self.assertFalse(cache.record_audit(index, cached_response, "晴れやで"))
+        self.assertTrue(cache.record_audit(index, cached_response, None))
+        self.assertEqual(cache.stats["falseHits"], 1)
+        self.assertIsNone(cache.lookup("今日の天気は？", now=2))
+
+    def test_cacheable_question_only_first_turn(self):
+        """Only short, context-free first turns are eligible."""
+        self.assertEqual(
+            cacheable_question([{"role": "user", "content": "今日の天気は？"}]), "今日の天気は？"
+        )
+        self.assertIsNone(
+            cacheable_question(
+                [
+                    {"role": "user", "content": "こんにちは"},
+                    {"role": "assistant", "content": "まいど"},
+                    {"role": "user", "content": "今日の天気は？"},
+                ]
+            )
+        )
+        self.assertIsNone(cacheable_question([{"role": "user", "content": "あ" * 200}]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import core
+import core.runtime
+import snapstart
+from snapstart import Lifecycle
+
+with (
+    patch("boto3.client"),
+    patch("boto3.resource"),
+    patch("webhook_handler.get_secret", return_value="test_secret"),
+):
+    import webhook_handler
+
+
+class TestLifecycle(unittest.TestCase):
+    def test_hook_ordering(self):
+        """Snapshot hooks run in reverse registration order, restore hooks in order."""
+        lifecycle = Lifecycle()
+        calls = []
+        for name in ("core", "handler"):
+            lifecycle.before_snapshot(lambda name=name: calls.append(f"drop:{name}"))
+            lifecycle.after_restore(lambda name=name: calls.append(f"load:{name}"))
+
+        self.assertEqual(lifecycle.phase, "init")
+        lifecycle.simulate()
+
+        self.assertEqual(calls, ["drop:handler", "drop:core", "load:core", "load:handler"])
+        self.assertEqual(lifecycle.phase, "restored")
+
+    def test_random_state_is_reseeded_first(self):
+        """The process-wide lifecycle reseeds random before any handler hook runs."""
+        self.assertIs(snapstart.lifecycle._after_restore[0], snapstart.reseed_random)
+
+
+class TestWebhookHandlerSnapshot(unittest.TestCase):
+    def test_credentials_dropped_and_reloaded(self):
+        """LINE secrets are absent from the snapshot and reloaded after restore."""
+        validator = webhook_handler.handler.parser.signature_validator
+        configuration = webhook_handler.configuration
+        original = (validator.channel_secret, configuration.access_token)
+        self.addCleanup(setattr, validator, "channel_secret", original[0])
+        self.addCleanup(setattr, configuration, "access_token", original[1])
+        self.addCleanup(core.registry.drop, core.runtime.SECRET)
+
+        for hook in (core.runtime.drop_secrets, webhook_handler.drop_line_credentials):
+            self.assertIn(hook, snapstart.lifecycle._before_snapshot)
+            hook()
+
+        self.assertEqual(configuration.access_token, "")
+        self.assertEqual(validator.channel_secret, b"")
+        self.assertNotIn(("secret", "s"), core.registry.keys())
+
+        secrets = {"s": "restored-secret", "tok": "restored-token"}
+        mock_client = MagicMock()
+        mock_client.get_secret_value.side_effect = lambda SecretId: {
+            "SecretString": secrets[SecretId]
+        }
+        with (
+            patch("boto3.client", return_value=mock_client),
+            patch("boto3.resource"),
+            patch.dict(
+                os.environ, {"CHANNEL_SECRET_NAME": "s", "CHANNEL_ACCESS_TOKEN_NAME": "tok"}
+            ),
+            patch.object(webhook_handler, "CHANNEL_SECRET_NAME", "s"),
+        ):
+            for hook in (
+                core.runtime.refresh_after_restore,
+                webhook_handler.restore_line_credentials,
+            ):
+                self.assertIn(hook, snapstart.lifecycle._after_restore)
+                hook()
+
+        self.assertEqual(configuration.access_token, "restored-token")
+        self.assertEqual(validator.channel_secret, b"restored-secret")
+        self.assertIs(webhook_handler.stepfunctions, core.client("stepfunctions"))
+
+
+if __name__ == "__main__":
+    unittest.main()
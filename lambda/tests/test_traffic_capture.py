@@ -0,0 +1,105 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import traffic_capture
+from traffic_capture import anonymize_body, capture_webhook, load_capture
+
+USER_ID = "U1234567890abcdef1234567890abcdef"
+BOT_ID = "Uffffffffffffffffffffffffffffffff"
+BODY = json.dumps(
+    {
+        "destination": BOT_ID,
+        "events": [
+            {
+                "type": "message",
+                "replyToken": "reply-token-1",
+                "webhookEventId": "01H000000000000000000000",
+                "timestamp": 1751371200000,
+                "source": {"type": "group", "groupId": "C0123456789", "userId": USER_ID},
+                "message": {
+                    "type": "text",
+                    "id": "468789577",
+                    "text": "@あいちゃん 今日の天気は？",
+                    "mention": {
+                        "mentionees": [
+                            {"index": 0, "length": 6, "type": "user", "userId": BOT_ID},
+                            {"index": 0, "length": 6, "type": "user", "userId": USER_ID},
+                        ]
+                    },
+                },
+            }
+        ],
+    },
+    ensure_ascii=False,
+)
+
+
+class TestTrafficCapture(unittest.TestCase):
+    def test_identifiers_are_pseudonymized_consistently(self):
+        """IDs keep their prefix and length and map to the same pseudonym every time."""
+        first = json.loads(anonymize_body(BODY))
+        second = json.loads(anonymize_body(BODY))
+        source = first["events"][0]["source"]
+
+        self.assertNotEqual(source["userId"], USER_ID)
+        self.assertTrue(source["userId"].startswith("U"))
+        self.assertEqual(len(source["userId"]), len(USER_ID))
+        self.assertTrue(source["groupId"].startswith("C"))
+        self.assertNotEqual(first["events"][0]["replyToken"], "reply-token-1")
+        self.assertEqual(first, second)
+
+    def test_bot_id_is_kept(self):
+        """The bot's ID stays unchanged so replayed group messages still mention it."""
+        payload = json.loads(anonymize_body(BODY))
+        mentionees = payload["events"][0]["message"]["mention"]["mentionees"]
+
+        self.assertEqual(payload["destination"], BOT_ID)
+        self.assertEqual(mentionees[0]["userId"], BOT_ID)
+        self.assertNotEqual(mentionees[1]["userId"], USER_ID)
+        self.assertEqual(mentionees[1]["userId"], payload["events"][0]["source"]["userId"])
+
+    def test_text_is_masked_with_mentions_kept(self):
+        """Masked text keeps its length and leading mention but not its content."""
+        text = json.loads(anonymize_body(BODY))["events"][0]["message"]["text"]
+
+        self.assertEqual(len(text), len("@あいちゃん 今日の天気は？"))
+        self.assertTrue(text.startswith("@"))
+        self.assertNotIn("天気", text)
+
+    def test_text_can_be_kept(self):
+        """TRAFFIC_CAPTURE_TEXT=keep leaves message text untouched."""
+        with patch.object(traffic_capture, "TRAFFIC_CAPTURE_TEXT", "keep"):
+            text = json.loads(anonymize_body(BODY))["events"][0]["message"]["text"]
+
+        self.assertEqual(text, "@あいちゃん 今日の天気は？")
+
+    def test_capture_round_trip(self):
+        """Captured lines load back sorted by arrival time."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "capture.jsonl")
+            capture_webhook(BODY, 2000, path)
+            capture_webhook(BODY, 1000, path)
+            capture_webhook("not json", 3000, path)
+
+            records = load_capture(path)
+
+        self.assertEqual([r["receivedAtMs"] for r in records], [1000, 2000])
+        self.assertNotIn(USER_ID, records[0]["body"])
+
+    def test_capture_disabled_without_path(self):
+        """Nothing is written when no capture path is configured."""
+        with patch("builtins.open") as mock_open:
+            capture_webhook(BODY, 1000)
+
+        mock_open.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
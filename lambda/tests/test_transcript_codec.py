@@ -0,0 +1,102 @@
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from boto3.dynamodb.types import Binary
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import transcript_codec
+from transcript_codec import (
+    decode_messages,
+    encode_messages,
+    item_size,
+    pack_item,
+    unpack_item,
+    write_units,
+)
+
+
+def make_context(turns=20):
+    start = datetime(2025, 7, 1, 12, 0, tzinfo=timezone.utc)
+    messages = []
+    for i in range(turns):
+        role = "user" if i % 2 == 0 else "assistant"
+        content = (
+            "今日の大阪の天気とおすすめのランチ教えて！"
+            if role == "user"
+            else "今日の大阪は晴れやで☀️ ランチやったら梅田のお好み焼きがめっちゃおすすめや！" * 3
+        )
+        messages.append(
+            {
+                "role": role,
+                "content": content,
+                "timestamp": (start + timedelta(seconds=30 * i)).isoformat(),
+            }
+        )
+    return {
+        "userId": "U1234567890abcdef1234567890abcdef",
+        "conversationId": "conv_20250701_120000",
+        "messages": messages,
+        "lastActivity": start.isoformat(),
+        "ttl": 1751457600,
+    }
+
+
+class TestTranscriptCodec(unittest.TestCase):
+    def test_round_trip(self):
+        """Messages should survive encoding with roles and timestamps intact."""
+        context = make_context()
+
+        self.assertEqual(decode_messages(encode_messages(context["messages"])), context["messages"])
+
+    def test_unknown_roles_and_missing_timestamps(self):
+        """Unknown roles are stored verbatim and missing timestamps stay missing."""
+        messages = [{"role": "narrator", "content": "hi"}]
+
+        self.assertEqual(decode_messages(encode_messages(messages)), messages)
+
+    def test_pack_and_unpack_item(self):
+        """Packed items carry a single Binary attribute and unpack transparently."""
+        context = make_context()
+
+        item = pack_item(context)
+
+        self.assertNotIn("messages", item)
+        self.assertIn("messages", context)
+        # DynamoDB hands binary attributes back wrapped in Binary
+        stored = dict(item, messagesBin=Binary(item["messagesBin"]))
+        self.assertEqual(unpack_item(stored), context)
+
+    def test_legacy_items_are_readable(self):
+        """Items written before the codec keep working unchanged."""
+        context = make_context(2)
+
+        self.assertEqual(unpack_item(context), context)
+
+    def test_legacy_encoding_can_be_selected(self):
+        """TRANSCRIPT_ENCODING=legacy keeps writing the list of maps."""
+        context = make_context(2)
+
+        with patch.object(transcript_codec, "TRANSCRIPT_ENCODING", "legacy"):
+            self.assertIs(pack_item(context), context)
+
+    def test_compressed_item_uses_fewer_write_units(self):
+        """A 20-message transcript should shrink well below the legacy encoding."""
+        context = make_context(20)
+        item = pack_item(context)
+
+        self.assertLess(item_size(item), item_size(context) / 3)
+        self.assertLess(write_units(item), write_units(context))
+
+    def test_rejects_unknown_version(self):
+        """Blobs from a future codec version should fail loudly."""
+        with self.assertRaises(ValueError):
+            decode_messages(b"\x09garbage")
+
+
+if __name__ == "__main__":
+    unittest.main()
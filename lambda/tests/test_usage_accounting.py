@@ -0,0 +1,165 @@
+import os
+import sys
+import unittest
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+with patch("boto3.client"), patch("boto3.resource"):
+    import usage_accounting
+    from ai_processor import get_ai_response
+    from usage_accounting import UsageRecorder, from_completion, from_grok, top_consumers
+
+
+class FakeUsageTable:
+    """Applies the ADD/SET update used by usage_accounting and pages queries."""
+
+    def __init__(self, page_size=100):
+        self.items = {}
+        self.page_size = page_size
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues, **_):
+        item = self.items.setdefault((Key["period"], Key["id"]), dict(Key))
+        adds, sets = UpdateExpression.removeprefix("ADD ").split(" SET ")
+        for clause in adds.split(", "):
+            name, placeholder = clause.split(" ")
+            item[name] = item.get(name, 0) + ExpressionAttributeValues[placeholder]
+        item.setdefault("ttl", ExpressionAttributeValues[":ttl"])
+
+    def query(self, KeyConditionExpression, ExclusiveStartKey=None, **_):
+        period = KeyConditionExpression.get_expression()["values"][1]
+        items = [item for (p, _), item in sorted(self.items.items()) if p == period]
+        start = ExclusiveStartKey or 0
+        response = {"Items": items[start : start + self.page_size]}
+        if start + self.page_size < len(items):
+            response["LastEvaluatedKey"] = start + self.page_size
+        return response
+
+
+def completion_usage(prompt, completion, cached=0):
+    return SimpleNamespace(
+        prompt_tokens=prompt,
+        completion_tokens=completion,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=cached),
+    )
+
+
+class TestUsageEntries(unittest.TestCase):
+    def test_from_completion(self):
+        """Prompt, completion and cached tokens are captured with the estimated cost."""
+        entry = from_completion("groq", "openai/gpt-oss-20b", completion_usage(1000, 200, 600))
+
+        self.assertEqual(entry["backend"], "groq:openai/gpt-oss-20b")
+        self.assertEqual(
+            (entry["promptTokens"], entry["completionTokens"], entry["cachedTokens"]),
+            (1000, 200, 600),
+        )
+        self.assertAlmostEqual(entry["costUsd"], (1000 * 0.10 + 200 * 0.50) / 1_000_000)
+
+    def test_from_grok_counts_searches(self):
+        """Grok entries carry the server-side search count and the reported cost."""
+        response = SimpleNamespace(
+            usage=SimpleNamespace(
+                prompt_tokens=5000,
+                completion_tokens=300,
+                cached_prompt_text_tokens=100,
+                server_side_tools_used=[1, 1, 1],
+                num_sources_used=12,
+            ),
+            cost_usd=0.031,
+        )
+
+        entry = from_grok("grok-4-1-fast", response)
+
+        self.assertEqual((entry["searches"], entry["sources"]), (3, 12))
+        self.assertEqual(entry["costUsd"], 0.031)
+
+
+class TestUsageRecorder(unittest.TestCase):
+    def setUp(self):
+        self.table = FakeUsageTable(page_size=2)
+        patcher = patch.object(usage_accounting, "usage_table", self.table)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def item(self, dimension, value):
+        day = next(period for period, _ in self.table.items).split("#")[0]
+        return self.table.items[(f"{day}#{dimension}", value)]
+
+    def test_counters_per_user_group_and_backend(self):
+        """Each flush adds to the user, group and backend items of the day."""
+        for _ in range(2):
+            recorder = UsageRecorder("U1", "group", "C1")
+            recorder.add(from_completion("groq", "openai/gpt-oss-20b", completion_usage(100, 20)))
+            recorder.add({**from_completion("xai", "grok", None), "searches": 2, "costUsd": 0.5})
+            recorder.flush()
+
+        user = self.item("user", "U1")
+        self.assertEqual(user["calls"], 4)
+        self.assertEqual(user["totalTokens"], 240)
+        self.assertEqual(user["searches"], 4)
+        self.assertIsInstance(user["costUsd"], Decimal)
+        self.assertEqual(self.item("group", "C1")["calls"], 4)
+        self.assertEqual(self.item("backend", "groq:openai/gpt-oss-20b")["promptTokens"], 200)
+        self.assertEqual(self.item("backend", "xai:grok")["calls"], 2)
+
+    def test_one_to_one_chats_have_no_group_item(self):
+        """Only group and room sources are aggregated per group."""
+        recorder = UsageRecorder("U1", "user", "U1")
+        recorder.add(from_completion("groq", "m", completion_usage(10, 1)))
+        recorder.flush()
+
+        self.assertEqual(
+            sorted(period.split("#")[1] for period, _ in self.table.items), ["backend", "user"]
+        )
+
+    def test_late_entries_are_written_after_flush(self):
+        """A speculative search finishing after the handler returns is still counted."""
+        recorder = UsageRecorder("U1", "user", "U1")
+        recorder.flush()
+        recorder.add(from_completion("xai", "grok", completion_usage(50, 5)))
+
+        self.assertEqual(self.item("user", "U1")["totalTokens"], 55)
+
+    def test_failed_write_does_not_raise(self):
+        """Accounting errors are logged and never break the reply."""
+        recorder = UsageRecorder("U1", "user", "U1")
+        recorder.add(from_completion("groq", "m", completion_usage(10, 1)))
+        with patch.object(self.table, "update_item", side_effect=RuntimeError("throttled")):
+            recorder.flush()
+
+    def test_top_consumers_across_pages(self):
+        """The helper reads every page of the day and ranks by the chosen metric."""
+        for user_id, prompt in [("U1", 10), ("U2", 500), ("U3", 50), ("U4", 200)]:
+            recorder = UsageRecorder(user_id, "user", user_id)
+            recorder.add(from_completion("groq", "m", completion_usage(prompt, 0)))
+            recorder.flush()
+
+        top = top_consumers("user", limit=3)
+
+        self.assertEqual([item["id"] for item in top], ["U2", "U4", "U3"])
+
+    def test_get_ai_response_records_completion_usage(self):
+        """The LLM call's response.usage reaches the recorder."""
+        message = MagicMock(content="まいど！", tool_calls=None)
+        response = MagicMock(
+            choices=[MagicMock(message=message, finish_reason="stop")],
+            usage=completion_usage(300, 40, 256),
+        )
+        client = MagicMock()
+        client.chat.completions.create.return_value = response
+        recorder = UsageRecorder("U1", "user", "U1")
+
+        with patch("ai_processor.get_groq_client", return_value=client):
+            get_ai_response([{"role": "user", "content": "おはよう"}], timeout=30, usage=recorder)
+        recorder.flush()
+
+        user = self.item("user", "U1")
+        self.assertEqual((user["calls"], user["cachedTokens"]), (1, 256))
+
+
+if __name__ == "__main__":
+    unittest.main()
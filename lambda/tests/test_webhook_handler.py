@@ -14,6 +14,7 @@ with (
     patch("webhook_handler.get_secret", return_value="test_secret"),
 ):
     from webhook_handler import (
+        THROTTLED_REPLY,
         get_conversation_context,
         handle_message,
         lambda_handler,
@@ -209,6 +210,28 @@ class TestWebhookHandler(unittest.TestCase):
         # Verify AI processing was started
         mock_start_ai.assert_called_once()
 
+    @patch("webhook_handler.start_ai_processing")
+    @patch("webhook_handler.get_conversation_context")
+    @patch("webhook_handler.rate_limiter")
+    @patch("webhook_handler.reply_line_message")
+    def test_handle_message_throttled(
+        self, mock_reply, mock_rate_limiter, mock_get_context, mock_start_ai
+    ):
+        """Throttled messages get a canned reply and never start a workflow."""
+        mock_event = Mock()
+        mock_event.source.user_id = "user123"
+        mock_event.message.text = "こんにちは"
+        mock_event.reply_token = "reply_token_123"
+        mock_event.source.type = "user"
+        mock_rate_limiter.admit_message.return_value = False
+
+        handle_message(mock_event)
+
+        mock_reply.assert_called_once()
+        self.assertEqual(mock_reply.call_args[0][1], THROTTLED_REPLY)
+        mock_get_context.assert_not_called()
+        mock_start_ai.assert_not_called()
+
     @patch("webhook_handler.get_bot_user_id")
     def test_handle_message_group_no_mention(self, mock_get_bot_id):
         """Test that messages without mentions in groups are ignored."""
@@ -0,0 +1,162 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+# Add the lambda directory to the python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+with (
+    patch("boto3.client"),
+    patch("boto3.resource"),
+    patch("core.runtime.get_secret", return_value="token"),
+    patch("webhook_handler.get_secret", return_value="default-secret"),
+):
+    import ingest_consumer
+    import ingest_queue
+    import webhook_handler
+    import webhook_prefilter
+
+BOT = "Ubot"
+
+
+def message_event(source_type="group", text="@ボット こんにちは", mentionees=(BOT,), kind="text"):
+    message = {"id": "1", "type": kind, "quoteToken": "q"}
+    if kind == "text":
+        message["text"] = text
+        if mentionees:
+            message["mention"] = {
+                "mentionees": [
+                    {"index": 0, "length": 4, "type": "user", "userId": user_id}
+                    for user_id in mentionees
+                ]
+            }
+    if kind == "sticker":
+        message.update(packageId="1", stickerId="1", stickerResourceType="STATIC")
+    source = {"type": source_type, "userId": "U1"}
+    if source_type != "user":
+        source[f"{source_type}Id"] = "G1"
+    return {
+        "type": "message",
+        "mode": "active",
+        "timestamp": 1700000000000,
+        "source": source,
+        "webhookEventId": "evt-1",
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": "reply",
+        "message": message,
+    }
+
+
+def sign(body, secret="default-secret"):
+    digest = hmac.new(secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+
+class TestRelevantEvents(unittest.TestCase):
+    def test_keeps_only_events_the_bot_would_act_on(self):
+        """Unmentioned group chatter, other bots' mentions and stickers are dropped."""
+        events = [
+            message_event(),
+            message_event(mentionees=()),
+            message_event(mentionees=("Uother",)),
+            message_event(source_type="room", mentionees=("Uother", BOT)),
+            message_event(source_type="user", mentionees=()),
+            message_event(source_type="user", kind="sticker"),
+            {"type": "follow", "source": {"type": "user", "userId": "U1"}},
+        ]
+
+        kept = webhook_prefilter.relevant_events({"destination": BOT, "events": events})
+
+        self.assertEqual(kept, [events[0], events[3], events[4]])
+
+    def test_filter_agrees_with_accept_message(self):
+        """Kept events are exactly those accept_message would not ignore for mentions."""
+        events = [message_event(mentionees=m) for m in ((), ("Uother",), (BOT,))]
+        with (
+            patch("webhook_handler.get_bot_user_id", return_value=BOT),
+            patch("webhook_handler.rate_limiter.admit_message", return_value=True),
+        ):
+            accepted = [
+                webhook_handler.accept_message(webhook_handler.Event.from_dict(e)) is not None
+                for e in events
+            ]
+        kept = [webhook_prefilter.is_relevant(e, BOT) for e in events]
+
+        self.assertEqual(kept, accepted)
+
+
+class TestPrefilteredWebhook(unittest.TestCase):
+    def setUp(self):
+        for target in (
+            patch.object(webhook_prefilter, "WEBHOOK_PREFILTER_ENABLED", True),
+            patch.object(webhook_handler, "BOT_USER_ID", None),
+            patch.object(
+                webhook_handler.handler.parser.signature_validator,
+                "channel_secret",
+                b"default-secret",
+            ),
+            patch("webhook_handler.traffic_capture.capture_webhook"),
+        ):
+            target.start()
+            self.addCleanup(target.stop)
+
+    def invoke(self, events, signature=None):
+        body = json.dumps({"destination": BOT, "events": events})
+        event = {"body": body, "headers": {"x-line-signature": signature or sign(body)}}
+        return webhook_handler.lambda_handler(event, None)
+
+    @patch("webhook_handler.handle_message")
+    def test_only_relevant_events_are_parsed_and_handled(self, mock_handle):
+        """The SDK parser is skipped; kept events reach handle_message as models."""
+        with patch.object(webhook_handler.handler, "handle") as mock_parse:
+            response = self.invoke([message_event(mentionees=()), message_event()])
+
+        self.assertEqual(response["statusCode"], 200)
+        mock_parse.assert_not_called()
+        mock_handle.assert_called_once()
+        self.assertEqual(mock_handle.call_args.args[0].message.text, "@ボット こんにちは")
+
+    @patch("webhook_handler.handle_message")
+    def test_invalid_signature_is_still_rejected(self, mock_handle):
+        """Filtering happens only after the signature check."""
+        response = self.invoke([message_event()], signature="bad")
+
+        self.assertEqual(response["statusCode"], 400)
+        mock_handle.assert_not_called()
+
+    def test_destination_seeds_the_bot_id(self):
+        """The mention check uses the destination instead of calling get_bot_info."""
+        with patch("webhook_handler.MessagingApi") as mock_api:
+            webhook_handler.relevant_events({"destination": BOT, "events": []})
+            self.assertEqual(webhook_handler.get_bot_user_id(), BOT)
+        mock_api.assert_not_called()
+
+    def test_queue_mode_skips_bodies_without_relevant_events(self):
+        """Unmentioned group chatter never reaches the ingestion queue."""
+        queue = ingest_queue.LocalQueue()
+        with (
+            patch.object(webhook_handler, "INGESTION_MODE", "queue"),
+            patch("webhook_handler.ingest_queue.get_queue", return_value=queue),
+        ):
+            self.invoke([message_event(mentionees=())])
+            self.invoke([message_event()])
+
+        self.assertEqual(len(queue.messages), 1)
+
+    def test_consumer_parses_only_relevant_events(self):
+        """The ingest consumer builds models only for events that pass the filter."""
+        body = json.dumps({"destination": BOT, "events": [message_event(mentionees=())]})
+        record = {"messageId": "m1", "body": ingest_queue.encode_envelope(body, 1700000000000)}
+        with patch("ingest_consumer.parse_event") as mock_parse:
+            self.assertEqual(ingest_consumer.parse_record(record), [])
+
+        mock_parse.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
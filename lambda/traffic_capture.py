@@ -0,0 +1,113 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables (capture is off unless a path is set, e.g. /tmp/webhook-capture.jsonl)
+TRAFFIC_CAPTURE_PATH = os.environ.get("TRAFFIC_CAPTURE_PATH", "")
+# Salt for pseudonymous IDs; the same salt keeps a user's IDs stable across captures
+TRAFFIC_CAPTURE_SALT = os.environ.get("TRAFFIC_CAPTURE_SALT", "echo-line-bot")
+# "mask" replaces message text with same-length filler; "keep" stores it as-is
+TRAFFIC_CAPTURE_TEXT = os.environ.get("TRAFFIC_CAPTURE_TEXT", "mask")
+
+# Fields replaced with a stable pseudonym keeping LINE's prefix letter and length.
+# The bot's own ID (the body's "destination") is not personal data and is kept as-is,
+# so replayed group messages still mention the bot.
+ID_FIELDS = {"userId", "groupId", "roomId"}
+# Fields that only need to be unique, not stable
+TOKEN_FIELDS = {"replyToken", "quoteToken", "webhookEventId", "id"}
+
+_MENTION = re.compile(r"@\S+")
+_write_lock = threading.Lock()
+
+
+def _pseudonym(value: str, keep_prefix: bool) -> str:
+    digest = hashlib.sha256(f"{TRAFFIC_CAPTURE_SALT}:{value}".encode("utf-8")).hexdigest()
+    if keep_prefix and value[:1] in ("U", "C", "R"):
+        return value[0] + digest[: max(len(value) - 1, 1)]
+    return digest[: max(len(value), 1)]
+
+
+def _mask_text(text: str) -> str:
+    # Keep mentions, whitespace and length so routing and token counts stay realistic
+    masked = []
+    last = 0
+    for match in _MENTION.finditer(text):
+        masked.append(re.sub(r"\S", "x", text[last : match.start()]))
+        masked.append("@" + _pseudonym(match.group()[1:], False)[: len(match.group()) - 1])
+        last = match.end()
+    masked.append(re.sub(r"\S", "x", text[last:]))
+    return "".join(masked)
+
+
+def _anonymize(value, key: str | None = None, bot_id: str | None = None):
+    if isinstance(value, dict):
+        return {k: _anonymize(v, k, bot_id) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_anonymize(v, key, bot_id) for v in value]
+    if isinstance(value, str):
+        if key in ID_FIELDS and value != bot_id:
+            return _pseudonym(value, True)
+        if key in TOKEN_FIELDS:
+            return _pseudonym(value, False)
+        if key == "text" and TRAFFIC_CAPTURE_TEXT == "mask":
+            return _mask_text(value)
+    return value
+
+
+def anonymize_body(body: str) -> str:
+    """Replace user, group and token identifiers (and optionally text) in a webhook body.
+
+    The bot's ID in "destination" and in mentionees is left unchanged.
+
+    Args:
+        body: Raw webhook JSON body
+
+    Returns:
+        Anonymized JSON body with the same structure
+    """
+    payload = json.loads(body)
+    anonymized = _anonymize(payload, bot_id=payload.get("destination"))
+    return json.dumps(anonymized, ensure_ascii=False, separators=(",", ":"))
+
+
+def capture_webhook(body: str, received_at_ms: int, path: str | None = None) -> None:
+    """Append an anonymized webhook body with its arrival time to the capture file.
+
+    Capture is best effort and never fails the webhook.
+
+    Args:
+        body: Raw webhook JSON body (signature already verified)
+        received_at_ms: Arrival time in epoch milliseconds
+        path: Capture file (defaults to TRAFFIC_CAPTURE_PATH)
+    """
+    path = path or TRAFFIC_CAPTURE_PATH
+    if not path:
+        return
+    try:
+        line = json.dumps(
+            {"receivedAtMs": received_at_ms, "body": anonymize_body(body)}, ensure_ascii=False
+        )
+        with _write_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except Exception as e:
+        logger.warning(f"Failed to capture webhook body: {e}")
+
+
+def load_capture(path: str) -> list[dict]:
+    """Read a capture file sorted by arrival time.
+
+    Args:
+        path: Capture file written by capture_webhook
+
+    Returns:
+        List of {"receivedAtMs", "body"} records
+    """
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return sorted(records, key=lambda r: r["receivedAtMs"])
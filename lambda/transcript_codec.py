@@ -0,0 +1,180 @@
+import logging
+import math
+import os
+import zlib
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import payload_codec
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# "compressed" writes the binary transcript; "legacy" keeps writing the list of maps.
+# Both formats are always readable.
+TRANSCRIPT_ENCODING = os.environ.get("TRANSCRIPT_ENCODING", "compressed")
+
+CODEC_VERSION = 1
+BINARY_ATTRIBUTE = "messagesBin"
+
+ROLE_CODES = {"user": 0, "assistant": 1, "system": 2, "tool": 3}
+ROLE_NAMES = {code: role for role, code in ROLE_CODES.items()}
+
+
+def _timestamp_to_ms(timestamp: str | None) -> int:
+    if not timestamp:
+        return 0
+    return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+
+
+def _ms_to_timestamp(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat()
+
+
+def encode_messages(messages: list) -> bytes:
+    """Encode a transcript as compressed positional rows.
+
+    Each message becomes ``[role, epoch_ms, content]`` where known roles are
+    small integers, serialized as compact JSON and zlib-compressed behind a
+    one-byte version header.
+
+    Args:
+        messages: List of {"role", "content", "timestamp"} dicts
+
+    Returns:
+        Encoded transcript
+    """
+    rows = [
+        [
+            ROLE_CODES.get(m["role"], m["role"]),
+            _timestamp_to_ms(m.get("timestamp")),
+            m["content"],
+        ]
+        for m in messages
+    ]
+    return bytes([CODEC_VERSION]) + zlib.compress(payload_codec.dumps_bytes(rows), 6)
+
+
+def decode_messages(blob: bytes) -> list:
+    """Decode a transcript produced by encode_messages.
+
+    Args:
+        blob: Encoded transcript
+
+    Returns:
+        List of {"role", "content", "timestamp"} dicts (timestamp omitted if unknown)
+
+    Raises:
+        ValueError: If the codec version is not supported
+    """
+    if not blob or blob[0] != CODEC_VERSION:
+        raise ValueError(f"Unsupported transcript codec version: {blob[:1]!r}")
+    messages = []
+    for role, ms, content in payload_codec.loads(zlib.decompress(blob[1:])):
+        message = {"role": ROLE_NAMES.get(role, role), "content": content}
+        if ms:
+            message["timestamp"] = _ms_to_timestamp(ms)
+        messages.append(message)
+    return messages
+
+
+def pack_item(conversation_context: dict) -> dict:
+    """Build the DynamoDB item for a conversation context.
+
+    The context is validated first (see payload_codec.check_conversation);
+    apart from number types fixed there it is not modified, the expanded
+    ``messages`` list is only replaced in the returned item.
+
+    Args:
+        conversation_context: Conversation data with a ``messages`` list
+
+    Returns:
+        Item to pass to put_item
+
+    Raises:
+        payload_codec.SchemaError: If the context does not match the stored schema
+    """
+    payload_codec.check_conversation(conversation_context)
+    if TRANSCRIPT_ENCODING != "compressed":
+        return conversation_context
+    item = {k: v for k, v in conversation_context.items() if k != "messages"}
+    item[BINARY_ATTRIBUTE] = encode_messages(conversation_context.get("messages", []))
+    return item
+
+
+def unpack_item(item: dict) -> dict:
+    """Turn a stored item (compressed or legacy) into a conversation context.
+
+    Args:
+        item: Item returned by DynamoDB
+
+    Returns:
+        Conversation context with an expanded ``messages`` list
+    """
+    if BINARY_ATTRIBUTE not in item:
+        return item
+    blob = item[BINARY_ATTRIBUTE]
+    # boto3 returns Binary wrappers for B attributes
+    blob = getattr(blob, "value", blob)
+    context = {k: v for k, v in item.items() if k != BINARY_ATTRIBUTE}
+    context["messages"] = decode_messages(bytes(blob))
+    return context
+
+
+def _value_size(value) -> int:
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (int, float, Decimal)):
+        # Numbers take roughly one byte per two significant digits plus one
+        return len(str(value).lstrip("-").replace(".", "")) // 2 + 1
+    if hasattr(value, "value"):
+        return _value_size(value.value)
+    if isinstance(value, dict):
+        return 3 + sum(len(k.encode("utf-8")) + _value_size(v) + 1 for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 3 + sum(_value_size(v) + 1 for v in value)
+    return len(str(value).encode("utf-8"))
+
+
+def item_size(item: dict) -> int:
+    """Estimate the stored size of a DynamoDB item in bytes.
+
+    Args:
+        item: Item as passed to put_item
+
+    Returns:
+        Approximate item size (attribute names plus values)
+    """
+    return sum(len(name.encode("utf-8")) + _value_size(value) for name, value in item.items())
+
+
+def write_units(item: dict) -> int:
+    """Get the write capacity units one put of this item consumes (1 WCU per 1 KB).
+
+    Args:
+        item: Item as passed to put_item
+
+    Returns:
+        Write capacity units
+    """
+    return max(1, math.ceil(item_size(item) / 1024))
+
+
+def log_item_savings(conversation_context: dict, item: dict) -> None:
+    """Log the item size and WCU of the legacy and stored encodings.
+
+    Args:
+        conversation_context: Context with an expanded ``messages`` list
+        item: Item actually written
+    """
+    legacy_size = item_size(conversation_context)
+    stored_size = item_size(item)
+    logger.info(
+        f"Conversation item size: legacy={legacy_size}B/{write_units(conversation_context)}WCU, "
+        f"stored={stored_size}B/{write_units(item)}WCU "
+        f"({len(conversation_context.get('messages', []))} messages)"
+    )
@@ -0,0 +1,221 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import core
+import model_cascade
+import snapstart
+from boto3.dynamodb.conditions import Key
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables (accounting is opt-in; the table is created with -c usageAccounting=true)
+USAGE_ACCOUNTING_ENABLED = os.environ.get("USAGE_ACCOUNTING_ENABLED", "false").lower() == "true"
+USAGE_TABLE_NAME = os.environ.get("USAGE_TABLE_NAME", "")
+USAGE_RETENTION_DAYS = int(os.environ.get("USAGE_RETENTION_DAYS", "400"))
+
+# Aggregation dimensions; items are keyed by period "<day>#<dimension>" and the dimension value
+USER = "user"
+GROUP = "group"
+BACKEND = "backend"
+
+# Counters kept on every item (costUsd is a Decimal, the rest are integers)
+COUNTERS = (
+    "calls",
+    "promptTokens",
+    "completionTokens",
+    "cachedTokens",
+    "totalTokens",
+    "searches",
+    "sources",
+)
+
+# Shared AWS clients (see core.runtime)
+usage_table = core.table(USAGE_TABLE_NAME) if USAGE_TABLE_NAME else None
+
+
+@snapstart.after_restore
+def refresh_clients() -> None:
+    """Pick up the table rebuilt by core after a SnapStart restore."""
+    global usage_table
+    usage_table = core.table(USAGE_TABLE_NAME) if USAGE_TABLE_NAME else None
+
+
+def from_completion(backend: str, model: str, usage) -> dict:
+    """Build a usage entry from an OpenAI-compatible chat completion.
+
+    Args:
+        backend: Backend name (e.g. "groq", "sambanova")
+        model: Model name
+        usage: ``response.usage`` (may be None)
+
+    Returns:
+        Usage entry for UsageRecorder.add
+    """
+    prompt_tokens = int(getattr(usage, "prompt_tokens", 0) or 0)
+    completion_tokens = int(getattr(usage, "completion_tokens", 0) or 0)
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "backend": f"{backend}:{model}",
+        "promptTokens": prompt_tokens,
+        "completionTokens": completion_tokens,
+        "cachedTokens": int(getattr(details, "cached_tokens", 0) or 0),
+        "costUsd": model_cascade.estimate_cost(model, usage),
+    }
+
+
+def from_grok(model: str, response) -> dict:
+    """Build a usage entry from an xAI SDK response with server-side search.
+
+    Args:
+        model: Model name
+        response: Response returned by ``chat.sample()``
+
+    Returns:
+        Usage entry for UsageRecorder.add
+    """
+    usage = getattr(response, "usage", None)
+    cost = getattr(response, "cost_usd", None)
+    return {
+        "backend": f"xai:{model}",
+        "promptTokens": int(getattr(usage, "prompt_tokens", 0) or 0),
+        "completionTokens": int(getattr(usage, "completion_tokens", 0) or 0),
+        "cachedTokens": int(getattr(usage, "cached_prompt_text_tokens", 0) or 0),
+        "searches": len(getattr(usage, "server_side_tools_used", None) or ()),
+        "sources": int(getattr(usage, "num_sources_used", 0) or 0),
+        "costUsd": float(cost or 0.0),
+    }
+
+
+class UsageRecorder:
+    """Collects the usage of one workflow step and writes it as atomic DynamoDB counters.
+
+    Entries may be added from worker threads (parallel Grok searches, speculative
+    search). ``flush`` aggregates them per dimension and issues one ``ADD`` update
+    per item, so concurrent Lambdas never overwrite each other's counts. Entries
+    that arrive after the flush (a speculative search finishing late) are written
+    as they come.
+    """
+
+    def __init__(self, user_id: str | None, source_type: str | None, source_id: str | None):
+        self.user_id = user_id
+        self.group_id = source_id if source_type in ("group", "room") else None
+        self.entries: list[dict] = []
+        self.flushed = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_event(cls, event: dict) -> "UsageRecorder | None":
+        """Create a recorder for a workflow payload, or None when accounting is disabled."""
+        if not USAGE_ACCOUNTING_ENABLED or usage_table is None:
+            return None
+        return cls(event.get("userId"), event.get("sourceType"), event.get("sourceId"))
+
+    def add(self, entry: dict) -> None:
+        """Record the usage of one call.
+
+        Args:
+            entry: Value from from_completion or from_grok
+        """
+        with self._lock:
+            if not self.flushed:
+                self.entries.append(entry)
+                return
+        self._write([entry])
+
+    def flush(self) -> None:
+        """Write everything recorded so far; never raises."""
+        with self._lock:
+            entries, self.entries, self.flushed = self.entries, [], True
+        if entries:
+            self._write(entries)
+
+    def _write(self, entries: list[dict]) -> None:
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        totals: dict[tuple[str, str], dict] = {}
+        for entry in entries:
+            keys = [(BACKEND, entry["backend"])]
+            if self.user_id:
+                keys.append((USER, self.user_id))
+            if self.group_id:
+                keys.append((GROUP, self.group_id))
+            for key in keys:
+                total = totals.setdefault(key, dict.fromkeys(COUNTERS, 0) | {"costUsd": 0.0})
+                total["calls"] += 1
+                total["totalTokens"] += entry["promptTokens"] + entry["completionTokens"]
+                for name in (
+                    "promptTokens",
+                    "completionTokens",
+                    "cachedTokens",
+                    "searches",
+                    "sources",
+                ):
+                    total[name] += entry.get(name, 0)
+                total["costUsd"] += entry["costUsd"]
+
+        ttl = int(time.time()) + USAGE_RETENTION_DAYS * 86400
+        for (dimension, value), total in totals.items():
+            try:
+                increment(f"{day}#{dimension}", value, total, ttl)
+            except Exception as e:
+                logger.error(f"Failed to record usage for {dimension} {value}: {e}")
+        cost = sum(entry["costUsd"] for entry in entries)
+        tokens = sum(entry["promptTokens"] + entry["completionTokens"] for entry in entries)
+        logger.info(f"Usage recorded: calls={len(entries)} tokens={tokens} cost=${cost:.6f}")
+
+
+def increment(period: str, value: str, total: dict, ttl: int) -> None:
+    """Atomically add counters to one usage item, creating it if needed.
+
+    Args:
+        period: Partition key, "<day>#<dimension>"
+        value: Sort key, the user ID, group ID or backend name
+        total: Counter increments (COUNTERS plus costUsd)
+        ttl: Expiry for a newly created item (epoch seconds)
+    """
+    names = [*COUNTERS, "costUsd"]
+    values = {f":{name}": total[name] for name in COUNTERS}
+    # DynamoDB numbers must be Decimal; round the float cost to avoid binary noise
+    values[":costUsd"] = Decimal(str(round(total["costUsd"], 9)))
+    values[":ttl"] = ttl
+    usage_table.update_item(
+        Key={"period": period, "id": value},
+        UpdateExpression="ADD "
+        + ", ".join(f"{name} :{name}" for name in names)
+        + " SET #ttl = if_not_exists(#ttl, :ttl)",
+        ExpressionAttributeNames={"#ttl": "ttl"},
+        ExpressionAttributeValues=values,
+    )
+
+
+def top_consumers(
+    dimension: str = USER, day: str | None = None, metric: str = "totalTokens", limit: int = 10
+) -> list[dict]:
+    """List the biggest consumers of one day.
+
+    Args:
+        dimension: USER, GROUP or BACKEND
+        day: UTC day as YYYY-MM-DD (defaults to today)
+        metric: Counter to rank by (e.g. "totalTokens", "costUsd", "searches")
+        limit: Number of items to return
+
+    Returns:
+        Usage items sorted by the metric, largest first
+    """
+    if usage_table is None:
+        raise RuntimeError("USAGE_TABLE_NAME is not set")
+    day = day or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    query = {"KeyConditionExpression": Key("period").eq(f"{day}#{dimension}")}
+    items: list[dict] = []
+    while True:
+        response = usage_table.query(**query)
+        items.extend(response.get("Items", []))
+        if "LastEvaluatedKey" not in response:
+            break
+        query["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    items.sort(key=lambda item: item.get(metric, 0), reverse=True)
+    return items[:limit]
@@ -3,60 +3,130 @@ import json
 import logging
 import os
 import re
+import time
 from datetime import datetime, timedelta, timezone
 
 # Import the ai_processor module
 import ai_processor
-import boto3
+import conversation_cache
+import core
+import deadline
+import ingest_queue
+import long_term_memory
+import memory_profile
+import payload_codec
+import rate_limiter
+import snapstart
+import traffic_capture
+import transcript_codec
+import webhook_prefilter
+from botocore.exceptions import ClientError
 from linebot.v3 import WebhookHandler
 from linebot.v3.exceptions import InvalidSignatureError
 from linebot.v3.messaging import (
     ApiClient,
-    Configuration,
     MessagingApi,
     ReplyMessageRequest,
     TextMessage,
 )
-from linebot.v3.webhooks import MessageEvent, TextMessageContent
+from linebot.v3.webhooks import Event, MessageEvent, TextMessageContent
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# AWS clients
-dynamodb = boto3.resource("dynamodb")
-stepfunctions = boto3.client("stepfunctions")
-secretsmanager = boto3.client("secretsmanager")
-
 # Environment variables
 CHANNEL_SECRET_NAME = os.environ["CHANNEL_SECRET_NAME"]
 CHANNEL_ACCESS_TOKEN_NAME = os.environ["CHANNEL_ACCESS_TOKEN_NAME"]
 CONVERSATION_TABLE_NAME = os.environ["CONVERSATION_TABLE_NAME"]
 STEP_FUNCTION_ARN = os.environ["STEP_FUNCTION_ARN"]
+# "direct": process in the webhook; "queue": verify, enqueue and let ingest_consumer process
+INGESTION_MODE = os.environ.get("INGESTION_MODE", "direct")
 
+# Version conflicts tolerated when saving a cached conversation before giving up
+MAX_VERSION_CONFLICTS = 3
 
-# Function to get secrets from Secrets Manager
-def get_secret(secret_name):
-    try:
-        response = secretsmanager.get_secret_value(SecretId=secret_name)
-        return response["SecretString"]
-    except Exception as e:
-        logger.error(f"Error retrieving secret {secret_name}: {e}")
-        raise
 
+# Shared AWS clients, secrets and LINE configuration (see core.runtime)
+get_secret = core.get_secret
+dynamodb = core.resource("dynamodb")
+stepfunctions = core.client("stepfunctions")
+conversation_table = core.table(CONVERSATION_TABLE_NAME)
 
-# LINE Bot setup
-CHANNEL_SECRET = get_secret(CHANNEL_SECRET_NAME)
-CHANNEL_ACCESS_TOKEN = get_secret(CHANNEL_ACCESS_TOKEN_NAME)
-configuration = Configuration(access_token=CHANNEL_ACCESS_TOKEN)
-handler = WebhookHandler(CHANNEL_SECRET)
-conversation_table = dynamodb.Table(CONVERSATION_TABLE_NAME)
+# LINE Bot setup (the stack's own channel; others in LINE_CHANNELS are built on demand)
+configuration = core.line_configuration()
+handler = WebhookHandler(get_secret(CHANNEL_SECRET_NAME))
 
 BOT_USER_ID = None
 
 
-def get_bot_user_id():
-    """Retrieve and cache the bot's own user ID"""
+def build_channel_handler(channel_id):
+    """Build the webhook handler of a channel listed in LINE_CHANNELS"""
+    channel_handler = WebhookHandler(get_secret(core.channel_secret_name(channel_id)))
+    channel_handler.add(MessageEvent, message=TextMessageContent)(
+        lambda event: handle_message(event, channel_id)
+    )
+    return channel_handler
+
+
+# Warm handlers of the other channels, shared by every bot this deployment serves
+channel_handlers = core.ChannelCache(build_channel_handler)
+
+
+def handler_for(channel_id):
+    """Get the webhook handler that verifies and dispatches a channel's webhooks"""
+    if core.channels.is_default(channel_id):
+        return handler
+    return channel_handlers.get(channel_id)
+
+
+def route_channel(body):
+    """Pick the channel of a webhook body by its destination (the bot's user ID)"""
+    if not core.channels.LINE_CHANNELS:
+        # Single-channel deployment: no need to parse the body here
+        return core.DEFAULT_CHANNEL
+    try:
+        destination = payload_codec.loads(body).get("destination")
+    except (ValueError, AttributeError):
+        destination = None
+    return core.resolve_channel(destination)
+
+
+@snapstart.before_snapshot
+def drop_line_credentials():
+    """Keep the LINE channel secrets out of the SnapStart snapshot (core drops the token)"""
+    handler.parser.signature_validator.channel_secret = b""
+    channel_handlers.clear()
+
+
+@snapstart.after_restore
+def restore_line_credentials():
+    """Pick up the clients rebuilt by core and reload the channel secret"""
+    global dynamodb, stepfunctions, conversation_table
+    dynamodb = core.resource("dynamodb")
+    stepfunctions = core.client("stepfunctions")
+    conversation_table = core.table(CONVERSATION_TABLE_NAME)
+    handler.parser.signature_validator.channel_secret = get_secret(CHANNEL_SECRET_NAME).encode(
+        "utf-8"
+    )
+
+
+THROTTLED_REPLY = (
+    "ちょっと待ってな〜💦 今めっちゃ混んでるから、少し時間置いてからまた話しかけてな！"
+)
+
+
+def get_bot_user_id(channel_id=None, destination=None):
+    """Retrieve and cache the bot's own user ID
+
+    A webhook's destination is the bot's user ID, so passing it saves the
+    get_bot_info call on a cold container.
+    """
+    if not core.channels.is_default(channel_id):
+        # Other channels are keyed by their webhook destination, which is the bot's user ID
+        return channel_id
     global BOT_USER_ID
+    if BOT_USER_ID is None and destination:
+        BOT_USER_ID = destination
     if BOT_USER_ID is None:
         with ApiClient(configuration) as api_client:
             line_bot_api = MessagingApi(api_client)
@@ -77,8 +147,11 @@ def strip_mentions(text):
     return re.sub(r"\s+", " ", cleaned).strip()
 
 
+@memory_profile.profiled("webhook_handler")
 def lambda_handler(event, context):
-    logger.info("Received event: %s", json.dumps(event))
+    started = time.perf_counter()
+    received_at_ms = deadline.now_ms()
+    logger.info("Received event: %s", payload_codec.log_dumps(event))
 
     headers = event.get("headers", {})
     if "body" not in event:
@@ -93,20 +166,102 @@ def lambda_handler(event, context):
             logger.error(f"Failed to decode base64 body: {e}")
             return {"statusCode": 400, "body": json.dumps({"message": "Invalid Body"})}
     signature = headers.get("x-line-signature")
+    channel_id = route_channel(body)
 
     try:
-        handler.handle(body, signature)
+        if INGESTION_MODE == "queue":
+            enqueue_webhook(body, signature, channel_id)
+        else:
+            with memory_profile.stage("handle"):
+                if webhook_prefilter.WEBHOOK_PREFILTER_ENABLED:
+                    handle_relevant_events(body, signature, channel_id)
+                else:
+                    handler_for(channel_id).handle(body, signature)
     except InvalidSignatureError:
         logger.error("Invalid signature")
         return {"statusCode": 400, "body": json.dumps({"message": "Invalid Signature"})}
 
+    # Only verified bodies are captured, so replays see the same traffic the bot handled
+    traffic_capture.capture_webhook(body, received_at_ms)
+
+    ack_latency_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Acknowledged webhook in {ack_latency_ms:.1f}ms (mode={INGESTION_MODE})")
     return {"statusCode": 200, "body": json.dumps({"message": "OK"})}
 
 
+def enqueue_webhook(body, signature, channel_id=core.DEFAULT_CHANNEL):
+    """Verify the signature and hand the raw body to the ingestion queue"""
+    if not verify_signature(body, signature, channel_id):
+        raise InvalidSignatureError(f"Invalid signature. signature={signature}")
+    if webhook_prefilter.WEBHOOK_PREFILTER_ENABLED and not relevant_events(
+        payload_codec.loads(body), channel_id
+    ):
+        # Nothing the consumer would act on (e.g. unmentioned group chatter)
+        return
+    ingest_queue.get_queue().send(ingest_queue.encode_envelope(body, deadline.now_ms()))
+
+
+def relevant_events(payload, channel_id=core.DEFAULT_CHANNEL):
+    """Raw events of a verified body worth parsing, judged against its destination"""
+    bot_id = get_bot_user_id(channel_id, payload.get("destination"))
+    return webhook_prefilter.relevant_events(payload, bot_id)
+
+
+def handle_relevant_events(body, signature, channel_id=core.DEFAULT_CHANNEL):
+    """Verify a body and dispatch only the events the pre-filter keeps.
+
+    Stands in for WebhookHandler.handle, which builds SDK models for every
+    event; dropped events (other bots' traffic, stickers, unmentioned group
+    messages) are never parsed.
+    """
+    if not verify_signature(body, signature, channel_id):
+        raise InvalidSignatureError(f"Invalid signature. signature={signature}")
+    for raw_event in relevant_events(payload_codec.loads(body), channel_id):
+        handle_message(Event.from_dict(raw_event), channel_id)
+
+
+def verify_signature(body, signature, channel_id=core.DEFAULT_CHANNEL):
+    """Check the x-line-signature of a body with the channel's secret"""
+    return handler_for(channel_id).parser.signature_validator.validate(body, signature or "")
+
+
 @handler.add(MessageEvent, message=TextMessageContent)
-def handle_message(event):
-    logger.info("Handling message event: %s", json.dumps(event, default=str))
+def handle_message(event, channel_id=core.DEFAULT_CHANNEL):
+    logger.info("Handling message event: %s", payload_codec.log_dumps(event))
+
+    message = accept_message(event, channel_id)
+    if message is None:
+        return
+
+    # No immediate response - will respond via Push API after processing
+
+    # Get or create conversation context
+    user_id = message["userId"]
+    conversation_context = get_conversation_context(user_id)
+
+    # Add user message to conversation
+    append_user_message(conversation_context, message["text"])
+
+    # Save conversation context
+    save_conversation_context(user_id, conversation_context)
+
+    # Start Step Functions workflow with quote token
+    start_ai_processing(
+        user_id,
+        conversation_context,
+        message["sourceType"],
+        message["sourceId"],
+        message["quoteToken"],
+        channel_id=channel_id,
+    )
+
+
+def accept_message(event, channel_id=core.DEFAULT_CHANNEL):
+    """Filter a text message event and handle commands and throttling.
 
+    Returns a dict describing the message when it should go to the AI
+    workflow, or None when it was ignored or already answered.
+    """
     user_id = event.source.user_id
     user_message = event.message.text
     reply_token = event.reply_token
@@ -119,61 +274,105 @@ def handle_message(event):
         mention = event.message.mention
         if not mention:
             logger.info("No mention found in group message; ignoring")
-            return
-        bot_id = get_bot_user_id()
+            return None
+        bot_id = get_bot_user_id(channel_id)
         if all(m.user_id != bot_id for m in mention.mentionees):
             logger.info("Bot not mentioned; ignoring message")
-            return
+            return None
 
     # Strip mentions first (important for group chats)
     sanitized_message = strip_mentions(user_message)
     # Check for forget command after stripping mentions
     if sanitized_message.strip().lower() in ["/forget", "/忘れて"]:
+        if conversation_cache.conversations is not None:
+            conversation_cache.conversations.invalidate(user_id)
         if ai_processor.delete_conversation_history(user_id):
             reply_text = "会話の履歴を削除しました。"
         else:
             reply_text = "履歴の削除に失敗しました。"
 
-        with ApiClient(configuration) as api_client:
-            line_bot_api = MessagingApi(api_client)
-
-            # Create text message with quote token if available (for group chats)
-            text_message = TextMessage(
-                text=reply_text,
-                quoteToken=quote_token
-                if quote_token and source_type in ("group", "room")
-                else None,
-            )
-
-            line_bot_api.reply_message(
-                ReplyMessageRequest(reply_token=reply_token, messages=[text_message])
-            )
-        return
-
-    # No immediate response - will respond via Push API after processing
+        reply_line_message(reply_token, reply_text, quote_token, source_type, channel_id)
+        return None
 
-    # Get or create conversation context
-    conversation_context = get_conversation_context(user_id)
+    # Admission control: throttled messages get a free reply and never start a workflow
+    if not rate_limiter.admit_message(user_id, source_type, source_id):
+        reply_line_message(reply_token, THROTTLED_REPLY, quote_token, source_type, channel_id)
+        return None
 
-    # Add user message to conversation
     logger.info(f"Sanitized message: {sanitized_message}")
+    return {
+        "userId": user_id,
+        "text": sanitized_message,
+        "sourceType": source_type,
+        "sourceId": source_id,
+        "quoteToken": quote_token,
+        "channelId": channel_id,
+    }
+
+
+def append_user_message(conversation_context, text):
+    """Append a user turn to the conversation context
+
+    Each user message starts a new generation; workflow stages still running
+    for an older one stop when they see it (generation_guard).
+    """
+    conversation_context["generation"] = core.new_version()
     conversation_context["messages"].append(
         {
             "role": "user",
-            "content": sanitized_message,
+            "content": text,
             "timestamp": datetime.now(timezone.utc).isoformat(),
         }
     )
 
-    # Save conversation context
-    save_conversation_context(user_id, conversation_context)
 
-    # Start Step Functions workflow with quote token
-    start_ai_processing(user_id, conversation_context, source_type, source_id, quote_token)
+def reply_line_message(reply_token, text, quote_token=None, source_type=None, channel_id=None):
+    """Reply to a webhook event using its reply token"""
+    channel_configuration = (
+        configuration
+        if core.channels.is_default(channel_id)
+        else core.channel_configuration(channel_id)
+    )
+    with ApiClient(channel_configuration) as api_client:
+        line_bot_api = MessagingApi(api_client)
+
+        # Create text message with quote token if available (for group chats)
+        text_message = TextMessage(
+            text=text,
+            quoteToken=quote_token if quote_token and source_type in ("group", "room") else None,
+        )
+
+        line_bot_api.reply_message(
+            ReplyMessageRequest(reply_token=reply_token, messages=[text_message])
+        )
+
+
+def cache_is_current(cached):
+    """Check a cached conversation against the stored version (drops it if outdated)"""
+    try:
+        current = core.stored_version(cached["userId"]) == cached.get("version")
+    except Exception as e:
+        logger.warning(f"Could not validate cached conversation: {e}")
+        current = False
+    if not current:
+        conversation_cache.conversations.record_stale(cached["userId"])
+    return current
 
 
 def get_conversation_context(user_id):
-    """Get existing conversation context or create new one"""
+    """Get existing conversation context or create new one
+
+    With the warm-container cache enabled, a cached conversation is used
+    if a projected read of the stored version still matches it; otherwise
+    the full item is read as without the cache.
+    """
+    cache = conversation_cache.conversations
+    cached = cache.get(user_id) if cache is not None else None
+    if cached is not None and cache_is_current(cached):
+        if is_conversation_active(cached):
+            return cached
+        return expire_conversation(cached)
+
     try:
         # Get most recent conversation
         response = conversation_table.query(
@@ -187,64 +386,239 @@ def get_conversation_context(user_id):
             len(response.get("Items", [])),
         )
 
+        if response["Items"] and is_conversation_active(response["Items"][0]):
+            return transcript_codec.unpack_item(response["Items"][0])
+
+        # Create new conversation (replacing the expired one, if any)
         if response["Items"]:
-            conversation = response["Items"][0]
-
-            # Check if conversation is still active (within 30 minutes)
-            last_activity = datetime.fromisoformat(conversation["lastActivity"])
-            now = datetime.now(timezone.utc)
-            if now - last_activity < timedelta(minutes=30):
-                return conversation
-
-        # Create new conversation
-        conversation_id = f"conv_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}"
-        return {
-            "userId": user_id,
-            "conversationId": conversation_id,
-            "messages": [],
-            "lastActivity": datetime.now(timezone.utc).isoformat(),
-            "ttl": int((datetime.now(timezone.utc) + timedelta(hours=24)).timestamp()),
-        }
+            return expire_conversation(transcript_codec.unpack_item(response["Items"][0]))
+        return new_conversation_context(user_id)
 
     except Exception as e:
         logger.error(f"Error getting conversation context: {e}")
         # Return new conversation on error
-        conversation_id = f"conv_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}"
-        return {
-            "userId": user_id,
-            "conversationId": conversation_id,
-            "messages": [],
-            "lastActivity": datetime.now(timezone.utc).isoformat(),
-            "ttl": int((datetime.now(timezone.utc) + timedelta(hours=24)).timestamp()),
-        }
+        return new_conversation_context(user_id)
+
 
+def get_conversation_contexts(user_ids, consistent_read=False):
+    """Get conversation contexts for several users with one BatchGetItem call"""
+    contexts = {}
+    try:
+        # BatchGetItem accepts at most 100 keys per request
+        for start in range(0, len(user_ids), 100):
+            keys = [{"userId": u} for u in user_ids[start : start + 100]]
+            request = {CONVERSATION_TABLE_NAME: {"Keys": keys, "ConsistentRead": consistent_read}}
+            while request:
+                response = dynamodb.batch_get_item(RequestItems=request)
+                for item in response.get("Responses", {}).get(CONVERSATION_TABLE_NAME, []):
+                    if is_conversation_active(item):
+                        contexts[item["userId"]] = transcript_codec.unpack_item(item)
+                    elif long_term_memory.LONG_TERM_MEMORY_ENABLED:
+                        expired = transcript_codec.unpack_item(item)
+                        contexts[item["userId"]] = link_memory(
+                            new_conversation_context(item["userId"]), expired
+                        )
+                request = response.get("UnprocessedKeys")
+        logger.info(f"Retrieved {len(contexts)} active conversation(s) for {len(user_ids)} users")
+    except Exception as e:
+        logger.error(f"Error getting conversation contexts: {e}")
+
+    for user_id in user_ids:
+        if user_id not in contexts:
+            contexts[user_id] = new_conversation_context(user_id)
+    return contexts
+
+
+def is_conversation_active(conversation):
+    """Check if a conversation is still active (within 30 minutes)"""
+    last_activity = datetime.fromisoformat(conversation["lastActivity"])
+    now = datetime.now(timezone.utc)
+    return now - last_activity < timedelta(minutes=30)
+
+
+def new_conversation_context(user_id, replaces_version=None):
+    """Create an empty conversation context
+
+    replaces_version is the version of the expired stored conversation this
+    one replaces, so a version-conditioned save may overwrite it.
+    """
+    conversation_id = f"conv_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}"
+    context = {
+        "userId": user_id,
+        "conversationId": conversation_id,
+        "messages": [],
+        "lastActivity": datetime.now(timezone.utc).isoformat(),
+        "ttl": long_term_memory.conversation_ttl(datetime.now(timezone.utc)),
+    }
+    if replaces_version is not None:
+        context["version"] = replaces_version
+    return context
+
+
+def expire_conversation(conversation):
+    """Start a new conversation replacing an expired one, remembering its turns"""
+    context = new_conversation_context(conversation["userId"], conversation.get("version"))
+    return link_memory(context, conversation)
+
+
+def link_memory(context, expired):
+    """Archive an expired conversation into long-term memory and link the new one to it"""
+    memory_version = long_term_memory.archive_conversation(expired)
+    if memory_version is not None:
+        context[long_term_memory.VERSION_KEY] = memory_version
+    return context
+
+
+# Fields set for the turn being saved (append_user_message) that a version merge keeps
+TURN_FIELDS = ("generation",)
+
+
+def save_conversation_context(user_id, conversation_context, new_messages=1):
+    """Save conversation context to DynamoDB
+
+    With the warm-container cache enabled the write is conditioned on the
+    version the context was based on. If another writer got in between the
+    read and this write, the stored conversation returned by the failed
+    write becomes the base, the last ``new_messages`` turns are appended to
+    it again (updating conversation_context in place) and the write is
+    retried.
+    """
+    cache = conversation_cache.conversations
+    if cache is None:
+        try:
+            core.save_conversation_context(user_id, conversation_context)
+        except Exception:
+            # Already logged; processing continues with the in-memory context
+            pass
+        return
 
-def save_conversation_context(user_id, conversation_context):
-    """Save conversation context to DynamoDB"""
     try:
-        conversation_context["lastActivity"] = datetime.now(timezone.utc).isoformat()
-        conversation_table.put_item(Item=conversation_context)
-        logger.info(f"Saved conversation context for user {user_id}")
+        for _ in range(MAX_VERSION_CONFLICTS):
+            current = core.save_if_version(
+                conversation_context, conversation_context.get("version")
+            )
+            if current is None:
+                cache.put(conversation_context)
+                logger.info(f"Saved conversation context for user {user_id}")
+                return
+            logger.info(f"Conversation of {user_id} was written concurrently; merging")
+            cache.invalidate(user_id)
+            if current and is_conversation_active(current):
+                base = transcript_codec.unpack_item(current)
+            else:
+                base = new_conversation_context(user_id, current.get("version"))
+            base["messages"].extend(conversation_context["messages"][-new_messages:])
+            # The stored item carries the previous turn's generation; keep this turn's
+            for field in TURN_FIELDS:
+                if field in conversation_context:
+                    base[field] = conversation_context[field]
+            conversation_context.clear()
+            conversation_context.update(base)
+        logger.error(f"Gave up saving conversation for {user_id} after repeated version conflicts")
     except Exception as e:
         logger.error(f"Error saving conversation context: {e}")
 
 
-def start_ai_processing(user_id, conversation_context, source_type, source_id, quote_token=None):
-    """Start Step Functions workflow for AI processing"""
+def save_conversation_contexts(conversation_contexts):
+    """Save several conversation contexts with batched writes"""
     try:
-        input_data = {
-            "userId": user_id,
-            "conversationContext": conversation_context,
-            "sourceType": source_type,
-            "sourceId": source_id,
-        }
+        now = datetime.now(timezone.utc).isoformat()
+        with conversation_table.batch_writer() as batch:
+            for conversation_context in conversation_contexts:
+                conversation_context["lastActivity"] = now
+                conversation_context["version"] = core.new_version()
+                batch.put_item(Item=transcript_codec.pack_item(conversation_context))
+        logger.info(f"Saved {len(conversation_contexts)} conversation context(s)")
+    except Exception as e:
+        logger.error(f"Error saving conversation contexts: {e}")
+
+
+def save_conversation_context_if_unchanged(conversation_context, read_activity):
+    """Save a context only if nobody else wrote it since it was read.
+
+    read_activity is the lastActivity of the stored conversation that was
+    read, or None if a new conversation was started; a new one may replace
+    a missing or expired item only.
+
+    Returns True if saved, False if another writer got there first.
+    """
+    if read_activity is None:
+        cutoff = (datetime.now(timezone.utc) - timedelta(minutes=30)).isoformat()
+        condition = "attribute_not_exists(userId) OR lastActivity < :cutoff"
+        values = {":cutoff": cutoff}
+    else:
+        condition = "lastActivity = :read"
+        values = {":read": read_activity}
 
-        # Add quote token if available for group/room messages
-        if quote_token and source_type in ("group", "room"):
-            input_data["quote_token"] = quote_token
+    previous = (conversation_context["lastActivity"], conversation_context.get("version"))
+    conversation_context["lastActivity"] = datetime.now(timezone.utc).isoformat()
+    conversation_context["version"] = core.new_version()
+    try:
+        conversation_table.put_item(
+            Item=transcript_codec.pack_item(conversation_context),
+            ConditionExpression=condition,
+            ExpressionAttributeValues=values,
+        )
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        conversation_context["lastActivity"], conversation_context["version"] = previous
+        logger.info(f"Conversation for {conversation_context['userId']} changed since read")
+        return False
+
+
+def build_workflow_input(
+    user_id,
+    conversation_context,
+    source_type,
+    source_id,
+    quote_token=None,
+    received_at_ms=None,
+    channel_id=None,
+):
+    """Build the workflow payload that AiProcessor receives"""
+    input_data = {
+        "userId": user_id,
+        "conversationContext": conversation_context,
+        "sourceType": source_type,
+        "sourceId": source_id,
+        # Deadline budget for the whole workflow, starting at webhook receipt
+        deadline.DEADLINE_KEY: deadline.start_budget(received_at_ms),
+    }
+
+    # Add quote token if available for group/room messages
+    if quote_token and source_type in ("group", "room"):
+        input_data["quote_token"] = quote_token
+    # The senders push with this channel's token; absent means the stack's own channel
+    if not core.channels.is_default(channel_id):
+        input_data["channelId"] = channel_id
+    return input_data
+
+
+def start_ai_processing(
+    user_id,
+    conversation_context,
+    source_type,
+    source_id,
+    quote_token=None,
+    received_at_ms=None,
+    channel_id=None,
+):
+    """Start Step Functions workflow for AI processing"""
+    try:
+        input_data = build_workflow_input(
+            user_id,
+            conversation_context,
+            source_type,
+            source_id,
+            quote_token,
+            received_at_ms,
+            channel_id,
+        )
 
         response = stepfunctions.start_execution(
-            stateMachineArn=STEP_FUNCTION_ARN, input=json.dumps(input_data, default=str)
+            stateMachineArn=STEP_FUNCTION_ARN, input=payload_codec.dumps(input_data)
         )
 
         logger.info(f"Started Step Functions execution: {response['executionArn']}")
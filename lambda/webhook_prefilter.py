@@ -0,0 +1,65 @@
+import logging
+import os
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables (drop irrelevant events before the SDK builds its models)
+WEBHOOK_PREFILTER_ENABLED = os.environ.get("WEBHOOK_PREFILTER_ENABLED", "false").lower() == "true"
+
+# Chats where the bot only answers when mentioned
+MENTION_ONLY_SOURCES = ("group", "room")
+
+
+def mentions(raw_event: dict, bot_id: str | None) -> bool:
+    """Whether a raw message event mentions the bot.
+
+    Args:
+        raw_event: Event object from the webhook body
+        bot_id: The bot's user ID
+
+    Returns:
+        True if one of the mentionees is the bot
+    """
+    mention = raw_event.get("message", {}).get("mention") or {}
+    return any(m.get("userId") == bot_id for m in mention.get("mentionees") or [])
+
+
+def is_relevant(raw_event: dict, bot_id: str | None) -> bool:
+    """Whether the bot would act on a raw event, judged without building SDK models.
+
+    Mirrors the checks of webhook_handler.accept_message: only text messages
+    are handled, and in groups and rooms only those mentioning the bot.
+
+    Args:
+        raw_event: Event object from the webhook body
+        bot_id: The bot's user ID (the body's "destination")
+
+    Returns:
+        False if the event would be ignored anyway
+    """
+    if raw_event.get("type") != "message":
+        return False
+    if raw_event.get("message", {}).get("type") != "text":
+        return False
+    if raw_event.get("source", {}).get("type") in MENTION_ONLY_SOURCES:
+        return mentions(raw_event, bot_id)
+    return True
+
+
+def relevant_events(payload: dict, bot_id: str | None = None) -> list[dict]:
+    """Keep the raw events of a verified webhook body the bot would act on.
+
+    Args:
+        payload: Parsed webhook body
+        bot_id: The bot's user ID (defaults to the body's "destination")
+
+    Returns:
+        Raw events worth parsing into SDK models, in their original order
+    """
+    bot_id = bot_id or payload.get("destination")
+    events = payload.get("events", [])
+    kept = [e for e in events if is_relevant(e, bot_id)]
+    if len(kept) < len(events):
+        logger.info(f"Pre-filter dropped {len(events) - len(kept)} of {len(events)} event(s)")
+    return kept
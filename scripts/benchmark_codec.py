@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Measure encode/decode time of conversation payloads with each codec.
+
+Times a conversation as DynamoDB returns it (Decimal ttl) through the
+stages it passes: the Step Functions input (stdlib json.dumps with
+default=str, as before, against payload_codec with orjson and its stdlib
+fallback) and the compressed transcript written back with put_item.
+It also reports whether ttl survives the round trip as a number.
+
+Example:
+    uv run scripts/benchmark_codec.py --messages 20
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from decimal import Decimal
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
+
+import payload_codec  # noqa: E402
+import transcript_codec  # noqa: E402
+
+
+def conversation(messages: int) -> dict:
+    """A stored conversation with ``messages`` alternating turns of typical length."""
+    return {
+        "userId": "Ubenchmark",
+        "conversationId": "conv_20260101_000000",
+        "messages": [
+            {
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": (
+                    "明日の大阪の天気どうなん？傘いるかな" * 2
+                    if i % 2 == 0
+                    else "明日の大阪は昼過ぎから雨っぽいで〜☔ 折りたたみ傘持っていき！" * 4
+                ),
+                "timestamp": f"2026-01-01T00:{i:02d}:00+00:00",
+            }
+            for i in range(messages)
+        ],
+        "lastActivity": "2026-01-01T00:20:00+00:00",
+        "ttl": Decimal("1767312000"),
+        "version": "0123456789abcdef0123456789abcdef",
+    }
+
+
+def time_us(function, runs: int) -> float:
+    """Median wall time of one call in microseconds."""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def measure(name: str, dumps, loads, context: dict, runs: int) -> dict:
+    encoded = dumps(context)
+    return {
+        "codec": name,
+        "encodeUs": round(time_us(lambda: dumps(context), runs), 1),
+        "decodeUs": round(time_us(lambda: loads(encoded), runs), 1),
+        "bytes": len(encoded.encode("utf-8") if isinstance(encoded, str) else encoded),
+        "ttlType": type(loads(encoded)["ttl"]).__name__,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20, help="Messages per transcript")
+    parser.add_argument("--runs", type=int, default=2000, help="Calls per measurement")
+    parser.add_argument("--json", action="store_true", help="Print raw results as JSON")
+    args = parser.parse_args()
+
+    context = conversation(args.messages)
+    results = [
+        measure(
+            "stdlib json (default=str)",
+            lambda c: json.dumps(c, default=str),
+            json.loads,
+            context,
+            args.runs,
+        )
+    ]
+    with patch.object(payload_codec, "PAYLOAD_CODEC", "stdlib"):
+        results.append(
+            measure(
+                "payload_codec stdlib", payload_codec.dumps, payload_codec.loads, context, args.runs
+            )
+        )
+        transcript = transcript_codec.encode_messages(context["messages"])
+        stdlib_pack = time_us(
+            lambda: transcript_codec.encode_messages(context["messages"]), args.runs
+        )
+        stdlib_unpack = time_us(lambda: transcript_codec.decode_messages(transcript), args.runs)
+    if payload_codec.orjson is not None:
+        results.append(
+            measure(
+                "payload_codec orjson", payload_codec.dumps, payload_codec.loads, context, args.runs
+            )
+        )
+    transcripts = {
+        "transcriptEncodeUs": round(
+            time_us(lambda: transcript_codec.encode_messages(context["messages"]), args.runs), 1
+        ),
+        "transcriptDecodeUs": round(
+            time_us(lambda: transcript_codec.decode_messages(transcript), args.runs), 1
+        ),
+        "stdlibTranscriptEncodeUs": round(stdlib_pack, 1),
+        "stdlibTranscriptDecodeUs": round(stdlib_unpack, 1),
+    }
+
+    if args.json:
+        print(json.dumps({"messages": args.messages, "payloads": results, **transcripts}, indent=2))
+        return
+    backend = "orjson" if payload_codec.use_orjson() else "stdlib (orjson not installed)"
+    print(f"{args.messages}-message transcript, payload_codec backend: {backend}")
+    print(f"{'codec':<28}{'encode µs':>11}{'decode µs':>11}{'bytes':>8}  ttl")
+    for r in results:
+        print(
+            f"{r['codec']:<28}{r['encodeUs']:>11}{r['decodeUs']:>11}{r['bytes']:>8}  {r['ttlType']}"
+        )
+    print(
+        f"{'transcript_codec (put_item)':<28}{transcripts['transcriptEncodeUs']:>11}"
+        f"{transcripts['transcriptDecodeUs']:>11}  (stdlib: {transcripts['stdlibTranscriptEncodeUs']}"
+        f" / {transcripts['stdlibTranscriptDecodeUs']})"
+    )
+
+
+if __name__ == "__main__":
+    main()
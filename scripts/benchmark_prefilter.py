@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Measure the parse time the webhook pre-filter saves on large group payloads.
+
+Compares the SDK path (WebhookParser.parse: signature check plus a model
+for every event) with the pre-filtered path of webhook_handler (signature
+check, json.loads, webhook_prefilter.relevant_events and Event.from_dict
+for the kept events only) on synthetic group webhooks where a small share
+of the messages mention the bot.
+
+Example:
+    uv run scripts/benchmark_prefilter.py --events 1 10 50 100 --mention-share 0.05
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
+
+import webhook_prefilter  # noqa: E402
+from linebot.v3 import WebhookParser  # noqa: E402
+from linebot.v3.webhooks import Event  # noqa: E402
+
+SECRET = "benchmark-secret"
+BOT = "Ubenchmarkbot"
+
+
+def sign(body: str) -> str:
+    digest = hmac.new(SECRET.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+
+def group_webhook(events: int, mention_share: float) -> str:
+    """A group chat webhook body where ``mention_share`` of the messages mention the bot."""
+    every = max(round(1 / mention_share), 1) if mention_share > 0 else events + 1
+    raw_events = []
+    for i in range(events):
+        mention = i % every == 0
+        message = {
+            "id": str(i),
+            "type": "text",
+            "text": "@あいちゃん 今日の天気は？" if mention else "せやな、ほんでな" * 4,
+            "quoteToken": f"q{i}",
+            # Group members mention each other too; only the bot's mentions matter
+            "mention": {
+                "mentionees": [
+                    {
+                        "index": 0,
+                        "length": 6,
+                        "type": "user",
+                        "userId": BOT if mention else f"U{i % 7}",
+                    }
+                ]
+            },
+        }
+        raw_events.append(
+            {
+                "type": "message",
+                "mode": "active",
+                "timestamp": 1700000000000 + i,
+                "source": {"type": "group", "groupId": "Cbenchmark", "userId": f"U{i % 7}"},
+                "webhookEventId": f"evt-{i}",
+                "deliveryContext": {"isRedelivery": False},
+                "replyToken": f"reply-{i}",
+                "message": message,
+            }
+        )
+    return json.dumps({"destination": BOT, "events": raw_events}, ensure_ascii=False)
+
+
+def full_parse(parser: WebhookParser, body: str, signature: str) -> int:
+    """What WebhookHandler.handle does before dispatching."""
+    return len(parser.parse(body, signature))
+
+
+def prefiltered_parse(parser: WebhookParser, body: str, signature: str) -> int:
+    """What webhook_handler.handle_relevant_events does before dispatching."""
+    if not parser.signature_validator.validate(body, signature):
+        raise ValueError("Invalid signature")
+    payload = json.loads(body)
+    kept = webhook_prefilter.relevant_events(payload, payload.get("destination"))
+    return len([Event.from_dict(raw_event) for raw_event in kept])
+
+
+def time_us(function, parser: WebhookParser, body: str, signature: str, runs: int) -> float:
+    """Median wall time of one call in microseconds."""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function(parser, body, signature)
+        samples.append((time.perf_counter() - started) * 1_000_000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--events", type=int, nargs="+", default=[1, 10, 50, 100], help="Events per webhook"
+    )
+    parser.add_argument(
+        "--mention-share", type=float, default=0.05, help="Share of messages mentioning the bot"
+    )
+    parser.add_argument("--runs", type=int, default=200, help="Parses per payload size")
+    parser.add_argument("--json", action="store_true", help="Print raw results as JSON")
+    args = parser.parse_args()
+
+    # The pre-filter logs what it dropped on every call
+    logging.getLogger().setLevel(logging.WARNING)
+    webhook_parser = WebhookParser(SECRET)
+
+    results = []
+    for events in args.events:
+        body = group_webhook(events, args.mention_share)
+        signature = sign(body)
+        full_us = time_us(full_parse, webhook_parser, body, signature, args.runs)
+        filtered_us = time_us(prefiltered_parse, webhook_parser, body, signature, args.runs)
+        results.append(
+            {
+                "events": events,
+                "kept": prefiltered_parse(webhook_parser, body, signature),
+                "bodyKiB": round(len(body.encode("utf-8")) / 1024, 1),
+                "fullUs": round(full_us, 1),
+                "prefilteredUs": round(filtered_us, 1),
+                "savedUs": round(full_us - filtered_us, 1),
+                "speedup": round(full_us / filtered_us, 1) if filtered_us else None,
+            }
+        )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(
+        f"{'events':>7}{'kept':>6}{'body KiB':>10}{'full µs':>10}"
+        f"{'filtered µs':>13}{'saved µs':>10}{'speedup':>9}"
+    )
+    for r in results:
+        print(
+            f"{r['events']:>7}{r['kept']:>6}{r['bodyKiB']:>10}{r['fullUs']:>10}"
+            f"{r['prefilteredUs']:>13}{r['savedUs']:>10}{r['speedup']:>8}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
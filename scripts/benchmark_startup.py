@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Measure per-container startup cost of the Lambda handlers.
+
+Imports a handler module in a fresh interpreter (as a cold start would) with
+AWS calls stubbed out, and reports import time, boto3 clients/resources
+built, and peak RSS growth. Run it against an older checkout with
+``--lambda-dir`` to compare before and after a change.
+
+Example:
+    uv run scripts/benchmark_startup.py webhook_handler ai_processor response_sender
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+DEFAULT_LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda")
+
+# Runs in the child interpreter; prints one JSON line
+CHILD = r"""
+import json, resource, sys, time
+from unittest.mock import patch
+
+import boto3
+import botocore.client
+
+counts = {"client": {}, "resource": {}}
+real_client, real_resource = boto3.client, boto3.resource
+
+def counting(kind, real):
+    def factory(service, *args, **kwargs):
+        counts[kind][service] = counts[kind].get(service, 0) + 1
+        return real(service, *args, **kwargs)
+    return factory
+
+def fake_api_call(self, operation, params):
+    if operation == "GetSecretValue":
+        return {"SecretString": '{"XAI_API_KEY": "benchmark"}'}
+    return {}
+
+sys.path.insert(0, sys.argv[1])
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+started = time.perf_counter()
+with (
+    patch("boto3.client", counting("client", real_client)),
+    patch("boto3.resource", counting("resource", real_resource)),
+    patch.object(botocore.client.BaseClient, "_make_api_call", fake_api_call),
+):
+    module = __import__(sys.argv[2])
+elapsed_ms = (time.perf_counter() - started) * 1000
+# ru_maxrss is in KiB on Linux
+rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+
+registry = None
+if "core" in sys.modules:
+    registry = sys.modules["core"].registry.stats
+print(json.dumps({
+    "module": sys.argv[2],
+    "importMs": round(elapsed_ms, 1),
+    "clients": sum(counts["client"].values()) + sum(counts["resource"].values()),
+    "byService": counts,
+    "rssGrowthKiB": rss_growth,
+    "registry": registry,
+}))
+"""
+
+# Dummy settings so handlers import without real AWS resources
+CHILD_ENV = {
+    "AWS_DEFAULT_REGION": "ap-northeast-1",
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "CONVERSATION_TABLE_NAME": "benchmark-conversations",
+    "STEP_FUNCTION_ARN": "arn:aws:states:ap-northeast-1:000000000000:stateMachine:benchmark",
+    "CHANNEL_SECRET_NAME": "LINE_CHANNEL_SECRET",
+    "CHANNEL_ACCESS_TOKEN_NAME": "LINE_CHANNEL_ACCESS_TOKEN",
+    "SAMBA_NOVA_API_KEY_NAME": "SAMBA_NOVA_API_KEY",
+    "GROQ_API_KEY_NAME": "GROQ_API_KEY",
+    "XAI_API_KEY_SECRET_NAME": "XAI_API_KEY",
+}
+
+
+def measure(lambda_dir: str, module: str) -> dict:
+    """Import one handler in a fresh interpreter and collect startup metrics.
+
+    Args:
+        lambda_dir: Directory containing the handler modules
+        module: Module name to import
+
+    Returns:
+        Metrics reported by the child interpreter
+    """
+    env = {**os.environ, **CHILD_ENV}
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, os.path.abspath(lambda_dir), module],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=["webhook_handler"], help="Handler modules")
+    parser.add_argument("--lambda-dir", default=DEFAULT_LAMBDA_DIR, help="Handler directory")
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts per module")
+    parser.add_argument("--json", action="store_true", help="Print raw results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for module in args.modules:
+        runs = [measure(args.lambda_dir, module) for _ in range(args.runs)]
+        import_ms = sorted(run["importMs"] for run in runs)
+        results.append({**runs[-1], "importMsMedian": import_ms[len(import_ms) // 2]})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'module':<26}{'import ms':>10}{'clients':>9}{'RSS KiB':>10}  services")
+    for r in results:
+        services = {
+            **r["byService"]["client"],
+            **{f"{k}(res)": v for k, v in r["byService"]["resource"].items()},
+        }
+        print(
+            f"{r['module']:<26}{r['importMsMedian']:>10.1f}{r['clients']:>9}{r['rssGrowthKiB']:>10}  "
+            f"{services}"
+        )
+        if r["registry"]:
+            print(f"{'':<26}registry: {r['registry']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Export the conversation table for analytics with a parallel segmented Scan.
+
+Each segment is scanned by its own thread under a read-capacity budget, items
+stream through a generator pipeline and are written in columnar batches:
+Parquet when pyarrow is installed, otherwise chunked JSONL. Conversation rows
+summarize message counts, characters per role and gaps between messages; use
+``--raw`` for other tables such as the usage counters (backend mix).
+
+Example:
+    uv run scripts/export_conversations.py --out export/ --segments 8 --rcu 20
+    uv run scripts/export_conversations.py --table line-bot-usage --raw --out usage/
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
+
+import boto3  # noqa: E402
+from conversation_export import (  # noqa: E402
+    CONVERSATION_COLUMNS,
+    conversation_row,
+    export,
+    flat_row,
+    make_writer,
+    parallel_scan,
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--table", default="line-bot-conversations", help="DynamoDB table name")
+    parser.add_argument("--out", required=True, help="Output directory")
+    parser.add_argument("--format", choices=["auto", "parquet", "jsonl"], default="auto")
+    parser.add_argument("--segments", type=int, default=4, help="Scan segments (threads)")
+    parser.add_argument(
+        "--rcu", type=float, default=25.0, help="Read capacity units per second per segment"
+    )
+    parser.add_argument("--page-size", type=int, default=500, help="Items per Scan request")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows per written batch")
+    parser.add_argument("--raw", action="store_true", help="Export scalar attributes as-is")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    table = boto3.resource("dynamodb").Table(args.table)
+    started = time.monotonic()
+    result = export(
+        parallel_scan(table, args.segments, args.rcu, args.page_size),
+        make_writer(args.out, args.format),
+        to_row=flat_row if args.raw else conversation_row,
+        batch_size=args.batch_size,
+        columns=None if args.raw else CONVERSATION_COLUMNS,
+    )
+    result["seconds"] = round(time.monotonic() - started, 1)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
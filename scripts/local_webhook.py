@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Serve webhook_handler.lambda_handler over plain HTTP for local replays.
+
+Wraps each POST in an API Gateway proxy event and passes it to the handler,
+so scripts/replay_traffic.py can exercise the webhook Lambda alone (the
+workflow still starts in Step Functions). To replay against the whole
+pipeline running in-process, use lambda/pipeline_server.py instead.
+With ``--secret`` the channel secret and access token are seeded locally
+instead of being read from Secrets Manager; everything downstream of the
+webhook (DynamoDB, Step Functions) still uses the configured AWS endpoint,
+e.g. AWS_ENDPOINT_URL pointing at LocalStack.
+
+Example:
+    uv run scripts/local_webhook.py --port 8080 --secret test-channel-secret
+"""
+
+import argparse
+import json
+import os
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
+
+from pipeline_server import seed_secrets  # noqa: E402
+
+
+def make_handler(lambda_handler, path: str):
+    class WebhookRequestHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != path:
+                self.send_error(404)
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8")
+            event = {
+                "headers": {k.lower(): v for k, v in self.headers.items()},
+                "body": body,
+                "isBase64Encoded": False,
+            }
+            try:
+                result = lambda_handler(event, None)
+            except Exception as e:
+                result = {"statusCode": 500, "body": json.dumps({"message": str(e)})}
+            payload = (result.get("body") or "").encode("utf-8")
+            self.send_response(result.get("statusCode", 200))
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return WebhookRequestHandler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address")
+    parser.add_argument("--port", type=int, default=8080, help="Bind port")
+    parser.add_argument("--path", default="/webhook", help="Webhook path")
+    parser.add_argument("--secret", help="Local channel secret (skips Secrets Manager)")
+    parser.add_argument(
+        "--access-token", default="local-access-token", help="Local channel access token"
+    )
+    args = parser.parse_args()
+
+    if args.secret:
+        seed_secrets(args.secret, args.access_token)
+    from webhook_handler import lambda_handler
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(lambda_handler, args.path))
+    print(f"Serving webhook_handler on http://{args.host}:{args.port}{args.path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
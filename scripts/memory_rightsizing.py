@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""Recommend Lambda memory sizes from a replayed workload.
+
+Each handler runs in fresh interpreters (as a cold start would) with AWS,
+LLM, Grok and LINE calls stubbed out, and replays a representative
+workload: captured webhook traffic (``--traffic``) or synthetic group chat
+for webhook_handler, and 20-message transcripts for the workflow steps.
+
+One run uses the memory profiling mode (MEMORY_PROFILE_ENABLED with
+PYTHONTRACEMALLOC, see lambda/memory_profile.py) for the traced peaks and
+top allocation sites; a second, unprofiled run measures peak RSS, init and
+per-invocation time, since tracing itself inflates both. Lambda gives a function CPU in proportion to its memory (one full
+vCPU at 1769 MB), so the CPU-bound time measured here is scaled to each
+candidate size to show the cold/warm latency and cost trade-off.
+
+Example:
+    uv run scripts/memory_rightsizing.py ai_processor grok_processor webhook_handler
+    uv run scripts/memory_rightsizing.py webhook_handler --traffic capture.jsonl --invocations 200
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda")
+sys.path.append(LAMBDA_DIR)
+
+from benchmark_startup import CHILD_ENV  # noqa: E402
+from traffic_capture import load_capture  # noqa: E402
+
+# Memory sizes to compare (MB); CPU is proportional to memory up to one vCPU at 1769 MB
+LAMBDA_SIZES_MB = [128, 256, 384, 512, 768, 1024, 1536, 1769, 2048, 3008]
+FULL_VCPU_MB = 1769
+# Lambda x86 price per GB-second
+PRICE_PER_GB_S = 0.0000166667
+# Peak RSS must stay below this share of the configured memory
+MEMORY_HEADROOM = 0.8
+
+# Shared secret the synthetic webhooks are signed with (the stubbed GetSecretValue returns it)
+STUB_SECRET = "benchmark"
+
+# Runs in the child interpreter; prints one JSON line
+CHILD = r"""
+import json, sys, time
+from unittest.mock import MagicMock, patch
+
+import botocore.client
+
+lambda_dir, module_name, workload_path = sys.argv[1:4]
+sys.path.insert(0, lambda_dir)
+with open(workload_path, encoding="utf-8") as f:
+    events = json.load(f)
+
+def fake_api_call(self, operation, params):
+    if operation == "GetSecretValue":
+        if "XAI" in params.get("SecretId", ""):
+            return {"SecretString": '{"XAI_API_KEY": "benchmark"}'}
+        return {"SecretString": "benchmark"}
+    if operation == "StartExecution":
+        return {"executionArn": "arn:aws:states:ap-northeast-1:0:execution:benchmark:x"}
+    return {}
+
+COMPLETION = {
+    "id": "chatcmpl-benchmark", "object": "chat.completion", "created": 0, "model": "benchmark",
+    "choices": [{"index": 0, "finish_reason": "stop",
+                 "message": {"role": "assistant", "content": "まいど！ほんまやな〜" * 20}}],
+    "usage": {"prompt_tokens": 1200, "completion_tokens": 200, "total_tokens": 1400},
+}
+
+def fake_completion(self, *args, **kwargs):
+    from openai.types.chat import ChatCompletion
+    return ChatCompletion.model_validate(COMPLETION)
+
+def fake_search(query, prompt, timeout=None, usage=None):
+    return f"{query}について調べたで！" + "こびとさんの調べによると、" * 100
+
+bot_info = MagicMock(user_id="Ubenchmarkbot")
+started = time.perf_counter()
+with (
+    patch.object(botocore.client.BaseClient, "_make_api_call", fake_api_call),
+    patch("openai.resources.chat.completions.Completions.create", fake_completion),
+    patch("linebot.v3.messaging.MessagingApi.push_message_with_http_info"),
+    patch("linebot.v3.messaging.MessagingApi.reply_message"),
+    patch("linebot.v3.messaging.MessagingApi.get_bot_info", return_value=bot_info),
+):
+    module = __import__(module_name)
+    init_ms = (time.perf_counter() - started) * 1000
+    import grok_processor
+    with patch.object(grok_processor, "search_with_grok", fake_search):
+        invoke_ms = []
+        for event in events:
+            call_started = time.perf_counter()
+            module.lambda_handler(json.loads(json.dumps(event)), None)
+            invoke_ms.append((time.perf_counter() - call_started) * 1000)
+
+import memory_profile
+print(json.dumps({
+    "module": module_name,
+    "initMs": round(init_ms, 1),
+    "invokeMs": [round(ms, 2) for ms in invoke_ms],
+    "peakRssMiB": round(memory_profile.peak_rss_mib(), 1),
+    "reports": memory_profile.reports,
+}, ensure_ascii=False))
+"""
+
+
+def sign(body: str, secret: str = STUB_SECRET) -> str:
+    digest = hmac.new(secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+
+def transcript(turns: int = 20) -> dict:
+    """A conversation context with ``turns`` alternating messages."""
+    messages = [
+        {
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": ("明日の大阪の天気どうなん？" if i % 2 == 0 else "晴れやで〜") * 5,
+            "timestamp": "2026-01-01T00:00:00+00:00",
+        }
+        for i in range(turns - 1)
+    ]
+    messages.append({"role": "user", "content": "今日のニュース教えて", "timestamp": ""})
+    return {"userId": "Ubenchmark", "messages": messages}
+
+
+def synthetic_webhooks(count: int) -> list[str]:
+    """Group chat where one message in five mentions the bot, plus direct messages."""
+    bodies = []
+    for i in range(count):
+        mention = i % 5 == 0
+        text = "@あいちゃん 今日の天気は？" if mention else "せやな、ほんでな" * 4
+        message = {"id": str(i), "type": "text", "text": text, "quoteToken": f"q{i}"}
+        if mention:
+            message["mention"] = {
+                "mentionees": [{"index": 0, "length": 6, "type": "user", "userId": "Ubenchmarkbot"}]
+            }
+        source = (
+            {"type": "group", "groupId": "Cbenchmark", "userId": f"U{i % 7}"}
+            if i % 4
+            else {"type": "user", "userId": f"U{i % 7}"}
+        )
+        event = {
+            "type": "message",
+            "mode": "active",
+            "timestamp": int(time.time() * 1000),
+            "source": source,
+            "webhookEventId": f"evt-{i}",
+            "deliveryContext": {"isRedelivery": False},
+            "replyToken": f"reply-{i}",
+            "message": message,
+        }
+        bodies.append(json.dumps({"destination": "Ubenchmarkbot", "events": [event]}))
+    return bodies
+
+
+def workload(module: str, count: int, traffic: str | None = None) -> list[dict]:
+    """Build the events replayed against one handler.
+
+    Args:
+        module: Handler module name
+        count: Number of invocations
+        traffic: Capture file (TRAFFIC_CAPTURE_PATH) used for webhook_handler
+
+    Returns:
+        Lambda events
+    """
+    if module == "webhook_handler":
+        bodies = [r["body"] for r in load_capture(traffic)] if traffic else []
+        bodies = (bodies or synthetic_webhooks(count))[:count]
+        return [{"body": b, "headers": {"x-line-signature": sign(b)}} for b in bodies]
+    payload = {
+        "userId": "Ubenchmark",
+        "sourceType": "group",
+        "sourceId": "Cbenchmark",
+        "conversationContext": transcript(),
+    }
+    if module == "grok_processor":
+        payload["toolQuery"] = "今日の大阪のニュース"
+    if module == "response_sender":
+        payload["grokResponse"] = "こびとさんの調べによると、" * 100
+    return [payload] * count
+
+
+def run_child(lambda_dir: str, module: str, events: list[dict], profile: bool) -> dict:
+    """Replay the events in a fresh interpreter and return its measurements."""
+    env = {**os.environ, **CHILD_ENV}
+    if profile:
+        env.update({"MEMORY_PROFILE_ENABLED": "true", "PYTHONTRACEMALLOC": "1"})
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+        json.dump(events, f, ensure_ascii=False)
+    try:
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD, os.path.abspath(lambda_dir), module, f.name],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    finally:
+        os.unlink(f.name)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def median(values: list[float]) -> float:
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2] if ordered else 0.0
+
+
+def size_options(peak_rss_mib: float, init_ms: float, first_ms: float, warm_ms: float) -> list:
+    """Estimate latency and cost of each candidate memory size.
+
+    Args:
+        peak_rss_mib: Peak RSS of the unprofiled run (tracemalloc inflates RSS)
+        init_ms: Init (import) time on one full local core
+        first_ms: First invocation time on one full local core
+        warm_ms: Median warm invocation time on one full local core
+
+    Returns:
+        One dict per size in LAMBDA_SIZES_MB
+    """
+    options = []
+    for size in LAMBDA_SIZES_MB:
+        # Single-threaded handlers gain nothing beyond one vCPU
+        slowdown = FULL_VCPU_MB / min(size, FULL_VCPU_MB)
+        warm = warm_ms * slowdown
+        options.append(
+            {
+                "memoryMb": size,
+                "fits": peak_rss_mib <= size * MEMORY_HEADROOM,
+                "coldMs": round((init_ms + first_ms) * slowdown),
+                "warmMs": round(warm, 1),
+                "usdPerMillionWarm": round(size / 1024 * warm / 1000 * PRICE_PER_GB_S * 1e6, 2),
+            }
+        )
+    return options
+
+
+def recommend(options: list[dict], cold_budget_ms: float) -> dict | None:
+    """Smallest size that fits and meets the cold-start budget (else the smallest that fits)."""
+    fitting = [o for o in options if o["fits"]]
+    within = [o for o in fitting if o["coldMs"] <= cold_budget_ms]
+    return (within or fitting or [None])[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "modules", nargs="*", default=["webhook_handler", "ai_processor", "grok_processor"]
+    )
+    parser.add_argument("--lambda-dir", default=LAMBDA_DIR, help="Handler directory")
+    parser.add_argument("--traffic", help="Capture file to replay against webhook_handler")
+    parser.add_argument("--invocations", type=int, default=50, help="Invocations per handler")
+    parser.add_argument(
+        "--cold-budget-ms", type=float, default=1500, help="Acceptable cold start (init + first)"
+    )
+    parser.add_argument("--json", action="store_true", help="Print raw results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for module in args.modules:
+        events = workload(module, args.invocations, args.traffic)
+        profiled = run_child(args.lambda_dir, module, events, profile=True)
+        timed = run_child(args.lambda_dir, module, events, profile=False)
+        invoke_ms = timed["invokeMs"]
+        options = size_options(
+            timed["peakRssMiB"], timed["initMs"], invoke_ms[0], median(invoke_ms[1:])
+        )
+        invocations = [r for r in profiled["reports"] if r["phase"] == "invoke"]
+        ranked = [r for r in invocations if "top" in r]
+        init = next((r for r in profiled["reports"] if r["phase"] == "init"), {})
+        results.append(
+            {
+                "module": module,
+                "peakRssMiB": timed["peakRssMiB"],
+                "initTop": init.get("top", [])[:5],
+                "invokeTop": max(ranked, key=lambda r: r["tracedPeakKiB"])["top"][:5]
+                if ranked
+                else [],
+                "maxTracedPeakKiB": max((r["tracedPeakKiB"] for r in invocations), default=0),
+                "options": options,
+                "recommended": recommend(options, args.cold_budget_ms),
+            }
+        )
+
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+
+    for result in results:
+        recommended = result["recommended"] or {}
+        print(
+            f"\n{result['module']}: peak RSS {result['peakRssMiB']} MiB, "
+            f"invocation peak {result['maxTracedPeakKiB']} KiB traced -> "
+            f"recommended {recommended.get('memoryMb', 'n/a')} MB"
+        )
+        print(f"  {'MB':>6} {'fits':>5} {'cold ms':>8} {'warm ms':>8} {'$/1M warm':>10}")
+        for option in result["options"]:
+            marker = " <-" if option is result["recommended"] else ""
+            print(
+                f"  {option['memoryMb']:>6} {'yes' if option['fits'] else 'no':>5} "
+                f"{option['coldMs']:>8} {option['warmMs']:>8} "
+                f"{option['usdPerMillionWarm']:>10}{marker}"
+            )
+        if recommended and recommended["coldMs"] > args.cold_budget_ms:
+            print(
+                f"  (no size fitting in memory meets the {args.cold_budget_ms:.0f}ms cold budget)"
+            )
+        print("  Top allocation sites (init):")
+        for site in result["initTop"]:
+            print(f"    {site['sizeKiB']:>9} KiB  {site['site']}")
+        print("  Top allocation sites (largest invocation):")
+        for site in result["invokeTop"]:
+            print(f"    {site['sizeKiB']:>9} KiB  {site['site']}")
+
+
+if __name__ == "__main__":
+    main()
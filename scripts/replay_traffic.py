@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Replay captured webhook traffic against a local pipeline.
+
+Reads a capture file written with TRAFFIC_CAPTURE_PATH, re-signs every body
+with a test channel secret and POSTs it to the target URL, keeping the
+original inter-arrival gaps divided by ``--speed``. The default URL is the
+self-hosted pipeline server (python lambda/pipeline_server.py --secret ...).
+
+Example:
+    uv run scripts/replay_traffic.py capture.jsonl \\
+        --url http://127.0.0.1:8080/webhook --secret test-secret --speed 10 --concurrency 16
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
+
+from traffic_capture import load_capture  # noqa: E402
+
+# Upper bounds (ms) of the latency histogram buckets
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf")]
+
+
+def sign_body(body: str, channel_secret: str) -> str:
+    """Compute the x-line-signature header for a body.
+
+    Args:
+        body: Request body
+        channel_secret: Channel secret the target verifies with
+
+    Returns:
+        Base64 HMAC-SHA256 signature
+    """
+    digest = hmac.new(channel_secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256)
+    return base64.b64encode(digest.digest()).decode("utf-8")
+
+
+def refresh_timestamps(body: str, now_ms: int) -> str:
+    """Move event timestamps to now so time-window checks behave as in production.
+
+    Args:
+        body: Webhook body
+        now_ms: Current epoch milliseconds
+
+    Returns:
+        Body with every event timestamp set to now_ms
+    """
+    payload = json.loads(body)
+    for event in payload.get("events", []):
+        if "timestamp" in event:
+            event["timestamp"] = now_ms
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def send_webhook(url: str, body: str, signature: str, timeout: float) -> tuple[int, float]:
+    """POST one webhook body.
+
+    Args:
+        url: Target URL
+        body: Request body
+        signature: x-line-signature value
+        timeout: Request timeout in seconds
+
+    Returns:
+        Tuple of (HTTP status or 0 on connection errors, latency in milliseconds)
+    """
+    request = urllib.request.Request(
+        url,
+        data=body.encode("utf-8"),
+        headers={"Content-Type": "application/json", "x-line-signature": signature},
+        method="POST",
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0
+    return status, (time.perf_counter() - started) * 1000
+
+
+def replay(
+    records: list[dict],
+    url: str,
+    secret: str,
+    speed: float = 1.0,
+    concurrency: int = 8,
+    timeout: float = 30.0,
+    refresh: bool = True,
+) -> dict:
+    """Fire captured bodies at the target with the original arrival pattern.
+
+    Args:
+        records: Records from load_capture, sorted by arrival time
+        url: Target URL
+        secret: Test channel secret used to re-sign bodies
+        speed: Time compression factor (10 replays 10 minutes of traffic in 1 minute)
+        concurrency: Maximum requests in flight
+        timeout: Per-request timeout in seconds
+        refresh: Whether to move event timestamps to the send time
+
+    Returns:
+        Dict with per-request results, total duration and schedule lag
+    """
+    results: list[tuple[int, float]] = []
+    results_lock = threading.Lock()
+    max_lag_ms = 0.0
+
+    def fire(body: str) -> None:
+        if refresh:
+            body = refresh_timestamps(body, int(time.time() * 1000))
+        result = send_webhook(url, body, sign_body(body, secret), timeout)
+        with results_lock:
+            results.append(result)
+
+    first_ms = records[0]["receivedAtMs"] if records else 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for record in records:
+            due = (record["receivedAtMs"] - first_ms) / 1000 / speed
+            delay = due - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                max_lag_ms = max(max_lag_ms, -delay * 1000)
+            executor.submit(fire, record["body"])
+    return {
+        "results": results,
+        "durationSeconds": time.perf_counter() - started,
+        "maxScheduleLagMs": max_lag_ms,
+    }
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(run: dict) -> dict:
+    """Compute throughput, latency percentiles, histogram and error rate.
+
+    Args:
+        run: Value returned by replay
+
+    Returns:
+        Summary dict
+    """
+    results = run["results"]
+    latencies = sorted(latency for _, latency in results)
+    statuses: dict[str, int] = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = sum(1 for status, _ in results if not 200 <= status < 300)
+
+    histogram = {}
+    lower = 0.0
+    for upper in LATENCY_BUCKETS_MS:
+        label = f"<{upper:g}ms" if upper != float("inf") else f">={lower:g}ms"
+        histogram[label] = sum(1 for latency in latencies if lower <= latency < upper)
+        lower = upper
+
+    duration = run["durationSeconds"]
+    return {
+        "requests": len(results),
+        "throughputPerSecond": len(results) / duration if duration else 0.0,
+        "errorRate": errors / len(results) if results else 0.0,
+        "statuses": statuses,
+        "latencyMs": {
+            "p50": percentile(latencies, 0.50),
+            "p90": percentile(latencies, 0.90),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else 0.0,
+        },
+        "histogram": histogram,
+        "maxScheduleLagMs": run["maxScheduleLagMs"],
+    }
+
+
+def print_report(summary: dict) -> None:
+    print(f"Requests:    {summary['requests']}")
+    print(f"Throughput:  {summary['throughputPerSecond']:.1f} req/s")
+    print(f"Error rate:  {summary['errorRate']:.1%} {summary['statuses']}")
+    latency = summary["latencyMs"]
+    print(
+        f"Latency:     p50={latency['p50']:.1f}ms p90={latency['p90']:.1f}ms "
+        f"p99={latency['p99']:.1f}ms max={latency['max']:.1f}ms"
+    )
+    print(f"Sched lag:   max {summary['maxScheduleLagMs']:.1f}ms")
+    peak = max(summary["histogram"].values(), default=0) or 1
+    for label, count in summary["histogram"].items():
+        print(f"  {label:>10} {count:6d} {'#' * round(40 * count / peak)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture", help="Capture file written with TRAFFIC_CAPTURE_PATH")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook", help="Webhook URL")
+    parser.add_argument(
+        "--secret",
+        default=os.environ.get("REPLAY_CHANNEL_SECRET", "test-channel-secret"),
+        help="Test channel secret the target verifies signatures with",
+    )
+    parser.add_argument("--speed", type=float, default=1.0, help="Speed-up factor (1-100)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum requests in flight")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout (s)")
+    parser.add_argument(
+        "--keep-timestamps", action="store_true", help="Send the captured event timestamps"
+    )
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    if not 1 <= args.speed <= 100:
+        parser.error("--speed must be between 1 and 100")
+
+    records = load_capture(args.capture)
+    run = replay(
+        records,
+        args.url,
+        args.secret,
+        speed=args.speed,
+        concurrency=args.concurrency,
+        timeout=args.timeout,
+        refresh=not args.keep_timestamps,
+    )
+    summary = summarize(run)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_report(summary)
+
+
+if __name__ == "__main__":
+    main()
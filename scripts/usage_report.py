@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Show the top token and cost consumers recorded by usage accounting.
+
+Reads the daily counters written to USAGE_TABLE_NAME (line-bot-usage when
+deployed with -c usageAccounting=true) and ranks users, groups or backends.
+
+Example:
+    USAGE_TABLE_NAME=line-bot-usage uv run scripts/usage_report.py --by user --metric costUsd
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
+
+os.environ.setdefault("USAGE_TABLE_NAME", "line-bot-usage")
+
+import usage_accounting  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--by",
+        choices=[usage_accounting.USER, usage_accounting.GROUP, usage_accounting.BACKEND],
+        default=usage_accounting.USER,
+        help="Dimension to rank",
+    )
+    parser.add_argument("--day", help="UTC day as YYYY-MM-DD (defaults to today)")
+    parser.add_argument(
+        "--metric",
+        default="totalTokens",
+        choices=[*usage_accounting.COUNTERS, "costUsd"],
+        help="Counter to rank by",
+    )
+    parser.add_argument("--limit", type=int, default=10, help="Number of rows")
+    parser.add_argument("--json", action="store_true", help="Print the rows as JSON")
+    args = parser.parse_args()
+
+    rows = usage_accounting.top_consumers(args.by, args.day, args.metric, args.limit)
+    if args.json:
+        print(json.dumps(rows, indent=2, default=str))
+        return
+    print(f"{'id':<40} {'calls':>7} {'tokens':>10} {'cached':>9} {'searches':>8} {'cost $':>10}")
+    for row in rows:
+        print(
+            f"{row['id']:<40} {int(row.get('calls', 0)):>7} {int(row.get('totalTokens', 0)):>10} "
+            f"{int(row.get('cachedTokens', 0)):>9} {int(row.get('searches', 0)):>8} "
+            f"{float(row.get('costUsd', 0)):>10.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()